@@ -0,0 +1,55 @@
+"""add task_queue_jobs table
+
+Revision ID: 43bb59405e2d
+Revises: d860c8a60136, 9c45ea7d3c12
+Create Date: 2025-05-06 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '43bb59405e2d'
+down_revision: Union[str, Sequence[str], None] = ('d860c8a60136', '9c45ea7d3c12')
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    connection = op.get_bind()
+    inspector = sa.inspect(connection)
+
+    # 应用启动时 create_all 可能已经创建了该表
+    if 'task_queue_jobs' in inspector.get_table_names():
+        return
+
+    op.create_table(
+        'task_queue_jobs',
+        sa.Column('task_id', sa.String(22), primary_key=True, comment="任务ID，对应tasks.id"),
+        sa.Column('queue', sa.String(50), nullable=False, server_default='default', comment="队列名称"),
+        sa.Column('user_id', sa.String(100), nullable=False, server_default='', comment="用户ID，用于单用户并发控制"),
+        sa.Column('priority', sa.Integer(), nullable=False, server_default='0', comment="优先级，数值越小越优先"),
+        sa.Column('status', sa.Enum('QUEUED', 'LEASED', 'SUCCEEDED', 'DEAD', name='taskqueuejobstatus'), nullable=False, comment="队列状态"),
+        sa.Column('payload', sa.Text(), nullable=True, comment="任务参数JSON"),
+        sa.Column('checkpoint', sa.Text(length=4294967295), nullable=True, comment="断点数据JSON，重试时用于恢复"),
+        sa.Column('attempts', sa.Integer(), nullable=False, server_default='0', comment="已领取次数"),
+        sa.Column('max_attempts', sa.Integer(), nullable=False, server_default='3', comment="最大尝试次数"),
+        sa.Column('lease_owner', sa.String(100), nullable=True, comment="持有租约的工作进程ID"),
+        sa.Column('lease_expires_at', sa.DateTime(), nullable=True, comment="租约过期时间"),
+        sa.Column('available_at', sa.DateTime(), nullable=False, comment="可被领取的时间，用于重试退避"),
+        sa.Column('last_error', sa.Text(), nullable=True, comment="最近一次错误信息"),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+    )
+    op.create_index('idx_task_queue_jobs_claim', 'task_queue_jobs', ['queue', 'status', 'priority', 'available_at'])
+    op.create_index('idx_task_queue_jobs_lease', 'task_queue_jobs', ['status', 'lease_expires_at'])
+    op.create_index('idx_task_queue_jobs_user', 'task_queue_jobs', ['user_id', 'status'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('task_queue_jobs')
@@ -0,0 +1,46 @@
+"""add task_checkpoints table
+
+Revision ID: 5f1c2a7d9e34
+Revises: 43bb59405e2d
+Create Date: 2025-05-08 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5f1c2a7d9e34'
+down_revision: Union[str, Sequence[str], None] = '43bb59405e2d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    connection = op.get_bind()
+    inspector = sa.inspect(connection)
+
+    # 应用启动时 create_all 可能已经创建了该表
+    if 'task_checkpoints' in inspector.get_table_names():
+        return
+
+    op.create_table(
+        'task_checkpoints',
+        sa.Column('id', sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column('task_id', sa.String(22), nullable=False, comment="任务ID"),
+        sa.Column('checkpoint_key', sa.String(100), nullable=False, comment="断点键，如 paragraph:<段落ID>"),
+        sa.Column('input_hash', sa.String(64), nullable=False, comment="生成该结果的输入哈希，输入变化时断点失效"),
+        sa.Column('data', sa.Text(length=4294967295), nullable=True, comment="断点数据JSON"),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.UniqueConstraint('task_id', 'checkpoint_key', name='uq_task_checkpoints_task_key'),
+    )
+    op.create_index('ix_task_checkpoints_task_id', 'task_checkpoints', ['task_id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('task_checkpoints')
@@ -0,0 +1,75 @@
+"""add path column to sub_paragraphs
+
+Revision ID: 7a3e9c41b2d8
+Revises: 5f1c2a7d9e34
+Create Date: 2025-05-12 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import text
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7a3e9c41b2d8'
+down_revision: Union[str, Sequence[str], None] = '5f1c2a7d9e34'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+PATH_SEGMENT_WIDTH = 4
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    connection = op.get_bind()
+    inspector = sa.inspect(connection)
+    columns = [column['name'] for column in inspector.get_columns('sub_paragraphs')]
+    indexes = [index['name'] for index in inspector.get_indexes('sub_paragraphs')]
+
+    if 'path' not in columns:
+        op.add_column('sub_paragraphs', sa.Column(
+            'path', sa.String(255), nullable=True,
+            comment="物化路径，由各级同级序号组成（如 0001.0003），按其排序即为文档顺序"
+        ))
+    if 'idx_sub_paragraphs_outline_path' not in indexes:
+        op.create_index('idx_sub_paragraphs_outline_path', 'sub_paragraphs', ['outline_id', 'path'])
+
+    # 回填现有段落的路径：同级段落按 sort_index（没有时按ID）排序
+    rows = connection.execute(
+        text("SELECT id, outline_id, parent_id, sort_index FROM sub_paragraphs WHERE path IS NULL")
+    ).fetchall()
+    if not rows:
+        return
+    outline_ids = {row.outline_id for row in rows}
+    all_rows = connection.execute(
+        text("SELECT id, outline_id, parent_id, sort_index FROM sub_paragraphs WHERE outline_id IN :outline_ids")
+        .bindparams(sa.bindparam('outline_ids', expanding=True)),
+        {"outline_ids": list(outline_ids)}
+    ).fetchall()
+
+    children_of = {}
+    for row in all_rows:
+        children_of.setdefault((row.outline_id, row.parent_id), []).append(row)
+    for siblings in children_of.values():
+        siblings.sort(key=lambda r: (r.sort_index if r.sort_index is not None else r.id, r.id))
+
+    updates = []
+    for outline_id in outline_ids:
+        stack = [(row, f"{i:0{PATH_SEGMENT_WIDTH}d}") for i, row in enumerate(children_of.get((outline_id, None), []))]
+        while stack:
+            row, path = stack.pop()
+            updates.append({"id": row.id, "path": path})
+            stack.extend(
+                (child, f"{path}.{i:0{PATH_SEGMENT_WIDTH}d}")
+                for i, child in enumerate(children_of.get((outline_id, row.id), []))
+            )
+    if updates:
+        connection.execute(text("UPDATE sub_paragraphs SET path = :path WHERE id = :id"), updates)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_sub_paragraphs_outline_path', table_name='sub_paragraphs')
+    op.drop_column('sub_paragraphs', 'path')
@@ -0,0 +1,45 @@
+"""add completion_cache_entries table
+
+Revision ID: 8c5d2f0e6a17
+Revises: 7a3e9c41b2d8
+Create Date: 2025-05-14 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c5d2f0e6a17'
+down_revision: Union[str, Sequence[str], None] = '7a3e9c41b2d8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    connection = op.get_bind()
+    inspector = sa.inspect(connection)
+
+    # 应用启动时 create_all 可能已经创建了该表
+    if 'completion_cache_entries' in inspector.get_table_names():
+        return
+
+    op.create_table(
+        'completion_cache_entries',
+        sa.Column('cache_key', sa.String(64), primary_key=True, comment="缓存键，sha256"),
+        sa.Column('action', sa.String(50), nullable=False, server_default='', comment="操作类型"),
+        sa.Column('model', sa.String(100), nullable=False, server_default='', comment="模型"),
+        sa.Column('content', sa.Text(length=4294967295), nullable=False, comment="生成内容"),
+        sa.Column('finish_reason', sa.String(20), nullable=True, comment="结束原因"),
+        sa.Column('expires_at', sa.DateTime(), nullable=False, comment="过期时间"),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+    )
+    op.create_index('idx_completion_cache_entries_expires_at', 'completion_cache_entries', ['expires_at'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('completion_cache_entries')
@@ -0,0 +1,61 @@
+"""add crawl columns to web_pages
+
+Revision ID: 9d4b7e2a1c58
+Revises: 8c5d2f0e6a17
+Create Date: 2025-05-15 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+import hashlib
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import text
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9d4b7e2a1c58'
+down_revision: Union[str, Sequence[str], None] = '8c5d2f0e6a17'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    connection = op.get_bind()
+    inspector = sa.inspect(connection)
+    columns = [column['name'] for column in inspector.get_columns('web_pages')]
+    indexes = [index['name'] for index in inspector.get_indexes('web_pages')]
+
+    if 'url_hash' not in columns:
+        op.add_column('web_pages', sa.Column('url_hash', sa.String(64), nullable=True, comment="URL的sha256"))
+    if 'html_compressed' not in columns:
+        op.add_column('web_pages', sa.Column('html_compressed', sa.LargeBinary(length=4294967295), nullable=True, comment="zlib压缩的HTML内容"))
+    if 'etag' not in columns:
+        op.add_column('web_pages', sa.Column('etag', sa.String(255), nullable=True, comment="响应的ETag，用于条件请求"))
+    if 'last_modified' not in columns:
+        op.add_column('web_pages', sa.Column('last_modified', sa.String(64), nullable=True, comment="响应的Last-Modified，用于条件请求"))
+    if 'fetched_at' not in columns:
+        op.add_column('web_pages', sa.Column('fetched_at', sa.DateTime(), nullable=True, comment="最近一次抓取时间"))
+    if 'ix_web_pages_url_hash' not in indexes:
+        op.create_index('ix_web_pages_url_hash', 'web_pages', ['url_hash'])
+
+    # 回填现有网页的URL哈希，旧的 html_content 保持不变，读取时兼容
+    rows = connection.execute(
+        text("SELECT id, url FROM web_pages WHERE url_hash IS NULL AND url IS NOT NULL")
+    ).fetchall()
+    if rows:
+        connection.execute(
+            text("UPDATE web_pages SET url_hash = :url_hash WHERE id = :id"),
+            [{"id": row.id, "url_hash": hashlib.sha256(row.url.encode("utf-8")).hexdigest()} for row in rows]
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_web_pages_url_hash', table_name='web_pages')
+    op.drop_column('web_pages', 'fetched_at')
+    op.drop_column('web_pages', 'last_modified')
+    op.drop_column('web_pages', 'etag')
+    op.drop_column('web_pages', 'html_compressed')
+    op.drop_column('web_pages', 'url_hash')
@@ -0,0 +1,73 @@
+"""add user_id, doc_id and outline_id columns to tasks
+
+Revision ID: a2e8f5c1d3b6
+Revises: 9d4b7e2a1c58
+Create Date: 2025-05-16 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+import json
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import text
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a2e8f5c1d3b6'
+down_revision: Union[str, Sequence[str], None] = '9d4b7e2a1c58'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BACKFILL_BATCH_SIZE = 1000
+PROMOTED_COLUMNS = ('user_id', 'doc_id', 'outline_id')
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    connection = op.get_bind()
+    inspector = sa.inspect(connection)
+    columns = [column['name'] for column in inspector.get_columns('tasks')]
+    indexes = [index['name'] for index in inspector.get_indexes('tasks')]
+
+    comments = {'user_id': "用户ID", 'doc_id': "文档ID", 'outline_id': "大纲ID"}
+    for name in PROMOTED_COLUMNS:
+        if name not in columns:
+            op.add_column('tasks', sa.Column(name, sa.String(100), nullable=True, comment=comments[name]))
+        if f'ix_tasks_{name}' not in indexes:
+            op.create_index(f'ix_tasks_{name}', 'tasks', [name])
+
+    # 从 params 回填，按主键分批处理
+    last_id = ''
+    while True:
+        rows = connection.execute(
+            text("SELECT id, params FROM tasks WHERE id > :last_id ORDER BY id LIMIT :limit"),
+            {"last_id": last_id, "limit": BACKFILL_BATCH_SIZE}
+        ).fetchall()
+        if not rows:
+            break
+        last_id = rows[-1].id
+
+        updates = []
+        for row in rows:
+            try:
+                params = json.loads(row.params) if row.params else {}
+            except ValueError:
+                continue
+            if not isinstance(params, dict):
+                continue
+            values = {name: params.get(name) for name in PROMOTED_COLUMNS}
+            if any(values.values()):
+                updates.append({"id": row.id, **{name: str(value) if value else None for name, value in values.items()}})
+        if updates:
+            connection.execute(
+                text("UPDATE tasks SET user_id = :user_id, doc_id = :doc_id, outline_id = :outline_id WHERE id = :id"),
+                updates
+            )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for name in PROMOTED_COLUMNS:
+        op.drop_index(f'ix_tasks_{name}', table_name='tasks')
+        op.drop_column('tasks', name)
@@ -0,0 +1,50 @@
+"""add composite indexes for chat, task, rag and web page queries
+
+Revision ID: b7c3d9e4f1a2
+Revises: a2e8f5c1d3b6
+Create Date: 2025-05-17 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7c3d9e4f1a2'
+down_revision: Union[str, Sequence[str], None] = 'a2e8f5c1d3b6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (表名, 索引名, 列)，与模型中的 __table_args__ 保持一致
+INDEXES = [
+    ('chat_sessions', 'idx_chat_sessions_user_type_deleted_updated', ['user_id', 'session_type', 'is_deleted', 'updated_at']),
+    ('chat_messages', 'idx_chat_messages_session_deleted_id', ['session_id', 'is_deleted', 'id']),
+    ('chat_messages', 'idx_chat_messages_session_role_deleted_id', ['session_id', 'role', 'is_deleted', 'id']),
+    ('tasks', 'idx_tasks_session_status', ['session_id', 'status']),
+    ('tasks', 'idx_tasks_status_type', ['status', 'type']),
+    ('rag_files', 'idx_rag_files_status', ['status']),
+    ('rag_files', 'idx_rag_files_hash_type_deleted', ['hash', 'kb_type', 'is_deleted']),
+    ('rag_files', 'idx_rag_files_kb_file_deleted', ['kb_file_id', 'is_deleted']),
+    ('rag_files', 'idx_rag_files_kb_deleted_id', ['kb_id', 'is_deleted', 'id']),
+    ('web_pages', 'idx_web_pages_user_status_deleted', ['user_id', 'status', 'is_deleted']),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    connection = op.get_bind()
+    inspector = sa.inspect(connection)
+    existing = {}
+    for table, name, columns in INDEXES:
+        if table not in existing:
+            existing[table] = {index['name'] for index in inspector.get_indexes(table)}
+        if name not in existing[table]:
+            op.create_index(name, table, columns)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table, name, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
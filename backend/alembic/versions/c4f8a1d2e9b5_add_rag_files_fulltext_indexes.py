@@ -0,0 +1,48 @@
+"""add ngram fulltext indexes on rag_files file_name and content
+
+Revision ID: c4f8a1d2e9b5
+Revises: b7c3d9e4f1a2
+Create Date: 2025-05-20 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4f8a1d2e9b5'
+down_revision: Union[str, Sequence[str], None] = 'b7c3d9e4f1a2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (索引名, 列)，与模型中的 __table_args__ 保持一致
+INDEXES = [
+    ('ft_rag_files_name', ['file_name']),
+    ('ft_rag_files_name_content', ['file_name', 'content']),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    connection = op.get_bind()
+    # 全文索引只在 MySQL 上创建，其他数据库搜索退化为 LIKE
+    if connection.dialect.name != 'mysql':
+        return
+    existing = {index['name'] for index in sa.inspect(connection).get_indexes('rag_files')}
+    for name, columns in INDEXES:
+        if name not in existing:
+            # content 为解析出的全文，大表上建索引耗时较长，建议在低峰期执行
+            op.create_index(name, 'rag_files', columns, mysql_prefix='FULLTEXT', mysql_with_parser='ngram')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    connection = op.get_bind()
+    if connection.dialect.name != 'mysql':
+        return
+    existing = {index['name'] for index in sa.inspect(connection).get_indexes('rag_files')}
+    for name, _ in reversed(INDEXES):
+        if name in existing:
+            op.drop_index(name, table_name='rag_files')
@@ -0,0 +1,32 @@
+"""add profile column to tasks
+
+Revision ID: d2a7e6b3c8f4
+Revises: c4f8a1d2e9b5
+Create Date: 2025-05-22 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd2a7e6b3c8f4'
+down_revision: Union[str, Sequence[str], None] = 'c4f8a1d2e9b5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    columns = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('tasks')}
+    if 'profile' not in columns:
+        op.add_column('tasks', sa.Column('profile', sa.Text(length=16777215), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    columns = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('tasks')}
+    if 'profile' in columns:
+        op.drop_column('tasks', 'profile')
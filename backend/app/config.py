@@ -72,6 +72,12 @@ class Settings(BaseSettings):
     LLM_REQUEST_TIMEOUT: float = yaml_config.get("request_timeout", 300.0)
     LLM_CHAT_MAX_TOKENS: int = yaml_config.get("chat_max_tokens", 200)
     LLM_COMPLETION_DOC_MAX_LENGTH: int = yaml_config.get("completion_doc_max_length", 10000)
+    # /completions 引用文件和网页内容的总长度上限，按引用数量平分，在数据库中截取
+    LLM_COMPLETION_FILE_MAX_LENGTH: int = yaml_config.get("completion_file_max_length", 10000)
+    # 进程内同一模型同时进行的调用数上限，模型配置中的 max_concurrency 优先
+    LLM_MAX_CONCURRENCY: int = yaml_config.get("llm_max_concurrency", 8)
+    # 提示词模板缓存检查数据库版本号的间隔（秒），多实例修改模板后最多延迟该时间生效
+    PROMPT_REGISTRY_CHECK_INTERVAL: float = yaml_config.get("prompt_registry_check_interval", 5.0)
     # 向后兼容的默认模型配置
     LLM_BASE_URL: str = LLM_MODELS[0]["base_url"]
     LLM_MODEL: str = LLM_MODELS[0]["model"]
@@ -108,6 +114,8 @@ class Settings(BaseSettings):
     RAG_CHAT_PRODUCT_SOURCE: str = yaml_config.get("rag", {}).get("chat_product_source", "saas")
     RAG_CHAT_RERANK: bool = yaml_config.get("rag", {}).get("chat_rerank", False)
     RAG_CHAT_ONLY_NEED_SEARCH_RESULTS: bool = yaml_config.get("rag", {}).get("chat_only_need_search_results", False)
+    # 知识库文件搜索使用 MySQL ngram 全文索引，须与服务端 ngram_token_size 一致，更短的关键词退化为 LIKE
+    RAG_SEARCH_NGRAM_TOKEN_SIZE: int = yaml_config.get("rag", {}).get("search_ngram_token_size", 2)
     RAG_CHAT_HYBRID_SEARCH: bool = yaml_config.get("rag", {}).get("chat_hybrid_search", False)
     RAG_CHAT_API_CONTEXT_LENGTH: int = yaml_config.get("rag", {}).get("chat_api_context_length", 4096)
     RAG_CHAT_CHUNK_SIZE: int = yaml_config.get("rag", {}).get("chat_chunk_size", 800)
@@ -120,6 +128,96 @@ class Settings(BaseSettings):
     WRITING_PER_PAGE_WORD_COUNT: int = yaml_config.get("writing", {}).get("per_page_word_count", 800)
     # 大模型每次生成字数限制
     WRITING_MAX_WORD_COUNT_PER_GENERATION: int = yaml_config.get("writing", {}).get("max_word_count_per_generation", 5000)
+    # 写作任务调度：全局并发数、单用户并发数、队列长度
+    WRITING_TASK_MAX_WORKERS: int = yaml_config.get("writing", {}).get("task_max_workers", 8)
+    WRITING_TASK_PER_USER_MAX_RUNNING: int = yaml_config.get("writing", {}).get("task_per_user_max_running", 2)
+    WRITING_TASK_MAX_QUEUE_SIZE: int = yaml_config.get("writing", {}).get("task_max_queue_size", 100)
+    WRITING_TASK_PER_USER_MAX_QUEUED: int = yaml_config.get("writing", {}).get("task_per_user_max_queued", 5)
+    # 段落生成提示词的输入token预算，模型配置中的 max_input_tokens 优先
+    WRITING_PROMPT_MAX_INPUT_TOKENS: int = yaml_config.get("writing", {}).get("prompt_max_input_tokens", 6000)
+    # 全文生成时参考资料切分为片段，每个段落检索的片段数和片段长度（字符）
+    WRITING_RAG_TOP_K: int = yaml_config.get("writing", {}).get("rag_top_k", 8)
+    WRITING_RAG_CHUNK_SIZE: int = yaml_config.get("writing", {}).get("rag_chunk_size", 400)
+    # 生成段落与已生成段落的字符n-gram相似度（MinHash估计的Jaccard）超过该阈值时重新生成
+    WRITING_DUPLICATE_THRESHOLD: float = yaml_config.get("writing", {}).get("duplicate_threshold", 0.6)
+    # 段落使用流式生成，token实时推送到文档流
+    WRITING_STREAM_PARAGRAPHS: bool = yaml_config.get("writing", {}).get("stream_paragraphs", True)
+    # 大纲子章节扩展的共享线程数（所有任务共用），实际调用并发受 LLM_MAX_CONCURRENCY 限制
+    WRITING_OUTLINE_EXPANSION_WORKERS: int = yaml_config.get("writing", {}).get("outline_expansion_workers", 16)
+    # 大纲详情缓存的大纲数，为 0 时不缓存
+    WRITING_OUTLINE_CACHE_SIZE: int = yaml_config.get("writing", {}).get("outline_cache_size", 256)
+    # 写作任务各阶段耗时（/writing/tasks/{task_id}/profile），每个任务最多记录的阶段数，为 0 时不记录
+    WRITING_PROFILE_MAX_SPANS: int = yaml_config.get("writing", {}).get("profile_max_spans", 2000)
+
+    # 持久化任务队列配置：local 为进程内调度，mysql/redis 为持久化队列，支持多个工作进程领取
+    TASK_QUEUE_BACKEND: str = yaml_config.get("task_queue", {}).get("backend", "local")
+    TASK_QUEUE_REDIS_URL: str = yaml_config.get("task_queue", {}).get("redis_url", "redis://localhost:6379/0")
+    TASK_QUEUE_REDIS_PREFIX: str = yaml_config.get("task_queue", {}).get("redis_prefix", "writing-assistant:task-queue")
+    # 租约时长（秒），工作进程崩溃后任务在租约过期后被重新领取
+    TASK_QUEUE_LEASE_SECONDS: int = yaml_config.get("task_queue", {}).get("lease_seconds", 120)
+    # 最大尝试次数，超出后进入死信
+    TASK_QUEUE_MAX_ATTEMPTS: int = yaml_config.get("task_queue", {}).get("max_attempts", 3)
+    # 重试退避基数（秒），按 2 的指数增长
+    TASK_QUEUE_RETRY_BACKOFF: float = yaml_config.get("task_queue", {}).get("retry_backoff", 30.0)
+    TASK_QUEUE_POLL_INTERVAL: float = yaml_config.get("task_queue", {}).get("poll_interval", 2.0)
+    # 是否在API进程内启动工作线程，关闭后需要单独运行 python -m app.worker
+    TASK_QUEUE_EMBEDDED_WORKER: bool = yaml_config.get("task_queue", {}).get("embedded_worker", True)
+
+    # /completions 响应缓存（默认关闭）：相同模型、提示词、温度和最大token数的请求直接返回缓存结果
+    COMPLETION_CACHE_ENABLED: bool = yaml_config.get("completion_cache", {}).get("enabled", False)
+    # 参与缓存的操作类型，chat 等依赖上下文的对话默认不缓存
+    COMPLETION_CACHE_ACTIONS: list = yaml_config.get("completion_cache", {}).get("actions", ["extension", "abridge", "continuation", "rewrite", "overall"])
+    COMPLETION_CACHE_MEMORY_SIZE: int = yaml_config.get("completion_cache", {}).get("memory_size", 1024)
+    COMPLETION_CACHE_TTL: int = yaml_config.get("completion_cache", {}).get("ttl", 86400)
+    # 持久层：mysql 为 completion_cache_entries 表，disk 为本地目录，none 为只使用内存
+    COMPLETION_CACHE_STORE: str = yaml_config.get("completion_cache", {}).get("store", "mysql")
+    COMPLETION_CACHE_DISK_DIR: str = yaml_config.get("completion_cache", {}).get("disk_dir", "./data/completion_cache")
+
+    # Web搜索：共享连接池，搜索和网页抓取均有超时，结果按查询缓存
+    WEB_SEARCH_TIMEOUT: float = yaml_config.get("web_search", {}).get("timeout", 10)
+    WEB_SEARCH_FETCH_TIMEOUT: float = yaml_config.get("web_search", {}).get("fetch_timeout", 8)
+    WEB_SEARCH_MAX_CONNECTIONS: int = yaml_config.get("web_search", {}).get("max_connections", 32)
+    WEB_SEARCH_MAX_BODY_BYTES: int = yaml_config.get("web_search", {}).get("max_body_bytes", 2 * 1024 * 1024)
+    WEB_SEARCH_CACHE_TTL: int = yaml_config.get("web_search", {}).get("cache_ttl", 3600)
+    WEB_SEARCH_CACHE_SIZE: int = yaml_config.get("web_search", {}).get("cache_size", 512)
+
+    # 网页抓取（/urls）：共享连接池，限制单个站点的并发数，已抓取的网页用条件请求刷新
+    CRAWLER_MAX_CONNECTIONS: int = yaml_config.get("crawler", {}).get("max_connections", 64)
+    CRAWLER_PER_HOST_LIMIT: int = yaml_config.get("crawler", {}).get("per_host_limit", 4)
+    CRAWLER_TIMEOUT: float = yaml_config.get("crawler", {}).get("timeout", 15)
+    CRAWLER_MAX_BODY_BYTES: int = yaml_config.get("crawler", {}).get("max_body_bytes", 5 * 1024 * 1024)
+    CRAWLER_BATCH_MAX_URLS: int = yaml_config.get("crawler", {}).get("batch_max_urls", 50)
+
+    # 日志：业务线程只入队，后台线程格式化并写入控制台和文件
+    LOG_LEVEL: str = yaml_config.get("logging", {}).get("level", "INFO")
+    LOG_FILE: str = yaml_config.get("logging", {}).get("file", "app.log")
+    # text: 单行文本加字段JSON; json: 一行一个JSON对象
+    LOG_CONSOLE_FORMAT: str = yaml_config.get("logging", {}).get("console_format", "text")
+    LOG_FILE_FORMAT: str = yaml_config.get("logging", {}).get("file_format", "json")
+    # 队列满时丢弃日志，不阻塞业务线程
+    LOG_QUEUE_SIZE: int = yaml_config.get("logging", {}).get("queue_size", 10000)
+    LOG_MAX_MESSAGE_LENGTH: int = yaml_config.get("logging", {}).get("max_message_length", 4000)
+    LOG_MAX_FIELD_LENGTH: int = yaml_config.get("logging", {}).get("max_field_length", 2000)
+    # 按 logger 名称配置 INFO 及以下级别的保留比例，如 {"app.rag_api_async": 0.1}
+    LOG_SAMPLE_RATES: dict = yaml_config.get("logging", {}).get("sample_rates", {}) or {}
+    LOG_REDACT_KEYS: list = yaml_config.get("logging", {}).get("redact_keys", ["api_key", "password", "token", "secret", "authorization"])
+
+    # 列表接口的游标分页：游标模式下总数为近似值，按查询条件缓存，为 0 时每次都重新统计
+    PAGINATION_COUNT_CACHE_TTL: int = yaml_config.get("pagination", {}).get("count_cache_ttl", 60)
+    PAGINATION_COUNT_CACHE_SIZE: int = yaml_config.get("pagination", {}).get("count_cache_size", 4096)
+
+    # Prometheus 指标：/metrics 接口，配置 token 后须携带 Authorization: Bearer <token>
+    METRICS_ENABLED: bool = yaml_config.get("metrics", {}).get("enabled", True)
+    METRICS_TOKEN: str = yaml_config.get("metrics", {}).get("token", "")
+
+    # 请求耗时：Server-Timing 响应头，超过阈值的请求记入慢请求缓冲区（/api/v1/admin/slow-requests）
+    REQUEST_TIMING_ENABLED: bool = yaml_config.get("request_timing", {}).get("enabled", True)
+    REQUEST_TIMING_SERVER_TIMING_HEADER: bool = yaml_config.get("request_timing", {}).get("server_timing_header", True)
+    REQUEST_TIMING_SLOW_THRESHOLD_MS: int = yaml_config.get("request_timing", {}).get("slow_threshold_ms", 1000)
+    REQUEST_TIMING_SLOW_BUFFER_SIZE: int = yaml_config.get("request_timing", {}).get("slow_buffer_size", 200)
+    # 抽样请求的调用栈采样，为 0 时不采样
+    REQUEST_TIMING_PROFILE_SAMPLE_RATE: float = yaml_config.get("request_timing", {}).get("profile_sample_rate", 0.0)
+    REQUEST_TIMING_PROFILE_INTERVAL_MS: int = yaml_config.get("request_timing", {}).get("profile_interval_ms", 5)
     class Config:
         case_sensitive = True
         env_file = ".env"
@@ -1,8 +1,10 @@
 from sqlalchemy import create_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from app.config import settings
+from app.metrics import instrument_engine, timed_pool_class
 from contextlib import asynccontextmanager
 import logging
 
@@ -18,7 +20,9 @@ sync_engine = create_engine(
     max_overflow=settings.MYSQL_MAX_OVERFLOW,
     pool_pre_ping=settings.MYSQL_POOL_PRE_PING,
     pool_recycle=settings.MYSQL_POOL_RECYCLE,
+    poolclass=timed_pool_class(QueuePool, "sync"),
 )
+instrument_engine(sync_engine, "sync")
 
 # 创建同步会话
 sync_session = sessionmaker(autocommit=False, autoflush=False, bind=sync_engine)
@@ -40,7 +44,9 @@ async_engine = create_async_engine(
     echo=False,
     pool_pre_ping=True,
     pool_recycle=3600,
+    poolclass=timed_pool_class(AsyncAdaptedQueuePool, "async"),
 )
+instrument_engine(async_engine.sync_engine, "async")
 
 # 创建异步会话
 async_session = sessionmaker(
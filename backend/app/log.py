@@ -0,0 +1,262 @@
+"""
+日志管道
+
+业务线程只把日志记录放入有界队列（QueueHandler），由后台 QueueListener 线程格式化并写入控制台和文件，
+请求线程不再承担磁盘 I/O 和大段内容的序列化。
+
+- 结构化字段：logger.info("消息", extra={"fields": {...}})，字段在后台线程序列化，文件默认输出 JSON 行
+- 长度限制：消息和字段中的字符串按 logging.max_message_length / max_field_length 截断，列表和字典只保留前若干项
+- 脱敏：字段名命中 logging.redact_keys 的值、消息中的 api_key=xxx / "api_key": "xxx" / sk-xxx 被替换为 ***
+- 采样：logging.sample_rates 按 logger 名称（含子 logger）配置 INFO 及以下级别的保留比例，WARNING 及以上全部保留
+- 队列满时丢弃并计数（dropped_count），不阻塞业务线程
+"""
+import atexit
+import json
+import logging
+import queue
+import random
+import re
+import sys
+import threading
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, List, Optional
+
+from app.config import settings
+from app.metrics import registry
+
+# 结构化字段放在 extra={"fields": {...}} 中
+FIELDS_ATTR = "fields"
+# 列表、字典最多保留的项数
+MAX_ITEMS = 20
+# 一条日志所有字段中字符串的总字符数上限（相对 max_field_length 的倍数）
+FIELDS_BUDGET_FACTOR = 4
+SHORT_STRING_LENGTH = 64
+REDACTED = "***"
+
+_SECRET_PATTERNS = [
+    re.compile(r'(?P<key>["\']?(?:api_key|apikey|password|token|secret|authorization)["\']?\s*[:=]\s*["\']?)(?P<value>[^"\',\s}]+)', re.IGNORECASE),
+    re.compile(r'(?P<key>)(?P<value>sk-[A-Za-z0-9_\-]{12,})'),
+]
+
+_listener: Optional[QueueListener] = None
+_queue_handler: Optional["NonBlockingQueueHandler"] = None
+_lock = threading.Lock()
+
+
+def truncate(text: str, max_length: int) -> str:
+    if max_length <= 0 or len(text) <= max_length:
+        return text
+    return f"{text[:max_length]}...(共{len(text)}字符)"
+
+
+def redact_text(text: str) -> str:
+    for pattern in _SECRET_PATTERNS:
+        text = pattern.sub(lambda m: f"{m.group('key')}{REDACTED}", text)
+    return text
+
+
+def limit_value(value: Any, max_length: int, redact_keys: frozenset, budget: List[int], depth: int = 0) -> Any:
+    """
+    截断字符串、裁剪容器并脱敏，返回可以直接 JSON 序列化的值
+
+    budget 为剩余的总字符数，所有字符串共用，用完后的长字符串只保留长度
+    """
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if depth >= 4 or not isinstance(value, (str, dict, list, tuple, set)):
+        value = str(value)
+    if isinstance(value, str):
+        # 短字符串（角色、ID等）不受总量限制
+        if budget[0] <= 0 and len(value) > SHORT_STRING_LENGTH:
+            return f"...(共{len(value)}字符)"
+        value = truncate(value, min(max_length, max(budget[0], SHORT_STRING_LENGTH)))
+        budget[0] -= len(value)
+        return redact_text(value)
+    if isinstance(value, dict):
+        limited = {}
+        for i, (key, item) in enumerate(value.items()):
+            if i >= MAX_ITEMS:
+                limited["..."] = f"共{len(value)}项"
+                break
+            key = str(key)
+            limited[key] = REDACTED if key.lower() in redact_keys else limit_value(item, max_length, redact_keys, budget, depth + 1)
+        return limited
+    items = list(value)
+    limited = [limit_value(item, max_length, redact_keys, budget, depth + 1) for item in items[:MAX_ITEMS]]
+    if len(items) > MAX_ITEMS:
+        limited.append(f"...(共{len(items)}项)")
+    return limited
+
+
+class StructuredFormatter(logging.Formatter):
+    """在后台线程中格式化：text 为 “时间 - logger - 级别 - 消息 | 字段JSON”，json 为一行一个 JSON 对象"""
+
+    def __init__(self, fmt_type: str = "text"):
+        super().__init__('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        self.fmt_type = fmt_type
+        self.max_message_length = settings.LOG_MAX_MESSAGE_LENGTH
+        self.max_field_length = settings.LOG_MAX_FIELD_LENGTH
+        self.redact_keys = frozenset(key.lower() for key in settings.LOG_REDACT_KEYS)
+
+    def _fields(self, record: logging.LogRecord) -> Optional[Dict[str, Any]]:
+        fields = getattr(record, FIELDS_ATTR, None)
+        if not fields:
+            return None
+        try:
+            budget = [self.max_field_length * FIELDS_BUDGET_FACTOR]
+            return limit_value(dict(fields), self.max_field_length, self.redact_keys, budget)
+        except Exception as e:
+            # 字段在记录后被其他线程修改等情况，不影响日志本身
+            return {"fields_error": f"{type(e).__name__}: {e}"}
+
+    def format(self, record: logging.LogRecord) -> str:
+        message = redact_text(truncate(record.getMessage(), self.max_message_length))
+        fields = self._fields(record)
+        if self.fmt_type == "json":
+            data = {
+                "time": self.formatTime(record),
+                "logger": record.name,
+                "level": record.levelname,
+                "message": message,
+                "thread": record.threadName,
+            }
+            if fields:
+                data["fields"] = fields
+            if record.exc_text:
+                data["exc"] = record.exc_text
+            return json.dumps(data, ensure_ascii=False, default=str)
+
+        record.message = message
+        record.asctime = self.formatTime(record)
+        text = self.formatMessage(record)
+        if fields:
+            text = f"{text} | {json.dumps(fields, ensure_ascii=False, default=str)}"
+        if record.exc_text:
+            text = f"{text}\n{record.exc_text}"
+        return text
+
+
+class SamplingFilter(logging.Filter):
+    """按 logger 名称采样 INFO 及以下级别的日志，在业务线程中执行，丢弃的记录不入队"""
+
+    def __init__(self, sample_rates: Dict[str, float]):
+        super().__init__()
+        self.sample_rates = {name: float(rate) for name, rate in (sample_rates or {}).items()}
+        self._rates: Dict[str, float] = {}
+
+    def _rate(self, name: str) -> float:
+        rate = self._rates.get(name)
+        if rate is None:
+            rate = 1.0
+            parts = name.split(".")
+            for i in range(len(parts), 0, -1):
+                prefix = ".".join(parts[:i])
+                if prefix in self.sample_rates:
+                    rate = self.sample_rates[prefix]
+                    break
+            self._rates[name] = rate
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not self.sample_rates:
+            return True
+        rate = self._rate(record.name)
+        return rate >= 1.0 or random.random() < rate
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """入队前只做消息拼接，队列满时丢弃并计数"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped_count = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 不调用格式化器：结构化字段留给后台线程处理，只在这里固定消息和异常堆栈
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped_count += 1
+
+
+def setup_logging() -> None:
+    """配置根、app 和 FastAPI 日志器，重复调用时替换之前的管道"""
+    global _listener, _queue_handler
+    from fastapi.logger import logger as fastapi_logger
+
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+
+        level = logging.getLevelName(str(settings.LOG_LEVEL).upper())
+        if not isinstance(level, int):
+            level = logging.INFO
+
+        # 控制台处理器
+        console_handler = logging.StreamHandler(sys.stdout)
+        console_handler.setFormatter(StructuredFormatter(settings.LOG_CONSOLE_FORMAT))
+        handlers = [console_handler]
+        # 文件处理器
+        if settings.LOG_FILE:
+            file_handler = logging.FileHandler(settings.LOG_FILE, encoding='utf-8')
+            file_handler.setFormatter(StructuredFormatter(settings.LOG_FILE_FORMAT))
+            handlers.append(file_handler)
+
+        log_queue = queue.Queue(maxsize=max(settings.LOG_QUEUE_SIZE, 0))
+        _queue_handler = NonBlockingQueueHandler(log_queue)
+        _queue_handler.addFilter(SamplingFilter(settings.LOG_SAMPLE_RATES))
+        _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+
+        # 根日志器、FastAPI 日志器和应用日志器都只挂队列处理器
+        root_logger = logging.getLogger()
+        root_logger.setLevel(level)
+        root_logger.handlers.clear()
+        root_logger.addHandler(_queue_handler)
+
+        fastapi_logger.setLevel(level)
+        fastapi_logger.handlers.clear()
+        fastapi_logger.addHandler(_queue_handler)
+        fastapi_logger.propagate = False
+
+        app_logger = logging.getLogger('app')
+        app_logger.setLevel(level)
+        # 防止日志传递到父日志器
+        app_logger.propagate = False
+        app_logger.handlers.clear()
+        app_logger.addHandler(_queue_handler)
+
+
+def stop_logging() -> None:
+    """停止后台线程，写出队列中剩余的日志"""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+def dropped_count() -> int:
+    """队列满被丢弃的日志条数"""
+    return _queue_handler.dropped_count if _queue_handler else 0
+
+
+@registry.register_collector
+def collect_logging():
+    return [("log_records_dropped_total", "counter", "日志队列满被丢弃的记录数", [({}, dropped_count())])]
+
+
+atexit.register(stop_logging)
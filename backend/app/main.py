@@ -1,67 +1,29 @@
 import logging
-import sys
 import threading
 import uvicorn
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
-from app.routers.v1 import api, auth, users, prompt, document, rag, writing
+from app.routers.v1 import api, auth, users, prompt, document, rag, writing, metrics, admin
 from fastapi.openapi.utils import get_openapi
 from app.config import settings
 from app.database import get_db, sync_engine, Base
 from app.rag.process import rag_worker
 from app.rag.kb import ensure_knowledge_bases
-from app.routers.v1.writing import refresh_writing_tasks_status
-from fastapi.logger import logger as fastapi_logger
+from app.routers.v1.writing import refresh_writing_tasks_status, start_writing_task_worker
+from app.log import setup_logging
+from app.request_timing import RequestTimingMiddleware, instrument_routes
 
 # Architectural hinge:
 # This entrypoint stitches together configuration, API routers, and background workers:
 #   - `lifespan` initializes DB state, knowledge bases, and the `rag_worker`, so writing endpoints can assume KB metadata exists.
 #   - Router wiring here mirrors the separation documented in ARCHITECTURE.md (auth/users/document/writing/rag) and keeps their cross-calls explicit.
-#   - `refresh_writing_tasks_status` bridges persisted `Task` rows with the thread-pool used in `app/routers/v1/writing.py`, ensuring restarts do not orphan UI-visible jobs.
+#   - `refresh_writing_tasks_status` bridges persisted `Task` rows with the in-process scheduler used in `app/routers/v1/writing.py`, ensuring restarts do not orphan UI-visible jobs;
+#     with a durable task queue enabled, `start_writing_task_worker` claims jobs by lease instead and `python -m app.worker` scales workers out.
 
 logger = logging.getLogger("app")
 
-def setup_logging():
-    # 创建格式化器
-    formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-    )
-    
-    # 控制台处理器
-    console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setFormatter(formatter)
-    
-    # 文件处理器
-    file_handler = logging.FileHandler('app.log', encoding='utf-8')
-    file_handler.setFormatter(formatter)
-    
-    # 配置根日志器
-    root_logger = logging.getLogger()
-    root_logger.setLevel(logging.INFO)
-    # 清除已有的处理器
-    root_logger.handlers.clear()
-    root_logger.addHandler(console_handler)
-    root_logger.addHandler(file_handler)
-    
-    # 配置FastAPI日志器
-    fastapi_logger.setLevel(logging.INFO)
-    # 清除已有的处理器
-    fastapi_logger.handlers.clear()
-    fastapi_logger.addHandler(console_handler)
-    fastapi_logger.addHandler(file_handler)
-    
-    # 配置应用日志器
-    app_logger = logging.getLogger('app')
-    app_logger.setLevel(logging.INFO)
-    # 防止日志传递到父日志器
-    app_logger.propagate = False
-    # 清除已有的处理器
-    app_logger.handlers.clear()
-    app_logger.addHandler(console_handler)
-    app_logger.addHandler(file_handler)
-
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """应用生命周期事件处理"""
@@ -91,10 +53,20 @@ async def lifespan(app: FastAPI):
         logger.info("未完成的写作任务恢复检查完成")
     except Exception as e:
         logger.error(f"恢复写作任务失败: {str(e)}")
+
+    # 启用持久化任务队列时，在当前进程内启动工作线程
+    writing_worker = None
+    if settings.TASK_QUEUE_EMBEDDED_WORKER:
+        try:
+            writing_worker = start_writing_task_worker()
+        except Exception as e:
+            logger.error(f"启动写作任务工作线程失败: {str(e)}")
     
     yield
     
     logger.info("应用正在关闭...")
+    if writing_worker:
+        writing_worker.stop(timeout=5)
 
 # 创建所有表
 def create_tables():
@@ -153,6 +125,14 @@ app.include_router(prompt.router, prefix="/api/v1", tags=["prompt"])
 app.include_router(document.router, prefix="/api/v1", tags=["document"])
 app.include_router(rag.router, prefix="/api/v1/rag", tags=["rag"])
 app.include_router(writing.router, prefix="/api/v1/writing", tags=["writing"])
+app.include_router(admin.router, prefix="/api/v1", tags=["admin"])
+if settings.METRICS_ENABLED:
+    app.include_router(metrics.router, tags=["metrics"])
+
+# 请求耗时，须在注册路由之后包装路由函数，并作为最外层中间件最后注册
+if settings.REQUEST_TIMING_ENABLED:
+    instrument_routes(app)
+    app.add_middleware(RequestTimingMiddleware)
 
 @app.get("/")
 async def root():
@@ -0,0 +1,386 @@
+"""
+进程内指标
+
+提供计数器、直方图、仪表和采集回调，GET /metrics 以 Prometheus 文本格式输出。
+各模块在自身内部记录指标或注册采集回调，本模块不依赖其他应用模块，可以在任何模块中导入：
+
+- 大模型调用：耗时、首 token 时间、prompt/completion token 数，按模型和调用场景（outline/paragraph/completion/summary）
+- RAG API：耗时和失败次数，按接口
+- 知识库处理队列深度、写作任务执行器的运行/排队数（app/rag/process.py、app/services/task_scheduler.py 注册）
+- 数据库连接池：获取连接的等待时间、连接占用时间、已借出连接数（app/database.py 注册）
+"""
+import contextvars
+import functools
+import logging
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine
+
+from app.request_timing import add_outbound_time
+
+logger = logging.getLogger(__name__)
+
+LabelValues = Tuple[str, ...]
+# 采集回调返回 (指标名, 类型, 说明, [(标签, 值)])
+Sample = Tuple[Dict[str, str], float]
+Collected = Tuple[str, str, str, List[Sample]]
+
+# 秒级耗时的默认分桶
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+# 大模型调用耗时较长，单独分桶
+LLM_LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300, 600)
+TOKEN_BUCKETS = (16, 64, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, Any]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _labels(self, key: LabelValues) -> Dict[str, str]:
+        return dict(zip(self.labelnames, key))
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self._render_samples())
+        return lines
+
+    def _render_samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: Any) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _render_samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self._labels(key))} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(_Metric):
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def set(self, value: float, **labels: Any) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: Any) -> None:
+        self.inc(-amount, **labels)
+
+    def _render_samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self._labels(key))} {_format_value(value)}" for key, value in items]
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 每组标签：[各分桶计数（非累计）..., +Inf 计数], 总和
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+            entry[0][index] += 1
+            entry[1][0] += value
+
+    def snapshot(self, **labels: Any) -> Tuple[int, float]:
+        """(次数, 总和)"""
+        with self._lock:
+            entry = self._values.get(self._key(labels))
+            return (sum(entry[0]), entry[1][0]) if entry else (0, 0.0)
+
+    def _render_samples(self) -> List[str]:
+        with self._lock:
+            items = [(key, list(counts), total[0]) for key, (counts, total) in self._values.items()]
+        lines = []
+        for key, counts, total in items:
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': _format_value(bound)})} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], Iterable[Collected]]] = []
+
+    def _register(self, metric: _Metric) -> Any:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def register_collector(self, collector: Callable[[], Iterable[Collected]]) -> Callable[[], Iterable[Collected]]:
+        """注册采集回调，每次输出指标时调用，适合队列深度、连接池状态等现取的数值"""
+        with self._lock:
+            self._collectors.append(collector)
+        return collector
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        for collector in collectors:
+            try:
+                collected = list(collector())
+            except Exception as e:
+                logger.warning(f"指标采集失败 [{getattr(collector, '__name__', collector)}]: {type(e).__name__}: {e}")
+                continue
+            for name, type_name, documentation, samples in collected:
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {type_name}")
+                lines.extend(f"{name}{_format_labels(labels)} {_format_value(value)}" for labels, value in samples)
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+# ---------------------------------------------------------------------------
+# 大模型调用
+# ---------------------------------------------------------------------------
+
+LLM_REQUEST_SECONDS = registry.histogram(
+    "llm_request_duration_seconds", "大模型调用耗时（不含等待并发名额）", ("model", "call_site", "status"), LLM_LATENCY_BUCKETS
+)
+LLM_FIRST_TOKEN_SECONDS = registry.histogram(
+    "llm_time_to_first_token_seconds", "流式调用的首 token 时间", ("model", "call_site"), LLM_LATENCY_BUCKETS
+)
+LLM_TOKENS = registry.counter(
+    "llm_tokens_total", "大模型 token 数，流式调用的 completion 按数据块数估算", ("model", "call_site", "type")
+)
+LLM_PROMPT_TOKENS = registry.histogram(
+    "llm_prompt_tokens", "单次调用的 prompt token 数", ("model", "call_site"), TOKEN_BUCKETS
+)
+LLM_SLOT_WAIT_SECONDS = registry.histogram(
+    "llm_slot_wait_seconds", "等待进程内大模型并发名额的时间", ("model",), LATENCY_BUCKETS
+)
+
+_llm_call_site: contextvars.ContextVar = contextvars.ContextVar("llm_call_site", default="other")
+
+
+def current_llm_call_site() -> str:
+    return _llm_call_site.get()
+
+
+def llm_call_site(name: str):
+    """
+    标记函数内的大模型调用场景，用作装饰器
+
+    线程池中执行的函数不继承提交方的上下文，需要单独标记
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            token = _llm_call_site.set(name)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _llm_call_site.reset(token)
+        return wrapper
+    return decorator
+
+
+class LLMCallTimer:
+    """
+    记录一次大模型调用
+
+        timer = LLMCallTimer(model)
+        ... timer.first_token() ...
+        timer.finish(prompt_tokens, completion_tokens)
+    """
+
+    def __init__(self, model: str, call_site: Optional[str] = None):
+        self.model = model or ""
+        self.call_site = call_site or current_llm_call_site()
+        self.start = time.perf_counter()
+        self._first_token = False
+        self._finished = False
+
+    def first_token(self) -> None:
+        if not self._first_token:
+            self._first_token = True
+            LLM_FIRST_TOKEN_SECONDS.observe(time.perf_counter() - self.start, model=self.model, call_site=self.call_site)
+
+    def finish(self, prompt_tokens: Optional[int] = None, completion_tokens: Optional[int] = None, status: str = "ok") -> None:
+        if self._finished:
+            return
+        self._finished = True
+        elapsed = time.perf_counter() - self.start
+        LLM_REQUEST_SECONDS.observe(elapsed, model=self.model, call_site=self.call_site, status=status)
+        add_outbound_time("llm", elapsed)
+        if prompt_tokens:
+            LLM_TOKENS.inc(prompt_tokens, model=self.model, call_site=self.call_site, type="prompt")
+            LLM_PROMPT_TOKENS.observe(prompt_tokens, model=self.model, call_site=self.call_site)
+        if completion_tokens:
+            LLM_TOKENS.inc(completion_tokens, model=self.model, call_site=self.call_site, type="completion")
+
+
+# ---------------------------------------------------------------------------
+# RAG API
+# ---------------------------------------------------------------------------
+
+RAG_API_SECONDS = registry.histogram(
+    "rag_api_request_duration_seconds", "RAG API 请求耗时，流式请求计到读取结束", ("endpoint", "status"), LATENCY_BUCKETS
+)
+RAG_API_ERRORS = registry.counter("rag_api_errors_total", "RAG API 请求失败次数", ("endpoint",))
+
+
+def observe_rag_api(endpoint: str, start: float, error: bool) -> None:
+    elapsed = time.perf_counter() - start
+    RAG_API_SECONDS.observe(elapsed, endpoint=endpoint, status="error" if error else "ok")
+    add_outbound_time("rag", elapsed)
+    if error:
+        RAG_API_ERRORS.inc(endpoint=endpoint)
+
+
+# ---------------------------------------------------------------------------
+# 数据库连接池
+# ---------------------------------------------------------------------------
+
+DB_POOL_WAIT_SECONDS = registry.histogram(
+    "db_pool_checkout_wait_seconds", "从连接池获取连接的耗时（含连接池耗尽时的等待和新建连接）", ("engine",), LATENCY_BUCKETS
+)
+DB_POOL_HOLD_SECONDS = registry.histogram(
+    "db_pool_checkout_duration_seconds", "连接从借出到归还的时间", ("engine",), LATENCY_BUCKETS
+)
+DB_POOL_TIMEOUTS = registry.counter("db_pool_checkout_timeouts_total", "获取连接超时次数", ("engine",))
+DB_STATEMENTS = registry.counter("db_statements_total", "执行的 SQL 语句数，包括后台任务中执行的语句", ("engine",))
+
+_pools: Dict[str, Any] = {}
+
+
+def timed_pool_class(base: type, engine_name: str) -> type:
+    """记录获取连接耗时的连接池类，通过 poolclass 传给 create_engine"""
+
+    class TimedPool(base):
+        def _do_get(self):
+            start = time.perf_counter()
+            try:
+                return super()._do_get()
+            except exc.TimeoutError:
+                DB_POOL_TIMEOUTS.inc(engine=engine_name)
+                raise
+            finally:
+                DB_POOL_WAIT_SECONDS.observe(time.perf_counter() - start, engine=engine_name)
+
+    TimedPool.__name__ = f"Timed{base.__name__}"
+    return TimedPool
+
+
+def instrument_engine(engine: Engine, engine_name: str) -> None:
+    """记录连接占用时间和 SQL 语句数，并在输出指标时读取连接池状态"""
+    _pools[engine_name] = engine
+
+    @event.listens_for(engine, "checkout")
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        connection_record.info["metrics_checkout_at"] = time.perf_counter()
+
+    @event.listens_for(engine, "checkin")
+    def on_checkin(dbapi_connection, connection_record):
+        start = connection_record.info.pop("metrics_checkout_at", None)
+        if start is not None:
+            DB_POOL_HOLD_SECONDS.observe(time.perf_counter() - start, engine=engine_name)
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def on_after_execute(conn, cursor, statement, parameters, context, executemany):
+        DB_STATEMENTS.inc(engine=engine_name)
+
+
+@registry.register_collector
+def collect_db_pools() -> Iterable[Collected]:
+    checked_out, size, overflow = [], [], []
+    for name, engine in list(_pools.items()):
+        pool = engine.pool
+        if not hasattr(pool, "checkedout"):
+            continue
+        labels = {"engine": name}
+        checked_out.append((labels, pool.checkedout()))
+        size.append((labels, pool.size()))
+        overflow.append((labels, max(pool.overflow(), 0)))
+    return [
+        ("db_pool_checked_out", "gauge", "已借出的连接数", checked_out),
+        ("db_pool_size", "gauge", "连接池大小", size),
+        ("db_pool_overflow", "gauge", "超出连接池大小的连接数", overflow),
+    ]
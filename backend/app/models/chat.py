@@ -1,6 +1,6 @@
-from sqlalchemy import Enum, Column, Integer, SmallInteger, String, Text, DateTime, Boolean
+from sqlalchemy import Enum, Column, Integer, SmallInteger, String, Text, DateTime, Boolean, Index
 from sqlalchemy.sql import func
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, deferred
 from app.database import Base
 
 class ChatSessionType(Enum):
@@ -28,6 +28,11 @@ class ChatSession(Base):
     is_deleted = Column(Boolean, default=False, comment="是否删除")
     tasks = relationship("Task", back_populates="session", foreign_keys="Task.session_id")
 
+    __table_args__ = (
+        # 会话列表：按用户、会话类型过滤，按更新时间排序
+        Index("idx_chat_sessions_user_type_deleted_updated", "user_id", "session_type", "is_deleted", "updated_at"),
+    )
+
     
 class ChatMessage(Base):
     """聊天消息记录表"""
@@ -45,9 +50,16 @@ class ChatMessage(Base):
     task_id = Column(String(100), default="", comment="任务ID")
     task_status = Column(String(20), default="", comment="任务状态")
     task_result = Column(Text, default="", comment="任务结果")
-    full_content = Column(Text(length=4294967295), default="", comment="完整消息内容")
+    full_content = deferred(Column(Text(length=4294967295), default="", comment="完整消息内容"))  # 延迟加载
     tokens = Column(Integer, default=0, comment="消息token数量")
     meta = Column(Text, default="", comment="额外元数据(温度、top_p等参数)")
     created_at = Column(DateTime(timezone=True), server_default=func.now(), comment="创建时间") 
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), comment="最后更新时间")
-    is_deleted = Column(Boolean, default=False, comment="是否删除")
\ No newline at end of file
+    is_deleted = Column(Boolean, default=False, comment="是否删除")
+
+    __table_args__ = (
+        # 会话消息分页、最后一条消息
+        Index("idx_chat_messages_session_deleted_id", "session_id", "is_deleted", "id"),
+        # 会话的第一条用户消息、最近的回答
+        Index("idx_chat_messages_session_role_deleted_id", "session_id", "role", "is_deleted", "id"),
+    )
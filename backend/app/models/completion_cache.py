@@ -0,0 +1,21 @@
+from datetime import datetime
+from sqlalchemy import Column, String, DateTime, Text, Index
+
+from app.database import Base
+
+
+class CompletionCacheEntry(Base):
+    """/completions 响应缓存（持久层），键为模型、提示词、温度、最大token数的哈希"""
+    __tablename__ = "completion_cache_entries"
+
+    cache_key = Column(String(64), primary_key=True, comment="缓存键，sha256")
+    action = Column(String(50), nullable=False, default="", comment="操作类型")
+    model = Column(String(100), nullable=False, default="", comment="模型")
+    content = Column(Text(length=4294967295), nullable=False, comment="生成内容")
+    finish_reason = Column(String(20), nullable=True, comment="结束原因")
+    expires_at = Column(DateTime, nullable=False, comment="过期时间")
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("idx_completion_cache_entries_expires_at", "expires_at"),
+    )
@@ -1,5 +1,5 @@
 from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, deferred
 from sqlalchemy.sql import func
 from app.database import Base
 
@@ -24,7 +24,7 @@ class DocumentVersion(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     doc_id = Column(String(100), ForeignKey("documents.doc_id", ondelete="CASCADE"), comment="文档ID")
-    content = Column(Text)
+    content = deferred(Column(Text))  # 延迟加载，需要版本内容的列表用 undefer
     version = Column(Integer)
     comment = Column(String(200), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
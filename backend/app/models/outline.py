@@ -1,5 +1,5 @@
 from shortuuid import uuid
-from sqlalchemy import JSON, Column, Integer, String, Text, ForeignKey, Enum, DateTime, Boolean
+from sqlalchemy import JSON, Column, Integer, String, Text, ForeignKey, Enum, DateTime, Boolean, Index
 from sqlalchemy.orm import relationship
 from app.database import Base
 import enum
@@ -114,6 +114,11 @@ class SubParagraph(Base):
     created_at = Column(DateTime, default=datetime.now)
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
     sort_index = Column(Integer, nullable=True, comment="排序索引")
+    path = Column(String(255), nullable=True, comment="物化路径，由各级同级序号组成（如 0001.0003），按其排序即为文档顺序")
+
+    __table_args__ = (
+        Index("idx_sub_paragraphs_outline_path", "outline_id", "path"),
+    )
 
     # 关联
     outline = relationship("Outline", back_populates="sub_paragraphs")
@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Enum, Integer, String, Text, DateTime, Boolean, SmallInteger
+from sqlalchemy import Column, Enum, Integer, String, Text, DateTime, Boolean, SmallInteger, Index
+from sqlalchemy.orm import deferred
 from sqlalchemy.sql import func
 from app.database import Base
 
@@ -82,15 +83,30 @@ class RagFile(Base):
     hash = Column(String(100), default="", comment="文件hash")
     status = Column(SmallInteger, default=1, nullable=False, comment="状态: 0解析失败, 1未解析, 2本地解析中, 3本地解析成功, 4知识库解析中, 5知识库解析成功")
     error_message = Column(String(255), default="", comment="错误信息")
-    summary_small = Column(Text, comment="小摘要")
-    summary_medium = Column(Text, comment="中摘要")
-    summary_large = Column(Text, comment="大摘要")
-    content = Column(Text(length=4294967295), comment="解析出的文本内容")
+    # 大字段延迟加载，列表和查找只读取元数据，需要时用 undefer/undefer_group 或 SUBSTRING 读取
+    summary_small = deferred(Column(Text, comment="小摘要"), group="summary")
+    summary_medium = deferred(Column(Text, comment="中摘要"), group="summary")
+    summary_large = deferred(Column(Text, comment="大摘要"), group="summary")
+    content = deferred(Column(Text(length=4294967295), comment="解析出的文本内容"))
     meta = Column(Text, comment="元数据")
     created_at = Column(DateTime(timezone=True), server_default=func.now(), comment="创建时间")
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), comment="更新时间")
     is_deleted = Column(Boolean, default=False, comment="是否删除")
 
+    __table_args__ = (
+        # 后台任务按状态领取文件
+        Index("idx_rag_files_status", "status"),
+        # 上传时按哈希去重
+        Index("idx_rag_files_hash_type_deleted", "hash", "kb_type", "is_deleted"),
+        # 检索结果按知识库文件ID查找
+        Index("idx_rag_files_kb_file_deleted", "kb_file_id", "is_deleted"),
+        # 知识库文件列表
+        Index("idx_rag_files_kb_deleted_id", "kb_id", "is_deleted", "id"),
+        # 文件名、内容全文搜索（app/rag/search.py），仅 MySQL
+        Index("ft_rag_files_name", "file_name", mysql_prefix="FULLTEXT", mysql_with_parser="ngram").ddl_if(dialect="mysql"),
+        Index("ft_rag_files_name_content", "file_name", "content", mysql_prefix="FULLTEXT", mysql_with_parser="ngram").ddl_if(dialect="mysql"),
+    )
+
 class RagKnowledgeBase(Base):
     """RAG知识库表"""
     __tablename__ = "rag_knowledge_bases"
@@ -1,7 +1,7 @@
 import enum
 import json
 from datetime import datetime
-from sqlalchemy import Column, String, Integer, DateTime, Enum, JSON, Text, ForeignKey
+from sqlalchemy import Column, String, Integer, DateTime, Enum, JSON, Text, ForeignKey, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 
 from app.database import Base
@@ -30,6 +30,10 @@ class Task(Base):
     process_detail_info = Column(Text, nullable=True)
     log = Column(Text, nullable=True)
     session_id = Column(String(22), ForeignKey("chat_sessions.session_id"), nullable=True)
+    # 常用查询条件，创建任务时从参数中单独保存，避免在 params 上做 LIKE 扫描
+    user_id = Column(String(100), nullable=True, index=True, comment="用户ID")
+    doc_id = Column(String(100), nullable=True, index=True, comment="文档ID")
+    outline_id = Column(String(100), nullable=True, index=True, comment="大纲ID")
     
     # 存储任务参数，如prompt、file_ids等
     _params = Column("params", Text, nullable=True)
@@ -39,12 +43,22 @@ class Task(Base):
     
     # 存储错误信息
     error = Column(Text, nullable=True)
+
+    # 各阶段耗时的 span 树，任务结束时写入
+    _profile = Column("profile", Text(length=16777215), nullable=True)
     
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # 关系
     session = relationship("ChatSession", back_populates="tasks", foreign_keys=[session_id])
+
+    __table_args__ = (
+        # 会话的未完成任务
+        Index("idx_tasks_session_status", "session_id", "status"),
+        # 启动时恢复未完成的任务
+        Index("idx_tasks_status_type", "status", "type"),
+    )
     
     @property
     def params(self):
@@ -64,4 +78,37 @@ class Task(Base):
     
     @result.setter
     def result(self, value):
-        self._result = json.dumps(value) 
\ No newline at end of file
+        self._result = json.dumps(value)
+
+    @property
+    def profile(self):
+        if self._profile:
+            return json.loads(self._profile)
+        return {}
+
+
+class TaskCheckpoint(Base):
+    """任务断点，任务中断后恢复时复用已完成的阶段结果（如已生成的段落）"""
+    __tablename__ = "task_checkpoints"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    task_id = Column(String(22), nullable=False, index=True, comment="任务ID")
+    checkpoint_key = Column(String(100), nullable=False, comment="断点键，如 paragraph:<段落ID>")
+    input_hash = Column(String(64), nullable=False, comment="生成该结果的输入哈希，输入变化时断点失效")
+    _data = Column("data", Text(length=4294967295), nullable=True, comment="断点数据JSON")
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint("task_id", "checkpoint_key", name="uq_task_checkpoints_task_key"),
+    )
+
+    @property
+    def data(self):
+        if self._data:
+            return json.loads(self._data)
+        return {}
+
+    @data.setter
+    def data(self, value):
+        self._data = json.dumps(value, ensure_ascii=False)
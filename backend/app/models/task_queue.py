@@ -0,0 +1,39 @@
+import enum
+from datetime import datetime
+from sqlalchemy import Column, String, Integer, DateTime, Enum, Text, Index
+
+from app.database import Base
+
+
+class TaskQueueJobStatus(enum.Enum):
+    QUEUED = "queued"        # 等待领取（包括等待重试）
+    LEASED = "leased"        # 已被工作进程领取，租约有效期内执行
+    SUCCEEDED = "succeeded"  # 执行成功
+    DEAD = "dead"            # 重试次数耗尽，进入死信
+
+
+class TaskQueueJob(Base):
+    """持久化任务队列表，多个工作进程通过租约领取任务"""
+    __tablename__ = "task_queue_jobs"
+
+    task_id = Column(String(22), primary_key=True, comment="任务ID，对应tasks.id")
+    queue = Column(String(50), nullable=False, default="default", comment="队列名称")
+    user_id = Column(String(100), nullable=False, default="", comment="用户ID，用于单用户并发控制")
+    priority = Column(Integer, nullable=False, default=0, comment="优先级，数值越小越优先")
+    status = Column(Enum(TaskQueueJobStatus), nullable=False, default=TaskQueueJobStatus.QUEUED, comment="队列状态")
+    payload = Column(Text, nullable=True, comment="任务参数JSON")
+    checkpoint = Column(Text(length=4294967295), nullable=True, comment="断点数据JSON，重试时用于恢复")
+    attempts = Column(Integer, nullable=False, default=0, comment="已领取次数")
+    max_attempts = Column(Integer, nullable=False, default=3, comment="最大尝试次数")
+    lease_owner = Column(String(100), nullable=True, comment="持有租约的工作进程ID")
+    lease_expires_at = Column(DateTime, nullable=True, comment="租约过期时间")
+    available_at = Column(DateTime, nullable=False, default=datetime.utcnow, comment="可被领取的时间，用于重试退避")
+    last_error = Column(Text, nullable=True, comment="最近一次错误信息")
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        Index("idx_task_queue_jobs_claim", "queue", "status", "priority", "available_at"),
+        Index("idx_task_queue_jobs_lease", "status", "lease_expires_at"),
+        Index("idx_task_queue_jobs_user", "user_id", "status"),
+    )
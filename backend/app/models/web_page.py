@@ -1,19 +1,47 @@
 import datetime
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean
+import hashlib
+import zlib
+from typing import Optional
+from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, LargeBinary, Index
+from sqlalchemy.orm import deferred
 from app.database import Base
 
+
+def url_hash(url: str) -> str:
+    """URL的sha256，用于索引查找（url 列过长无法直接建索引）"""
+    return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+
 class WebPage(Base):
     __tablename__ = "web_pages"
 
     id = Column(Integer, primary_key=True, index=True, comment="主键ID")
     webpage_id = Column(String(100), unique=True, index=True, comment="网页ID")
     url = Column(String(1024), comment="URL")
+    url_hash = Column(String(64), index=True, comment="URL的sha256")
     user_id = Column(String(100), index=True, comment="用户ID")
     status = Column(Integer, default=0, comment="状态: 0未解析, 1解析中, 2解析成功, 3解析失败")
     title = Column(String(512), comment="标题")
-    text_content = Column(Text(length=4294967295), comment="文本内容")
-    html_content = Column(Text(length=4294967295), comment="HTML内容")
+    # 大字段延迟加载，列表和查找只读取元数据
+    text_content = deferred(Column(Text(length=4294967295), comment="文本内容"))
+    html_content = deferred(Column(Text(length=4294967295), comment="HTML内容（旧数据，新数据保存在 html_compressed）"), group="html")
+    html_compressed = deferred(Column(LargeBinary(length=4294967295), comment="zlib压缩的HTML内容"), group="html")
+    etag = Column(String(255), comment="响应的ETag，用于条件请求")
+    last_modified = Column(String(64), comment="响应的Last-Modified，用于条件请求")
+    fetched_at = Column(DateTime, comment="最近一次抓取时间")
     summary = Column(Text, comment="摘要")
     created_at = Column(DateTime, default=datetime.datetime.now, comment="创建时间")
     updated_at = Column(DateTime, default=datetime.datetime.now, onupdate=datetime.datetime.now, comment="更新时间")
     is_deleted = Column(Boolean, default=False, comment="是否删除")
+
+    __table_args__ = (
+        # 用户的网页列表
+        Index("idx_web_pages_user_status_deleted", "user_id", "status", "is_deleted"),
+    )
+
+    @property
+    def html(self) -> Optional[str]:
+        """HTML内容，兼容未压缩的旧数据"""
+        if self.html_compressed is not None:
+            return zlib.decompress(self.html_compressed).decode("utf-8")
+        return self.html_content
@@ -3,6 +3,7 @@ import os
 import PyPDF2
 from docx import Document
 from app.config import settings
+from app.metrics import LLMCallTimer
 import openai
 import aiofiles
 import pytesseract
@@ -43,6 +44,7 @@ class FileParser:
         
         prompt = length_prompts.get(length, length_prompts["small"])
         
+        timer = None
         try:
             # 配置OpenAI客户端
             client = openai.AsyncOpenAI(
@@ -51,6 +53,7 @@ class FileParser:
             )
             
             # 调用API生成摘要
+            timer = LLMCallTimer(settings.RAG_LLM_MODEL, "summary")
             completion = await client.chat.completions.create(
                 model=settings.RAG_LLM_MODEL,
                 messages=[
@@ -61,10 +64,14 @@ class FileParser:
                 max_tokens=settings.RAG_LLM_MAX_TOKENS,
                 timeout=settings.RAG_LLM_REQUEST_TIMEOUT
             )
+            usage = completion.usage
+            timer.finish(usage.prompt_tokens if usage else None, usage.completion_tokens if usage else None)
             
             return completion.choices[0].message.content.strip()
             
         except Exception as e:
+            if timer:
+                timer.finish(status="error")
             raise Exception(f"生成摘要时发生错误: {str(e)}")
 
 class PDFEncryptedError(Exception):
@@ -2,6 +2,7 @@ import asyncio
 import logging
 import time
 from app.database import get_async_db, get_db
+from app.metrics import registry
 from app.models.rag import RagFile, RagFileStatus
 from app.rag.parser import get_parser
 from app.rag.rag_api_async import rag_api_async
@@ -14,6 +15,17 @@ rag_summary_queue = asyncio.Queue()
 rag_upload_queue = asyncio.Queue()
 rag_parsing_queue = asyncio.Queue()
 
+
+@registry.register_collector
+def collect_rag_queues():
+    queues = {
+        "content": rag_content_queue,
+        "summary": rag_summary_queue,
+        "upload": rag_upload_queue,
+        "parsing": rag_parsing_queue,
+    }
+    return [("rag_queue_depth", "gauge", "知识库文件处理队列中等待的文件数", [({"queue": name}, queue.qsize()) for name, queue in queues.items()])]
+
 # Architectural hinge:
 # The ingestion worker is the counterweight to the writing router:
 #   - `/api/v1/rag` + `/api/v1/writing` enqueue `RagFile` rows; this loop advances their state so prompts can trust `RagFile.status`.
@@ -183,8 +195,14 @@ async def rag_summary_task(queue: asyncio.Queue, semaphore: asyncio.Semaphore):
                     )
                     continue
 
+                # 文件内容延迟加载，队列中的对象不包含内容，生成摘要前单独读取
+                async with get_async_db() as db:
+                    content = (await db.execute(
+                        select(RagFile.content).where(RagFile.file_id == rag_file.file_id)
+                    )).scalar_one_or_none()
+
                 # 生成摘要
-                summary = await parser.summary(rag_file.content, length="small")
+                summary = await parser.summary(content or "", length="small")
                 
                 # 使用异步上下文管理器和事务上下文更新数据库
                 async with get_async_db() as db:
@@ -1,8 +1,10 @@
 import os
+import time
 import requests
 import json
 from typing import List, Optional, Dict, Any, Union, Iterator
 from app.config import settings
+from app.metrics import observe_rag_api
 import logging
 
 logger = logging.getLogger("app.rag_api")
@@ -16,16 +18,24 @@ class RagAPI:
     def _make_request(self, method: str, endpoint: str, **kwargs) -> Dict[str, Any]:
         """发送HTTP请求的通用方法"""
         url = f"{self.base_url}{endpoint}"
+        start = time.perf_counter()
+        failed = True
         try:
             response = requests.request(method, url, **kwargs)
             response.raise_for_status()
-            return response.json()
+            result = response.json()
+            failed = False
+            return result
         except requests.exceptions.RequestException as e:
             raise Exception(f"RAG API请求失败: {str(e)}")
+        finally:
+            observe_rag_api(endpoint, start, failed)
 
     def _make_streaming_request(self, method: str, endpoint: str, **kwargs) -> Iterator[Dict[str, Any]]:
         """发送HTTP流式请求的通用方法"""
         url = f"{self.base_url}{endpoint}"
+        start = time.perf_counter()
+        failed = False
         try:
             with requests.request(method, url, stream=True, **kwargs) as response:
                 response.raise_for_status()
@@ -57,8 +67,15 @@ class RagAPI:
                             continue
                         
         except requests.exceptions.RequestException as e:
+            failed = True
             logger.error(f"RAG API流式请求失败: {str(e)}")
             raise Exception(f"RAG API流式请求失败: {str(e)}")
+        except Exception:
+            failed = True
+            raise
+        finally:
+            # 流式请求计到读取结束（或调用方提前关闭）
+            observe_rag_api(endpoint, start, failed)
 
     def create_knowledge_base(self, kb_name: str) -> Dict[str, Any]:
         """
@@ -1,4 +1,5 @@
 import os
+import time
 import aiofiles
 import aiohttp
 import json
@@ -6,6 +7,7 @@ import logging
 import codecs
 from typing import Dict, Any, AsyncIterator, List, Optional, Union
 from app.config import settings
+from app.metrics import observe_rag_api
 
 logger = logging.getLogger("app.rag_api_async")
 
@@ -18,18 +20,26 @@ class RagAPIAsync:
     async def _make_request(self, method: str, endpoint: str, **kwargs) -> Dict[str, Any]:
         """发送HTTP请求的通用方法"""
         url = f"{self.base_url}{endpoint}"
+        start = time.perf_counter()
+        failed = True
         try:
             async with aiohttp.ClientSession() as session:
                 async with session.request(method, url, **kwargs) as response:
                     response.raise_for_status()
-                    return await response.json()
+                    result = await response.json()
+                    failed = False
+                    return result
         except aiohttp.ClientError as e:
             logger.error(f"RAG API请求失败: {str(e)}, URL: {url}, 请求参数: {kwargs}")
             raise RuntimeError(f"RAG API请求失败: {str(e)}") from e
+        finally:
+            observe_rag_api(endpoint, start, failed)
 
     async def _make_streaming_request(self, method: str, endpoint: str, **kwargs) -> AsyncIterator[Dict[str, Any]]:
         """发送HTTP流式请求的通用方法"""
         url = f"{self.base_url}{endpoint}"
+        start = time.perf_counter()
+        failed = False
         try:
             async with aiohttp.ClientSession() as session:
                 async with session.request(method, url, **kwargs) as response:
@@ -91,8 +101,15 @@ class RagAPIAsync:
                         logger.error(f"处理最终数据时出错: {str(e)}")
                         
         except aiohttp.ClientError as e:
+            failed = True
             logger.error(f"RAG API流式请求失败: {str(e)}, URL: {url}, 请求参数: {kwargs}")
             raise RuntimeError(f"RAG API流式请求失败: {str(e)}") from e
+        except Exception:
+            failed = True
+            raise
+        finally:
+            # 流式请求计到读取结束（或调用方提前关闭）
+            observe_rag_api(endpoint, start, failed)
 
 
     async def create_knowledge_base(self, kb_name: str) -> Dict[str, Any]:
@@ -0,0 +1,70 @@
+"""
+知识库文件搜索
+
+MySQL 上使用 ngram 全文索引：ft_rag_files_name (file_name) 和 ft_rag_files_name_content (file_name, content)，
+解析任务写入 content 后索引由 MySQL 自动维护。多个关键词之间为 AND，结果按相关度排序，文件名命中的权重更高。
+短于 ngram_token_size 的关键词无法走全文索引，退化为文件名 LIKE 过滤。
+其他数据库（如本地开发用的 SQLite）全部退化为 LIKE 过滤，不排序。
+"""
+import re
+from typing import List, Optional, Tuple
+
+from sqlalchemy import or_
+from sqlalchemy.dialects.mysql import match
+from sqlalchemy.orm import Query
+from sqlalchemy.sql.elements import ColumnElement
+
+from app.config import settings
+from app.models.rag import RagFile
+
+# 文件名命中相对内容命中的权重
+FILE_NAME_WEIGHT = 10
+
+# 逗号、空白、顿号之外，全文检索布尔模式的运算符也作为分隔符
+_TERM_SPLIT = re.compile(r'[,\s、+\-<>()~*"@]+')
+
+
+def split_terms(keyword: str) -> List[str]:
+    return list(dict.fromkeys(term for term in _TERM_SPLIT.split(keyword or "") if term))
+
+
+def boolean_query(terms: List[str]) -> str:
+    """每个关键词作为必须出现的短语，ngram 分词后按顺序匹配"""
+    return " ".join(f'+"{term}"' for term in terms)
+
+
+def apply_file_search(query: Query, keyword: str, search_content: bool, dialect_name: str) -> Tuple[Query, Optional[ColumnElement]]:
+    """
+    给文件查询加上搜索条件
+
+    Args:
+        query: RagFile 查询
+        keyword: 搜索关键词，按逗号、空白、顿号切分，多个关键词须同时命中
+        search_content: 是否同时搜索解析出的文件内容
+        dialect_name: 数据库方言，mysql 时使用全文索引
+
+    Returns:
+        (加上搜索条件的查询, 相关度表达式)，不支持相关度时为 None
+    """
+    terms = split_terms(keyword)
+    if dialect_name != "mysql":
+        for term in terms:
+            if search_content:
+                query = query.filter(or_(RagFile.file_name.contains(term), RagFile.content.contains(term)))
+            else:
+                query = query.filter(RagFile.file_name.contains(term))
+        return query, None
+
+    indexed = [term for term in terms if len(term) >= settings.RAG_SEARCH_NGRAM_TOKEN_SIZE]
+    for term in terms:
+        if term not in indexed:
+            query = query.filter(RagFile.file_name.contains(term))
+    if not indexed:
+        return query, None
+
+    against = boolean_query(indexed)
+    name_score = match(RagFile.file_name, against=against).in_boolean_mode()
+    if not search_content:
+        return query.filter(name_score), name_score
+    content_score = match(RagFile.file_name, RagFile.content, against=against).in_boolean_mode()
+    return query.filter(content_score), name_score * FILE_NAME_WEIGHT + content_score
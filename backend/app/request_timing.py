@@ -0,0 +1,399 @@
+"""
+请求耗时
+
+RequestTimingMiddleware 为每个 HTTP 请求记录：
+- handler：路由函数执行时间（instrument_routes 包装路由函数）
+- db：SQL 执行时间和语句数（SQLAlchemy 引擎事件）
+- rag / llm：外部 RAG API 和大模型调用时间（app.metrics 中的计时点上报）
+- serialize：路由函数返回到开始发送响应之间的时间（响应模型校验、JSON 序列化）
+
+以上耗时写入 Server-Timing 响应头。流式响应的响应头在生成开始前发送，只包含此前的耗时。
+
+总耗时（含流式响应体）超过 request_timing.slow_threshold_ms 的请求进入有界环形缓冲区，
+记录 SQL 语句数和按语句汇总的次数（便于发现 N+1 查询），通过 /api/v1/admin/slow-requests 查看。
+按 request_timing.profile_sample_rate 抽样的请求由后台线程定时采集调用栈，慢请求附带采样结果。
+"""
+import asyncio
+import contextvars
+import functools
+import logging
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 每个请求按语句汇总的最大语句数
+MAX_STATEMENTS = 50
+# 慢请求记录中保留的语句数和调用栈数
+TOP_STATEMENTS = 10
+TOP_STACKS = 20
+# 语句文本和调用栈的最大长度
+MAX_STATEMENT_LENGTH = 300
+MAX_STACK_DEPTH = 40
+
+
+class RequestTiming:
+    """单个请求的耗时累计，只在处理该请求的任务（及其复制上下文的线程）中修改"""
+
+    def __init__(self, method: str, path: str):
+        self.method = method
+        self.path = path
+        self.route: Optional[str] = None
+        self.status: Optional[int] = None
+        self.started_at = datetime.utcnow()
+        self.start = time.perf_counter()
+        self.handler_seconds = 0.0
+        self.handler_end: Optional[float] = None
+        self.response_start: Optional[float] = None
+        self.end: Optional[float] = None
+        self.db_seconds = 0.0
+        self.db_count = 0
+        self.statements: Dict[str, List[float]] = {}
+        self.outbound: Dict[str, List[float]] = {}
+        self.profile: Optional["StackSampler"] = None
+        self._lock = threading.Lock()
+
+    def add_statement(self, statement: str, seconds: float) -> None:
+        with self._lock:
+            self.db_seconds += seconds
+            self.db_count += 1
+            stats = self.statements.get(statement)
+            if stats is None:
+                if len(self.statements) >= MAX_STATEMENTS:
+                    return
+                stats = self.statements[statement] = [0, 0.0]
+            stats[0] += 1
+            stats[1] += seconds
+
+    def add_outbound(self, kind: str, seconds: float) -> None:
+        with self._lock:
+            stats = self.outbound.setdefault(kind, [0, 0.0])
+            stats[0] += 1
+            stats[1] += seconds
+
+    @property
+    def serialize_seconds(self) -> float:
+        if self.handler_end is None or self.response_start is None:
+            return 0.0
+        return max(self.response_start - self.handler_end, 0.0)
+
+    def server_timing(self) -> str:
+        """Server-Timing 响应头，耗时单位为毫秒"""
+        now = self.response_start or time.perf_counter()
+        parts = [
+            f"app;dur={(now - self.start) * 1000:.1f}",
+            f"handler;dur={self.handler_seconds * 1000:.1f}",
+            f'db;dur={self.db_seconds * 1000:.1f};desc="{self.db_count} queries"',
+        ]
+        with self._lock:
+            outbound = dict(self.outbound)
+        for kind, (count, seconds) in sorted(outbound.items()):
+            parts.append(f'{kind};dur={seconds * 1000:.1f};desc="{count} calls"')
+        parts.append(f"serialize;dur={self.serialize_seconds * 1000:.1f}")
+        return ", ".join(parts)
+
+    def to_dict(self) -> Dict[str, Any]:
+        end = self.end or time.perf_counter()
+        with self._lock:
+            statements = sorted(self.statements.items(), key=lambda item: item[1][1], reverse=True)[:TOP_STATEMENTS]
+            outbound = {kind: {"count": count, "ms": round(seconds * 1000, 1)} for kind, (count, seconds) in self.outbound.items()}
+        data = {
+            "method": self.method,
+            "path": self.path,
+            "route": self.route,
+            "status": self.status,
+            "started_at": self.started_at.isoformat(),
+            "total_ms": round((end - self.start) * 1000, 1),
+            "first_byte_ms": round((self.response_start - self.start) * 1000, 1) if self.response_start else None,
+            "handler_ms": round(self.handler_seconds * 1000, 1),
+            "serialize_ms": round(self.serialize_seconds * 1000, 1),
+            "db_ms": round(self.db_seconds * 1000, 1),
+            "sql_count": self.db_count,
+            "sql_distinct": len(self.statements),
+            "statements": [
+                {"sql": statement, "count": count, "ms": round(seconds * 1000, 1)}
+                for statement, (count, seconds) in statements
+            ],
+            "outbound": outbound,
+        }
+        if self.profile is not None:
+            data["profile"] = self.profile.to_dict()
+        return data
+
+
+_current: contextvars.ContextVar = contextvars.ContextVar("request_timing", default=None)
+
+
+def current_timing() -> Optional[RequestTiming]:
+    return _current.get()
+
+
+def add_outbound_time(kind: str, seconds: float) -> None:
+    """记录外部调用耗时（rag、llm），不在请求内时忽略"""
+    timing = _current.get()
+    if timing is not None:
+        timing.add_outbound(kind, seconds)
+
+
+# ---------------------------------------------------------------------------
+# SQL 耗时
+# ---------------------------------------------------------------------------
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("request_timing_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    timing = _current.get()
+    starts = conn.info.get("request_timing_start")
+    if timing is None or not starts:
+        return
+    timing.add_statement(statement[:MAX_STATEMENT_LENGTH], time.perf_counter() - starts.pop())
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(context):
+    # 出错的语句不会触发 after_cursor_execute，丢弃开始时间
+    connection = context.connection
+    if _current.get() is not None and connection is not None and connection.info.get("request_timing_start"):
+        connection.info["request_timing_start"].pop()
+
+
+# ---------------------------------------------------------------------------
+# 调用栈采样
+# ---------------------------------------------------------------------------
+
+class StackSampler:
+    """
+    单个请求的调用栈采样结果
+
+    异步路由与其他请求共用事件循环线程，只在该请求的任务正在运行时计入样本；
+    同步路由在线程池中执行，执行期间采样对应的工作线程。
+    """
+
+    def __init__(self):
+        self.thread_id = threading.get_ident()
+        try:
+            self.loop = asyncio.get_running_loop()
+            self.task = asyncio.current_task()
+        except RuntimeError:
+            self.loop = None
+            self.task = None
+        self.samples = 0
+        self.stacks: Counter = Counter()
+
+    def sample(self, frames: Dict[int, Any]) -> None:
+        thread_id, task = self.thread_id, self.task
+        if task is not None and asyncio.current_task(self.loop) is not task:
+            return
+        frame = frames.get(thread_id)
+        if frame is None:
+            return
+        stack = []
+        while frame is not None and len(stack) < MAX_STACK_DEPTH:
+            code = frame.f_code
+            stack.append(f"{code.co_filename.rsplit('/', 1)[-1]}:{code.co_name}:{frame.f_lineno}")
+            frame = frame.f_back
+        self.samples += 1
+        self.stacks[";".join(reversed(stack))] += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "interval_ms": settings.REQUEST_TIMING_PROFILE_INTERVAL_MS,
+            "samples": self.samples,
+            "stacks": [{"stack": stack, "count": count} for stack, count in self.stacks.most_common(TOP_STACKS)],
+        }
+
+
+class _SamplerThread:
+    """后台采样线程，有抽样请求时按间隔读取各线程当前的调用栈"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._active: List[StackSampler] = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._thread: Optional[threading.Thread] = None
+
+    def add(self, sampler: StackSampler) -> None:
+        with self._lock:
+            self._active.append(sampler)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+                self._thread.start()
+            self._wakeup.notify()
+
+    def remove(self, sampler: StackSampler) -> None:
+        with self._lock:
+            if sampler in self._active:
+                self._active.remove(sampler)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._active:
+                    self._wakeup.wait()
+                active = list(self._active)
+            frames = sys._current_frames()
+            for sampler in active:
+                try:
+                    sampler.sample(frames)
+                except Exception:
+                    pass
+            del frames
+            time.sleep(self.interval)
+
+
+_sampler_thread = _SamplerThread(max(settings.REQUEST_TIMING_PROFILE_INTERVAL_MS, 1) / 1000)
+
+
+# ---------------------------------------------------------------------------
+# 慢请求
+# ---------------------------------------------------------------------------
+
+class SlowRequestLog:
+    """最近的慢请求，超出容量后丢弃最早的记录"""
+
+    def __init__(self, max_size: int):
+        self._entries: deque = deque(maxlen=max(max_size, 1))
+        self._lock = threading.Lock()
+        self.total = 0
+
+    def add(self, entry: Dict[str, Any]) -> None:
+        with self._lock:
+            self._entries.append(entry)
+            self.total += 1
+
+    def list(self, limit: int, path: Optional[str] = None) -> List[Dict[str, Any]]:
+        """按时间倒序返回，path 为路由模板或请求路径的前缀"""
+        with self._lock:
+            entries = list(self._entries)
+        if path:
+            entries = [entry for entry in entries if (entry["route"] or entry["path"]).startswith(path) or entry["path"].startswith(path)]
+        return list(reversed(entries))[:limit]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+slow_requests = SlowRequestLog(settings.REQUEST_TIMING_SLOW_BUFFER_SIZE)
+
+
+# ---------------------------------------------------------------------------
+# 中间件
+# ---------------------------------------------------------------------------
+
+class RequestTimingMiddleware:
+    """纯 ASGI 中间件，须作为最外层中间件注册（最后一个 add_middleware）"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.slow_threshold = settings.REQUEST_TIMING_SLOW_THRESHOLD_MS / 1000
+        self.sample_rate = settings.REQUEST_TIMING_PROFILE_SAMPLE_RATE
+        self.server_timing_header = settings.REQUEST_TIMING_SERVER_TIMING_HEADER
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timing = RequestTiming(scope.get("method", ""), scope.get("path", ""))
+        token = _current.set(timing)
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            timing.profile = StackSampler()
+            _sampler_thread.add(timing.profile)
+
+        async def send_with_timing(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                timing.response_start = time.perf_counter()
+                timing.status = message["status"]
+                if self.server_timing_header:
+                    MutableHeaders(scope=message).append("Server-Timing", timing.server_timing())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        except BaseException:
+            timing.status = timing.status or 500
+            raise
+        finally:
+            timing.end = time.perf_counter()
+            if timing.profile is not None:
+                _sampler_thread.remove(timing.profile)
+            _current.reset(token)
+            route = scope.get("route")
+            timing.route = getattr(route, "path", None)
+            if timing.end - timing.start >= self.slow_threshold:
+                self._capture(timing)
+
+    def _capture(self, timing: RequestTiming) -> None:
+        entry = timing.to_dict()
+        slow_requests.add(entry)
+        logger.warning(
+            f"慢请求 [{timing.method} {timing.route or timing.path}, total={entry['total_ms']}ms, sql_count={timing.db_count}]",
+            extra={"fields": {key: entry[key] for key in ("status", "handler_ms", "db_ms", "sql_distinct", "outbound")}}
+        )
+
+
+# ---------------------------------------------------------------------------
+# 路由函数耗时
+# ---------------------------------------------------------------------------
+
+def _timed_endpoint(fn: Callable) -> Callable:
+    if asyncio.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            timing = _current.get()
+            start = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                if timing is not None:
+                    timing.handler_end = time.perf_counter()
+                    timing.handler_seconds += timing.handler_end - start
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def sync_wrapper(*args, **kwargs):
+        # 同步路由在线程池中执行，采样切换到当前工作线程
+        timing = _current.get()
+        profile = timing.profile if timing is not None else None
+        if profile is not None:
+            owner = profile.thread_id, profile.task
+            profile.thread_id, profile.task = threading.get_ident(), None
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            if timing is not None:
+                timing.handler_end = time.perf_counter()
+                timing.handler_seconds += timing.handler_end - start
+            if profile is not None:
+                profile.thread_id, profile.task = owner
+    return sync_wrapper
+
+
+def instrument_routes(app) -> None:
+    """包装已注册的路由函数以记录 handler 耗时，在 include_router 之后调用"""
+    from fastapi.routing import APIRoute
+
+    for route in app.routes:
+        if isinstance(route, APIRoute) and not getattr(route.dependant.call, "__request_timed__", False):
+            route.dependant.call = _timed_endpoint(route.dependant.call)
+            route.dependant.call.__request_timed__ = True
@@ -0,0 +1,41 @@
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Query
+
+from app.auth import get_current_user
+from app.config import settings
+from app.models.user import User, UserRole
+from app.request_timing import slow_requests
+from app.schemas.response import APIResponse
+
+router = APIRouter()
+
+
+@router.get("/admin/slow-requests")
+async def get_slow_requests(
+    limit: int = Query(50, ge=1, le=500, description="返回条数"),
+    path: Optional[str] = Query(None, description="按路由模板或请求路径前缀过滤，如 /api/v1/rag"),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    最近的慢请求（仅系统管理员）
+
+    每条记录包含总耗时、handler/serialize/db 耗时、SQL 语句数及按语句汇总的次数和耗时、
+    rag/llm 外部调用耗时，抽样请求附带调用栈采样结果
+    """
+    if current_user.admin != UserRole.SYS_ADMIN:
+        return APIResponse.error(message="权限不足")
+    return APIResponse.success(data={
+        "slow_threshold_ms": settings.REQUEST_TIMING_SLOW_THRESHOLD_MS,
+        "total": slow_requests.total,
+        "list": slow_requests.list(limit, path)
+    })
+
+
+@router.delete("/admin/slow-requests")
+async def clear_slow_requests(current_user: User = Depends(get_current_user)):
+    """清空慢请求记录（仅系统管理员）"""
+    if current_user.admin != UserRole.SYS_ADMIN:
+        return APIResponse.error(message="权限不足")
+    slow_requests.clear()
+    return APIResponse.success(message="已清空慢请求记录")
@@ -4,6 +4,7 @@ import shortuuid
 from app.config import settings
 import openai
 import json
+import asyncio
 from typing import List, Literal, Optional, Dict, Any
 from pathlib import Path
 from app.database import get_db
@@ -16,34 +17,27 @@ from sqlalchemy.sql import func
 from sqlalchemy import desc
 from app.auth import get_current_user
 from app.models.user import User
-from app.models.system_config import SystemConfig
 from app.models.chat import ChatSession, ChatMessage, ChatSessionType
 from urllib.parse import quote
-from jinja2 import Environment, FileSystemLoader, Template
+from jinja2 import Environment, FileSystemLoader
 import logging
 from app.schemas.response import APIResponse, PaginationData, PaginationResponse
-from app.scrape.web import scraper
+from app.scrape.web import scraper, INGEST_EXISTING, INGEST_FAILED
 from app.models.web_page import WebPage
 from app.models.rag import RagFile
+from app.services.prompt_registry import prompt_registry
+from app.services.completion_cache import CachedCompletion, completion_cache, completion_cache_key, completion_response, replay_stream
+from app.utils.pagination import InvalidCursorError, count_cache, keyset_page
+from app.utils.prompt_budget import count_tokens
+from app.metrics import LLMCallTimer
 
 
 router = APIRouter()
 
-# 配置日志
+# 配置日志，输出由 app 日志器的队列处理器统一处理
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
-# 创建控制台处理器
-console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.INFO)
-
-# 设置日志格式
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-console_handler.setFormatter(formatter)
-
-# 添加处理器到logger
-logger.addHandler(console_handler)
-
 # 初始化Jinja2环境
 template_dir = Path(__file__).parent.parent.parent.parent / "templates"
 env = Environment(loader=FileSystemLoader(template_dir))
@@ -108,17 +102,12 @@ async def completions(
         body = request.model_dump(exclude_none=True)
         action = request.action
         
-        # 从数据库读取提示词模板
+        # 从提示词注册表获取编译好的模板
         template_key = f"prompt.{action}"
-        template_config = db.query(SystemConfig).filter(
-            SystemConfig.key == template_key
-        ).first()
+        template = prompt_registry.get(db, template_key)
         
-        if not template_config:
+        if template is None:
             return APIResponse.error(message=f"提示词模板 {template_key} 不存在")
-            
-        # 使用字符串模板替代文件模板
-        template = Template(template_config.value)
         
         # 构建完整的消息列表
         full_messages = []
@@ -140,10 +129,12 @@ async def completions(
         # 只在需要使用doc时再查询数据库
         doc_content = ""
         if request.doc_id:
-            doc = db.query(Document).filter(Document.doc_id == request.doc_id).first()
+            doc = db.query(
+                func.substring(Document.content, 1, settings.LLM_COMPLETION_DOC_MAX_LENGTH).label("content")
+            ).filter(Document.doc_id == request.doc_id).first()
             if not doc:
                 return APIResponse.error(message="引用的文档不存在")
-            doc_content = doc.content[:settings.LLM_COMPLETION_DOC_MAX_LENGTH]
+            doc_content = doc.content or ""
         
         # 处理文件引用
         reference_files = []
@@ -151,11 +142,12 @@ async def completions(
             file_ids = body["file_ids"]
             del body["file_ids"]
             if isinstance(file_ids, list):
-                # 获取所有引用文件的内容
+                # 获取所有引用文件的内容，在数据库中按单文件长度上限截取
+                per_file_max_length = settings.LLM_COMPLETION_FILE_MAX_LENGTH // max(len(set(file_ids)), 1)
                 files = db.query(
                     RagFile.file_id,
                     RagFile.file_name,
-                    RagFile.content
+                    func.substring(RagFile.content, 1, per_file_max_length).label("content")
                 ).filter(RagFile.file_id.in_(file_ids)).all()
                 
                 # 检查是否所有请求的文件都存在
@@ -179,8 +171,12 @@ async def completions(
         if "webpage_ids" in body:
             webpage_ids = body["webpage_ids"]
             del body["webpage_ids"]
-            # 获取所有引用网页的内容
-            webpages = db.query(WebPage).filter(WebPage.webpage_id.in_(webpage_ids)).all()
+            # 获取所有引用网页的文本内容，在数据库中按单网页长度上限截取
+            per_webpage_max_length = settings.LLM_COMPLETION_FILE_MAX_LENGTH // max(len(set(webpage_ids)), 1)
+            webpages = db.query(
+                WebPage.webpage_id,
+                func.substring(WebPage.text_content, 1, per_webpage_max_length).label("content")
+            ).filter(WebPage.webpage_id.in_(webpage_ids)).all()
             # 检查是否所有请求的网页都存在
             found_webpage_ids = {webpage.webpage_id for webpage in webpages}
             missing_webpage_ids = set(webpage_ids) - found_webpage_ids
@@ -211,41 +207,88 @@ async def completions(
         # max_token
         max_tokens = request.max_tokens
 
+        # 命中响应缓存时直接返回，不再调用大模型
+        cache_key = None
+        if completion_cache is not None and completion_cache.is_cacheable(action):
+            cache_key = completion_cache_key(llm_config["model"], full_messages, request.temperature, max_tokens)
+            cached = await asyncio.to_thread(completion_cache.get, cache_key, action)
+            if cached is not None:
+                logger.info(f"命中补全缓存 [action={action}, key={cache_key[:12]}]")
+                if stream:
+                    return StreamingResponse(
+                        replay_stream(cache_key, cached),
+                        media_type="text/event-stream",
+                    )
+                return APIResponse.success(data=completion_response(cache_key, cached))
+
         # 配置OpenAI客户端并调用API
         client = openai.AsyncOpenAI(
             base_url=llm_config["base_url"],
             api_key=llm_config["api_key"]
         )
 
-        completion = await client.chat.completions.create(
-            model=llm_config["model"],
-            messages=full_messages,
-            temperature=request.temperature,
-            stream=request.stream,
-            max_tokens=max_tokens,
-            timeout=settings.LLM_REQUEST_TIMEOUT
-        )
+        timer = LLMCallTimer(llm_config["model"], "completion")
+        try:
+            completion = await client.chat.completions.create(
+                model=llm_config["model"],
+                messages=full_messages,
+                temperature=request.temperature,
+                stream=request.stream,
+                max_tokens=max_tokens,
+                timeout=settings.LLM_REQUEST_TIMEOUT
+            )
+        except Exception:
+            timer.finish(status="error")
+            raise
 
-        # 使用logger替换print
-        logger.info("Chat Completion Request Info:")
-        logger.info(f"Model: {body.get('model_name', '未传model_name')}")
-        logger.info(f"Original Message: {original_message}")
-        logger.info(f"Full Messages: {json.dumps(full_messages, ensure_ascii=False, indent=2)}")
+        # 请求内容作为结构化字段，由日志线程截断和序列化
+        logger.info("Chat Completion Request Info", extra={"fields": {
+            "model": body.get('model_name', '未传model_name'),
+            "original_message": original_message,
+            "messages": full_messages,
+        }})
 
         if stream:
             # 流式响应
             async def generate_stream():
                 assistant_content = ""
-                async for chunk in completion:
-                    if chunk.choices[0].delta.content:
-                        assistant_content += chunk.choices[0].delta.content
-                    yield f"data: {json.dumps(chunk.model_dump())}\n\n"
+                finish_reason = None
+                chunks = 0
+                status = "error"
+                try:
+                    async for chunk in completion:
+                        if chunk.choices[0].delta.content:
+                            timer.first_token()
+                            chunks += 1
+                            assistant_content += chunk.choices[0].delta.content
+                        if chunk.choices[0].finish_reason:
+                            finish_reason = chunk.choices[0].finish_reason
+                        yield f"data: {json.dumps(chunk.model_dump())}\n\n"
+                    status = "ok"
+                finally:
+                    # 流式响应没有用量，prompt 按消息内容估算，completion 按数据块数估算
+                    prompt_tokens = sum(count_tokens(str(message.get("content", "")), llm_config["model"]) for message in full_messages)
+                    timer.finish(prompt_tokens, chunks, status)
+                
+                if cache_key:
+                    await asyncio.to_thread(
+                        completion_cache.put, cache_key, action,
+                        CachedCompletion(assistant_content, llm_config["model"], finish_reason)
+                    )
                 
             return StreamingResponse(
                 generate_stream(),
                 media_type="text/event-stream",
             )
         else:
+            usage = completion.usage
+            timer.finish(usage.prompt_tokens if usage else None, usage.completion_tokens if usage else None)
+            if cache_key and completion.choices:
+                choice = completion.choices[0]
+                await asyncio.to_thread(
+                    completion_cache.put, cache_key, action,
+                    CachedCompletion(choice.message.content or "", llm_config["model"], choice.finish_reason)
+                )
             return APIResponse.success(
                 data={
                     **completion.model_dump(),
@@ -255,6 +298,13 @@ async def completions(
     except Exception as e:
         return APIResponse.error(message=f"请求失败: {str(e)}")
 
+@router.get("/completions/cache/stats")
+async def get_completion_cache_stats(current_user: User = Depends(get_current_user)):
+    """获取 /completions 响应缓存按操作类型的命中统计"""
+    if completion_cache is None:
+        return APIResponse.success(data={"enabled": False, "actions": {}})
+    return APIResponse.success(data={"enabled": True, "actions": completion_cache.stats()})
+
 @router.post("/files")
 async def upload_files(
     files: List[FastAPIUploadFile] = File(
@@ -511,6 +561,7 @@ async def get_sessions(
     doc_id: Optional[str] = None,
     page: int = Query(1, ge=1, description="页码"),
     page_size: int = Query(10, ge=1, le=100, description="每页数量"),
+    cursor: Optional[str] = Query(None, description="游标分页：第一页传空字符串，之后传上一页返回的 next_cursor，传入时忽略 page"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
@@ -521,13 +572,15 @@ async def get_sessions(
         doc_id: 可选的文档ID，如果提供则只返回与该文档相关的会话
         page: 页码，从1开始
         page_size: 每页显示的数量，默认10，最大100
+        cursor: 游标分页，第一页传空字符串，之后传上一页返回的 next_cursor
         
     Returns:
-        total: 总记录数
+        total: 总记录数（游标分页时为近似值）
         items: 会话列表
         page: 当前页码
         page_size: 每页数量
         pages: 总页数
+        next_cursor: 下一页游标（仅游标分页），为空表示没有更多数据
     """
     try:
         # 构建基础查询
@@ -541,15 +594,22 @@ async def get_sessions(
         if doc_id:
             query = query.filter(ChatSession.doc_id == doc_id)
         
-        # 获取总记录数
-        total = query.count()
-        pages = (total + page_size - 1) // page_size
-        
-        # 分页查询会话
-        sessions = query.order_by(desc(ChatSession.updated_at))\
-            .offset((page - 1) * page_size)\
-            .limit(page_size)\
-            .all()
+        if cursor is not None:
+            # 游标分页：按 (updated_at, id) 定位下一页，总数按查询条件缓存
+            sessions, next_cursor = keyset_page(
+                query, [(ChatSession.updated_at, True), (ChatSession.id, True)], cursor, page_size
+            )
+            total = count_cache.get_or_count(("api.sessions", current_user.user_id, doc_id), query.count)
+        else:
+            # 获取总记录数
+            total = query.count()
+            pages = (total + page_size - 1) // page_size
+            
+            # 分页查询会话
+            sessions = query.order_by(desc(ChatSession.updated_at))\
+                .offset((page - 1) * page_size)\
+                .limit(page_size)\
+                .all()
         
         # 获取每个会话的最后一条消息
         session_data = []
@@ -570,6 +630,15 @@ async def get_sessions(
                 "updated_at": session.updated_at.strftime("%Y-%m-%d %H:%M:%S") if session.updated_at else None
             })
         
+        if cursor is not None:
+            return APIResponse.success(
+                data={
+                    "total": total,
+                    "items": session_data,
+                    "page_size": page_size,
+                    "next_cursor": next_cursor
+                }
+            )
         return APIResponse.success(
             data={
                 "total": total,
@@ -580,6 +649,8 @@ async def get_sessions(
             }
         )
         
+    except InvalidCursorError as e:
+        return APIResponse.error(message=str(e))
     except Exception as e:
         logger.error(f"获取会话列表失败: {str(e)}")
         return APIResponse.error(message=f"获取会话列表失败: {str(e)}")
@@ -589,6 +660,7 @@ async def get_session_messages(
     session_id: str,
     page: int = Query(1, ge=1, description="页码"),
     page_size: int = Query(10, ge=1, le=100, description="每页数量"),
+    cursor: Optional[str] = Query(None, description="游标分页：第一页传空字符串，之后传上一页返回的 next_cursor，传入时忽略 page"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
@@ -599,13 +671,15 @@ async def get_session_messages(
         session_id: 会话ID
         page: 页码，从1开始
         page_size: 每页显示的数量，默认10，最大100
+        cursor: 游标分页，第一页传空字符串，之后传上一页返回的 next_cursor
         
     Returns:
-        total: 总记录数
+        total: 总记录数（游标分页时为近似值）
         items: 消息列表
         page: 当前页码
         page_size: 每页数量
         pages: 总页数
+        next_cursor: 下一页游标（仅游标分页），为空表示没有更多数据
     """
     try:
         # 验证会话是否存在且属于当前用户
@@ -625,6 +699,29 @@ async def get_session_messages(
             ChatMessage.is_deleted == False
         )
         
+        def message_item(msg: ChatMessage) -> Dict[str, Any]:
+            return {
+                "message_id": msg.message_id,
+                "role": msg.role,
+                "content": msg.content,
+                "content_type": msg.content_type,
+                "outline_id": msg.outline_id,
+                "created_at": msg.created_at.strftime("%Y-%m-%d %H:%M:%S"),
+            }
+
+        if cursor is not None:
+            # 游标分页：按消息 id 定位下一页，总数按会话缓存
+            messages, next_cursor = keyset_page(query, [(ChatMessage.id, False)], cursor, page_size)
+            total = count_cache.get_or_count(("api.session_messages", session_id), query.count)
+            return APIResponse.success(
+                data={
+                    "total": total,
+                    "items": [message_item(msg) for msg in messages],
+                    "page_size": page_size,
+                    "next_cursor": next_cursor
+                }
+            )
+
         total = query.count()
         pages = (total + page_size - 1) // page_size
         
@@ -636,23 +733,15 @@ async def get_session_messages(
         return APIResponse.success(
             data={
                 "total": total,
-                "items": [
-                    {
-                        "message_id": msg.message_id,
-                        "role": msg.role,
-                        "content": msg.content,
-                        "content_type": msg.content_type,
-                        "outline_id": msg.outline_id,
-                        "created_at": msg.created_at.strftime("%Y-%m-%d %H:%M:%S"),
-                    }
-                    for msg in messages
-                ],
+                "items": [message_item(msg) for msg in messages],
                 "page": page,
                 "page_size": page_size,
                 "pages": pages
             }
         )
         
+    except InvalidCursorError as e:
+        return APIResponse.error(message=str(e))
     except Exception as e:
         logger.error(f"获取聊天记录失败: {str(e)}")
         return APIResponse.error(message=f"获取聊天记录失败: {str(e)}")
@@ -667,41 +756,16 @@ async def upload_url(
     current_user: User = Depends(get_current_user),
 ):
     try:
-        # 检查URL是否已经爬取过
-        existing_page = scraper.get_by_url(str(request.url), db)
-        if existing_page and existing_page.user_id == current_user.user_id:
-            return APIResponse.success(
-                message="URL内容已存在",
-                data={
-                    "webpage_id": existing_page.webpage_id,
-                    "url": existing_page.url,
-                    "title": existing_page.title,
-                }
-            )
-        if existing_page:
-            content = existing_page.__dict__.copy()
-            webpage = scraper.save_to_db(current_user.user_id, content, db)
-            
-            return APIResponse.success(
-                message="URL内容爬取成功",
-                data={
-                    "webpage_id": webpage.webpage_id,
-                    "url": webpage.url,
-                    "title": webpage.title,
-                }
-            )
-        
-        # 爬取新的URL内容
-        webpage = scraper.scrape_and_save(current_user.user_id, str(request.url), db)
-        if not webpage:
+        result = (await scraper.ingest(current_user.user_id, [str(request.url)], db))[0]
+        if result["status"] == INGEST_FAILED:
             return APIResponse.error(message="爬取URL内容失败")
-            
+
         return APIResponse.success(
-            message="URL内容爬取成功",
+            message="URL内容已存在" if result["status"] == INGEST_EXISTING else "URL内容爬取成功",
             data={
-                "webpage_id": webpage.webpage_id,
-                "url": str(request.url),
-                "title": webpage.title,
+                "webpage_id": result["webpage_id"],
+                "url": result["url"],
+                "title": result["title"],
             }
         )
         
@@ -709,6 +773,43 @@ async def upload_url(
         logger.error(f"上传URL失败: {str(e)}")
         return APIResponse.error(message=f"上传URL失败: {str(e)}")
 
+class UrlBatchUploadRequest(BaseModel):
+    urls: List[HttpUrl] = Field(..., min_length=1, description="要爬取的网页URL列表")
+    refresh: bool = Field(False, description="是否重新抓取已存在的URL（条件请求，页面未变化时复用原内容）")
+
+@router.post("/urls/batch", summary="批量上传URL")
+async def upload_urls(
+    request: UrlBatchUploadRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """
+    批量上传URL，所有URL并发抓取
+
+    Returns:\n
+        items: 每个URL的处理结果，status 为 existing/created/refreshed/not_modified/failed\n
+        succeeded: 成功数量\n
+        failed: 失败数量
+    """
+    if len(request.urls) > settings.CRAWLER_BATCH_MAX_URLS:
+        return APIResponse.error(message=f"单次最多上传 {settings.CRAWLER_BATCH_MAX_URLS} 个URL")
+    try:
+        results = await scraper.ingest(
+            current_user.user_id, [str(url) for url in request.urls], db, refresh=request.refresh
+        )
+        failed = sum(1 for result in results if result["status"] == INGEST_FAILED)
+        return APIResponse.success(
+            message="URL批量上传完成",
+            data={
+                "items": results,
+                "succeeded": len(results) - failed,
+                "failed": failed,
+            }
+        )
+    except Exception as e:
+        logger.error(f"批量上传URL失败: {str(e)}")
+        return APIResponse.error(message=f"批量上传URL失败: {str(e)}")
+
 class WebPageResponse(BaseModel):
     webpage_id: str = Field(..., description="网页ID")
     url: str = Field(..., description="网页URL")
@@ -1,5 +1,5 @@
 from fastapi import APIRouter, Depends, Query
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, undefer
 from pydantic import BaseModel, Field
 from typing import Optional, List
 from fastapi.params import Body
@@ -144,7 +144,7 @@ async def get_document_versions(
     if not document:
         return APIResponse.error(message="文档不存在或无权访问")
     
-    versions = db.query(DocumentVersion).filter(
+    versions = db.query(DocumentVersion).options(undefer(DocumentVersion.content)).filter(
         DocumentVersion.doc_id == doc_id
     ).order_by(desc(DocumentVersion.version)).all()
     
@@ -366,7 +366,7 @@ async def export_document_docx(
         # 获取版本历史（如果需要）
         versions = None
         if include_versions:
-            versions_query = db.query(DocumentVersion).filter(
+            versions_query = db.query(DocumentVersion).options(undefer(DocumentVersion.content)).filter(
                 DocumentVersion.doc_id == doc_id
             ).order_by(desc(DocumentVersion.version)).all()
             
@@ -442,7 +442,7 @@ async def export_document_pdf(
         # 获取版本历史（如果需要）
         versions = None
         if include_versions:
-            versions_query = db.query(DocumentVersion).filter(
+            versions_query = db.query(DocumentVersion).options(undefer(DocumentVersion.content)).filter(
                 DocumentVersion.doc_id == doc_id
             ).order_by(desc(DocumentVersion.version)).all()
             
@@ -3,6 +3,7 @@ from sqlalchemy.orm import Session
 from app.database import get_db
 from app.models.system_config import SystemConfig
 from app.schemas.response import APIResponse
+from app.services.prompt_registry import prompt_registry
 from pydantic import BaseModel, Field
 from typing import Optional
 
@@ -77,7 +78,10 @@ async def update_prompt_template(
         if prompt.description:
             db_template.description = prompt.description
     
+    # 递增模板版本号，其他实例检查到后重新加载
+    prompt_registry.bump_version(db)
     db.commit()
+    prompt_registry.invalidate()
     db.refresh(db_template)
     
     return APIResponse.success(
@@ -8,7 +8,7 @@ from fastapi import APIRouter, Depends, File, UploadFile as FastAPIUploadFile
 from fastapi.params import Body, Path, Query
 from fastapi.responses import StreamingResponse, FileResponse
 from pydantic import BaseModel, Field
-from sqlalchemy import desc
+from sqlalchemy import desc, func
 from sqlalchemy.orm import Session
 from app.auth import get_current_user
 from app.config import settings
@@ -21,10 +21,12 @@ from app.rag.parser import convert_doc_to_docx, get_parser, get_file_format
 from app.rag.rag_api_async import rag_api_async
 from app.rag.kb import ensure_user_knowledge_base, get_department_kb, get_department_kbs, get_knowledge_base, get_system_kb, get_user_kb, get_user_shared_kb, has_permission_to_file, has_permission_to_kb
 from app.rag.department import get_all_departments, get_departments
-from app.schemas.response import APIResponse, PaginationData, PaginationResponse
+from app.schemas.response import APIResponse, CursorPaginationData, PaginationData, PaginationResponse
 from app.models.task import Task, TaskStatus
 from app.models.document import Document
 from app.models.department import Department, UserDepartment
+from app.utils.pagination import InvalidCursorError, count_cache, keyset_page
+from app.rag.search import apply_file_search
 import re
 import hashlib
 
@@ -197,7 +199,9 @@ async def get_files(
     page: Optional[int] = Query(default=1, ge=1, description="页码", example=1),
     page_size: Optional[int] = Query(default=10, ge=1, description="每页数量", example=10),
     current_user: User = Depends(get_current_user),
-    file_name: Optional[str] = Query(None, description="搜索关键词", example="四川"),
+    file_name: Optional[str] = Query(None, description="搜索关键词，多个关键词用逗号或空格分隔", example="四川"),
+    search_content: bool = Query(False, description="同时搜索解析出的文件内容"),
+    cursor: Optional[str] = Query(None, description="游标分页：第一页传空字符串，之后传上一页返回的 next_cursor，传入时忽略 page；游标分页按时间倒序，不按相关度排序"),
     db: Session = Depends(get_db)
 ):
     try:
@@ -245,41 +249,64 @@ async def get_files(
 
         query_filter = db.query(RagFile).filter(RagFile.kb_id.in_(kb_ids), RagFile.is_deleted == False)
 
+        owner_id = None
         if category == "user" or category == "user_shared" or category == "user_all":
-            query_filter = query_filter.filter(RagFile.user_id == current_user.user_id)
+            owner_id = current_user.user_id
+            query_filter = query_filter.filter(RagFile.user_id == owner_id)
         
-        # 文件名搜索
+        # 文件名、内容搜索，MySQL 上走全文索引并返回相关度
+        score = None
         if file_name:
-            query_list = re.split(r'[,\s、]+', file_name)
-            for term in query_list:
-                query_filter = query_filter.filter(RagFile.file_name.contains(term))
+            query_filter, score = apply_file_search(query_filter, file_name, search_content, db.get_bind().dialect.name)
+
+        def file_item(file: RagFile) -> Dict[str, Any]:
+            return {
+                "kb_id": file.kb_id,
+                "kb_type": RagKnowledgeBaseType.type_to_name(file.kb_type),
+                "user_id": file.user_id,
+                "file_id": file.file_id,
+                "file_name": file.file_name,
+                "file_size": file.file_size,
+                "file_words": file.file_words,
+                "department_id": kb_depts[file.kb_id].department_id if file.kb_id in kb_depts else "",
+                "department_name": kb_depts[file.kb_id].name if file.kb_id in kb_depts else "",
+                "status": RagFileStatus.get_status_map()[file.status],
+                "error_message": file.error_message,
+                "created_at": file.created_at
+            }
+
+        if cursor is not None:
+            files, next_cursor = keyset_page(query_filter, [(RagFile.id, True)], cursor, page_size)
+            total = count_cache.get_or_count(
+                ("rag.files", tuple(sorted(kb_ids)), owner_id, file_name, search_content),
+                query_filter.count
+            )
+            return APIResponse.success(
+                message="获取知识库文件列表成功",
+                data=CursorPaginationData(
+                    list=[file_item(file) for file in files],
+                    total=total,
+                    page_size=page_size,
+                    next_cursor=next_cursor
+                )
+            )
         
         total = query_filter.count()
         total_pages = (total + page_size - 1) // page_size
-        files = query_filter.order_by(RagFile.id.desc()).offset((page - 1) * page_size).limit(page_size).all()
+        order = [RagFile.id.desc()] if score is None else [desc(score), RagFile.id.desc()]
+        files = query_filter.order_by(*order).offset((page - 1) * page_size).limit(page_size).all()
         return APIResponse.success(
             message="获取知识库文件列表成功",
             data=PaginationData(
-                list=[{
-                    "kb_id": file.kb_id,
-                    "kb_type": RagKnowledgeBaseType.type_to_name(file.kb_type),
-                    "user_id": file.user_id,
-                    "file_id": file.file_id,
-                    "file_name": file.file_name,
-                    "file_size": file.file_size,
-                    "file_words": file.file_words,
-                    "department_id": kb_depts[file.kb_id].department_id if file.kb_id in kb_depts else "",
-                    "department_name": kb_depts[file.kb_id].name if file.kb_id in kb_depts else "",
-                    "status": RagFileStatus.get_status_map()[file.status],
-                    "error_message": file.error_message,
-                    "created_at": file.created_at
-                } for file in files],
+                list=[file_item(file) for file in files],
                 total=total,
                 page=page,
                 page_size=page_size,
                 total_pages=total_pages
             )
         )
+    except InvalidCursorError as e:
+        return APIResponse.error(message=str(e))
     except Exception as e:
         logger.exception(f"获取知识库文件列表时发生异常: {str(e)}")
         return APIResponse.error(message="获取知识库文件列表失败")
@@ -656,16 +683,22 @@ async def chat(
         if not chat_session:
             return APIResponse.error(message="会话不存在或无权访问")
 
-        reference_files = db.query(RagFile).filter(
+        reference_filter = (
             RagFile.file_id.in_(request.file_ids),
             RagFile.user_id == current_user.user_id,
             RagFile.is_deleted == False
-        ).all()
+        )
+        reference_count = db.query(func.count(RagFile.id)).filter(*reference_filter).scalar()
         
         custom_prompt = ''
-        per_file_max_length = int(settings.RAG_CHAT_TOTAL_FILE_MAX_LENGTH / (len(reference_files) if len(reference_files) > 0 else 1))
+        per_file_max_length = int(settings.RAG_CHAT_TOTAL_FILE_MAX_LENGTH / (reference_count if reference_count > 0 else 1))
+        # 只读取每个文件内容的前 per_file_max_length 个字符
+        reference_files = db.query(
+            RagFile.file_name,
+            func.substring(RagFile.content, 1, per_file_max_length).label("content_preview")
+        ).filter(*reference_filter).order_by(RagFile.id).all() if reference_count else []
         for file in reference_files:
-            content_preview = file.content[:per_file_max_length]
+            content_preview = file.content_preview or ""
             custom_prompt += f"文件名: {file.file_name}\n文件内容: {content_preview}\n\n"
 
         if chat_session.doc_id:
@@ -729,7 +762,7 @@ async def chat(
             for at_file in at_files:
                 at_kb_file_ids.append(at_file.kb_file_id)
 
-        logger.info(json.dumps({
+        logger.info("RAG对话请求", extra={"fields": {
             "session_id": session_id,
             "message_id": question_message_id,
             "user_id": current_user.user_id,
@@ -746,14 +779,13 @@ async def chat(
             "hybrid_search": hybrid_search,
             "max_token": settings.RAG_CHAT_MAX_TOKENS,
             "api_base": model['base_url'],
-            "api_key": model['api_key'],
             "model": model['model'],
             "api_context_length": settings.RAG_CHAT_API_CONTEXT_LENGTH,
             "chunk_size": settings.RAG_CHAT_CHUNK_SIZE,
             "top_p": settings.RAG_CHAT_TOP_P,
             "top_k": settings.RAG_CHAT_TOP_K,
             "temperature": settings.RAG_CHAT_TEMPERATURE
-        }, ensure_ascii=False))
+        }})
 
         streaming = request.stream
 
@@ -4,18 +4,17 @@ import shortuuid
 from typing import List, Optional, Tuple, Dict, Any
 from fastapi import APIRouter, Depends, Path, UploadFile as FastAPIUploadFile, File, Query, Body
 from pydantic import BaseModel, Field
-from sqlalchemy import desc
+from sqlalchemy import desc, func
 from sqlalchemy.orm import Session
 import os
 import asyncio
-import concurrent.futures
 import json
 import time
 from fastapi.responses import StreamingResponse
 import threading
 from datetime import datetime, timedelta
 
-from app.schemas.response import APIResponse, PaginationData
+from app.schemas.response import APIResponse, CursorPaginationData, PaginationData
 from app.database import get_db
 from app.services import OutlineGenerator
 from app.models.outline import (
@@ -34,23 +33,78 @@ from app.config import settings
 from app.parser import DocxParser, MarkdownParser
 from app.auth import get_current_user
 from app.models.user import User, UserRole
-from app.utils.outline import  build_paragraph_response
+from app.utils.outline import  paragraph_path
+from app.utils.pagination import InvalidCursorError, count_cache, keyset_page
 from app.models.task import Task, TaskStatus, TaskType
 from app.models.document import Document
 from app.models.rag import RagFile, RagFileStatus, RagKnowledgeBase, RagKnowledgeBaseType
 from app.models.department import UserDepartment
 from app.models.system_config import SystemConfig
+from app.services.task_scheduler import writing_task_scheduler, TaskPriority, TaskQueueFullError
+from app.services.task_queue import QueuedJob, get_task_queue, load_task_checkpoint, save_task_checkpoint
+from app.services.task_worker import TaskQueueWorker
+from app.services.task_checkpoint import clear_task_checkpoints, has_task_checkpoints
+from app.services.task_profile import summarize_profile, task_profile
+from app.services.doc_stream import get_doc_stream_hub
+from app.services.outline_cache import outline_tree_cache
+from app.services.outline_writer import delete_paragraphs, insert_paragraph_level, normalize_count_style, paragraph_row, sync_references
 
 logger = logging.getLogger("app")
 
 router = APIRouter()
 
-# 存储正在运行的任务ID，避免重复处理
-running_tasks = set()
-# 线程锁，确保线程安全
-task_lock = threading.Lock()
-# 创建线程池执行器
-executor = concurrent.futures.ThreadPoolExecutor()
+# 持久化队列中写作任务的队列名称
+WRITING_TASK_QUEUE = "writing"
+
+
+def _check_writing_admission(user_id: str) -> Optional[APIResponse]:
+    """
+    检查是否可以接收新的写作任务，队列已满时返回 429 响应
+    """
+    task_queue = get_task_queue()
+    try:
+        if task_queue:
+            task_queue.check_admission(WRITING_TASK_QUEUE, user_id)
+        else:
+            writing_task_scheduler.check_admission(user_id)
+    except TaskQueueFullError as e:
+        return APIResponse.error(message=str(e), code=429)
+    return None
+
+
+def _get_task_queue_position(task_id: str) -> Optional[int]:
+    """获取写作任务的排队位置"""
+    task_queue = get_task_queue()
+    if task_queue:
+        return task_queue.get_queue_position(task_id)
+    return writing_task_scheduler.get_queue_position(task_id)
+
+
+def _submit_writing_task(db: Session, task: Task, user_id: str, assistant_message_id: str, priority: TaskPriority, fn, **kwargs) -> Optional[APIResponse]:
+    """
+    将写作任务提交到调度器（或持久化队列），队列已满时将任务标记为失败并返回 429 响应
+    """
+    try:
+        task_queue = get_task_queue()
+        if task_queue:
+            task_queue.check_admission(WRITING_TASK_QUEUE, user_id)
+            task_queue.enqueue(task.id, WRITING_TASK_QUEUE, user_id, priority, {
+                "type": task.type.value,
+                "kwargs": kwargs
+            }, settings.TASK_QUEUE_MAX_ATTEMPTS)
+        else:
+            writing_task_scheduler.submit(task.id, user_id, priority, fn, kwargs=dict(task_id=task.id, **kwargs))
+        return None
+    except TaskQueueFullError as e:
+        logger.warning(f"写作任务被拒绝 [task_id={task.id}, user_id={user_id}]: {str(e)}")
+        task.status = TaskStatus.FAILED
+        task.error = str(e)
+        db.query(ChatMessage).filter(ChatMessage.message_id == assistant_message_id).update({
+            "content": str(e),
+            "task_status": TaskStatus.FAILED.value
+        })
+        db.commit()
+        return APIResponse.error(message=str(e), code=429)
 
 # Architectural hinge:
 # This router is the coordination layer between user-facing writing flows and the lower-level services described in ARCHITECTURE.md.
@@ -133,6 +187,9 @@ class GetOutlineRequest(BaseModel):
 
 def get_sibling_index(paragraph, outline_id, db):
     """获取段落在同级中的序号（从1开始）"""
+    if paragraph.path:
+        # 物化路径的最后一级即为同级序号
+        return int(paragraph.path.rsplit(".", 1)[-1]) + 1
     if not paragraph.parent_id:
         # 获取所有顶级段落
         siblings = db.query(SubParagraph).filter(
@@ -170,6 +227,9 @@ async def generate_outline(
         task_id: 任务ID
         session_id: 会话ID
     """
+    rejected = _check_writing_admission(current_user.user_id)
+    if rejected:
+        return rejected
 
     at_file_ids = []
     if request.at_file_ids:
@@ -212,7 +272,9 @@ async def generate_outline(
                         title=para.title,
                         description=para.description,
                         count_style=para.count_style,
-                        reference_status=para.reference_status
+                        reference_status=para.reference_status,
+                        sort_index=para.sort_index,
+                        path=para.path
                     )
                     db.add(new_para)
                     db.flush()  # 获取新ID
@@ -264,60 +326,6 @@ async def generate_outline(
             # 使用新创建的大纲
             outline = new_outline
             
-        # 一次性获取所有段落
-        all_paragraphs = db.query(SubParagraph).filter(
-            SubParagraph.outline_id == outline.id
-        ).all()
-        
-        # 构建段落字典和父子关系字典
-        paragraphs_dict = {p.id: p for p in all_paragraphs}
-        siblings_dict = {}  # parent_id -> [ordered_child_ids]
-        for p in all_paragraphs:
-            if p.parent_id not in siblings_dict:
-                siblings_dict[p.parent_id] = []
-            siblings_dict[p.parent_id].append(p.id)
-        
-        # 确保每个列表都是按 sort_index 排序的
-        for parent_id in siblings_dict:
-            siblings_dict[parent_id].sort(
-                key=lambda para_id: (
-                    paragraphs_dict[para_id].sort_index if paragraphs_dict[para_id].sort_index is not None else paragraphs_dict[para_id].id
-                )
-            )
-            
-        # 递归构建段落树
-        def build_paragraph_tree(parent_id=None):
-            result = []
-            children_ids = siblings_dict.get(parent_id, [])
-            
-            # 对子段落按 sort_index 排序
-            children_ids.sort(
-                key=lambda para_id: (
-                    paragraphs_dict[para_id].sort_index if paragraphs_dict[para_id].sort_index is not None else paragraphs_dict[para_id].id
-                )
-            )
-            
-            for para_id in children_ids:
-                paragraph = paragraphs_dict[para_id]
-                # 使用 build_paragraph_response 构建数据
-                data = build_paragraph_response(
-                    paragraph, 
-                    siblings_dict, 
-                    paragraphs_dict, 
-                    {}, 
-                    ReferenceStatus
-                )
-                
-                # 递归处理子段落
-                children = build_paragraph_tree(para_id)
-                if children:
-                    data["children"] = children
-                
-                result.append(data)
-            
-            return result
-        
-        
         # 创建聊天会话
         session_id = f"chat-{shortuuid.uuid()}"[:22]
         chat_session = ChatSession(
@@ -360,6 +368,7 @@ async def generate_outline(
             type=TaskType.GENERATE_OUTLINE,
             status=TaskStatus.PENDING,
             session_id=session_id,
+            user_id=current_user.user_id,
             params={
                 "user_id": current_user.user_id,
                 "prompt": request.prompt,
@@ -374,13 +383,9 @@ async def generate_outline(
         db.commit()
         
         
-        # 记录任务到运行集合中
-        with task_lock:
-            running_tasks.add(task_id)
-        
-        # 启动异步任务
-        executor.submit(run_outline_task,
-            task_id=task_id,
+        # 提交到任务调度器
+        rejected = _submit_writing_task(db, task, current_user.user_id, assistant_message_id,
+            TaskPriority.INTERACTIVE, run_outline_task,
             prompt=request.prompt,
             file_ids=request.file_ids or [],
             session_id=session_id,
@@ -389,6 +394,8 @@ async def generate_outline(
             web_search=request.web_search,
             at_file_ids=at_file_ids
         )
+        if rejected:
+            return rejected
         
         # 立即返回响应，不等待异步任务完成
         return APIResponse.success(message="大纲生成任务已创建", data={
@@ -438,6 +445,7 @@ async def generate_outline(
         type=TaskType.GENERATE_OUTLINE,
         status=TaskStatus.PENDING,
         session_id=session_id,
+        user_id=current_user.user_id,
         params={
             "user_id": current_user.user_id,
             "prompt": request.prompt,
@@ -451,13 +459,9 @@ async def generate_outline(
     # 提交事务
     db.commit()
     
-    # 记录任务到运行集合中
-    with task_lock:
-        running_tasks.add(task_id)
-    
-    # 启动异步任务
-    executor.submit(run_outline_task,
-        task_id=task_id,
+    # 提交到任务调度器
+    rejected = _submit_writing_task(db, task, current_user.user_id, assistant_message_id,
+        TaskPriority.INTERACTIVE, run_outline_task,
         prompt=request.prompt,
         file_ids=request.file_ids or [],
         session_id=session_id,
@@ -466,6 +470,8 @@ async def generate_outline(
         web_search=request.web_search,
         at_file_ids=at_file_ids
     )
+    if rejected:
+        return rejected
     
     # 立即返回响应，不等待异步任务完成
     return APIResponse.success(message="大纲生成任务已创建", data={
@@ -534,8 +540,14 @@ async def process_outline_generation(task_id: str, prompt: str, file_ids: List[s
                     if department_kbs:
                         kb_ids.extend([kb.kb_id for kb in department_kbs])
             
-            # 生成大纲
-            outline_data = await _generate_outline(outline_generator, prompt, file_contents, user_id, kb_ids, task_id, db, at_file_ids)
+            # 生成大纲，重试时优先使用断点中已生成的大纲
+            checkpoint = load_task_checkpoint(task_id)
+            outline_data = checkpoint.get("outline_data")
+            if outline_data:
+                logger.info(f"从断点恢复已生成的大纲 [task_id={task_id}]")
+            else:
+                outline_data = await _generate_outline(outline_generator, prompt, file_contents, user_id, kb_ids, task_id, db, at_file_ids)
+                save_task_checkpoint(task_id, {"outline_data": outline_data})
             
             # 保存大纲并更新消息
             await _save_outline_and_update_message(
@@ -716,6 +728,7 @@ async def get_task_status(
         process: 进度百分比 (0-100)
         process_detail_info: 进度详情描述
         log: 日志
+        queue_position: 排队位置（从1开始），未在排队时为 null
     """
     task = db.query(Task).filter(
         Task.id == task_id,
@@ -734,12 +747,51 @@ async def get_task_status(
         "error": task.error,
         "process": task.process or 0,
         "process_detail_info": task.process_detail_info or "",
-        "log": task.log or ""
+        "log": task.log or "",
+        "queue_position": _get_task_queue_position(task.id)
     }
     
     return APIResponse.success(message="获取任务状态成功", data=response_data)
 
 
+@router.get("/tasks/{task_id}/profile")
+async def get_task_profile(
+    task_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    获取任务各阶段耗时
+
+    Args:
+        task_id: 任务ID
+
+    Returns:
+        id: 任务ID
+        type: 任务类型
+        status: 任务状态
+        summary: 按阶段名称汇总的次数、总耗时、最大耗时（毫秒），按总耗时降序
+        profile: span 树，每个节点包含 name、start_ms（相对任务开始）、duration_ms、attrs、children，
+                 任务执行中或中断时为空
+    """
+    # span 属性中包含检索问题、段落标题等内容，只允许任务所属用户和系统管理员查看
+    query = db.query(Task).filter(Task.id == task_id)
+    if current_user.admin != UserRole.SYS_ADMIN:
+        query = query.filter(Task.user_id == current_user.user_id)
+    task = query.first()
+    if not task:
+        return APIResponse.error(message=f"未找到ID为{task_id}的任务")
+
+    profile = task.profile
+    return APIResponse.success(message="获取任务耗时成功", data={
+        "id": task.id,
+        "type": task.type.value,
+        "status": task.status.value,
+        "summary": summarize_profile(profile),
+        "profile": profile or None
+    })
+
+
 @router.put("/outlines/{outline_id}")
 async def update_outline(
     outline_id: str,
@@ -815,140 +867,68 @@ async def update_outline(
         # 首先验证整个段落结构
         validate_paragraph_structure(request.sub_paragraphs)
         
-        # 递归更新段落
-        def update_paragraphs_recursively(paragraphs, parent_id=None):
-            result_ids = []
-            
-            for index, para_data in enumerate(paragraphs):
+        # 按层级更新段落：已有段落原地更新，每一层的新段落批量插入
+        known_ids = set(existing_dict)
+        references_by_paragraph = {}  # 1级段落ID -> 请求中的引用列表
+        level_items = [(None, None, index, para_data) for index, para_data in enumerate(request.sub_paragraphs)]
+        while level_items:
+            resolved_ids = []
+            new_rows = []
+            new_positions = []
+            for position, (parent_id, parent_path, index, para_data) in enumerate(level_items):
+                path = paragraph_path(parent_path, index)
                 paragraph_id = para_data.id
-                
+
                 # 如果有ID且存在于现有段落中，则更新
                 if paragraph_id is not None and paragraph_id in existing_dict:
                     paragraph = existing_dict[paragraph_id]
-                    
-                    # 更新基本信息
                     paragraph.title = para_data.title
                     paragraph.description = para_data.description
                     paragraph.reference_status = ReferenceStatus(para_data.reference_status)
                     paragraph.parent_id = parent_id
                     paragraph.sort_index = index  # 使用索引作为排序依据
-                    
+                    paragraph.path = path
+
                     # 只有1级段落才能设置count_style
                     if para_data.level == 1 and para_data.count_style:
-                        count_style_value = para_data.count_style.lower()
-                        # 确保count_style是有效的枚举值
-                        if count_style_value not in [e.value for e in CountStyle]:
-                            count_style_value = "medium"  # 默认值
-                        paragraph.count_style = count_style_value
-                    
-                    # 记录此段落已处理
+                        paragraph.count_style = normalize_count_style(para_data.count_style)
+
                     new_paragraph_ids.add(paragraph_id)
-                    result_ids.append(paragraph_id)
-                    
-                    # 处理引用（只有1级段落才能有引用）
+                    resolved_ids.append(paragraph_id)
+                    # 只有1级段落才能有引用，已有段落的引用同步为请求中的列表
                     if para_data.level == 1:
-                        # 删除所有现有引用
-                        db.query(Reference).filter(
-                            Reference.sub_paragraph_id == paragraph_id
-                        ).delete()
-                        
-                        # 添加新引用
-                        if para_data.references:
-                            for ref_data in para_data.references:
-                                # 创建引用
-                                ref_id = ref_data.id if ref_data.id else shortuuid.uuid()
-                                reference = Reference(
-                                    id=ref_id,
-                                    sub_paragraph_id=paragraph.id,
-                                    type=ref_data.type.value,
-                                    is_selected=ref_data.is_selected
-                                )
-                                db.add(reference)
-                                db.flush()
-                                
-                                # 如果是网页链接类型，创建WebLink
-                                if ref_data.type == ReferenceType.WEB_LINK and ref_data.web_link:
-                                    web_link = WebLink(
-                                        reference_id=reference.id,
-                                        url=ref_data.web_link.url,
-                                        title=ref_data.web_link.title,
-                                        summary=ref_data.web_link.summary,
-                                        icon_url=ref_data.web_link.icon_url,
-                                        content_count=ref_data.web_link.content_count,
-                                        content=ref_data.web_link.content
-                                    )
-                                    db.add(web_link)
+                        references_by_paragraph[paragraph_id] = para_data.references or []
                 else:
-                    # 创建新段落
-                    paragraph = SubParagraph(
-                        outline_id=outline_id,
-                        title=para_data.title,
-                        description=para_data.description,
-                        reference_status=ReferenceStatus(para_data.reference_status),
-                        level=para_data.level,
-                        parent_id=parent_id,
-                        sort_index=index  # 使用索引作为排序依据
-                    )
-                    
-                    # 只有1级段落才能设置count_style
-                    if para_data.level == 1 and para_data.count_style:
-                        count_style_value = para_data.count_style.lower()
-                        # 确保count_style是有效的枚举值
-                        if count_style_value not in [e.value for e in CountStyle]:
-                            count_style_value = "medium"  # 默认值
-                        paragraph.count_style = count_style_value
-                    
-                    db.add(paragraph)
-                    db.flush()  # 获取ID
-                    
-                    # 如果是新创建的段落，记录其ID
-                    if paragraph_id is not None:
-                        new_paragraph_ids.add(paragraph_id)
-                    result_ids.append(paragraph.id)
-                    
-                    # 只有1级段落才能有引用
-                    if para_data.level == 1 and para_data.references:
-                        for ref_data in para_data.references:
-                            # 创建引用
-                            ref_id = ref_data.id if ref_data.id else shortuuid.uuid()
-                            reference = Reference(
-                                id=ref_id,
-                                sub_paragraph_id=paragraph.id,
-                                type=ref_data.type.value,
-                                is_selected=ref_data.is_selected
-                            )
-                            db.add(reference)
-                            db.flush()
-                            
-                            # 如果是网页链接类型，创建WebLink
-                            if ref_data.type == ReferenceType.WEB_LINK and ref_data.web_link:
-                                web_link = WebLink(
-                                    reference_id=reference.id,
-                                    url=ref_data.web_link.url,
-                                    title=ref_data.web_link.title,
-                                    summary=ref_data.web_link.summary,
-                                    icon_url=ref_data.web_link.icon_url,
-                                    content_count=ref_data.web_link.content_count,
-                                    content=ref_data.web_link.content
-                                )
-                                db.add(web_link)
-                
-                # 递归处理子段落
-                if para_data.children:
-                    child_ids = update_paragraphs_recursively(para_data.children, paragraph.id if paragraph_id is None else paragraph_id)
-            
-            return result_ids
-        
-        # 开始递归更新
-        update_paragraphs_recursively(request.sub_paragraphs)
-        
-        # 删除不再存在的段落
-        for old_id, old_paragraph in existing_dict.items():
-            if old_id not in new_paragraph_ids:
-                db.delete(old_paragraph)
+                    new_rows.append(paragraph_row(
+                        outline.id, parent_id, para_data.level, index,
+                        para_data.title, para_data.description,
+                        para_data.count_style, para_data.reference_status,
+                        parent_path=parent_path
+                    ))
+                    new_positions.append(position)
+                    resolved_ids.append(None)
+
+            for position, new_id in zip(new_positions, insert_paragraph_level(db, new_rows, known_ids)):
+                resolved_ids[position] = new_id
+                para_data = level_items[position][3]
+                if para_data.level == 1 and para_data.references:
+                    references_by_paragraph[new_id] = para_data.references
+
+            level_items = [
+                (paragraph_id, paragraph_path(parent_path, index), child_index, child)
+                for (_, parent_path, index, para_data), paragraph_id in zip(level_items, resolved_ids)
+                for child_index, child in enumerate(para_data.children or [])
+            ]
+
+        sync_references(db, references_by_paragraph)
+
+        # 删除不再存在的段落（先写出已有段落的更新，移到其他父段落下的子段落不会随旧父段落删除）
+        db.flush()
+        delete_paragraphs(db, [p for old_id, p in existing_dict.items() if old_id not in new_paragraph_ids])
         
         # 提交更改
         db.commit()
+        outline_tree_cache.invalidate(outline.id)
         
         return APIResponse.success(message="大纲更新成功", data={"id": outline.id})
     
@@ -987,66 +967,8 @@ async def get_outline(
     if outline.user_id is not None and outline.user_id != current_user.user_id and current_user.admin != UserRole.SYS_ADMIN:
         return APIResponse.error(message="您没有权限访问该大纲")
     
-    # 一次性获取所有段落
-    all_paragraphs = db.query(SubParagraph).filter(
-        SubParagraph.outline_id == outline_id
-    ).all()
-    
-    # 构建段落字典和父子关系字典
-    paragraphs_dict = {p.id: p for p in all_paragraphs}
-    siblings_dict = {}  # parent_id -> [ordered_child_ids]
-    for p in all_paragraphs:
-        if p.parent_id not in siblings_dict:
-            siblings_dict[p.parent_id] = []
-        siblings_dict[p.parent_id].append(p.id)
-    
-    # 确保每个列表都是按 sort_index 排序的
-    for parent_id in siblings_dict:
-        siblings_dict[parent_id].sort(
-            key=lambda para_id: (
-                paragraphs_dict[para_id].sort_index if paragraphs_dict[para_id].sort_index is not None else paragraphs_dict[para_id].id
-            )
-        )
-    
-    # 递归构建段落树
-    def build_paragraph_tree(parent_id=None):
-        result = []
-        children_ids = siblings_dict.get(parent_id, [])
-        
-        # 对子段落按 sort_index 排序
-        children_ids.sort(
-            key=lambda para_id: (
-                paragraphs_dict[para_id].sort_index if paragraphs_dict[para_id].sort_index is not None else paragraphs_dict[para_id].id
-            )
-        )
-        
-        for para_id in children_ids:
-            paragraph = paragraphs_dict[para_id]
-            # 使用 build_paragraph_response 构建数据
-            data = build_paragraph_response(
-                paragraph, 
-                siblings_dict, 
-                paragraphs_dict, 
-                {}, 
-                ReferenceStatus
-            )
-            
-            # 递归处理子段落
-            children = build_paragraph_tree(para_id)
-            if children:
-                data["children"] = children
-            
-            result.append(data)
-        
-        return result
-    
-    # 构建响应
-    response_data = {
-        "id": outline.id,
-        "title": outline.title,
-        "markdown_content": outline.markdown_content,
-        "sub_paragraphs": build_paragraph_tree()
-    }
+    # 段落树和Markdown由编译缓存提供，大纲未修改时不再加载段落
+    response_data = outline_tree_cache.get(db, outline).to_response()
     
     return APIResponse.success(message="获取大纲详情成功", data=response_data)
 
@@ -1088,6 +1010,10 @@ async def generate_content(
     # 验证请求参数
     if not request.outline_id and not request.prompt:
         return APIResponse.error(message="必须提供大纲ID或写作提示")
+
+    rejected = _check_writing_admission(current_user.user_id)
+    if rejected:
+        return rejected
     
     # 创建或使用现有会话ID
     session_id = request.session_id
@@ -1184,6 +1110,9 @@ async def generate_content(
         type=TaskType.GENERATE_CONTENT,
         status=TaskStatus.PENDING,
         session_id=session_id,
+        user_id=current_user.user_id,
+        doc_id=doc_id,
+        outline_id=request.outline_id,
         params={
             "user_id": current_user.user_id,
             "outline_id": request.outline_id,
@@ -1197,13 +1126,9 @@ async def generate_content(
     db.add(task)
     db.commit()
     
-    # 记录任务到运行集合中
-    with task_lock:
-        running_tasks.add(task_id)
-    
-    # 启动异步任务
-    executor.submit(run_content_task,
-        task_id=task_id,
+    # 提交到任务调度器
+    rejected = _submit_writing_task(db, task, current_user.user_id, assistant_message_id,
+        TaskPriority.BATCH, run_content_task,
         outline_id=request.outline_id,
         prompt=request.prompt,
         file_ids=request.file_ids or [],
@@ -1215,6 +1140,8 @@ async def generate_content(
         web_search=request.web_search,
         at_file_ids=at_file_ids
     )
+    if rejected:
+        return rejected
     
     # 立即返回响应，不等待异步任务完成
     return APIResponse.success(message="全文生成任务已创建", data={
@@ -1279,7 +1206,7 @@ async def process_content_generation(task_id: str, outline_id: Optional[str], pr
                 kb_ids.extend([kb.kb_id for kb in department_kbs])
 
             # 生成内容
-            full_content = await _generate_content(outline_generator, outline_id, prompt, file_contents, db, user_id, kb_ids, session_id, doc_id, at_file_ids)
+            full_content = await _generate_content(outline_generator, outline_id, prompt, file_contents, db, user_id, kb_ids, session_id, doc_id, at_file_ids, task_id)
             
             # 保存文档并更新消息
             document_id = await _save_document_and_update_message(
@@ -1305,17 +1232,23 @@ async def _prepare_generation_resources(db: Session, task_id: str, file_ids: Lis
     """准备生成所需的资源：用户ID和参考文件内容"""
     # 获取用户ID
     task = db.query(Task).filter(Task.id == task_id).first()
-    task_params = task.params
-    user_id = task_params.get("user_id")
+    user_id = task.user_id
     logger.info(f"获取用户ID [user_id={user_id}]")
     
     # 获取文件内容
     file_contents = []
     per_file_max_length = int(settings.RAG_CHAT_TOTAL_FILE_MAX_LENGTH / (len(file_ids) if len(file_ids) > 0 else 1))
+    # 只读取每个文件内容的前 per_file_max_length 个字符
+    rows = db.query(
+        RagFile.file_id,
+        func.substring(RagFile.content, 1, per_file_max_length).label("content")
+    ).filter(RagFile.file_id.in_(file_ids), RagFile.is_deleted == False).all() if file_ids else []
+    contents = {}
+    for row in rows:
+        contents.setdefault(row.file_id, row.content)
     for file_id in file_ids:
-        file = db.query(RagFile).filter(RagFile.file_id == file_id, RagFile.is_deleted == False).first()
-        if file and file.content:
-            file_contents.append(file.content[:per_file_max_length])
+        if contents.get(file_id):
+            file_contents.append(contents[file_id])
             logger.info(f"加载参考文件内容 [file_id={file_id}]")
     
     return user_id, file_contents
@@ -1331,7 +1264,8 @@ async def _generate_content(
     kb_ids: Optional[List[str]] = None,
     session_id: Optional[str] = None,
     doc_id: Optional[str] = None,
-    at_file_ids: Optional[List[str]] = None
+    at_file_ids: Optional[List[str]] = None,
+    task_id: Optional[str] = None
 ) -> Dict[str, Any]:
     """根据模式生成内容"""
     if outline_id:
@@ -1349,11 +1283,11 @@ async def _generate_content(
         user_prompt = first_user_message.content if first_user_message else ""
         logger.info(f"获取到用户第一条消息: {user_prompt}")
         
-        full_content = outline_generator.generate_full_content(outline_id, db, user_id, kb_ids, user_prompt, doc_id, at_file_ids)
+        full_content = outline_generator.generate_full_content(outline_id, db, user_id, kb_ids, user_prompt, doc_id, at_file_ids, task_id)
     else:
         # 直接生成模式
         logger.info("开始直接生成全文")
-        full_content = outline_generator.generate_content_directly(prompt, file_contents, user_id, kb_ids, doc_id, at_file_ids)
+        full_content = outline_generator.generate_content_directly(prompt, file_contents, user_id, kb_ids, doc_id, at_file_ids, task_id, db)
     
     logger.info("全文生成完成")
     return full_content
@@ -1691,6 +1625,7 @@ async def get_chat_sessions(
     page_size: int = 10,
     global_search: Optional[bool] = False,
     username: Optional[str] = None,
+    cursor: Optional[str] = Query(None, description="游标分页：第一页传空字符串，之后传上一页返回的 next_cursor，传入时忽略 page"),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -1715,15 +1650,23 @@ async def get_chat_sessions(
             user_ids = [user.user_id for user in users]
             query = query.filter(ChatSession.user_id.in_(user_ids))
 
-        # 获取总记录数
-        total = query.count()
-        pages = (total + page_size - 1) // page_size
-        
-        # 分页查询会话
-        sessions = query.order_by(desc(ChatSession.id))\
-            .offset((page - 1) * page_size)\
-            .limit(page_size)\
-            .all()
+        if cursor is not None:
+            # 游标分页：按会话 id 定位下一页，总数按查询条件缓存
+            sessions, next_cursor = keyset_page(query, [(ChatSession.id, True)], cursor, page_size)
+            total = count_cache.get_or_count(
+                ("writing.chat_sessions", None if global_search else current_user.user_id, username),
+                query.count
+            )
+        else:
+            # 获取总记录数
+            total = query.count()
+            pages = (total + page_size - 1) // page_size
+            
+            # 分页查询会话
+            sessions = query.order_by(desc(ChatSession.id))\
+                .offset((page - 1) * page_size)\
+                .limit(page_size)\
+                .all()
         
         # 获取每个会话的最后一条消息
         session_data = []
@@ -1771,6 +1714,16 @@ async def get_chat_sessions(
                 "unfinished_task_ids": unfinished_task_ids
             })
         
+        if cursor is not None:
+            return APIResponse.success(
+                message="获取知识库会话列表成功",
+                data=CursorPaginationData(
+                    list=session_data,
+                    total=total,
+                    page_size=page_size,
+                    next_cursor=next_cursor
+                )
+            )
         return APIResponse.success(
             message="获取知识库会话列表成功",
             data=PaginationData(
@@ -1782,6 +1735,8 @@ async def get_chat_sessions(
             )
         )
         
+    except InvalidCursorError as e:
+        return APIResponse.error(message=str(e))
     except Exception as e:
         logger.error(f"获取知识库会话列表失败: {str(e)}")
         return APIResponse.error(message=f"获取知识库会话列表失败: {str(e)}")
@@ -1945,8 +1900,7 @@ async def stream_doc_content(
             return APIResponse.error(message="无效的任务类型")
         
         # 检查任务关联的文档ID是否匹配
-        task_params = task.params
-        if task_params.get("doc_id") != doc_id:
+        if task.doc_id != doc_id:
             return APIResponse.error(message="任务与文档不匹配")
         
         # 记录初始状态
@@ -1958,8 +1912,59 @@ async def stream_doc_content(
         # 检查是否是恢复的任务（通过进度和进度详情信息判断）
         is_resumed_task = (task.process or 0) >= 40 and "已生成部分内容" in (task.process_detail_info or "")
         
+        def doc_stream_chunk(event: dict) -> str:
+            """将段落流式事件转为SSE消息，token放在 token 字段，content 仍只用于文档HTML增量"""
+            chunk = {
+                "id": f"docstream-{shortuuid.uuid()}",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": "doc-stream",
+                "choices": [
+                    {
+                        "index": 0,
+                        "delta": {
+                            "role": "assistant",
+                            "content": "",
+                            "status": "processing",
+                            "type": event["type"],
+                            "paragraph_id": event.get("paragraph_id"),
+                            "title": event.get("title"),
+                            "token": event.get("content", "")
+                        }
+                    }
+                ]
+            }
+            return f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+        
+        async def forward_stream_events(stream_queue: asyncio.Queue, timeout: float):
+            """在 timeout 时间内转发段落生成的流式事件"""
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + timeout
+            while True:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    return
+                try:
+                    event = await asyncio.wait_for(stream_queue.get(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    return
+                yield doc_stream_chunk(event)
+        
         # 流式响应函数
         async def generate():
+            # 任务未结束时订阅段落生成的token流，连接断开时取消订阅
+            doc_stream_hub = get_doc_stream_hub()
+            stream_queue = None
+            if current_task_status in [TaskStatus.PENDING, TaskStatus.PROCESSING]:
+                stream_queue = doc_stream_hub.subscribe(doc_id)
+            try:
+                async for chunk in generate_chunks(doc_stream_hub, stream_queue):
+                    yield chunk
+            finally:
+                if stream_queue is not None:
+                    doc_stream_hub.unsubscribe(doc_id, stream_queue)
+        
+        async def generate_chunks(doc_stream_hub, stream_queue):
             # 创建metadata字典，包含状态信息
             metadata = {
                 "doc_id": doc_id,
@@ -2053,6 +2058,13 @@ async def stream_doc_content(
                 }
                 yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
             
+            # 发送正在生成的段落中已生成的部分
+            snapshot = doc_stream_hub.snapshot(doc_id) if stream_queue is not None else None
+            if snapshot:
+                yield doc_stream_chunk({"type": "paragraph_start", "paragraph_id": snapshot["paragraph_id"], "title": snapshot.get("title")})
+                if snapshot.get("content"):
+                    yield doc_stream_chunk({"type": "token", "paragraph_id": snapshot["paragraph_id"], "content": snapshot["content"]})
+            
             # 如果任务正在处理中，等待更新并流式返回
             if current_task_status in [TaskStatus.PENDING, TaskStatus.PROCESSING]:
                 # 根据任务类型设置等待时间和检查间隔
@@ -2097,9 +2109,13 @@ async def stream_doc_content(
                 last_update_time = time.time()
                 
                 while wait_time < max_wait_time:
-                    # 等待一段时间
-                    await asyncio.sleep(check_interval)
-                    wait_time += check_interval
+                    # 等待一段时间，期间转发正在生成段落的token
+                    received_tokens = False
+                    async for stream_chunk in forward_stream_events(stream_queue, check_interval):
+                        received_tokens = True
+                        yield stream_chunk
+                    # 持续有token输出时说明任务仍在生成，重新计算等待时间
+                    wait_time = 0 if received_tokens else wait_time + check_interval
                     
                     # 创建新的数据库会话，避免使用已关闭的会话
                     with Session(db.bind) as new_db:
@@ -2301,6 +2317,11 @@ def refresh_writing_tasks_status():
     使用数据库作为分布式锁，确保在多实例环境中只有一个实例执行任务恢复
     通过心跳机制和锁的自动续期，确保正在运行的实例不会被新实例打断
     """
+    if get_task_queue():
+        # 持久化队列通过租约过期回收中断的任务，无需在启动时恢复
+        logger.info(f"已启用持久化任务队列 [backend={settings.TASK_QUEUE_BACKEND}]，跳过写作任务状态刷新")
+        return
+
     logger.info("开始刷新写作任务状态...")
     db = next(get_db())
     
@@ -2314,11 +2335,6 @@ def refresh_writing_tasks_status():
     heartbeat_thread = None
     should_stop_heartbeat = False
     
-    # 确保running_tasks是集合而不是列表
-    global running_tasks
-    if not isinstance(running_tasks, set):
-        running_tasks = set()
-    
     def update_heartbeat():
         """心跳更新线程函数"""
         while not should_stop_heartbeat:
@@ -2336,11 +2352,7 @@ def refresh_writing_tasks_status():
                             lock_data["expire_time"] = (current_time + timedelta(seconds=lock_timeout)).isoformat()
                             
                             # 更新正在运行的任务列表，只保存任务ID字符串
-                            task_ids = []
-                            with task_lock:
-                                # 确保只存储字符串ID，不存储Task对象
-                                task_ids = [str(task_id) for task_id in running_tasks]
-                            lock_data["running_tasks"] = task_ids
+                            lock_data["running_tasks"] = writing_task_scheduler.active_task_ids()
                             
                             lock_record.value = json.dumps(lock_data)
                             heartbeat_db.commit()
@@ -2483,6 +2495,7 @@ def refresh_writing_tasks_status():
                         assistant_message.content = "任务生成超时，已自动终止"
                     
                     db.commit()
+                    clear_task_checkpoints(task_id)
                     continue
                 
                 # 清理任务状态相关字段
@@ -2510,8 +2523,8 @@ def refresh_writing_tasks_status():
                     logger.warning(f"无法找到任务 {task_id} 的关联消息，跳过恢复")
                     continue
                 
-                # 对于生成全文任务，清理文档内容
-                if task_type == TaskType.GENERATE_CONTENT:
+                # 对于生成全文任务，清理文档内容；已有段落断点的任务会从断点继续生成，保留已生成的内容
+                if task_type == TaskType.GENERATE_CONTENT and not has_task_checkpoints(task_id):
                     doc_id = params.get("doc_id")
                     if doc_id:
                         document = db.query(Document).filter(Document.doc_id == doc_id).first()
@@ -2539,13 +2552,10 @@ def refresh_writing_tasks_status():
                 assistant_message_id = assistant_message.message_id
                 message_id = user_message.message_id if user_message else None
                 
-                with task_lock:
-                    # 检查任务是否已经在处理中
-                    if task_id in running_tasks:
-                        logger.info(f"任务 {task_id} 已经在处理中，跳过")
-                        continue
-                    # 将task_id作为字符串添加到running_tasks集合中
-                    running_tasks.add(str(task_id))
+                # 检查任务是否已经在处理中
+                if writing_task_scheduler.is_active(task_id):
+                    logger.info(f"任务 {task_id} 已经在处理中，跳过")
+                    continue
                 
                 # 首先提交当前的数据库更改
                 db.commit()
@@ -2559,9 +2569,9 @@ def refresh_writing_tasks_status():
                     web_search = params.get("web_search", False)
                     at_file_ids = params.get("at_file_ids", [])
                     
-                    # 在线程池中启动任务
+                    # 提交到任务调度器，已接收的任务跳过准入检查
                     logger.info(f"恢复大纲生成任务: {task_id}")
-                    executor.submit(run_outline_task, 
+                    writing_task_scheduler.submit(task_id, params.get("user_id"), TaskPriority.INTERACTIVE, run_outline_task, force=True, kwargs=dict(
                         task_id=task_id,
                         prompt=prompt,
                         file_ids=file_ids,
@@ -2570,7 +2580,7 @@ def refresh_writing_tasks_status():
                         readable_model_name=model_name,
                         web_search=web_search,
                         at_file_ids=at_file_ids
-                    )
+                    ))
                 
                 elif task_type == TaskType.GENERATE_CONTENT:
                     # 恢复内容生成任务
@@ -2581,9 +2591,9 @@ def refresh_writing_tasks_status():
                     model_name = params.get("model_name")
                     web_search = params.get("web_search", False)
                     at_file_ids = params.get("at_file_ids", [])
-                    # 在线程池中启动任务
+                    # 提交到任务调度器，已接收的任务跳过准入检查
                     logger.info(f"恢复内容生成任务: {task_id}")
-                    executor.submit(run_content_task,
+                    writing_task_scheduler.submit(task_id, params.get("user_id"), TaskPriority.BATCH, run_content_task, force=True, kwargs=dict(
                         task_id=task_id,
                         outline_id=outline_id,
                         prompt=prompt,
@@ -2595,14 +2605,10 @@ def refresh_writing_tasks_status():
                         doc_id=doc_id,
                         web_search=web_search,
                         at_file_ids=at_file_ids
-                    )
+                    ))
             
             except Exception as e:
                 logger.error(f"恢复任务 {task.id} 时出错: {str(e)}")
-                # 移除任务ID
-                with task_lock:
-                    if task.id in running_tasks:
-                        running_tasks.remove(task.id)
         
         logger.info("写作任务状态刷新完成")
     except Exception as e:
@@ -2638,58 +2644,138 @@ def refresh_writing_tasks_status():
 
 # 用于启动大纲生成任务的函数
 def run_outline_task(task_id, prompt, file_ids, session_id, assistant_message_id, readable_model_name=None, web_search=False, at_file_ids=None):
+    # 创建新的事件循环
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
     try:
-        # 创建新的事件循环
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        
-        # 在新的事件循环中运行异步任务
-        loop.run_until_complete(process_outline_generation(
-            task_id=task_id,
-            prompt=prompt,
-            file_ids=file_ids,
-            session_id=session_id,
-            assistant_message_id=assistant_message_id,
-            readable_model_name=readable_model_name,
-            web_search=web_search,
-            at_file_ids=at_file_ids
-        ))
-        
-        loop.close()
+        # 在新的事件循环中运行异步任务，各阶段耗时在任务结束时写入 Task.profile
+        with task_profile(task_id, TaskType.GENERATE_OUTLINE.value):
+            loop.run_until_complete(process_outline_generation(
+                task_id=task_id,
+                prompt=prompt,
+                file_ids=file_ids,
+                session_id=session_id,
+                assistant_message_id=assistant_message_id,
+                readable_model_name=readable_model_name,
+                web_search=web_search,
+                at_file_ids=at_file_ids
+            ))
     finally:
-        # 任务完成后从运行集合中移除
-        with task_lock:
-            if task_id in running_tasks:
-                running_tasks.remove(task_id)
+        loop.close()
 
 # 用于启动内容生成任务的函数
 def run_content_task(task_id, outline_id, prompt, file_ids, session_id, message_id, assistant_message_id, readable_model_name=None, doc_id=None, web_search=False, at_file_ids=None):
+    # 创建新的事件循环
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
     try:
-        # 创建新的事件循环
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        
-        # 在新的事件循环中运行异步任务
-        loop.run_until_complete(process_content_generation(
-            task_id=task_id,
-            outline_id=outline_id,
-            prompt=prompt,
-            file_ids=file_ids,
-            session_id=session_id,
-            message_id=message_id,
-            assistant_message_id=assistant_message_id,
-            readable_model_name=readable_model_name,
-            doc_id=doc_id,
-            web_search=web_search,
-            at_file_ids=at_file_ids
-        ))
-        
+        # 在新的事件循环中运行异步任务，各阶段耗时在任务结束时写入 Task.profile
+        with task_profile(task_id, TaskType.GENERATE_CONTENT.value):
+            loop.run_until_complete(process_content_generation(
+                task_id=task_id,
+                outline_id=outline_id,
+                prompt=prompt,
+                file_ids=file_ids,
+                session_id=session_id,
+                message_id=message_id,
+                assistant_message_id=assistant_message_id,
+                readable_model_name=readable_model_name,
+                doc_id=doc_id,
+                web_search=web_search,
+                at_file_ids=at_file_ids
+            ))
+    finally:
         loop.close()
+
+# 持久化队列中任务类型到执行函数的映射
+WRITING_TASK_RUNNERS = {
+    TaskType.GENERATE_OUTLINE.value: run_outline_task,
+    TaskType.GENERATE_CONTENT.value: run_content_task,
+}
+
+def _reset_task_for_retry(job: QueuedJob):
+    """重试前重置任务状态，没有断点的全文任务需要清空已生成的文档内容"""
+    db = next(get_db())
+    try:
+        task = db.query(Task).filter(Task.id == job.task_id).first()
+        if not task:
+            return
+        task.status = TaskStatus.PENDING
+        task.error = None
+        task.process = 0
+        task.process_detail_info = ""
+
+        kwargs = job.payload.get("kwargs", {})
+        assistant_message = db.query(ChatMessage).filter(
+            ChatMessage.message_id == kwargs.get("assistant_message_id")
+        ).first()
+        if assistant_message:
+            assistant_message.task_status = TaskStatus.PENDING.value
+            assistant_message.content = f"任务执行失败，正在进行第{job.attempts}次尝试..."
+
+        if (task.type == TaskType.GENERATE_CONTENT and not job.checkpoint
+                and not has_task_checkpoints(job.task_id) and kwargs.get("doc_id")):
+            document = db.query(Document).filter(Document.doc_id == kwargs["doc_id"]).first()
+            if document:
+                document.content = ""
+                document.title = "正在生成..."
+        db.commit()
     finally:
-        # 任务完成后从运行集合中移除
-        with task_lock:
-            if task_id in running_tasks:
-                running_tasks.remove(task_id)
+        db.close()
+
+def run_queued_writing_task(job: QueuedJob):
+    """执行从持久化队列领取的写作任务，任务失败时抛出异常以触发重试"""
+    if job.attempts > 1:
+        _reset_task_for_retry(job)
+
+    runner = WRITING_TASK_RUNNERS[job.payload["type"]]
+    runner(task_id=job.task_id, **job.payload.get("kwargs", {}))
+
+    # 生成流程内部会捕获异常并将任务标记为失败，这里通过任务状态判断执行结果
+    db = next(get_db())
+    try:
+        task = db.query(Task).filter(Task.id == job.task_id).first()
+        if task and task.status == TaskStatus.FAILED:
+            raise RuntimeError(task.error or "任务执行失败")
+    finally:
+        db.close()
+
+def mark_writing_task_dead(job: QueuedJob, error: str):
+    """任务进入死信后，将任务和助手消息标记为失败"""
+    db = next(get_db())
+    try:
+        task = db.query(Task).filter(Task.id == job.task_id).first()
+        if task:
+            task.status = TaskStatus.FAILED
+            task.error = error
+        assistant_message_id = job.payload.get("kwargs", {}).get("assistant_message_id")
+        if assistant_message_id:
+            db.query(ChatMessage).filter(ChatMessage.message_id == assistant_message_id).update({
+                "task_status": TaskStatus.FAILED.value,
+                "content": f"生成失败: {error}"
+            })
+        db.commit()
+    finally:
+        db.close()
+    clear_task_checkpoints(job.task_id)
+
+def start_writing_task_worker() -> Optional[TaskQueueWorker]:
+    """启用持久化队列时启动写作任务工作线程"""
+    task_queue = get_task_queue()
+    if not task_queue:
+        return None
+    worker = TaskQueueWorker(
+        task_queue=task_queue,
+        queue=WRITING_TASK_QUEUE,
+        handler=run_queued_writing_task,
+        dead_letter_handler=mark_writing_task_dead,
+        concurrency=settings.WRITING_TASK_MAX_WORKERS,
+        lease_seconds=settings.TASK_QUEUE_LEASE_SECONDS,
+        poll_interval=settings.TASK_QUEUE_POLL_INTERVAL,
+        per_user_max_running=settings.WRITING_TASK_PER_USER_MAX_RUNNING,
+    )
+    worker.start()
+    return worker
 
 @router.delete("/templates/{template_id}")
 async def delete_template(
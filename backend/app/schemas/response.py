@@ -11,6 +11,13 @@ class PaginationData(BaseModel, Generic[T]):
     page_size: int = 10  # 每页数量
     total_pages: int = 0  # 总页数
 
+class CursorPaginationData(BaseModel, Generic[T]):
+    """游标分页数据结构"""
+    list: List[T] = []  # 数据列表
+    total: int = 0  # 总记录数（近似值，短时间缓存）
+    page_size: int = 10  # 每页数量
+    next_cursor: Optional[str] = None  # 下一页游标，为空表示没有更多数据
+
 class APIResponse(BaseModel, Generic[T]):
     code: int = 200
     message: str = "success"
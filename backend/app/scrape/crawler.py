@@ -0,0 +1,152 @@
+"""
+异步网页抓取
+
+所有抓取共享一个 aiohttp 连接池，总连接数和单个站点的并发数都有上限，每次抓取都有超时，
+响应体超过 CRAWLER_MAX_BODY_BYTES 时截断。传入上次抓取的 ETag/Last-Modified 时发送条件请求，
+页面未变化（304）时不再下载和解析。HTML 用 lxml 解析，解析在线程中执行，不阻塞事件循环。
+"""
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import aiohttp
+import lxml.html
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+FETCH_OK = "ok"
+FETCH_NOT_MODIFIED = "not_modified"
+FETCH_FAILED = "failed"
+
+
+@dataclass
+class FetchResult:
+    url: str
+    status: str
+    html: str = ""
+    title: str = ""
+    text_content: str = ""
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    error: Optional[str] = None
+
+
+def parse_html(body: bytes, charset: Optional[str]) -> Tuple[str, str, str]:
+    """
+    解析HTML
+
+    Returns:
+        (HTML文本, 标题, 正文文本)，正文为所有 <p> 的文本
+    """
+    if not body.strip():
+        return "", "", ""
+    parser = lxml.html.HTMLParser(encoding=charset) if charset else None
+    doc = lxml.html.document_fromstring(body, parser=parser)
+    encoding = charset or doc.getroottree().docinfo.encoding or "utf-8"
+    try:
+        html = body.decode(encoding, errors="ignore")
+    except LookupError:
+        html = body.decode("utf-8", errors="ignore")
+    title_element = doc.find(".//title")
+    title = title_element.text_content().strip().replace('\t', '').replace('\n', '') if title_element is not None else ''
+    text_content = ' '.join(p.text_content() for p in doc.iter('p'))
+    return html, title, text_content
+
+
+class AsyncCrawler:
+    """
+    带连接池和站点并发限制的网页抓取器
+
+    Args:
+        max_connections: 连接池大小
+        per_host_limit: 单个站点的最大并发抓取数
+        timeout: 单次抓取超时（秒）
+        max_body_bytes: 响应体最大字节数
+    """
+
+    def __init__(self, max_connections: int, per_host_limit: int, timeout: float, max_body_bytes: int):
+        self.max_connections = max_connections
+        self.per_host_limit = per_host_limit
+        self.timeout = timeout
+        self.max_body_bytes = max_body_bytes
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._host_limits: Dict[str, asyncio.Semaphore] = {}
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        # 连接池和信号量绑定事件循环，在其他事件循环中使用时重新创建
+        if self._session is None or self._session.closed or self._loop is not loop:
+            self._session = aiohttp.ClientSession(
+                headers=_HEADERS,
+                connector=aiohttp.TCPConnector(limit=self.max_connections, ttl_dns_cache=300)
+            )
+            self._loop = loop
+            self._host_limits = {}
+        return self._session
+
+    def _host_limit(self, url: str) -> asyncio.Semaphore:
+        host = urlparse(url).hostname or ""
+        semaphore = self._host_limits.get(host)
+        if semaphore is None:
+            semaphore = self._host_limits[host] = asyncio.Semaphore(self.per_host_limit)
+        return semaphore
+
+    async def _read_body(self, response: aiohttp.ClientResponse) -> bytes:
+        body = bytearray()
+        async for chunk in response.content.iter_chunked(65536):
+            body.extend(chunk)
+            if len(body) >= self.max_body_bytes:
+                logger.warning(f"网页内容超过大小上限，已截断 [url={response.url}, limit={self.max_body_bytes}]")
+                del body[self.max_body_bytes:]
+                break
+        return bytes(body)
+
+    async def fetch(self, url: str, etag: Optional[str] = None, last_modified: Optional[str] = None) -> FetchResult:
+        """抓取并解析网页，传入 etag/last_modified 时发送条件请求"""
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+
+        session = self._get_session()
+        try:
+            async with self._host_limit(url):
+                timeout = aiohttp.ClientTimeout(total=self.timeout)
+                async with session.get(url, headers=headers, timeout=timeout) as response:
+                    if response.status == 304:
+                        return FetchResult(url, FETCH_NOT_MODIFIED, etag=etag, last_modified=last_modified)
+                    if response.status != 200:
+                        logger.error(f"Failed to fetch {url}, status: {response.status}")
+                        return FetchResult(url, FETCH_FAILED, error=f"HTTP {response.status}")
+                    body = await self._read_body(response)
+                    charset = response.charset
+                    new_etag = response.headers.get("ETag")
+                    new_last_modified = response.headers.get("Last-Modified")
+            html, title, text_content = await asyncio.to_thread(parse_html, body, charset)
+            return FetchResult(url, FETCH_OK, html, title, text_content, new_etag, new_last_modified)
+        except Exception as e:
+            error = f"{type(e).__name__} {str(e)}".strip()
+            logger.error(f"Error fetching {url}: {error}")
+            return FetchResult(url, FETCH_FAILED, error=error)
+
+    async def fetch_many(self, targets: List[Tuple[str, Optional[str], Optional[str]]]) -> List[FetchResult]:
+        """并发抓取多个网页，targets 为 (url, etag, last_modified)，按顺序返回结果"""
+        return list(await asyncio.gather(*(self.fetch(*target) for target in targets)))
+
+
+crawler = AsyncCrawler(
+    settings.CRAWLER_MAX_CONNECTIONS,
+    settings.CRAWLER_PER_HOST_LIMIT,
+    settings.CRAWLER_TIMEOUT,
+    settings.CRAWLER_MAX_BODY_BYTES
+)
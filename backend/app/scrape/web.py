@@ -1,77 +1,186 @@
-from typing import Optional, Dict, Any
-import requests
-from bs4 import BeautifulSoup
+from typing import Optional, Dict, Any, List
 import shortuuid
-from sqlalchemy.orm import Session
-from sqlalchemy import select
+import zlib
+from sqlalchemy.orm import Session, undefer, undefer_group
+from sqlalchemy import select, desc
 from datetime import datetime
 import logging
-from app.models.web_page import WebPage
+from app.models.web_page import WebPage, url_hash
+from app.scrape.crawler import crawler, FetchResult, FETCH_OK, FETCH_NOT_MODIFIED
 
 # 配置日志
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+# ingest 返回的每个URL的处理结果
+INGEST_EXISTING = "existing"          # 当前用户已有该网页，未重新抓取
+INGEST_CREATED = "created"            # 新建网页记录
+INGEST_REFRESHED = "refreshed"        # 重新抓取后内容有变化，已更新
+INGEST_NOT_MODIFIED = "not_modified"  # 重新抓取时页面未变化
+INGEST_FAILED = "failed"
+
+
 class WebScraper:
     def __init__(self):
-        self.headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
+        self.crawler = crawler
 
-    def fetch_url(self, url: str) -> Optional[Dict[str, Any]]:
-        """获取URL内容"""
-        try:
-            response = requests.get(url, headers=self.headers)
-            if response.status_code == 200:
-                return self._parse_content(url, response.text)
-            else:
-                logger.error(f"Failed to fetch {url}, status: {response.status_code}")
-                return None
-        except Exception as e:
-            logger.error(f"Error fetching {url}: {str(e)}")
-            return None
-
-    def _parse_content(self, url: str, html_content: str) -> Dict[str, Any]:
-        """解析HTML内容"""
-        soup = BeautifulSoup(html_content, 'html.parser')
-        title = soup.title.string.strip().replace('\t', '').replace('\n', '') if soup.title else ''
+    @staticmethod
+    def _content_from_fetch(result: FetchResult) -> Dict[str, Any]:
         return {
-            'url': url,
-            'title': title,
-            'text_content': ' '.join([p.get_text() for p in soup.find_all('p')]),
-            'html_content': html_content,
+            'url': result.url,
+            'title': result.title,
+            'text_content': result.text_content,
+            'html_compressed': zlib.compress(result.html.encode('utf-8')),
+            'html_content': None,
+            'etag': result.etag,
+            'last_modified': result.last_modified,
             'summary': '',
         }
 
-    def save_to_db(self, user_id: str, content: Dict[str, Any], db: Session) -> WebPage:
+    @staticmethod
+    def _content_from_page(page: WebPage) -> Dict[str, Any]:
+        """复制已有网页的内容，压缩后的HTML直接复用"""
+        return {
+            'url': page.url,
+            'title': page.title,
+            'text_content': page.text_content,
+            'html_compressed': page.html_compressed,
+            'html_content': page.html_content,
+            'etag': page.etag,
+            'last_modified': page.last_modified,
+            'summary': page.summary,
+        }
+
+    def save_to_db(self, user_id: str, content: Dict[str, Any], db: Session, commit: bool = True) -> WebPage:
         """保存内容到数据库"""
         webpage = WebPage(
             webpage_id=f"webpage-{shortuuid.uuid()}",
             user_id=user_id,
             url=content['url'],
+            url_hash=url_hash(content['url']),
             title=content['title'],
             text_content=content['text_content'],
-            html_content=content['html_content'],
+            html_content=content.get('html_content'),
+            html_compressed=content.get('html_compressed'),
+            etag=content.get('etag'),
+            last_modified=content.get('last_modified'),
+            fetched_at=datetime.now(),
             summary=content['summary'],
             status=2,
         )
         db.add(webpage)
-        db.commit()
+        if commit:
+            db.commit()
         return webpage
 
-    def get_by_url(self, url: str, db: Session) -> Optional[WebPage]:
-        """根据URL检索内容"""
-        query = select(WebPage).where(WebPage.url == url)
-        result = db.execute(query)
-        webpage = result.scalar_one_or_none()
-        return webpage
+    def get_by_url(self, url: str, db: Session, user_id: Optional[str] = None) -> Optional[WebPage]:
+        """根据URL检索内容，优先返回指定用户的网页"""
+        query = select(WebPage).where(
+            WebPage.url_hash == url_hash(url),
+            WebPage.url == url,
+            WebPage.status == 2,
+            WebPage.is_deleted == False
+        )
+        if user_id:
+            own = db.execute(query.where(WebPage.user_id == user_id).limit(1)).scalar_one_or_none()
+            if own:
+                return own
+        return db.execute(query.order_by(desc(WebPage.id)).limit(1)).scalar_one_or_none()
+
+    def _existing_pages(self, urls: List[str], user_id: str, db: Session):
+        """批量查询已抓取的网页，返回 (当前用户的网页, 其他用户最新的网页)，均以URL为键"""
+        pages = db.execute(
+            select(WebPage).where(
+                WebPage.url_hash.in_([url_hash(url) for url in urls]),
+                WebPage.status == 2,
+                WebPage.is_deleted == False
+            ).order_by(desc(WebPage.id))
+        ).scalars().all()
+        wanted = set(urls)
+        own, others = {}, {}
+        for page in pages:
+            if page.url not in wanted:
+                continue
+            target = own if page.user_id == user_id else others
+            target.setdefault(page.url, page)
+        return own, others
+
+    async def ingest(self, user_id: str, urls: List[str], db: Session, refresh: bool = False) -> List[Dict[str, Any]]:
+        """
+        批量抓取并保存URL
+
+        已抓取过的URL不再请求网络：当前用户已有时直接返回，其他用户抓取过时复制其内容。
+        refresh 为 True 时对已抓取过的URL发送条件请求，页面未变化时复用原内容。
+        所有需要抓取的URL并发请求，结果一次提交。
+
+        Returns:
+            与去重后的 urls 顺序一致的处理结果
+        """
+        urls = list(dict.fromkeys(urls))
+        own, others = self._existing_pages(urls, user_id, db)
+
+        to_fetch = []
+        for url in urls:
+            if url in own and not refresh:
+                continue
+            if url in others and not refresh:
+                continue
+            known = own.get(url) or others.get(url)
+            to_fetch.append((url, known.etag if known else None, known.last_modified if known else None))
+        fetched = {result.url: result for result in await self.crawler.fetch_many(to_fetch)}
+
+        # 需要复制内容的网页一次性加载延迟加载的内容列
+        copy_ids = [others[url].id for url in urls if url in others and url not in own
+                    and (url not in fetched or fetched[url].status == FETCH_NOT_MODIFIED)]
+        if copy_ids:
+            db.query(WebPage).options(undefer(WebPage.text_content), undefer_group("html")).filter(
+                WebPage.id.in_(copy_ids)
+            ).all()
+
+        results = []
+        now = datetime.now()
+        for url in urls:
+            page = own.get(url)
+            result = fetched.get(url)
+            if result is None:
+                if page is not None:
+                    results.append(self._result(url, INGEST_EXISTING, page))
+                else:
+                    page = self.save_to_db(user_id, self._content_from_page(others[url]), db, commit=False)
+                    results.append(self._result(url, INGEST_CREATED, page))
+            elif result.status == FETCH_OK:
+                content = self._content_from_fetch(result)
+                if page is not None:
+                    for key, value in content.items():
+                        setattr(page, key, value)
+                    page.fetched_at = now
+                    results.append(self._result(url, INGEST_REFRESHED, page))
+                else:
+                    page = self.save_to_db(user_id, content, db, commit=False)
+                    results.append(self._result(url, INGEST_CREATED, page))
+            elif result.status == FETCH_NOT_MODIFIED:
+                if page is not None:
+                    page.fetched_at = now
+                    results.append(self._result(url, INGEST_NOT_MODIFIED, page))
+                else:
+                    page = self.save_to_db(user_id, self._content_from_page(others[url]), db, commit=False)
+                    results.append(self._result(url, INGEST_CREATED, page))
+            else:
+                # 刷新失败时保留当前用户原有的网页
+                results.append(self._result(url, INGEST_FAILED, page, result.error))
+        db.commit()
+        logger.info(f"批量抓取URL完成 [user_id={user_id}, 总数={len(urls)}, 请求={len(to_fetch)}]")
+        return results
+
+    @staticmethod
+    def _result(url: str, status: str, page: Optional[WebPage], error: Optional[str] = None) -> Dict[str, Any]:
+        return {
+            "url": url,
+            "status": status,
+            "webpage_id": page.webpage_id if page else None,
+            "title": page.title if page else None,
+            "error": error,
+        }
 
-    def scrape_and_save(self, user_id: str, url: str, db: Session) -> Optional[WebPage]:
-        """抓取并保存URL内容"""
-        content = self.fetch_url(url)
-        if content:
-            return self.save_to_db(user_id, content, db)
-        return None
-    
 # 创建一个单例实例
 scraper = WebScraper()
@@ -0,0 +1,273 @@
+"""
+/completions 响应缓存
+
+编辑器操作（扩写、缩写、续写、改写等）经常对同一段选中文本和文档重复执行。开启后按
+（模型、渲染后的提示词哈希、温度、最大token数）缓存生成结果：
+- 内存层：进程内 LRU
+- 持久层：completion_cache_entries 表或本地目录，多实例/重启后仍可命中
+
+命中时非流式请求直接返回 chat.completion 格式的结果，流式请求回放为 chat.completion.chunk 格式的SSE。
+按操作类型统计命中率。
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from app.config import settings
+from app.metrics import registry
+from app.database import sync_session
+from app.models.completion_cache import CompletionCacheEntry
+
+logger = logging.getLogger(__name__)
+
+# 只缓存正常结束的生成结果
+_CACHEABLE_FINISH_REASONS = ("stop", "length")
+# 回放流式响应时每个分片的字符数
+_REPLAY_CHUNK_SIZE = 32
+
+
+@dataclass
+class CachedCompletion:
+    content: str
+    model: str
+    finish_reason: Optional[str]
+
+
+def completion_cache_key(model: str, messages: List[Dict[str, Any]], temperature: Optional[float], max_tokens: Optional[int]) -> str:
+    """计算缓存键"""
+    prompt_hash = hashlib.sha256(
+        json.dumps(messages, ensure_ascii=False, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+    raw = json.dumps([model, prompt_hash, temperature, max_tokens])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class MySQLCompletionStore:
+    """completion_cache_entries 表持久层"""
+
+    def get(self, key: str) -> Optional[CachedCompletion]:
+        db = sync_session()
+        try:
+            entry = db.query(CompletionCacheEntry).filter(
+                CompletionCacheEntry.cache_key == key,
+                CompletionCacheEntry.expires_at > datetime.utcnow()
+            ).first()
+            if entry is None:
+                return None
+            return CachedCompletion(entry.content, entry.model, entry.finish_reason)
+        finally:
+            db.close()
+
+    def put(self, key: str, action: str, completion: CachedCompletion, ttl: int) -> None:
+        db = sync_session()
+        try:
+            db.merge(CompletionCacheEntry(
+                cache_key=key,
+                action=action,
+                model=completion.model,
+                content=completion.content,
+                finish_reason=completion.finish_reason,
+                expires_at=datetime.utcnow() + timedelta(seconds=ttl)
+            ))
+            # 顺带清理过期条目
+            db.query(CompletionCacheEntry).filter(
+                CompletionCacheEntry.expires_at <= datetime.utcnow()
+            ).delete(synchronize_session=False)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+
+class DiskCompletionStore:
+    """本地目录持久层，每个条目一个JSON文件"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def get(self, key: str) -> Optional[CachedCompletion]:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        if data.get("expires_at", 0) <= time.time():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return CachedCompletion(data["content"], data["model"], data.get("finish_reason"))
+
+    def put(self, key: str, action: str, completion: CachedCompletion, ttl: int) -> None:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({**asdict(completion), "action": action, "expires_at": time.time() + ttl}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+
+class CompletionCache:
+    """
+    两级 /completions 响应缓存
+
+    Args:
+        actions: 参与缓存的操作类型
+        memory_size: 内存层条数
+        ttl: 有效期（秒）
+        store: 持久层，为 None 时只使用内存
+    """
+
+    def __init__(self, actions: List[str], memory_size: int, ttl: int, store=None):
+        self.actions = set(actions)
+        self.memory_size = memory_size
+        self.ttl = ttl
+        self.store = store
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, Tuple[float, CachedCompletion]]" = OrderedDict()
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def is_cacheable(self, action: Optional[str]) -> bool:
+        return action in self.actions
+
+    def _record(self, action: str, field: str) -> None:
+        with self._lock:
+            stats = self._stats.setdefault(action, {"memory_hits": 0, "store_hits": 0, "misses": 0, "stores": 0})
+            stats[field] += 1
+
+    def get(self, key: str, action: str) -> Optional[CachedCompletion]:
+        """查询缓存，内存层未命中时查询持久层并回填内存层"""
+        now = time.time()
+        with self._lock:
+            item = self._memory.get(key)
+            if item and item[0] > now:
+                self._memory.move_to_end(key)
+                completion = item[1]
+            else:
+                completion = None
+                if item:
+                    del self._memory[key]
+        if completion is not None:
+            self._record(action, "memory_hits")
+            return completion
+
+        if self.store is not None:
+            try:
+                completion = self.store.get(key)
+            except Exception as e:
+                logger.warning(f"读取补全缓存失败 [key={key}]: {str(e)}")
+            if completion is not None:
+                self._remember(key, completion)
+                self._record(action, "store_hits")
+                return completion
+
+        self._record(action, "misses")
+        return None
+
+    def put(self, key: str, action: str, completion: CachedCompletion) -> None:
+        """写入缓存，非正常结束的结果不缓存"""
+        if not completion.content or completion.finish_reason not in _CACHEABLE_FINISH_REASONS:
+            return
+        self._remember(key, completion)
+        if self.store is not None:
+            try:
+                self.store.put(key, action, completion, self.ttl)
+            except Exception as e:
+                logger.warning(f"写入补全缓存失败 [key={key}]: {str(e)}")
+        self._record(action, "stores")
+
+    def _remember(self, key: str, completion: CachedCompletion) -> None:
+        if self.memory_size <= 0:
+            return
+        with self._lock:
+            self._memory[key] = (time.time() + self.ttl, completion)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """按操作类型统计命中情况"""
+        with self._lock:
+            result = {}
+            for action, stats in self._stats.items():
+                hits = stats["memory_hits"] + stats["store_hits"]
+                lookups = hits + stats["misses"]
+                result[action] = {**stats, "hit_rate": round(hits / lookups, 4) if lookups else 0.0}
+            return result
+
+
+def completion_response(key: str, completion: CachedCompletion) -> Dict[str, Any]:
+    """构建与 chat.completion 相同格式的响应"""
+    return {
+        "id": f"chatcmpl-cache-{key[:24]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": completion.model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": completion.content},
+            "finish_reason": completion.finish_reason,
+        }],
+        "usage": None,
+        "cached": True,
+    }
+
+
+def replay_stream(key: str, completion: CachedCompletion) -> Iterator[str]:
+    """将缓存结果回放为 chat.completion.chunk 格式的SSE"""
+    created = int(time.time())
+    base = {"id": f"chatcmpl-cache-{key[:24]}", "object": "chat.completion.chunk", "created": created, "model": completion.model}
+    content = completion.content
+    for start in range(0, len(content), _REPLAY_CHUNK_SIZE):
+        delta = {"content": content[start:start + _REPLAY_CHUNK_SIZE]}
+        if start == 0:
+            delta["role"] = "assistant"
+        chunk = {**base, "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+        yield f"data: {json.dumps(chunk)}\n\n"
+    chunk = {**base, "choices": [{"index": 0, "delta": {}, "finish_reason": completion.finish_reason}]}
+    yield f"data: {json.dumps(chunk)}\n\n"
+
+
+def _build_completion_cache() -> Optional[CompletionCache]:
+    if not settings.COMPLETION_CACHE_ENABLED:
+        return None
+    store = None
+    if settings.COMPLETION_CACHE_STORE == "mysql":
+        store = MySQLCompletionStore()
+    elif settings.COMPLETION_CACHE_STORE == "disk":
+        store = DiskCompletionStore(settings.COMPLETION_CACHE_DISK_DIR)
+    return CompletionCache(
+        settings.COMPLETION_CACHE_ACTIONS,
+        settings.COMPLETION_CACHE_MEMORY_SIZE,
+        settings.COMPLETION_CACHE_TTL,
+        store
+    )
+
+
+# 未开启时为 None
+completion_cache = _build_completion_cache()
+
+
+@registry.register_collector
+def collect_completion_cache():
+    if completion_cache is None:
+        return []
+    samples = []
+    for action, stats in completion_cache.stats().items():
+        for result in ("memory_hits", "store_hits", "misses"):
+            samples.append(({"action": action, "result": result}, stats[result]))
+    return [("completion_cache_lookups_total", "counter", "/completions 响应缓存查询次数", samples)]
@@ -0,0 +1,234 @@
+"""
+文档生成的实时流
+
+段落生成使用流式补全，token 通过这里转发给 /writing/doc/{doc_id} 的 SSE 连接，
+不必等整个段落生成完、写入数据库后才能看到内容。同时保存每个文档正在生成的段落缓冲，
+中途连接的客户端可以先拿到已生成的部分。
+
+- DocStreamHub: 进程内转发，生成任务与 API 在同一进程时使用
+- RedisDocStreamHub: 通过 Redis 发布订阅转发，任务队列使用 Redis 且工作进程独立部署时使用
+
+事件格式：
+- {"type": "paragraph_start", "paragraph_id": ..., "title": ...}  段落开始（重新生成时会再次发送，客户端应清空该段落的缓冲）
+- {"type": "token", "paragraph_id": ..., "content": ...}           新生成的文本
+- {"type": "paragraph_end", "paragraph_id": ...}                   段落结束，之后文档HTML会更新
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class DocStreamHub:
+    """进程内的文档流转发"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buffers: Dict[str, Dict[str, Any]] = {}
+        self._subscribers: Dict[str, List[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = {}
+
+    def publish(self, doc_id: str, event: Dict[str, Any]) -> None:
+        """发布事件，可在任意线程调用"""
+        with self._lock:
+            self._update_buffer(self._buffers, doc_id, event)
+        self._dispatch(doc_id, event)
+
+    @staticmethod
+    def _update_buffer(buffers: Dict[str, Dict[str, Any]], doc_id: str, event: Dict[str, Any]):
+        if event["type"] == "paragraph_start":
+            buffers[doc_id] = {"paragraph_id": event["paragraph_id"], "title": event.get("title", ""), "content": ""}
+        elif event["type"] == "token":
+            buffer = buffers.get(doc_id)
+            if buffer and buffer["paragraph_id"] == event["paragraph_id"]:
+                buffer["content"] += event.get("content", "")
+        elif event["type"] == "paragraph_end":
+            buffers.pop(doc_id, None)
+
+    def _dispatch(self, doc_id: str, event: Dict[str, Any]) -> None:
+        with self._lock:
+            subscribers = list(self._subscribers.get(doc_id, []))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, event)
+            except RuntimeError:
+                # 事件循环已关闭，连接已断开
+                pass
+
+    def snapshot(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        """获取文档正在生成的段落缓冲，没有时返回 None"""
+        with self._lock:
+            buffer = self._buffers.get(doc_id)
+            return dict(buffer) if buffer else None
+
+    def subscribe(self, doc_id: str) -> asyncio.Queue:
+        """订阅文档事件，需在事件循环中调用"""
+        queue: asyncio.Queue = asyncio.Queue()
+        with self._lock:
+            self._subscribers.setdefault(doc_id, []).append((asyncio.get_running_loop(), queue))
+        return queue
+
+    def unsubscribe(self, doc_id: str, queue: asyncio.Queue) -> None:
+        with self._lock:
+            subscribers = [item for item in self._subscribers.get(doc_id, []) if item[1] is not queue]
+            if subscribers:
+                self._subscribers[doc_id] = subscribers
+            else:
+                self._subscribers.pop(doc_id, None)
+
+
+class RedisDocStreamHub(DocStreamHub):
+    """
+    通过 Redis 发布订阅转发文档流
+
+    段落缓冲保存在 Redis 中（带过期时间），API 进程用一个后台线程订阅所有文档频道并分发给本进程的连接。
+    """
+
+    _BUFFER_TTL = 3600
+
+    def __init__(self, redis_url: str, key_prefix: str):
+        super().__init__()
+        import redis
+        self.redis = redis.Redis.from_url(redis_url, decode_responses=True)
+        self.prefix = key_prefix
+        self._listener: Optional[threading.Thread] = None
+
+    def _channel(self, doc_id: str) -> str:
+        return f"{self.prefix}:docstream:{doc_id}"
+
+    def _buffer_key(self, doc_id: str) -> str:
+        return f"{self.prefix}:docstream_buffer:{doc_id}"
+
+    def _content_key(self, doc_id: str) -> str:
+        return f"{self.prefix}:docstream_content:{doc_id}"
+
+    def publish(self, doc_id: str, event: Dict[str, Any]) -> None:
+        buffer_key = self._buffer_key(doc_id)
+        content_key = self._content_key(doc_id)
+        try:
+            pipe = self.redis.pipeline()
+            if event["type"] == "paragraph_start":
+                pipe.delete(content_key)
+                pipe.hset(buffer_key, mapping={"paragraph_id": event["paragraph_id"], "title": event.get("title", "")})
+                pipe.expire(buffer_key, self._BUFFER_TTL)
+            elif event["type"] == "token":
+                # 每个文档同一时间只有一个段落在生成，直接追加
+                pipe.append(content_key, event.get("content", ""))
+                pipe.expire(content_key, self._BUFFER_TTL)
+            elif event["type"] == "paragraph_end":
+                pipe.delete(buffer_key, content_key)
+            pipe.publish(self._channel(doc_id), json.dumps(event, ensure_ascii=False))
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"发布文档流事件失败 [doc_id={doc_id}]: {str(e)}")
+
+    def snapshot(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            buffer = self.redis.hgetall(self._buffer_key(doc_id))
+            if not buffer:
+                return None
+            buffer["content"] = self.redis.get(self._content_key(doc_id)) or ""
+            return buffer
+        except Exception as e:
+            logger.warning(f"读取文档流缓冲失败 [doc_id={doc_id}]: {str(e)}")
+            return None
+
+    def subscribe(self, doc_id: str) -> asyncio.Queue:
+        self._ensure_listener()
+        return super().subscribe(doc_id)
+
+    def _ensure_listener(self):
+        with self._lock:
+            if self._listener and self._listener.is_alive():
+                return
+            self._listener = threading.Thread(target=self._listen, name="doc-stream-listener", daemon=True)
+            self._listener.start()
+
+    def _listen(self):
+        channel_prefix = f"{self.prefix}:docstream:"
+        while True:
+            try:
+                pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(f"{channel_prefix}*")
+                for message in pubsub.listen():
+                    if message.get("type") != "pmessage":
+                        continue
+                    doc_id = message["channel"][len(channel_prefix):]
+                    self._dispatch(doc_id, json.loads(message["data"]))
+            except Exception as e:
+                logger.error(f"订阅文档流失败，稍后重试: {str(e)}")
+                time.sleep(1)
+
+
+class ParagraphStream:
+    """
+    单个段落的流式输出，合并高频的小 token 后按间隔发布
+
+    Args:
+        hub: 文档流
+        doc_id: 文档ID
+        paragraph_id: 段落ID
+        title: 段落标题
+        flush_interval: 发布间隔（秒）
+    """
+
+    def __init__(self, hub: DocStreamHub, doc_id: str, paragraph_id: str, title: str, flush_interval: float = 0.1):
+        self.hub = hub
+        self.doc_id = doc_id
+        self.paragraph_id = paragraph_id
+        self.title = title
+        self.flush_interval = flush_interval
+        self._pending = ""
+        self._last_flush = 0.0
+        self.started_at = 0.0
+        self.first_token_at: Optional[float] = None
+
+    def start(self):
+        self.started_at = time.time()
+        self._last_flush = self.started_at
+        self.hub.publish(self.doc_id, {"type": "paragraph_start", "paragraph_id": self.paragraph_id, "title": self.title})
+
+    def write(self, text: str):
+        if not text:
+            return
+        now = time.time()
+        if self.first_token_at is None:
+            self.first_token_at = now
+        self._pending += text
+        if now - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if self._pending:
+            self.hub.publish(self.doc_id, {"type": "token", "paragraph_id": self.paragraph_id, "content": self._pending})
+            self._pending = ""
+        self._last_flush = time.time()
+
+    def close(self):
+        self.flush()
+        self.hub.publish(self.doc_id, {"type": "paragraph_end", "paragraph_id": self.paragraph_id})
+
+    @property
+    def time_to_first_token(self) -> Optional[float]:
+        if self.first_token_at is None:
+            return None
+        return self.first_token_at - self.started_at
+
+
+_doc_stream_hub: Optional[DocStreamHub] = None
+
+
+def get_doc_stream_hub() -> DocStreamHub:
+    """任务队列使用 Redis 时通过 Redis 跨进程转发，否则进程内转发"""
+    global _doc_stream_hub
+    if _doc_stream_hub is None:
+        if settings.TASK_QUEUE_BACKEND == "redis":
+            _doc_stream_hub = RedisDocStreamHub(settings.TASK_QUEUE_REDIS_URL, settings.TASK_QUEUE_REDIS_PREFIX)
+        else:
+            _doc_stream_hub = DocStreamHub()
+    return _doc_stream_hub
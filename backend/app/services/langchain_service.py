@@ -1,6 +1,6 @@
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI
 from langchain_core.output_parsers import JsonOutputParser
+from langchain_core.messages import AIMessageChunk
 from typing import List, Dict, Any, Optional
 from app.config import settings
 import logging
@@ -12,17 +12,27 @@ import uuid
 from datetime import datetime
 import traceback
 import math
+import concurrent.futures
 
 from langchain_core.prompts import ChatPromptTemplate
 
-from app.utils.outline import  build_paragraph_data
+from app.utils.outline import  build_paragraph_data, attach_children, ensure_document_order
 from app.models.outline import SubParagraph, Outline
 from app.rag.rag_api import rag_api
 from app.models.document import Document
 from app.models.task import Task, TaskStatus
-from app.utils.web_search import baidu_search
+from app.services.task_checkpoint import TaskCheckpointStore, compute_input_hash
+from app.utils.prompt_budget import BudgetSection, PromptBudgeter
+from app.utils.passage_index import PassageIndex
+from app.utils.near_duplicate import MinHashIndex
+from app.services.doc_stream import ParagraphStream, get_doc_stream_hub
+from app.services.llm_governor import GovernedChatOpenAI, outline_expansion_executor
+from app.metrics import llm_call_site
+from app.services.task_profile import bind_trace, set_span_attributes, trace_span, traced
+from app.services.outline_cache import outline_tree_cache
+from app.services.outline_writer import delete_paragraphs, insert_paragraph_tree
+from app.utils.web_search import baidu_search_many
 from app.config import settings
-from app.models.outline import CountStyle
 from app.database import get_db
 from sqlalchemy.orm import Session
 from sqlalchemy import func
@@ -346,13 +356,18 @@ class OutlineGenerator:
             self.api_key = model_config["api_key"]
             self.base_url = model_config["base_url"]
             self.max_tokens = model_config.get("max_tokens", 4096)
+            self.max_input_tokens = model_config.get("max_input_tokens", settings.WRITING_PROMPT_MAX_INPUT_TOKENS)
         else:
             self.model = settings.LLM_MODELS[0]["model"]
             self.api_key = settings.LLM_MODELS[0]["api_key"]
             self.base_url = settings.LLM_MODELS[0]["base_url"]
             self.max_tokens = settings.LLM_MODELS[0].get("max_tokens", 4096)
+            self.max_input_tokens = settings.LLM_MODELS[0].get("max_input_tokens", settings.WRITING_PROMPT_MAX_INPUT_TOKENS)
         
-        self.llm = ChatOpenAI(
+        # 段落生成提示词的token预算
+        self.prompt_budgeter = PromptBudgeter(self.model, int(self.max_input_tokens))
+        
+        self.llm = GovernedChatOpenAI(
             model=self.model,
             openai_api_key=self.api_key,
             openai_api_base=self.base_url,
@@ -377,6 +392,7 @@ class OutlineGenerator:
             self.rag_api = None
             logger.info("RAG API 已禁用")
         
+    @traced("rag_api")
     def _call_rag_api(
         self,
         question: str,
@@ -430,10 +446,9 @@ class OutlineGenerator:
             rag_response = None
             if isinstance(rag_result, dict):
                 # 非流式响应处理
-                logger.info(f"处理非流式响应: {rag_result}")
+                logger.debug("处理非流式响应", extra={"fields": {"rag_result": rag_result}})
                 if "response" in rag_result:
                     rag_response = rag_result["response"]
-                    logger.info(f"提取到非流式RAG响应文本: {rag_response}")
             elif isinstance(rag_result, list) or hasattr(rag_result, '__iter__'):
                 # 流式响应处理
                 logger.info("检测到流式响应，开始处理")
@@ -454,7 +469,7 @@ class OutlineGenerator:
                     
                     # 使用最后一个chunk的响应
                     if last_response:
-                        logger.info(f"流式响应处理完成，共处理 {chunk_count} 个数据块，最后一个响应: {last_response}")
+                        logger.info(f"流式响应处理完成，共处理 {chunk_count} 个数据块，响应长度: {len(last_response)}")
                         rag_response = last_response
                     else:
                         logger.warning("未找到有效的响应内容")
@@ -470,7 +485,7 @@ class OutlineGenerator:
                 logger.warning("检测到无效的响应内容")
                 return None
             
-            logger.info(f"最终返回的响应内容: {rag_response}")
+            logger.info("RAG响应", extra={"fields": {"user_id": user_id, "response": rag_response}})
             return rag_response
             
         except Exception as e:
@@ -492,6 +507,7 @@ class OutlineGenerator:
         
         return cleaned.strip()
 
+    @traced("rag_query")
     def _get_rag_context(self, question: str, user_id: Optional[str], kb_ids: Optional[List[str]], context_msg: str = "", networking: bool = False, rerank: bool = False, at_file_ids: Optional[List[str]] = None) -> str:
         """
         获取RAG上下文的通用方法
@@ -507,6 +523,7 @@ class OutlineGenerator:
         Returns:
             str: RAG上下文文本
         """
+        set_span_attributes(question=question)
         # 如果未启用RAG，直接返回空字符串
         if not self.use_rag:
             logger.info("RAG API已禁用，跳过RAG搜索")
@@ -537,6 +554,8 @@ class OutlineGenerator:
         
         return rag_context
 
+    @traced("generate_outline")
+    @llm_call_site("outline")
     def generate_outline(self, prompt: str, file_contents: List[str] = None, user_id: str = None, kb_ids: List[str] = None, task_id: Optional[str] = None, db_session = None, at_file_ids: Optional[List[str]] = None) -> Dict[str, Any]:
         """
         生成结构化大纲
@@ -620,6 +639,7 @@ class OutlineGenerator:
                 ]
             }
         
+    @traced("extract_requirements")
     def _extract_requirements_with_llm(self, prompt: str) -> Dict[str, Any]:
         """使用LLM提取用户需求，包括大纲层级数、字数、页数和预定义章节"""
         template = """
@@ -890,7 +910,13 @@ class OutlineGenerator:
             return outline_data
         
     def _expand_outline_with_subchapters(self, outline_data: Dict[str, Any], prompt: str, file_context: str, rag_context: str, required_level: int, word_count: Optional[int], page_count: Optional[int], task_id: Optional[str], db_session) -> Dict[str, Any]:
-        """为大纲中的每个一级章节生成所有子章节"""
+        """
+        为大纲中的每个一级章节生成所有子章节
+
+        按层级广度优先展开：每个章节的直接子章节生成完成后立即提交其子章节的生成，
+        同一层级的章节并行生成。任务提交到进程共享的优先级线程池，层级越浅越先执行，
+        实际的大模型调用并发由 llm_governor 按模型统一限制。
+        """
         first_level_chapters = outline_data["sub_paragraphs"]
         chapter_count = len(first_level_chapters)
 
@@ -902,137 +928,86 @@ class OutlineGenerator:
             children_num = "6-7"
 
         logger.info(f"字数要求：{word_count}，页数要求：{page_count}，子章节数量：{children_num}")
-        
-        # 使用并行处理框架
-        try:
-            import concurrent.futures
-            use_parallel = True
-        except ImportError:
-            use_parallel = False
-            logger.warning("concurrent.futures module not available, falling back to sequential processing")
-        
-        # 防止并发数据库会话访问的锁
-        from threading import Lock
-        db_session_lock = Lock()
-
-        # 创建子章节生成任务函数
-        def generate_chapter_task(index, chapter):
-            if task_id and db_session:
-                with db_session_lock:
-                    try:
-                        progress = 40 + int(50 * (index / chapter_count))
-                        update_task_progress(task_id, db_session, progress, f"正在生成第{index+1}/{chapter_count}个章节的子章节...")
-                    except Exception as e:
-                        logger.error(f"更新任务进度失败: {str(e)}")
-            
-            # 计算本章节字数/页数参考值（按比例分配总量）
-            chapter_word_count = int(word_count / chapter_count) if word_count else None
-            chapter_page_count = max(1, int(page_count / chapter_count)) if page_count else None
-            
-            # 递归生成子章节
-            subchapters = self._generate_subchapters_recursively(
-                prompt, 
+
+        if required_level <= 1 or chapter_count == 0:
+            return outline_data
+
+        def submit(chapter: Dict[str, Any], level: int, chapter_index: int) -> concurrent.futures.Future:
+            return outline_expansion_executor.submit(
+                level,
+                bind_trace(self._generate_direct_subchapters),
+                prompt,
                 chapter["title"],
-                chapter["description"],
+                chapter.get("description", ""),
                 file_context,
                 rag_context,
                 required_level,
-                current_level=1,  # 当前是一级章节
-                chapter_word_count=chapter_word_count,
-                chapter_page_count=chapter_page_count,
-                task_id=task_id,  # 传递task_id用于日志记录
-                chapter_index=index,
-                total_chapters=chapter_count,
-                children_num=children_num
+                level,
+                children_num,
+                task_id,
+                chapter_index,
+                chapter_count
             )
-            
-            return index, subchapters
-        
-        # 处理所有一级章节
-        if use_parallel and chapter_count > 1:
-            # 并行处理
-            results = {}
-            with concurrent.futures.ThreadPoolExecutor(max_workers=min(8, chapter_count)) as executor:
-                # 提交所有任务
-                future_to_index = {
-                    executor.submit(generate_chapter_task, i, chapter): i 
-                    for i, chapter in enumerate(first_level_chapters)
-                }
-                
-                # 收集结果
-                for future in concurrent.futures.as_completed(future_to_index):
-                    try:
-                        index, subchapters = future.result()
-                        results[index] = subchapters
-                    except Exception as e:
-                        logger.error(f"Error in chapter generation task: {str(e)}")
-                        # 发生错误时使用备用子章节
-                        index = future_to_index[future]
-                        results[index] = self._create_default_subchapters(first_level_chapters[index]["title"])
-            
-            # 将结果按原始顺序组织回大纲
-            for i in range(chapter_count):
-                if i in results:
-                    first_level_chapters[i]["children"] = results[i]
-                else:
-                    # 如果某个任务没有返回结果，使用备用章节
-                    first_level_chapters[i]["children"] = self._create_default_subchapters(first_level_chapters[i]["title"])
 
-            # 生成完成后，在主线程中更新总进度
-            if task_id and db_session:
+        pending = {}
+        for i, chapter in enumerate(first_level_chapters):
+            pending[submit(chapter, 1, i)] = (chapter, 1, i)
+        submitted = len(pending)
+        completed = 0
+        last_progress = 40
+
+        while pending:
+            done, _ = concurrent.futures.wait(list(pending), return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                chapter, level, chapter_index = pending.pop(future)
+                completed += 1
+                try:
+                    children = future.result()
+                except Exception as e:
+                    logger.error(f"Error in chapter generation task: {str(e)}")
+                    # 一级章节失败时使用备用子章节，更深层级的章节不再展开
+                    children = self._create_default_subchapters(chapter["title"]) if level == 1 else []
+                chapter["children"] = children
+
+                if level + 1 < required_level:
+                    for child in children:
+                        pending[submit(child, level + 1, chapter_index)] = (child, level + 1, chapter_index)
+                        submitted += 1
+
+            # 章节总数随展开增长，进度按已完成比例估算且不回退
+            progress = max(last_progress, 40 + int(50 * completed / submitted))
+            if task_id and db_session and progress != last_progress:
                 try:
-                    update_task_progress(task_id, db_session, 90, "子章节生成完成，正在优化大纲结构...")
+                    update_task_progress(task_id, db_session, progress, f"正在生成子章节（已完成{completed}/{submitted}个章节）...")
                 except Exception as e:
                     logger.error(f"更新任务进度失败: {str(e)}")
-        else:
-            # 顺序处理
-            for i, chapter in enumerate(first_level_chapters):
-                # 直接更新进度，不需要锁
-                if task_id and db_session:
-                    try:
-                        progress = 40 + int(50 * (i / chapter_count))
-                        update_task_progress(task_id, db_session, progress, f"正在生成第{i+1}/{chapter_count}个章节的子章节...")
-                    except Exception as e:
-                        logger.error(f"更新任务进度失败: {str(e)}")
-
-            # 递归生成子章节
-                subchapters = self._generate_subchapters_recursively(
-                    prompt, 
-                    chapter["title"],
-                    chapter["description"],
-                    file_context,
-                    rag_context,
-                    required_level,
-                    current_level=1,
-                    chapter_word_count=int(word_count / chapter_count) if word_count else None,
-                    chapter_page_count=max(1, int(page_count / chapter_count)) if page_count else None,
-                    task_id=task_id,
-                    chapter_index=i,
-                    total_chapters=chapter_count,
-                    children_num=children_num
-                )
-                
-                chapter["children"] = subchapters
-        
+            last_progress = progress
+
+        if task_id and db_session:
+            try:
+                update_task_progress(task_id, db_session, 90, "子章节生成完成，正在优化大纲结构...")
+            except Exception as e:
+                logger.error(f"更新任务进度失败: {str(e)}")
+
         return outline_data
-    
-    def _generate_subchapters_recursively(
-        self, 
+
+    @traced("subchapters")
+    @llm_call_site("outline")
+    def _generate_direct_subchapters(
+        self,
         prompt: str,
         chapter_title: str,
         chapter_description: str,
-        file_context: str, 
-        rag_context: str, 
-        required_level: int, 
+        file_context: str,
+        rag_context: str,
+        required_level: int,
         current_level: int = 1,
-        chapter_word_count: Optional[int] = None, 
-        chapter_page_count: Optional[int] = None,
+        children_num: str = "2-3",
         task_id: Optional[str] = None,
         chapter_index: int = 0,
-        total_chapters: int = 1,
-        children_num: str = "2-3"
+        total_chapters: int = 1
     ) -> List[Dict[str, Any]]:
-        """递归生成章节的子章节"""
+        """生成章节的直接子章节（只生成下一级，更深层级由调用方继续展开）"""
         # 记录日志但不更新数据库
         if task_id:
             logger.info(f"生成章节 [{chapter_index+1}/{total_chapters}] '{chapter_title}' 的第{current_level+1}级子章节")
@@ -1125,7 +1100,7 @@ class OutlineGenerator:
                     # 如果不是列表或为空，使用备用生成
                     return []
                 
-                # 转换为标准格式并递归处理更深层级
+                # 转换为标准格式
                 standard_subchapters = []
                 
                 # 限制子章节数量
@@ -1154,31 +1129,6 @@ class OutlineGenerator:
                         "children": []
                     }
                     
-                    # 如果当前层级还没达到要求的深度，递归生成更深层级的子章节
-                    if next_level < required_level:
-                        # 计算更深层级子章节的字数/页数（按比例分配）
-                        sub_word_count = int(chapter_word_count / max_subchapters) if chapter_word_count else None
-                        sub_page_count = max(1, int(chapter_page_count / max_subchapters)) if chapter_page_count else None
-                        
-                        # 递归生成更深层级子章节
-                        deeper_subchapters = self._generate_subchapters_recursively(
-                            prompt,
-                            subchapter_title,
-                            subchapter_description,
-                            file_context,
-                            rag_context,
-                            required_level,
-                            next_level,
-                            sub_word_count,
-                            sub_page_count,
-                            task_id,
-                            chapter_index,
-                            total_chapters,
-                            children_num
-                        )
-                        
-                        subchapter_obj["children"] = deeper_subchapters
-                    
                     standard_subchapters.append(subchapter_obj)
                 
                 # 确保至少有一些子章节
@@ -1303,6 +1253,7 @@ class OutlineGenerator:
                 
         return subchapters
 
+    @traced("distribute_word_count")
     def _distribute_word_outline(self, outline_data: Dict[str, Any], word_count: int) -> None:
         """
         根据总体字数，计算每个段落的预估字数
@@ -1622,6 +1573,7 @@ class OutlineGenerator:
                 child["expected_word_count"] = 0
                 logger.info(f"子段落 '{child.get('title', '无标题')}' 不需要生成内容，分配 0 字")
 
+    @traced("validate_outline")
     def _validate_and_fix_outline(self, outline_data: Dict[str, Any]) -> None:
         """
         验证大纲结构，检查是否有重复标题，并尝试修复问题
@@ -1780,6 +1732,7 @@ class OutlineGenerator:
         
         # 无法在这里访问prompt参数，只记录最大层级即可
         
+    @traced("extract_requirements")
     def _extract_required_level_from_prompt(self, prompt: str) -> int:
         """
         通过 LLM 提取用户提示中的目录层级要求和字数要求
@@ -1847,6 +1800,7 @@ class OutlineGenerator:
             # 出错时返回默认值
             return {"level": 2, "word_count": None}
 
+    @traced("save_outline")
     def save_outline_to_db(self, outline_data: Dict[str, Any], db_session, outline_id: Optional[str] = None, user_id: Optional[str] = None) -> Dict[str, Any]:
         """
         将生成的大纲保存到数据库
@@ -1886,54 +1840,21 @@ class OutlineGenerator:
             db_session.flush()  # 获取新ID
             logger.info(f"保存大纲基本信息完成 [outline_id={outline.id}]")
             
-            # 递归保存段落
-            def save_paragraphs(paragraphs_data, parent_id=None, level=1):
-                saved_paragraphs = []
-                for para_data in paragraphs_data:
-                    # 创建段落
-                    paragraph = SubParagraph(
-                        outline_id=outline.id,
-                        parent_id=parent_id,
-                        title=para_data.get("title", ""),
-                        description=para_data.get("description", ""),
-                        level=level
-                    )
-                    
-                    # 只有1级段落才设置count_style
-                    if level == 1:
-                        count_style = para_data.get("count_style", "medium").lower()
-                        # 确保count_style是有效的枚举值
-                        if count_style not in [e.value for e in CountStyle]:
-                            count_style = "medium"
-                        paragraph.count_style = count_style
-                    
-                    db_session.add(paragraph)
-                    db_session.flush()  # 获取新ID
-                    logger.info(f"保存段落 [id={paragraph.id}, level={level}, parent_id={parent_id}]")
-                    
-                    # 递归保存子段落
-                    children = para_data.get("children", [])
-                    if children:
-                        logger.info(f"开始保存子段落 [parent_id={paragraph.id}, count={len(children)}]")
-                        save_paragraphs(children, paragraph.id, level + 1)
-                    
-                    saved_paragraphs.append(paragraph)
-                
-                return saved_paragraphs
-            
             # 删除现有段落（如果是更新模式）
             if outline_id:
                 logger.info(f"删除现有段落 [outline_id={outline_id}]")
-                db_session.query(SubParagraph).filter(
-                    SubParagraph.outline_id == outline_id
-                ).delete()
+                delete_paragraphs(db_session, db_session.query(SubParagraph).filter(
+                    SubParagraph.outline_id == outline.id
+                ).all())
             
-            # 开始保存段落
+            # 按层级批量保存段落
             logger.info("开始保存段落结构")
-            save_paragraphs(outline_data.get("sub_paragraphs", []))
+            saved = insert_paragraph_tree(db_session, outline.id, outline_data.get("sub_paragraphs", []))
+            logger.info(f"段落结构保存完成 [outline_id={outline.id}, 段落数={len(saved)}]")
             
             # 提交事务
             db_session.commit()
+            outline_tree_cache.invalidate(outline.id)
             logger.info(f"大纲保存完成 [outline_id={outline.id}]")
             
             # 返回保存的数据
@@ -1953,6 +1874,7 @@ class OutlineGenerator:
             logger.error(f"保存大纲到数据库时出错: {str(e)}")
             raise
             
+    @traced("optimize_outline")
     def _optimize_outline_structure(self, outline_data: Dict[str, Any]) -> None:
         """
         优化大纲结构，确保层级合理，内容不重复
@@ -2040,23 +1962,8 @@ class OutlineGenerator:
         logger.info(f"开始构建大纲内容 [outline_id={outline.id}]")
         
         try:
-            # 构建段落树
-            paragraph_map = {p.id: p for p in paragraphs}
-            root_paragraphs = [p for p in paragraphs if p.parent_id is None]
-            
-            # 对根段落按照 sort_index 排序
-            root_paragraphs.sort(key=lambda p: p.sort_index if p.sort_index is not None else p.id)
-            
-            # 构建段落树结构
-            for p in paragraphs:
-                if p.parent_id:
-                    parent = paragraph_map.get(p.parent_id)
-                    if parent:
-                        if not hasattr(parent, 'children'):
-                            parent.children = []
-                        # 检查是否已经添加过这个子段落
-                        if p not in parent.children:
-                            parent.children.append(p)
+            # 按文档顺序线性构建段落树，同级段落已按顺序排列
+            root_paragraphs = attach_children(ensure_document_order(list(paragraphs)))
             
             # 开始构建大纲内容
             outline_content = f"# {outline.title}\n"
@@ -2083,10 +1990,8 @@ class OutlineGenerator:
                         result.append(f"({p.description})")
                     
                     # 递归处理子段落
-                    if hasattr(p, 'children') and p.children:
-                        # 确保子段落按 sort_index 排序
-                        sorted_children = sorted(p.children, key=lambda x: x.sort_index if x.sort_index is not None else x.id)
-                        result.extend(build_outline_text(sorted_children, level + 1))
+                    if p.children:
+                        result.extend(build_outline_text(p.children, level + 1))
                 return result
             
             # 构建大纲文本
@@ -2102,6 +2007,7 @@ class OutlineGenerator:
             # 返回一个基本的大纲结构，避免完全失败
             return f"# {outline.title}\n## 大纲生成失败，请重试\n(构建大纲内容时发生错误: {str(e)})"
 
+    @traced("article_title")
     def _generate_article_title(self, user_prompt: str, outline_title: str, outline_content: str) -> str:
         """
         生成文章标题
@@ -2157,7 +2063,65 @@ class OutlineGenerator:
             logger.error(f"生成文章标题时出错: {str(e)}")
             return outline_title
 
-    def generate_full_content(self, outline_id: str, db_session, user_id: Optional[str] = None, kb_ids: Optional[List[str]] = None, user_prompt: str = "", doc_id: str = None, at_file_ids: Optional[List[str]] = None) -> Dict[str, Any]:
+    def _assign_expected_word_counts(self, outline: Outline, root_paragraphs: List[SubParagraph], paragraphs_dict: Dict[int, SubParagraph], word_count: int) -> None:
+        """
+        按用户要求的总字数分配各段落的预期字数，写入段落的 expected_word_count（不提交）
+
+        Args:
+            outline: 大纲
+            root_paragraphs: 已挂好子段落的顶级段落
+            paragraphs_dict: 段落ID到段落的映射
+            word_count: 总字数
+        """
+        # 转换大纲和段落为JSON格式，以便使用_distribute_word_outline方法
+        outline_data = {
+            "title": outline.title,
+            "sub_paragraphs": []
+        }
+        
+        # 递归构建段落树
+        def build_paragraph_tree(paragraphs):
+            result = []
+            for p in paragraphs:
+                para_data = {
+                    "id": p.id,
+                    "title": p.title,
+                    "description": p.description,
+                    "level": p.level,
+                    "count_style": p.count_style.value if p.count_style else "medium"
+                }
+                
+                if hasattr(p, 'children') and p.children:
+                    para_data["children"] = build_paragraph_tree(sorted(p.children, key=lambda x: x.sort_index if x.sort_index is not None else x.id))
+                    
+                result.append(para_data)
+            return result
+        
+        # 构建JSON格式的大纲数据
+        outline_data["sub_paragraphs"] = build_paragraph_tree(root_paragraphs)
+        
+        # 分配字数
+        self._distribute_word_outline(outline_data, word_count)
+        
+        # 将分配好的字数更新到段落中
+        def update_word_counts(json_paragraphs, db_paragraphs_dict):
+            for json_para in json_paragraphs:
+                if "id" in json_para and json_para["id"] in db_paragraphs_dict:
+                    db_para = db_paragraphs_dict[json_para["id"]]
+                    if "expected_word_count" in json_para:
+                        db_para.expected_word_count = json_para["expected_word_count"]
+                        logger.info(f"更新段落 '{db_para.title}' 的预期字数为 {db_para.expected_word_count} 字")
+                
+                # 递归处理子段落
+                if "children" in json_para and json_para["children"]:
+                    update_word_counts(json_para["children"], db_paragraphs_dict)
+        
+        # 将字数分配结果更新到数据库中的段落
+        update_word_counts(outline_data["sub_paragraphs"], paragraphs_dict)
+
+    @traced("generate_full_content")
+    @llm_call_site("paragraph")
+    def generate_full_content(self, outline_id: str, db_session, user_id: Optional[str] = None, kb_ids: Optional[List[str]] = None, user_prompt: str = "", doc_id: str = None, at_file_ids: Optional[List[str]] = None, task_id: Optional[str] = None) -> Dict[str, Any]:
         """
         生成完整的文章内容
         
@@ -2168,26 +2132,20 @@ class OutlineGenerator:
             kb_ids: 知识库ID列表
             user_prompt: 用户提示
             doc_id: 文档ID
+            task_id: 任务ID，用于更新任务进度和断点
             
         Returns:
             Dict: 生成的内容
         """
-        logger.info(f"开始生成完整内容 [outline_id={outline_id}]")
-        
-        # 获取任务ID用于更新任务进度
-        task_id = None
-        if doc_id:
-            # 查找相关任务ID
-            task = db_session.query(Task).filter(
-                Task._params.like(f'%"doc_id": "{doc_id}"%'),
-                Task.status == TaskStatus.PROCESSING
-            ).first()
-            if task:
-                task_id = task.id
-                logger.info(f"找到关联的任务ID: {task_id}")
+        logger.info(f"开始生成完整内容 [outline_id={outline_id}, task_id={task_id}]")
                 
+        # 加载任务断点，任务中断后重新执行时从第一个缺失的段落继续
+        checkpoints = TaskCheckpointStore(task_id)
+        
         # 初始化任务进度
         update_task_progress(task_id, db_session, 5, "开始生成文章", f"大纲ID: {outline_id}, 用户ID: {user_id}")
+        if len(checkpoints):
+            update_task_progress(task_id, db_session, 5, "从断点恢复任务", f"已有 {len(checkpoints)} 个断点")
         
         # 获取大纲
         outline = db_session.query(Outline).filter(Outline.id == outline_id).first()
@@ -2196,34 +2154,15 @@ class OutlineGenerator:
         
         update_task_progress(task_id, db_session, 8, "获取大纲信息", f"大纲标题: {outline.title}")
         
-        # 获取大纲内容
-        outline_content= self._build_outline_content(outline, outline.sub_paragraphs)
-        
-        # 获取所有段落
-        all_paragraphs = db_session.query(SubParagraph).filter(
+        # 按文档顺序获取所有段落（物化路径索引），线性构建段落树
+        all_paragraphs = ensure_document_order(db_session.query(SubParagraph).filter(
             SubParagraph.outline_id == outline_id
-        ).all()
-        
-        # 构建段落字典
+        ).order_by(SubParagraph.path).all())
+        root_paragraphs = attach_children(all_paragraphs)
         paragraphs_dict = {p.id: p for p in all_paragraphs}
         
-        # 构建父子关系
-        for p in all_paragraphs:
-            if hasattr(p, 'children'):
-                continue  # 已经有children属性
-            
-            # 添加children属性
-            p.children = [
-                paragraphs_dict[child.id] 
-                for child in all_paragraphs 
-                if child.parent_id == p.id
-            ]
-        
-        # 获取顶级段落
-        root_paragraphs = [p for p in all_paragraphs if p.parent_id is None]
-        
-        # 按 sort_index 排序
-        root_paragraphs.sort(key=lambda p: p.sort_index if p.sort_index is not None else p.id)
+        # 获取大纲内容
+        outline_content= self._build_outline_content(outline, all_paragraphs)
         
         update_task_progress(task_id, db_session, 10, "解析大纲结构", f"找到 {len(all_paragraphs)} 个段落，{len(root_paragraphs)} 个顶级段落")
         
@@ -2232,7 +2171,7 @@ class OutlineGenerator:
         word_count = requirements.get("word_count")
         page_count = requirements.get("page_count")
         if page_count and not word_count:
-            word_count = page_count * settings.WRITING_WORD_COUNT_PER_PAGE
+            word_count = page_count * settings.WRITING_PER_PAGE_WORD_COUNT
         
         
         # 如果用户指定了字数，则进行分配
@@ -2240,51 +2179,7 @@ class OutlineGenerator:
             update_task_progress(task_id, db_session, 11, "开始分配字数", f"用户要求总字数: {word_count}字")
             logger.info(f"从用户提示中提取到字数要求: {word_count}字，开始分配字数到大纲...")
             
-            # 转换大纲和段落为JSON格式，以便使用_distribute_word_outline方法
-            outline_data = {
-                "title": outline.title,
-                "sub_paragraphs": []
-            }
-            
-            # 递归构建段落树
-            def build_paragraph_tree(paragraphs):
-                result = []
-                for p in paragraphs:
-                    para_data = {
-                        "id": p.id,
-                        "title": p.title,
-                        "description": p.description,
-                        "level": p.level,
-                        "count_style": p.count_style.value if p.count_style else "medium"
-                    }
-                    
-                    if hasattr(p, 'children') and p.children:
-                        para_data["children"] = build_paragraph_tree(sorted(p.children, key=lambda x: x.sort_index if x.sort_index is not None else x.id))
-                        
-                    result.append(para_data)
-                return result
-            
-            # 构建JSON格式的大纲数据
-            outline_data["sub_paragraphs"] = build_paragraph_tree(root_paragraphs)
-            
-            # 分配字数
-            self._distribute_word_outline(outline_data, word_count)
-            
-            # 将分配好的字数更新到段落中
-            def update_word_counts(json_paragraphs, db_paragraphs_dict):
-                for json_para in json_paragraphs:
-                    if "id" in json_para and json_para["id"] in db_paragraphs_dict:
-                        db_para = db_paragraphs_dict[json_para["id"]]
-                        if "expected_word_count" in json_para:
-                            db_para.expected_word_count = json_para["expected_word_count"]
-                            logger.info(f"更新段落 '{db_para.title}' 的预期字数为 {db_para.expected_word_count} 字")
-                    
-                    # 递归处理子段落
-                    if "children" in json_para and json_para["children"]:
-                        update_word_counts(json_para["children"], db_paragraphs_dict)
-            
-            # 将字数分配结果更新到数据库中的段落
-            update_word_counts(outline_data["sub_paragraphs"], paragraphs_dict)
+            self._assign_expected_word_counts(outline, root_paragraphs, paragraphs_dict, word_count)
             
             # 提交更改
             db_session.commit()
@@ -2292,7 +2187,13 @@ class OutlineGenerator:
         
         # 获取RAG上下文
         rag_context = ""
-        if kb_ids:
+        rag_input_hash = compute_input_hash(outline_id, user_prompt, kb_ids, at_file_ids, self.use_web)
+        rag_checkpoint = checkpoints.get("rag_context", rag_input_hash) if kb_ids else None
+        if rag_checkpoint is not None:
+            # RAG查询问题由大模型生成，结果不稳定，恢复时直接复用断点中的上下文
+            rag_context = rag_checkpoint.get("rag_context", "")
+            update_task_progress(task_id, db_session, 30, "从断点恢复RAG上下文", f"上下文长度: {len(rag_context)} 字符")
+        elif kb_ids:
             logger.info(f"获取RAG上下文 [kb_ids={kb_ids}]")
             # 更新任务进度到12%，开始RAG检索
             
@@ -2308,7 +2209,8 @@ class OutlineGenerator:
             logger.info("开始生成用于RAG查询的问题")
             try:
                 # 调用LLM生成相关问题
-                question_response = self.llm.invoke(question_generation_prompt)
+                with trace_span("rag_questions"):
+                    question_response = self.llm.invoke(question_generation_prompt)
                 generated_questions = question_response.content.strip().split('\n')
                 
                 # 过滤掉可能包含的序号或空行
@@ -2368,21 +2270,7 @@ class OutlineGenerator:
 
                 # 新增：通过百度搜索获取更多信息
                 if self.use_web:
-                    update_task_progress(task_id, db_session, 28, "开始Web搜索", "通过百度搜索补充信息")
-                    web_search_results = []
-                    for i, question in enumerate(filtered_questions[:2]):  # 只对前两个问题进行搜索
-                        logger.info(f"开始通过百度搜索获取问题相关信息: {question}")
-                        update_task_progress(task_id, db_session, 29, f"搜索问题 {i+1}", f"问题: {question}")
-                        
-                        search_results = baidu_search(question)
-                        if search_results:
-                            search_summary = self._summarize_search_results(question, search_results)
-                            rag_context += f"\n--- 百度搜索结果: {question} ---\n{search_summary}\n\n"
-                            web_search_results.append(f"问题 {i+1}: {len(search_summary)} 字符")
-                            logger.info(f"已将搜索结果添加到RAG上下文中")
-                    
-                    if web_search_results:
-                        update_task_progress(task_id, db_session, 30, "Web搜索完成", f"获取搜索结果: {', '.join(web_search_results)}")
+                    rag_context += self._web_search_context(filtered_questions, task_id, db_session)
             except Exception as e:
                 error_msg = f"生成问题或查询RAG时出错: {str(e)}"
                 logger.error(error_msg)
@@ -2398,6 +2286,7 @@ class OutlineGenerator:
                 update_task_progress(task_id, db_session, 32, "使用替代方式完成RAG查询", f"获取上下文长度: {len(rag_context)} 字符")
             
             logger.info(f"RAG上下文长度: {len(rag_context)} 字符")
+            checkpoints.save("rag_context", rag_input_hash, {"rag_context": rag_context})
         else:
             # 没有RAG检索
             update_task_progress(task_id, db_session, 30, "准备生成内容", "不使用RAG检索")
@@ -2438,7 +2327,11 @@ class OutlineGenerator:
             "doc_id": doc_id,  # 文档ID，用于更新HTML内容
             "task_id": task_id,  # 任务ID，用于更新进度
             "total_paragraphs": len(all_paragraphs),  # 段落总数
-            "generated_paragraph_count": 0  # 已生成段落数
+            "generated_paragraph_count": 0,  # 已生成段落数
+            "checkpoints": checkpoints,  # 任务断点，用于跳过已生成的段落
+            "duplicate_index": MinHashIndex(),  # 已生成段落的MinHash索引，用于检测重复内容
+            "rag_index": PassageIndex.from_text(rag_context, chunk_size=settings.WRITING_RAG_CHUNK_SIZE) if rag_context else None,  # 参考资料片段索引，按段落检索
+            "restored_paragraph_count": 0  # 从断点恢复的段落数
         }
         
         logger.info(f"开始生成段落内容，共 {len(root_paragraphs)} 个顶级段落")
@@ -2485,19 +2378,20 @@ class OutlineGenerator:
             logger.warning(duplicate_log)
         
         # 记录章节摘要数量
-        summary_log = f"生成了 {len(global_context['chapter_summaries'])} 个章节摘要, {len(global_context['generated_contents'])} 个段落内容, 总长度: {len(final_content)} 字符"
+        summary_log = f"生成了 {len(global_context['chapter_summaries'])} 个章节摘要, {len(global_context['generated_contents'])} 个段落内容（其中 {global_context['restored_paragraph_count']} 个从断点恢复）, 总长度: {len(final_content)} 字符"
         logger.info(summary_log)
         
         # 将markdown转换为HTML
-        html_content = markdown.markdown(final_content, extensions=[
-            'markdown.extensions.extra',
-            'markdown.extensions.toc',
-            'markdown.extensions.sane_lists',
-            'markdown.extensions.smarty',
-            'markdown.extensions.tables',
-            'markdown.extensions.fenced_code',
-            'markdown.extensions.codehilite'
-        ])
+        with trace_span("render_html", scope="final", length=len(final_content)):
+            html_content = markdown.markdown(final_content, extensions=[
+                'markdown.extensions.extra',
+                'markdown.extensions.toc',
+                'markdown.extensions.sane_lists',
+                'markdown.extensions.smarty',
+                'markdown.extensions.tables',
+                'markdown.extensions.fenced_code',
+                'markdown.extensions.codehilite'
+            ])
         
         # 更新文档HTML内容
         html_log = ""
@@ -2517,12 +2411,54 @@ class OutlineGenerator:
         final_log = f"{summary_log}\n{duplicate_log}\n{html_log}".strip()
         update_task_progress(task_id, db_session, 100, "内容生成完成", final_log)
         
+        # 内容已完整写入文档，断点不再需要
+        checkpoints.clear()
+        
         return {
             "title": article_title,
             "markdown": final_content,
             "html": html_content
         }
     
+    @traced("web_search")
+    def _web_search_context(self, questions: List[str], task_id: Optional[str], db_session) -> str:
+        """
+        并行搜索所有问题并总结搜索结果
+
+        Args:
+            questions: 搜索的问题列表
+            task_id: 任务ID
+            db_session: 数据库会话，只在当前线程中用于更新进度
+
+        Returns:
+            str: 追加到RAG上下文的搜索结果总结
+        """
+        if not questions:
+            return ""
+        update_task_progress(task_id, db_session, 28, "开始Web搜索", f"通过百度搜索补充信息，共 {len(questions)} 个问题")
+        logger.info(f"开始通过百度搜索获取问题相关信息: {questions}")
+        search_results = baidu_search_many(questions)
+
+        # 总结调用经过LLM并发控制，这里只负责并行提交
+        found = [(i, question, result) for i, (question, result) in enumerate(zip(questions, search_results)) if result]
+        update_task_progress(task_id, db_session, 29, "Web搜索结果总结", f"获取到 {len(found)}/{len(questions)} 个问题的搜索结果")
+        if not found:
+            return ""
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(found)) as executor:
+            summarize = bind_trace(lambda item: self._summarize_search_results(item[1], item[2]))
+            summaries = list(executor.map(summarize, found))
+
+        context = ""
+        web_search_results = []
+        for (i, question, _), search_summary in zip(found, summaries):
+            context += f"\n--- 百度搜索结果: {question} ---\n{search_summary}\n\n"
+            web_search_results.append(f"问题 {i+1}: {len(search_summary)} 字符")
+        logger.info(f"已将搜索结果添加到RAG上下文中")
+        update_task_progress(task_id, db_session, 30, "Web搜索完成", f"获取搜索结果: {', '.join(web_search_results)}")
+        return context
+
+    @traced("summarize_search")
+    @llm_call_site("summary")
     def _summarize_search_results(self, question: str, search_results: str) -> str:
         """
         总结百度搜索结果
@@ -2557,6 +2493,7 @@ class OutlineGenerator:
             logger.error(f"总结搜索结果时出错: {str(e)}")
             return "搜索结果总结失败。"
 
+    @traced("paragraph")
     def _generate_paragraph_with_context(
         self,
         paragraph,
@@ -2619,6 +2556,8 @@ class OutlineGenerator:
         # 获取段落描述
         description = paragraph.description or ""
         
+        set_span_attributes(paragraph_id=paragraph.id, title=title, level=level)
+
         # 获取子段落标题
         sub_titles = get_sub_paragraph_titles(paragraph)
         
@@ -2637,7 +2576,8 @@ class OutlineGenerator:
             "parent_content": parent_content,
             "already_generated_titles": list(global_context.get("generated_titles", set())),
             "duplicate_warning": "请确保生成的内容与已生成的章节不重复，特别是避免与以下章节内容重复: " + 
-                               ", ".join([f"'{title}'" for title in list(global_context.get("generated_titles", set()))[-5:]])
+                               ", ".join([f"'{title}'" for title in list(global_context.get("generated_titles", set()))[-5:]]),
+            "doc_id": global_context.get("doc_id")  # 文档ID，用于将生成的token实时推送到文档流
         }
         
         # 生成段落内容
@@ -2647,36 +2587,55 @@ class OutlineGenerator:
         is_deepest_level = not hasattr(paragraph, 'children') or not paragraph.children
         logger.info(f"段落层级信息 [标题='{title}', 级别={level}, 是否有子段落={not is_deepest_level}]")
 
-        if description or is_deepest_level:
+        # 段落断点按段落ID和生成输入的哈希存储，标题、描述、字数等输入变化后断点失效
+        checkpoints = global_context.get("checkpoints")
+        checkpoint_key = f"paragraph:{paragraph.id}"
+        checkpoint_hash = compute_input_hash(
+            article_title, paragraph.title, description, level, sub_titles,
+            count_style, paragraph.expected_word_count, user_prompt, self.model
+        )
+        checkpoint = checkpoints.get(checkpoint_key, checkpoint_hash) if checkpoints is not None else None
+        restored = checkpoint is not None
+
+        if restored:
+            # 复用断点中的内容和摘要，跳过生成和相似度检查
+            content = checkpoint.get("content", "")
+            content_summary = checkpoint.get("summary") or self._extract_content_summary(content)
+            global_context["restored_paragraph_count"] = global_context.get("restored_paragraph_count", 0) + 1
+            set_span_attributes(restored=True)
+            logger.info(f"从断点恢复段落内容 [标题='{title}', ID={paragraph.id}, 长度={len(content)}]")
+        elif description or is_deepest_level:
+            # 按段落标题、描述和子标题从参考资料索引中检索最相关的片段
+            rag_index = global_context.get("rag_index")
+            if rag_index is not None:
+                paragraph_query = "\n".join([paragraph.title, description] + list(sub_titles))
+                paragraph_rag_context = rag_index.retrieve(paragraph_query, settings.WRITING_RAG_TOP_K)
+                logger.info(f"检索段落参考资料 [ID={paragraph.id}, 片段数={len(rag_index)}, top_k={settings.WRITING_RAG_TOP_K}, 长度={len(paragraph_rag_context)}/{len(rag_context)}]")
+            else:
+                paragraph_rag_context = rag_context
+
             content = self._generate_paragraph_content_with_context(
                 article_title=article_title,
                 paragraph=paragraph,
                 sub_titles=sub_titles,
                 count_style=count_style,
-                rag_context=rag_context,
+                rag_context=paragraph_rag_context,
                 outline_content=outline_content,
                 user_prompt=user_prompt,
                 context_info=context_info,
                 expected_word_count=paragraph.expected_word_count
             )
             
-            # 检查生成的内容与已有内容的相似度
+            # 检查生成的内容与已有内容的相似度，通过MinHash索引找出最相似的已生成段落
             content_too_similar = False
             similar_title = None
             
-            for pid, content_info in global_context["generated_contents"].items():
-                if pid != paragraph.id:  # 不与自己比较
-                    existing_content = content_info.get("content", "")
-                    existing_title = content_info.get("title", "")
-                    
-                    # 计算内容相似度
-                    similarity = self._paragraph_similarity(content, existing_content)
-                    
-                    if similarity > 0.7:  # 相似度阈值
-                        content_too_similar = True
-                        similar_title = existing_title
-                        logger.warning(f"生成的内容与已有内容 '{existing_title}' 相似度过高 ({similarity:.2f})，尝试重新生成")
-                        break
+            with trace_span("similarity_check"):
+                similar_id, similarity = global_context["duplicate_index"].most_similar(content, exclude=paragraph.id)
+            if similar_id is not None and similarity > settings.WRITING_DUPLICATE_THRESHOLD:
+                content_too_similar = True
+                similar_title = global_context["generated_contents"][similar_id]["title"]
+                logger.warning(f"生成的内容与已有内容 '{similar_title}' 相似度过高 ({similarity:.2f})，尝试重新生成")
             
             # 如果内容相似度过高，尝试重新生成
             if content_too_similar and similar_title:
@@ -2690,7 +2649,7 @@ class OutlineGenerator:
                     paragraph=paragraph,
                     sub_titles=sub_titles,
                     count_style=count_style,
-                    rag_context=rag_context,
+                    rag_context=paragraph_rag_context,
                     outline_content=outline_content,
                     user_prompt=user_prompt,
                     context_info=context_info,
@@ -2700,8 +2659,17 @@ class OutlineGenerator:
         else:
             content = ""
             
-        # 提取内容摘要
-        content_summary = self._extract_content_summary(content)
+        if not restored:
+            # 提取内容摘要
+            content_summary = self._extract_content_summary(content)
+            
+            # 保存段落断点，任务中断后从下一个段落继续
+            if checkpoints is not None and content:
+                checkpoints.save(checkpoint_key, checkpoint_hash, {
+                    "title": title,
+                    "content": content,
+                    "summary": content_summary
+                })
         
         # 更新全局上下文
         global_context["previous_content_summary"] = content_summary
@@ -2711,6 +2679,7 @@ class OutlineGenerator:
             "content": content,
             "summary": content_summary
         }
+        global_context["duplicate_index"].add(paragraph.id, content)
         
         # 增加已生成段落计数
         global_context["generated_paragraph_count"] += 1
@@ -2722,19 +2691,20 @@ class OutlineGenerator:
         header = "#" * (level + 1)  # 增加一个#，使一级标题变为##
         markdown_content.append(f"{header} {title}\n\n{content}\n")
         
-        # 更新文档的HTML内容（如果提供了文档ID）
+        # 更新文档的HTML内容（如果提供了文档ID），从断点恢复的段落在下一个新生成的段落时一并更新
         doc_id = global_context.get("doc_id")
-        if doc_id and db_session:
+        if doc_id and db_session and not restored:
             try:
                 # 合并到目前为止生成的内容
-                current_content = "\n".join(markdown_content)
-                current_html = markdown.markdown(current_content,extensions=[
-                    'markdown.extensions.extra',
-                    'markdown.extensions.toc',
-                    'markdown.extensions.sane_lists',
-                    'markdown.extensions.smarty',
-                    'markdown.extensions.tables',
-                    ])
+                with trace_span("render_html", scope="partial"):
+                    current_content = "\n".join(markdown_content)
+                    current_html = markdown.markdown(current_content,extensions=[
+                        'markdown.extensions.extra',
+                        'markdown.extensions.toc',
+                        'markdown.extensions.sane_lists',
+                        'markdown.extensions.smarty',
+                        'markdown.extensions.tables',
+                        ])
                 
                 # 更新文档HTML内容
                 document = db_session.query(Document).filter(Document.doc_id == doc_id).first()
@@ -2763,6 +2733,22 @@ class OutlineGenerator:
                     db_session=db_session
                 )
 
+    def _stream_paragraph_content(self, prompt: str, doc_id: str, paragraph) -> AIMessageChunk:
+        """流式生成段落内容，生成的token实时推送到文档流"""
+        stream = ParagraphStream(get_doc_stream_hub(), doc_id, str(paragraph.id), paragraph.title)
+        result = AIMessageChunk(content="")
+        stream.start()
+        try:
+            for chunk in self.llm.stream(prompt):
+                result += chunk
+                stream.write(chunk.content)
+        finally:
+            stream.close()
+        if stream.time_to_first_token is not None:
+            logger.info(f"段落流式生成完成 [段落ID={paragraph.id}, 首token耗时={stream.time_to_first_token:.2f}s, 总耗时={time.time() - stream.started_at:.2f}s]")
+        return result
+
+    @traced("paragraph_llm")
     def _generate_paragraph_content_with_context(
         self, 
         article_title: str, 
@@ -2823,16 +2809,13 @@ class OutlineGenerator:
         duplicate_warning = context_info.get("duplicate_warning", "")
         
         # 构建章节摘要字符串
-        chapter_summaries_str = ""
+        chapter_summaries_lines = ""
         if chapter_summaries:
-            chapter_summaries_str = "已生成的章节摘要：\n"
             for ch_title, ch_summary in list(chapter_summaries.items())[-5:]:  # 只取最近5个章节
-                chapter_summaries_str += f"- {ch_title}: {ch_summary}\n"
+                chapter_summaries_lines += f"- {ch_title}: {ch_summary}\n"
         
         # 构建已生成标题字符串
-        already_generated_titles_str = ""
-        if already_generated_titles:
-            already_generated_titles_str = "已生成的章节标题：" + ", ".join(already_generated_titles[-10:])  # 只取最近10个标题
+        already_generated_titles_line = ", ".join(already_generated_titles[-10:])  # 只取最近10个标题
         
         # 构建章节位置字符串
         chapter_position_str = ""
@@ -2861,8 +2844,9 @@ class OutlineGenerator:
             expected_word_count = count_style_word_counts.get(count_style, 800)
             logger.warning(f"段落 [ID={paragraph.id}] 没有设置预期字数，根据count_style='{count_style}'使用默认值 {expected_word_count}")
         
-        # 构建提示模板
-        template = f"""
+        # 构建提示模板，参考资料、父段落内容、章节摘要等上下文按token预算裁剪后填入
+        def build_template(rag_context, parent_content, previous_content_summary, chapter_summaries_str, already_generated_titles_str):
+            return f"""
 # 角色
 你是一位专业的公文撰写精灵，擅长撰写各类公文，能够根据提供的详细信息，生成符合要求的公文段落内容。
 
@@ -2929,10 +2913,43 @@ class OutlineGenerator:
 例如，如果标题是"越西县智慧交通科技治超建设规划"，不要生成一个包含"一、建设背景"、"二、现状与需求"等结构的完整规划文档，而是只生成关于这个规划的单个段落描述。
 """
         
+        budget_result = self.prompt_budgeter.fit(
+            build_template("", "", "", "", ""),
+            [
+                # 参考资料按与当前段落的相关度挑选片段
+                BudgetSection("rag_context", rag_context, weight=5, query=f"{clean_title}\n{description}\n{sub_topics}"),
+                BudgetSection("parent_content", parent_content, weight=2),
+                # 章节摘要、前一段落摘要和已生成标题优先保留最近的部分
+                BudgetSection("chapter_summaries", chapter_summaries_lines, weight=2, keep="tail"),
+                BudgetSection("previous_content_summary", previous_content_summary, weight=1, keep="tail"),
+                BudgetSection("already_generated_titles", already_generated_titles_line, weight=0.5, keep="tail"),
+            ]
+        )
+        budgeted = budget_result.texts
+        chapter_summaries_str = f"已生成的章节摘要：\n{budgeted['chapter_summaries']}" if budgeted["chapter_summaries"] else ""
+        already_generated_titles_str = f"已生成的章节标题：{budgeted['already_generated_titles']}" if budgeted["already_generated_titles"] else ""
+        template = build_template(
+            budgeted["rag_context"],
+            budgeted["parent_content"],
+            budgeted["previous_content_summary"],
+            chapter_summaries_str,
+            already_generated_titles_str
+        )
+        prompt_tokens = self.prompt_budgeter.count(template)
+        logger.info(f"段落提示词token统计 [段落ID={paragraph.id}, prompt_tokens={prompt_tokens}, 是否裁剪={budget_result.trimmed}, {budget_result.summary()}]")
+        
         try:
             # 直接调用LLM，不使用ChatPromptTemplate
             logger.info(f"开始调用LLM生成段落内容 [段落ID={paragraph.id}]")
-            result = self.llm.invoke(template)
+            doc_id = context_info.get("doc_id")
+            if doc_id and settings.WRITING_STREAM_PARAGRAPHS:
+                result = self._stream_paragraph_content(template, doc_id, paragraph)
+            else:
+                result = self.llm.invoke(template)
+            # 流式调用不返回用量，使用本地计数
+            token_usage = (getattr(result, "response_metadata", None) or {}).get("token_usage") or {}
+            completion_tokens = token_usage.get("completion_tokens") or self.prompt_budgeter.count(result.content)
+            logger.info(f"段落生成token用量 [段落ID={paragraph.id}, prompt_tokens={token_usage.get('prompt_tokens', prompt_tokens)}, completion_tokens={completion_tokens}]")
             
             # 获取生成的内容
             content = result.content
@@ -3208,6 +3225,7 @@ class OutlineGenerator:
         
         return f"{first_part}...\n[中间内容省略]...\n{last_part}"
 
+    @traced("full_content_optimize")
     def _full_content_optimize(self, user_prompt: str, final_content: str) -> str:
         """
         优化全文内容，处理可能的重复标题和内容
@@ -3404,7 +3422,9 @@ class OutlineGenerator:
             # 如果优化失败，返回原始内容
             return final_content
 
-    def generate_content_directly(self, prompt: str, file_contents: List[str], user_id: Optional[str] = None, kb_ids: Optional[List[str]] = None, doc_id: str = None, at_file_ids: Optional[List[str]] = None) -> Dict[str, Any]:
+    @traced("generate_content_directly")
+    @llm_call_site("paragraph")
+    def generate_content_directly(self, prompt: str, file_contents: List[str], user_id: Optional[str] = None, kb_ids: Optional[List[str]] = None, doc_id: str = None, at_file_ids: Optional[List[str]] = None, task_id: Optional[str] = None, db_session=None) -> Dict[str, Any]:
         """
         直接生成文章内容，不需要先生成大纲
         
@@ -3414,6 +3434,8 @@ class OutlineGenerator:
             user_id: 用户ID
             kb_ids: 知识库ID列表
             doc_id: 文档ID
+            task_id: 任务ID，用于更新任务进度和断点
+            db_session: 数据库会话，为空时新建
             
         Returns:
             Dict: 生成的内容
@@ -3431,23 +3453,12 @@ class OutlineGenerator:
             logger.info(f"根据页数({page_count}页)计算字数要求: {word_count}字")
         logger.info(f"要求层级：{required_level} 级, 要求字数：{word_count}")
         
-        # 获取任务ID用于更新任务进度
-        task_id = None
-        if doc_id:
-            # 查找相关任务ID
-            
-            try:
-                db_session = next(get_db())
-                task = db_session.query(Task).filter(
-                    Task._params.like(f'%"doc_id": "{doc_id}"%'),
-                    Task.status == TaskStatus.PROCESSING
-                ).first()
-                if task:
-                    task_id = task.id
-                    logger.info(f"找到关联的任务ID: {task_id}")
-            except Exception as e:
-                logger.error(f"查找任务ID出错: {str(e)}")
+        if db_session is None:
+            db_session = next(get_db())
                 
+        # 加载任务断点，任务中断后重新执行时复用已生成的大纲和段落
+        checkpoints = TaskCheckpointStore(task_id)
+        
         # 初始进度
         start_log = f"开始任务，提示词: '{prompt[:100]}{'...' if len(prompt) > 100 else ''}', 用户ID: {user_id}, 文档ID: {doc_id}"
         update_task_progress(task_id, db_session, 5, "准备生成文章", start_log)
@@ -3463,7 +3474,13 @@ class OutlineGenerator:
         
         # 获取RAG上下文
         rag_context = ""
-        if kb_ids:
+        rag_input_hash = compute_input_hash(prompt, kb_ids, at_file_ids, self.use_web)
+        rag_checkpoint = checkpoints.get("rag_context", rag_input_hash) if kb_ids else None
+        if rag_checkpoint is not None:
+            # RAG查询问题由大模型生成，结果不稳定，恢复时直接复用断点中的上下文
+            rag_context = rag_checkpoint.get("rag_context", "")
+            update_task_progress(task_id, db_session, 30, "从断点恢复RAG上下文", f"上下文长度: {len(rag_context)} 字符")
+        elif kb_ids:
             logger.info(f"获取RAG上下文 [kb_ids={kb_ids}]")
             # 更新任务进度到12%，开始RAG检索
             
@@ -3479,7 +3496,8 @@ class OutlineGenerator:
             logger.info("开始生成用于RAG查询的问题")
             try:
                 # 调用LLM生成相关问题
-                question_response = self.llm.invoke(question_generation_prompt)
+                with trace_span("rag_questions"):
+                    question_response = self.llm.invoke(question_generation_prompt)
                 generated_questions = question_response.content.strip().split('\n')
                 
                 # 过滤掉可能包含的序号或空行
@@ -3538,21 +3556,7 @@ class OutlineGenerator:
 
                 # 新增：通过百度搜索获取更多信息
                 if self.use_web:
-                    update_task_progress(task_id, db_session, 28, "开始Web搜索", "通过百度搜索补充信息")
-                    web_search_results = []
-                    for i, question in enumerate(filtered_questions[:2]):  # 只对前两个问题进行搜索
-                        logger.info(f"开始通过百度搜索获取问题相关信息: {question}")
-                        update_task_progress(task_id, db_session, 29, f"搜索问题 {i+1}", f"问题: {question}")
-                        
-                        search_results = baidu_search(question)
-                        if search_results:
-                            search_summary = self._summarize_search_results(question, search_results)
-                            rag_context += f"\n--- 百度搜索结果: {question} ---\n{search_summary}\n\n"
-                            web_search_results.append(f"问题 {i+1}: {len(search_summary)} 字符")
-                            logger.info(f"已将搜索结果添加到RAG上下文中")
-                    
-                    if web_search_results:
-                        update_task_progress(task_id, db_session, 30, "Web搜索完成", f"获取搜索结果: {', '.join(web_search_results)}")
+                    rag_context += self._web_search_context(filtered_questions, task_id, db_session)
             except Exception as e:
                 error_msg = f"生成问题或查询RAG时出错: {str(e)}"
                 logger.error(error_msg)
@@ -3567,6 +3571,7 @@ class OutlineGenerator:
                 update_task_progress(task_id, db_session, 32, "使用替代方式完成RAG查询", f"获取上下文长度: {len(rag_context)} 字符")
             
             logger.info(f"RAG上下文长度: {len(rag_context)} 字符")
+            checkpoints.save("rag_context", rag_input_hash, {"rag_context": rag_context})
         else:
             # 没有RAG检索
             update_task_progress(task_id, db_session, 30, "准备生成内容", "不使用RAG检索")
@@ -3719,9 +3724,17 @@ class OutlineGenerator:
 
         messages = f"System: {system_prompt}\n\nUser: {structure_prompt}"
         
-        # 调用LLM生成大纲结构
-        outline_content = self.llm.invoke(messages).content
-        update_task_progress(task_id, db_session, 35, f"已生成 {required_level} 级大纲")
+        # 大纲结构由大模型生成，段落ID依赖大纲结构，恢复时必须复用同一份大纲，段落断点才能对应
+        outline_input_hash = compute_input_hash(prompt)
+        outline_checkpoint = checkpoints.get("outline_structure", outline_input_hash)
+        if outline_checkpoint is not None:
+            outline_content = outline_checkpoint.get("outline_content", "")
+            update_task_progress(task_id, db_session, 35, "从断点恢复大纲", f"大纲长度: {len(outline_content)} 字符")
+        else:
+            # 调用LLM生成大纲结构
+            outline_content = self.llm.invoke(messages).content
+            checkpoints.save("outline_structure", outline_input_hash, {"outline_content": outline_content})
+            update_task_progress(task_id, db_session, 35, f"已生成 {required_level} 级大纲")
         logger.info(outline_content)
 
         outline = self._parse_outline_to_json(outline_content, prompt)
@@ -3783,7 +3796,11 @@ class OutlineGenerator:
                 "doc_id": doc_id,  # 文档ID，用于更新HTML内容
                 "task_id": task_id,  # 任务ID，用于更新进度
                 "total_paragraphs": len(all_paragraphs),  # 段落总数
-                "generated_paragraph_count": 0  # 已生成段落数
+                "generated_paragraph_count": 0,  # 已生成段落数
+                "checkpoints": checkpoints,  # 任务断点，用于跳过已生成的段落
+                "duplicate_index": MinHashIndex(),  # 已生成段落的MinHash索引，用于检测重复内容
+                "rag_index": PassageIndex.from_text(rag_context, chunk_size=settings.WRITING_RAG_CHUNK_SIZE) if rag_context else None,  # 参考资料片段索引，按段落检索
+                "restored_paragraph_count": 0  # 从断点恢复的段落数
             }
             
             logger.info(f"开始生成段落内容，共 {len(root_paragraphs)} 个顶级段落")
@@ -3830,19 +3847,20 @@ class OutlineGenerator:
                 logger.warning(duplicate_log)
             
             # 记录章节摘要数量
-            summary_log = f"生成了 {len(global_context['chapter_summaries'])} 个章节摘要, {len(global_context['generated_contents'])} 个段落内容, 总长度: {len(final_content)} 字符"
+            summary_log = f"生成了 {len(global_context['chapter_summaries'])} 个章节摘要, {len(global_context['generated_contents'])} 个段落内容（其中 {global_context['restored_paragraph_count']} 个从断点恢复）, 总长度: {len(final_content)} 字符"
             logger.info(summary_log)
             
             # 将markdown转换为HTML
-            html_content = markdown.markdown(final_content, extensions=[
-                'markdown.extensions.extra',
-                'markdown.extensions.toc',
-                'markdown.extensions.sane_lists',
-                'markdown.extensions.smarty',
-                'markdown.extensions.tables',
-                'markdown.extensions.fenced_code',
-                'markdown.extensions.codehilite'
-            ])
+            with trace_span("render_html", scope="final", length=len(final_content)):
+                html_content = markdown.markdown(final_content, extensions=[
+                    'markdown.extensions.extra',
+                    'markdown.extensions.toc',
+                    'markdown.extensions.sane_lists',
+                    'markdown.extensions.smarty',
+                    'markdown.extensions.tables',
+                    'markdown.extensions.fenced_code',
+                    'markdown.extensions.codehilite'
+                ])
             
             # 更新文档HTML内容
             html_log = ""
@@ -3862,6 +3880,9 @@ class OutlineGenerator:
             final_log = f"{summary_log}\n{duplicate_log}\n{html_log}".strip()
             update_task_progress(task_id, db_session, 100, "内容生成完成", final_log)
             
+            # 内容已完整写入文档，断点不再需要
+            checkpoints.clear()
+            
             # 返回结果
             return {
                 "title": article_title,
@@ -3953,6 +3974,8 @@ class OutlineGenerator:
         
         return max_level + 1 == required_levels
     
+    @traced("outline_draft")
+    @llm_call_site("outline")
     def generate_outline_new(self, topic, levels=3, word_count=10000, show_result=False, fill_desc=True, task_id: Optional[str] = None, db_session = None):
         """生成大纲"""        
         # 构建提示词
@@ -4282,6 +4305,7 @@ class OutlineGenerator:
             return 0
         return 0
     
+    @traced("parse_outline")
     def _parse_outline_to_json(self, outline_text, topic):
         """将大纲文本解析为指定的JSON结构"""
         try:
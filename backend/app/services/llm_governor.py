@@ -0,0 +1,200 @@
+"""
+进程级大模型并发控制
+
+多个大纲/全文任务同时运行时，各自开线程调用大模型会在上游触发限流。这里提供：
+- LLMGovernor: 按 (base_url, model) 限制整个进程同时进行的大模型调用数，
+  上限取模型配置中的 max_concurrency，未配置时使用 llm_max_concurrency
+- GovernedChatOpenAI: 每次调用（包括流式）都先向 LLMGovernor 申请调用名额的 ChatOpenAI
+- PriorityExecutor: 进程共享的优先级线程池，大纲子章节按层级广度优先在所有任务之间调度
+"""
+import itertools
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+from langchain_openai import ChatOpenAI
+
+from app.config import settings
+from app.metrics import LLM_SLOT_WAIT_SECONDS, LLMCallTimer, registry
+from app.utils.prompt_budget import count_tokens
+
+logger = logging.getLogger(__name__)
+
+
+class LLMGovernor:
+    """
+    按模型限制大模型调用并发
+
+    Args:
+        default_limit: 未单独配置的模型的并发上限
+        limits: {(base_url, model): 并发上限}
+    """
+
+    def __init__(self, default_limit: int, limits: Optional[Dict[Tuple[str, str], int]] = None):
+        self.default_limit = max(1, default_limit)
+        self.limits = dict(limits or {})
+        self._lock = threading.Lock()
+        self._semaphores: Dict[Tuple[str, str], threading.BoundedSemaphore] = {}
+        self._in_flight: Dict[Tuple[str, str], int] = {}
+        self._local = threading.local()
+
+    def _semaphore(self, key: Tuple[str, str]) -> threading.BoundedSemaphore:
+        with self._lock:
+            semaphore = self._semaphores.get(key)
+            if semaphore is None:
+                semaphore = threading.BoundedSemaphore(max(1, self.limits.get(key, self.default_limit)))
+                self._semaphores[key] = semaphore
+                self._in_flight[key] = 0
+            return semaphore
+
+    @contextmanager
+    def slot(self, base_url: str, model: str) -> Iterator[None]:
+        """申请一个调用名额，同一线程内嵌套申请同一模型时不重复占用"""
+        key = (base_url or "", model or "")
+        held = getattr(self._local, "held", None)
+        if held is None:
+            held = self._local.held = set()
+        if key in held:
+            yield
+            return
+
+        semaphore = self._semaphore(key)
+        start = time.time()
+        semaphore.acquire()
+        waited = time.time() - start
+        LLM_SLOT_WAIT_SECONDS.observe(waited, model=model or "")
+        if waited > 1:
+            logger.info(f"等待大模型调用名额 [model={model}, base_url={base_url}, 等待={waited:.2f}s]")
+        held.add(key)
+        with self._lock:
+            self._in_flight[key] += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._in_flight[key] -= 1
+            held.discard(key)
+            semaphore.release()
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """各模型的并发上限和进行中的调用数"""
+        with self._lock:
+            return {
+                f"{model}@{base_url}": {
+                    "limit": self.limits.get((base_url, model), self.default_limit),
+                    "in_flight": self._in_flight.get((base_url, model), 0),
+                }
+                for base_url, model in self._semaphores
+            }
+
+
+def _build_llm_governor() -> LLMGovernor:
+    limits = {
+        (model.get("base_url", ""), model.get("model", "")): int(model["max_concurrency"])
+        for model in settings.LLM_MODELS
+        if model.get("max_concurrency")
+    }
+    return LLMGovernor(settings.LLM_MAX_CONCURRENCY, limits)
+
+
+llm_governor = _build_llm_governor()
+
+
+@registry.register_collector
+def collect_llm_governor():
+    stats = llm_governor.stats()
+    return [
+        ("llm_in_flight", "gauge", "进行中的大模型调用数", [({"model": key}, value["in_flight"]) for key, value in stats.items()]),
+        ("llm_concurrency_limit", "gauge", "大模型调用并发上限", [({"model": key}, value["limit"]) for key, value in stats.items()]),
+    ]
+
+
+def _messages_tokens(messages: Any, model: str) -> int:
+    """流式调用没有返回用量，按消息内容估算 prompt token 数"""
+    try:
+        return sum(count_tokens(message.content if isinstance(message.content, str) else str(message.content), model) for message in messages)
+    except Exception:
+        return 0
+
+
+class GovernedChatOpenAI(ChatOpenAI):
+    """调用前向 llm_governor 申请名额的 ChatOpenAI，并记录调用耗时和 token 数"""
+
+    def _generate(self, *args: Any, **kwargs: Any):
+        with llm_governor.slot(self.openai_api_base, self.model_name):
+            timer = LLMCallTimer(self.model_name)
+            try:
+                result = super()._generate(*args, **kwargs)
+            except Exception:
+                timer.finish(status="error")
+                raise
+            usage = (result.llm_output or {}).get("token_usage") or {}
+            timer.finish(usage.get("prompt_tokens"), usage.get("completion_tokens"))
+            return result
+
+    def _stream(self, messages: Any, *args: Any, **kwargs: Any):
+        with llm_governor.slot(self.openai_api_base, self.model_name):
+            timer = LLMCallTimer(self.model_name)
+            chunks = 0
+            status = "error"
+            try:
+                for chunk in super()._stream(messages, *args, **kwargs):
+                    if chunk.text:
+                        timer.first_token()
+                        chunks += 1
+                    yield chunk
+                status = "ok"
+            except GeneratorExit:
+                status = "cancelled"
+                raise
+            finally:
+                timer.finish(_messages_tokens(messages, self.model_name), chunks, status)
+
+
+class PriorityExecutor:
+    """
+    优先级线程池，priority 越小越先执行，相同优先级按提交顺序执行
+
+    Args:
+        max_workers: 工作线程数
+        name: 线程名前缀
+    """
+
+    def __init__(self, max_workers: int, name: str):
+        self.max_workers = max(1, max_workers)
+        self.name = name
+        self._queue: "queue.PriorityQueue" = queue.PriorityQueue()
+        self._counter = itertools.count()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def submit(self, priority: int, fn: Callable, *args: Any, **kwargs: Any) -> Future:
+        future: Future = Future()
+        self._queue.put((priority, next(self._counter), future, fn, args, kwargs))
+        self._ensure_workers()
+        return future
+
+    def _ensure_workers(self):
+        with self._lock:
+            if len(self._threads) >= self.max_workers:
+                return
+            thread = threading.Thread(target=self._run, name=f"{self.name}-{len(self._threads)}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _run(self):
+        while True:
+            _, _, future, fn, args, kwargs = self._queue.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+
+
+outline_expansion_executor = PriorityExecutor(settings.WRITING_OUTLINE_EXPANSION_WORKERS, "outline-expansion")
@@ -0,0 +1,81 @@
+"""
+大纲详情缓存
+
+缓存 CompiledOutline，命中时 GET /outlines/{id} 只需一次大纲查询和一次段落版本查询。
+版本由大纲的 updated_at 以及段落数量、段落最大 updated_at 组成，其他进程修改段落后版本变化即失效；
+本进程内的大纲写入（保存、更新大纲）会主动失效，不受 updated_at 秒级精度的影响。
+"""
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.outline import Outline, SubParagraph
+from app.utils.outline import CompiledOutline
+
+logger = logging.getLogger(__name__)
+
+
+class OutlineTreeCache:
+    """
+    按大纲ID缓存编译后的大纲（LRU）
+
+    Args:
+        max_size: 最多缓存的大纲数，为 0 时不缓存
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, Tuple[Tuple[Any, ...], CompiledOutline]]" = OrderedDict()
+
+    def get(self, db: Session, outline: Outline) -> CompiledOutline:
+        """获取大纲的编译结果，版本变化或未缓存时重新编译"""
+        count, last_updated = db.execute(
+            select(func.count(SubParagraph.id), func.max(SubParagraph.updated_at)).where(
+                SubParagraph.outline_id == outline.id
+            )
+        ).one()
+        version = (outline.title, outline.updated_at, count, last_updated)
+
+        with self._lock:
+            entry = self._entries.get(outline.id)
+            if entry and entry[0] == version:
+                self._entries.move_to_end(outline.id)
+                return entry[1]
+
+        paragraphs = db.execute(
+            select(
+                SubParagraph.id,
+                SubParagraph.parent_id,
+                SubParagraph.level,
+                SubParagraph.title,
+                SubParagraph.description,
+                SubParagraph.count_style,
+                SubParagraph.reference_status,
+                SubParagraph.sort_index,
+                SubParagraph.path
+            ).where(SubParagraph.outline_id == outline.id).order_by(SubParagraph.path)
+        ).all()
+        compiled = CompiledOutline(outline.id, outline.title, paragraphs)
+
+        if self.max_size > 0:
+            with self._lock:
+                self._entries[outline.id] = (version, compiled)
+                self._entries.move_to_end(outline.id)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+        return compiled
+
+    def invalidate(self, outline_id: Optional[Any]) -> None:
+        if outline_id is None:
+            return
+        with self._lock:
+            self._entries.pop(int(outline_id), None)
+
+
+outline_tree_cache = OutlineTreeCache(settings.WRITING_OUTLINE_CACHE_SIZE)
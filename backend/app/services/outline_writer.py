@@ -0,0 +1,212 @@
+"""
+大纲段落树的批量写入
+
+逐个 add + flush 段落来获取自增ID，大纲有多少个段落就有多少次数据库往返。这里按层级批量写入：
+每一层的新段落用一条 executemany 插入，再用一次查询取回这些段落的ID（数据库支持
+INSERT ... RETURNING 时直接返回），下一层的父ID由此得到，保存大纲的语句数只与层级数有关。
+
+引用按差异写入：未变化的引用不动，变化的引用原地更新，新增和删除的引用各用一条批量语句。
+"""
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import shortuuid
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session, selectinload
+
+from app.models.outline import CountStyle, Reference, ReferenceStatus, ReferenceType, SubParagraph, WebLink
+from app.utils.outline import paragraph_path
+
+logger = logging.getLogger(__name__)
+
+_WEB_LINK_FIELDS = ("url", "title", "summary", "icon_url", "content_count", "content")
+
+
+def normalize_count_style(value: Optional[str]) -> CountStyle:
+    """转换为篇幅风格枚举，无效值使用 medium"""
+    try:
+        return CountStyle((value or "medium").lower())
+    except ValueError:
+        return CountStyle.MEDIUM
+
+
+def paragraph_row(
+    outline_id: int,
+    parent_id: Optional[int],
+    level: int,
+    sort_index: int,
+    title: str,
+    description: Optional[str],
+    count_style: Optional[str] = None,
+    reference_status: int = 0,
+    parent_path: Optional[str] = None
+) -> Dict[str, Any]:
+    """构建一条待插入的段落记录，只有1级段落设置 count_style"""
+    return {
+        "outline_id": outline_id,
+        "parent_id": parent_id,
+        "level": level,
+        "sort_index": sort_index,
+        "path": paragraph_path(parent_path, sort_index),
+        "title": title,
+        "description": description,
+        "count_style": normalize_count_style(count_style) if level == 1 else None,
+        "reference_status": ReferenceStatus(reference_status),
+    }
+
+
+def insert_paragraph_level(db: Session, rows: List[Dict[str, Any]], known_ids: Set[int]) -> List[int]:
+    """
+    批量插入同一批段落（通常为同一层级），返回与 rows 顺序一致的段落ID
+
+    同一父段落下的 sort_index 必须互不相同。数据库不支持 executemany RETURNING 时（MySQL），
+    插入后按 (parent_id, sort_index) 查回本层新插入的段落ID，known_ids 为插入前该大纲已有的段落ID。
+    插入得到的ID会加入 known_ids。
+    """
+    if not rows:
+        return []
+    table = SubParagraph.__table__
+    dialect = db.get_bind().dialect
+
+    if getattr(dialect, "insert_executemany_returning_sort_by_parameter_order", False):
+        result = db.execute(insert(table).returning(table.c.id, sort_by_parameter_order=True), rows)
+        ids = [row.id for row in result]
+    else:
+        db.execute(insert(table), rows)
+        inserted = {}
+        for row in db.execute(
+            select(table.c.id, table.c.parent_id, table.c.sort_index).where(
+                table.c.outline_id == rows[0]["outline_id"],
+                table.c.level.in_({row["level"] for row in rows})
+            )
+        ):
+            if row.id not in known_ids:
+                inserted[(row.parent_id, row.sort_index)] = row.id
+        ids = [inserted[(row["parent_id"], row["sort_index"])] for row in rows]
+
+    known_ids.update(ids)
+    return ids
+
+
+def insert_paragraph_tree(db: Session, outline_id: int, paragraphs: Sequence[Dict[str, Any]]) -> List[Tuple[Dict[str, Any], int]]:
+    """
+    按层级批量插入大纲生成的段落树（dict 格式，子段落在 children 中）
+
+    Returns:
+        List: 按层级顺序的 (段落数据, 段落ID)
+    """
+    known_ids = set(db.execute(
+        select(SubParagraph.id).where(SubParagraph.outline_id == outline_id)
+    ).scalars())
+    saved = []
+    level = 1
+    current = [(None, None, para) for para in paragraphs]
+    while current:
+        rows = []
+        sort_indexes: Dict[Optional[int], int] = {}
+        for parent_id, parent_path, para in current:
+            sort_index = sort_indexes.get(parent_id, 0)
+            sort_indexes[parent_id] = sort_index + 1
+            rows.append(paragraph_row(
+                outline_id, parent_id, level, sort_index,
+                para.get("title", ""), para.get("description", ""), para.get("count_style"),
+                parent_path=parent_path
+            ))
+        ids = insert_paragraph_level(db, rows, known_ids)
+        logger.info(f"批量保存段落 [outline_id={outline_id}, level={level}, count={len(ids)}]")
+
+        next_level = []
+        for (_, _, para), row, paragraph_id in zip(current, rows, ids):
+            saved.append((para, paragraph_id))
+            next_level.extend((paragraph_id, row["path"], child) for child in para.get("children") or [])
+        current = next_level
+        level += 1
+    return saved
+
+
+def delete_paragraphs(db: Session, paragraphs: Iterable[SubParagraph]) -> None:
+    """批量删除段落及其引用，子段落先于父段落删除"""
+    by_level: Dict[int, List[int]] = {}
+    for paragraph in paragraphs:
+        by_level.setdefault(paragraph.level, []).append(paragraph.id)
+    if not by_level:
+        return
+    all_ids = [paragraph_id for ids in by_level.values() for paragraph_id in ids]
+    reference_ids = select(Reference.id).where(Reference.sub_paragraph_id.in_(all_ids))
+    db.execute(delete(WebLink).where(WebLink.reference_id.in_(reference_ids)).execution_options(synchronize_session=False))
+    db.execute(delete(Reference).where(Reference.sub_paragraph_id.in_(all_ids)).execution_options(synchronize_session=False))
+    for level in sorted(by_level, reverse=True):
+        db.execute(delete(SubParagraph).where(SubParagraph.id.in_(by_level[level])).execution_options(synchronize_session=False))
+
+
+def sync_references(db: Session, wanted: Dict[int, List[Any]]) -> None:
+    """
+    将1级段落的引用同步为请求中的列表
+
+    Args:
+        wanted: {段落ID: 引用列表}，引用需有 id、type、is_selected、web_link 属性，id 为空时创建新引用；
+            列表为空表示清空该段落的引用
+    """
+    if not wanted:
+        return
+    existing = {
+        ref.id: ref
+        for ref in db.query(Reference).options(selectinload(Reference.web_link)).filter(
+            Reference.sub_paragraph_id.in_(list(wanted))
+        )
+    }
+
+    kept: Set[str] = set()
+    new_references: List[Dict[str, Any]] = []
+    new_web_links: List[Dict[str, Any]] = []
+    stale_web_links: List[int] = []
+    for paragraph_id, references in wanted.items():
+        for ref_data in references:
+            web_link_data = ref_data.web_link if ref_data.type.value == ReferenceType.WEB_LINK.value and ref_data.web_link else None
+            reference = existing.get(ref_data.id) if ref_data.id else None
+            if reference is None:
+                ref_id = ref_data.id or shortuuid.uuid()
+                new_references.append({
+                    "id": ref_id,
+                    "sub_paragraph_id": paragraph_id,
+                    "type": ref_data.type.value,
+                    "is_selected": ref_data.is_selected,
+                })
+                if web_link_data:
+                    new_web_links.append({"reference_id": ref_id, **{f: getattr(web_link_data, f) for f in _WEB_LINK_FIELDS}})
+                continue
+
+            # 已有引用只更新变化的字段，未变化时不产生 UPDATE
+            kept.add(reference.id)
+            if reference.sub_paragraph_id != paragraph_id:
+                reference.sub_paragraph_id = paragraph_id
+            if reference.type != ref_data.type.value:
+                reference.type = ref_data.type.value
+            if reference.is_selected != ref_data.is_selected:
+                reference.is_selected = ref_data.is_selected
+            if web_link_data is None:
+                if reference.web_link is not None:
+                    stale_web_links.append(reference.web_link.id)
+            elif reference.web_link is None:
+                new_web_links.append({"reference_id": reference.id, **{f: getattr(web_link_data, f) for f in _WEB_LINK_FIELDS}})
+            else:
+                for field in _WEB_LINK_FIELDS:
+                    value = getattr(web_link_data, field)
+                    if getattr(reference.web_link, field) != value:
+                        setattr(reference.web_link, field, value)
+
+    removed = [ref_id for ref_id in existing if ref_id not in kept]
+    # 先让 ORM 写出更新，再执行批量语句
+    db.flush()
+    if stale_web_links:
+        db.execute(delete(WebLink).where(WebLink.id.in_(stale_web_links)).execution_options(synchronize_session=False))
+    if removed:
+        db.execute(delete(WebLink).where(WebLink.reference_id.in_(removed)).execution_options(synchronize_session=False))
+        db.execute(delete(Reference).where(Reference.id.in_(removed)).execution_options(synchronize_session=False))
+    if new_references:
+        db.execute(insert(Reference.__table__), new_references)
+    if new_web_links:
+        db.execute(insert(WebLink.__table__), new_web_links)
+    logger.info(
+        f"同步引用 [段落数={len(wanted)}, 保留={len(kept)}, 新增={len(new_references)}, 删除={len(removed)}]"
+    )
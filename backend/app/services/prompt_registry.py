@@ -0,0 +1,110 @@
+"""
+提示词模板注册表
+
+/completions 每次请求都要查询 prompt.{action} 并重新编译 Jinja2 模板。注册表一次性加载所有 prompt.*
+配置，模板在首次使用时用共享的 Environment 编译并缓存，请求路径上不再访问数据库也不再编译。
+
+多实例部署时通过 system_configs 中的版本号（version:prompt）失效：PUT /prompts/{key} 修改模板时
+版本号加一，各实例最多每隔 PROMPT_REGISTRY_CHECK_INTERVAL 秒检查一次版本号，变化后重新加载。
+"""
+import logging
+import threading
+import time
+from typing import Dict, Optional
+
+from jinja2 import Environment, Template
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.system_config import SystemConfig
+
+logger = logging.getLogger(__name__)
+
+PROMPT_KEY_PREFIX = "prompt."
+PROMPT_VERSION_KEY = "version:prompt"
+
+
+class PromptRegistry:
+    """
+    进程内的提示词模板缓存
+
+    Args:
+        check_interval: 检查数据库版本号的最小间隔（秒），为 0 时每次获取都检查
+    """
+
+    def __init__(self, check_interval: float):
+        self.check_interval = check_interval
+        self.env = Environment()
+        self._lock = threading.Lock()
+        self._sources: Optional[Dict[str, str]] = None
+        self._templates: Dict[str, Template] = {}
+        self._version: Optional[str] = None
+        self._checked_at = 0.0
+
+    def get(self, db: Session, key: str) -> Optional[Template]:
+        """获取编译后的模板，模板不存在时返回 None"""
+        self._refresh_if_stale(db)
+        with self._lock:
+            template = self._templates.get(key)
+            if template is not None:
+                return template
+            source = self._sources.get(key) if self._sources is not None else None
+        if source is None:
+            return None
+
+        template = self.env.from_string(source)
+        with self._lock:
+            # 编译期间模板可能已被重新加载，只缓存仍然有效的版本
+            if self._sources is not None and self._sources.get(key) == source:
+                self._templates[key] = template
+        return template
+
+    def _refresh_if_stale(self, db: Session) -> None:
+        now = time.time()
+        with self._lock:
+            if self._sources is not None and now - self._checked_at < self.check_interval:
+                return
+
+        version = self._read_version(db)
+        with self._lock:
+            if self._sources is not None and version == self._version:
+                self._checked_at = now
+                return
+
+        rows = db.query(SystemConfig.key, SystemConfig.value).filter(
+            SystemConfig.key.like(f"{PROMPT_KEY_PREFIX}%")
+        ).all()
+        with self._lock:
+            self._sources = {row.key: row.value for row in rows}
+            self._templates = {}
+            self._version = version
+            self._checked_at = now
+        logger.info(f"加载提示词模板 [数量={len(rows)}, 版本={version}]")
+
+    @staticmethod
+    def _read_version(db: Session) -> str:
+        row = db.query(SystemConfig.value).filter(SystemConfig.key == PROMPT_VERSION_KEY).first()
+        return row.value if row else "0"
+
+    def bump_version(self, db: Session) -> None:
+        """
+        模板修改后调用：在调用方的事务中递增版本号
+
+        需在调用方提交事务之前调用，提交后再调用 invalidate 让本进程立即重新加载。
+        """
+        config = db.query(SystemConfig).filter(
+            SystemConfig.key == PROMPT_VERSION_KEY
+        ).with_for_update().first()
+        if config is None:
+            db.add(SystemConfig(key=PROMPT_VERSION_KEY, value="1", description="提示词模板版本号"))
+        else:
+            config.value = str(int(config.value or 0) + 1)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._sources = None
+            self._templates = {}
+            self._version = None
+
+
+prompt_registry = PromptRegistry(settings.PROMPT_REGISTRY_CHECK_INTERVAL)
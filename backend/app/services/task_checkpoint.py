@@ -0,0 +1,116 @@
+"""
+任务阶段断点
+
+长耗时的全文生成按段落落盘断点，任务中断（进程重启、租约过期重试、手动刷新重跑）后
+从第一个缺失的段落继续，已生成段落的内容和摘要直接复用，不再重复调用大模型。
+
+每个断点记录生成它的输入哈希，输入（标题、描述、字数、用户需求、模型等）发生变化时断点自动失效。
+"""
+import hashlib
+import json
+import logging
+from typing import Any, Dict, Optional
+
+from app.database import sync_session
+from app.models.task import TaskCheckpoint
+
+logger = logging.getLogger(__name__)
+
+
+def compute_input_hash(*parts: Any) -> str:
+    """计算生成输入的哈希"""
+    raw = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def has_task_checkpoints(task_id: str) -> bool:
+    """任务是否存在断点"""
+    db = sync_session()
+    try:
+        return db.query(TaskCheckpoint.id).filter(TaskCheckpoint.task_id == task_id).first() is not None
+    except Exception as e:
+        logger.warning(f"查询任务断点失败 [task_id={task_id}]: {str(e)}")
+        return False
+    finally:
+        db.close()
+
+
+def clear_task_checkpoints(task_id: str) -> None:
+    """删除任务的全部断点"""
+    db = sync_session()
+    try:
+        db.query(TaskCheckpoint).filter(TaskCheckpoint.task_id == task_id).delete(synchronize_session=False)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"删除任务断点失败 [task_id={task_id}]: {str(e)}")
+    finally:
+        db.close()
+
+
+class TaskCheckpointStore:
+    """
+    单个任务的断点存储
+
+    创建时一次性加载该任务的全部断点，之后按键读取；写入使用独立会话立即提交，
+    不受生成流程中数据库会话状态的影响。task_id 为空时不读写任何断点。
+    """
+
+    def __init__(self, task_id: Optional[str]):
+        self.task_id = task_id
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        if task_id:
+            self._load()
+
+    def _load(self):
+        db = sync_session()
+        try:
+            rows = db.query(TaskCheckpoint).filter(TaskCheckpoint.task_id == self.task_id).all()
+            self._entries = {row.checkpoint_key: {"input_hash": row.input_hash, "data": row.data} for row in rows}
+            if self._entries:
+                logger.info(f"加载任务断点 [task_id={self.task_id}, count={len(self._entries)}]")
+        except Exception as e:
+            logger.warning(f"加载任务断点失败 [task_id={self.task_id}]: {str(e)}")
+            self._entries = {}
+        finally:
+            db.close()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str, input_hash: str) -> Optional[Dict[str, Any]]:
+        """读取断点，不存在或输入哈希不一致时返回 None"""
+        entry = self._entries.get(key)
+        if not entry or entry["input_hash"] != input_hash:
+            return None
+        return entry["data"]
+
+    def save(self, key: str, input_hash: str, data: Dict[str, Any]) -> None:
+        """保存断点，失败只记录日志，不影响生成流程"""
+        if not self.task_id:
+            return
+        db = sync_session()
+        try:
+            row = db.query(TaskCheckpoint).filter(
+                TaskCheckpoint.task_id == self.task_id,
+                TaskCheckpoint.checkpoint_key == key
+            ).first()
+            if not row:
+                row = TaskCheckpoint(task_id=self.task_id, checkpoint_key=key)
+                db.add(row)
+            row.input_hash = input_hash
+            row.data = data
+            db.commit()
+            self._entries[key] = {"input_hash": input_hash, "data": data}
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"保存任务断点失败 [task_id={self.task_id}, key={key}]: {str(e)}")
+        finally:
+            db.close()
+
+    def clear(self) -> None:
+        """任务完成后删除断点"""
+        if not self.task_id:
+            return
+        clear_task_checkpoints(self.task_id)
+        self._entries = {}
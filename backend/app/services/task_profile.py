@@ -0,0 +1,221 @@
+"""
+写作任务阶段耗时
+
+任务执行期间按阶段记录嵌套的耗时区间（span），任务结束后把精简的 span 树写入 Task.profile，
+通过 /writing/tasks/{task_id}/profile 查看，排查慢任务时不必再翻日志。
+
+    with task_profile(task_id, "generate_content"):
+        ...
+            with trace_span("rag_query", question=question):
+                ...
+
+    @traced("extract_requirements")
+    def _extract_requirements_with_llm(self, prompt): ...
+
+当前 span 保存在 contextvar 中，不在任务内（未调用 task_profile）时 trace_span 不做任何事。
+提交到线程池的函数不继承提交方的上下文，需要用 bind_trace 包装后再提交。
+"""
+import contextvars
+import functools
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from app.config import settings
+from app.database import sync_session
+from app.models.task import Task
+
+logger = logging.getLogger(__name__)
+
+# 属性值中字符串的最大长度
+MAX_ATTRIBUTE_LENGTH = 100
+# 错误信息的最大长度
+MAX_ERROR_LENGTH = 200
+
+
+def _attribute_value(value: Any) -> Any:
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    text = str(value)
+    return text if len(text) <= MAX_ATTRIBUTE_LENGTH else f"{text[:MAX_ATTRIBUTE_LENGTH]}..."
+
+
+class Span:
+    __slots__ = ("name", "start", "end", "attributes", "children", "error")
+
+    def __init__(self, name: str, attributes: Dict[str, Any]):
+        self.name = name
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self.attributes = {key: _attribute_value(value) for key, value in attributes.items()}
+        self.children: List["Span"] = []
+        self.error: Optional[str] = None
+
+    def to_dict(self, origin: float, now: float) -> Dict[str, Any]:
+        end = self.end if self.end is not None else now
+        data: Dict[str, Any] = {
+            "name": self.name,
+            "start_ms": round((self.start - origin) * 1000, 1),
+            "duration_ms": round((end - self.start) * 1000, 1),
+        }
+        if self.attributes:
+            data["attrs"] = self.attributes
+        if self.error:
+            data["error"] = self.error
+        if self.end is None:
+            data["unfinished"] = True
+        if self.children:
+            data["children"] = [child.to_dict(origin, now) for child in sorted(self.children, key=lambda s: s.start)]
+        return data
+
+
+class TaskProfile:
+    """单个任务的 span 树，超过 max_spans 后新的 span 只计数不记录"""
+
+    def __init__(self, task_id: str, name: str, max_spans: int):
+        self.task_id = task_id
+        self.started_at = datetime.utcnow()
+        self.max_spans = max_spans
+        self.root = Span(name, {"task_id": task_id})
+        self.span_count = 1
+        self.dropped_spans = 0
+        self._lock = threading.Lock()
+
+    def start_span(self, parent: Span, name: str, attributes: Dict[str, Any]) -> Optional[Span]:
+        with self._lock:
+            if self.span_count >= self.max_spans:
+                self.dropped_spans += 1
+                return None
+            self.span_count += 1
+            span = Span(name, attributes)
+            # 线程池中的子阶段可能并发挂到同一个父 span 下
+            parent.children.append(span)
+            return span
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "task_id": self.task_id,
+                "started_at": self.started_at.isoformat(),
+                "span_count": self.span_count,
+                "dropped_spans": self.dropped_spans,
+                "root": self.root.to_dict(self.root.start, time.perf_counter()),
+            }
+
+
+_current: contextvars.ContextVar = contextvars.ContextVar("task_profile_span", default=None)
+
+
+def _finish(span: Span, error: Optional[BaseException]) -> None:
+    span.end = time.perf_counter()
+    if error is not None:
+        span.error = f"{type(error).__name__}: {error}"[:MAX_ERROR_LENGTH]
+
+
+@contextmanager
+def trace_span(name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+    """记录一个阶段，嵌套调用形成 span 树"""
+    current: Optional[Tuple[TaskProfile, Span]] = _current.get()
+    span = current[0].start_span(current[1], name, attributes) if current else None
+    if span is None:
+        yield None
+        return
+    token = _current.set((current[0], span))
+    try:
+        yield span
+    except BaseException as e:
+        _finish(span, e)
+        raise
+    else:
+        _finish(span, None)
+    finally:
+        _current.reset(token)
+
+
+def traced(name: str):
+    """用 trace_span 包裹整个函数，用作装饰器"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with trace_span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def set_span_attributes(**attributes: Any) -> None:
+    """给当前 span 补充属性，如阶段执行中才知道的结果长度"""
+    current = _current.get()
+    if current:
+        current[1].attributes.update({key: _attribute_value(value) for key, value in attributes.items()})
+
+
+def bind_trace(fn: Callable) -> Callable:
+    """让提交到线程池的函数在当前 span 下记录子阶段"""
+    if _current.get() is None:
+        return fn
+    context = contextvars.copy_context()
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        # 同一个 Context 不能被多个线程同时进入，每次调用使用副本
+        return context.copy().run(fn, *args, **kwargs)
+    return wrapper
+
+
+def save_task_profile(profile: TaskProfile) -> None:
+    """使用独立会话写入 Task.profile，失败只记录日志"""
+    db = sync_session()
+    try:
+        db.query(Task).filter(Task.id == profile.task_id).update({Task._profile: json.dumps(profile.to_dict(), ensure_ascii=False)}, synchronize_session=False)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"保存任务耗时记录失败 [task_id={profile.task_id}]: {str(e)}")
+    finally:
+        db.close()
+
+
+@contextmanager
+def task_profile(task_id: Optional[str], name: str) -> Iterator[Optional[TaskProfile]]:
+    """在任务执行函数外层调用，结束（包括失败）时保存 span 树"""
+    if not task_id or settings.WRITING_PROFILE_MAX_SPANS <= 0:
+        yield None
+        return
+    profile = TaskProfile(task_id, name, settings.WRITING_PROFILE_MAX_SPANS)
+    token = _current.set((profile, profile.root))
+    try:
+        yield profile
+    except BaseException as e:
+        _finish(profile.root, e)
+        raise
+    else:
+        _finish(profile.root, None)
+    finally:
+        _current.reset(token)
+        save_task_profile(profile)
+
+
+def summarize_profile(profile: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """按阶段名称汇总次数、总耗时和最大耗时，按总耗时降序"""
+    stats: Dict[str, Dict[str, Any]] = {}
+
+    def visit(node: Dict[str, Any]):
+        item = stats.setdefault(node["name"], {"name": node["name"], "count": 0, "total_ms": 0.0, "max_ms": 0.0, "errors": 0})
+        item["count"] += 1
+        item["total_ms"] += node.get("duration_ms", 0)
+        item["max_ms"] = max(item["max_ms"], node.get("duration_ms", 0))
+        if node.get("error"):
+            item["errors"] += 1
+        for child in node.get("children", []):
+            visit(child)
+
+    if profile.get("root"):
+        visit(profile["root"])
+    for item in stats.values():
+        item["total_ms"] = round(item["total_ms"], 1)
+    return sorted(stats.values(), key=lambda item: item["total_ms"], reverse=True)
@@ -0,0 +1,546 @@
+"""
+持久化任务队列
+
+任务只存在于接收请求的进程内存中时，进程重启或崩溃会导致任务丢失。
+这里提供一个持久化队列抽象，任意数量的工作进程都可以通过租约（lease）领取任务：
+- MySQLTaskQueue: 基于 task_queue_jobs 表，使用 SELECT ... FOR UPDATE SKIP LOCKED 领取
+- RedisTaskQueue: 基于 Redis（或兼容 Redis 协议的本地替代品）的实现，使用 Lua 脚本保证原子性
+
+两者都支持：
+- 租约续期与过期回收（工作进程崩溃后任务会被其他进程重新领取）
+- 断点（checkpoint）保存，重试时从断点恢复
+- 失败重试（指数退避）与死信
+"""
+import json
+import logging
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import func
+
+from app.config import settings
+from app.database import sync_session
+from app.models.task_queue import TaskQueueJob, TaskQueueJobStatus
+from app.services.task_scheduler import TaskQueueFullError
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class QueuedJob:
+    """被领取的任务"""
+    task_id: str
+    queue: str
+    user_id: str
+    priority: int
+    payload: Dict[str, Any] = field(default_factory=dict)
+    checkpoint: Dict[str, Any] = field(default_factory=dict)
+    attempts: int = 0
+    max_attempts: int = 1
+
+
+class BaseTaskQueue(ABC):
+    """持久化任务队列接口，后端须实现全部抽象方法"""
+
+    def __init__(self, max_queue_size: int, per_user_max_queued: int, retry_backoff: float):
+        self.max_queue_size = max_queue_size
+        self.per_user_max_queued = per_user_max_queued
+        self.retry_backoff = retry_backoff
+
+    @abstractmethod
+    def enqueue(self, task_id: str, queue: str, user_id: str, priority: int, payload: Dict[str, Any], max_attempts: int) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def claim(self, queue: str, worker_id: str, lease_seconds: int, per_user_max_running: int) -> Optional[QueuedJob]:
+        """领取一个任务，没有可领取的任务时返回 None"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def extend_lease(self, task_id: str, worker_id: str, lease_seconds: int) -> bool:
+        """续期租约，租约已丢失时返回 False"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def complete(self, task_id: str, worker_id: str) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def fail(self, task_id: str, worker_id: str, error: str) -> TaskQueueJobStatus:
+        """标记执行失败，返回失败后的状态（QUEUED 表示等待重试，DEAD 表示进入死信）"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def reap_expired_leases(self) -> List[QueuedJob]:
+        """回收过期租约，返回因重试次数耗尽而进入死信的任务"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def save_checkpoint(self, task_id: str, checkpoint: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_checkpoint(self, task_id: str) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_queue_position(self, task_id: str) -> Optional[int]:
+        """排队位置（从1开始），不在排队中时返回 None"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def count_queued(self, queue: str, user_id: Optional[str] = None) -> int:
+        raise NotImplementedError
+
+    def check_admission(self, queue: str, user_id: str) -> None:
+        """队列已满时抛出 TaskQueueFullError"""
+        if self.count_queued(queue) >= self.max_queue_size:
+            raise TaskQueueFullError("系统繁忙，任务队列已满，请稍后再试")
+        if self.count_queued(queue, user_id) >= self.per_user_max_queued:
+            raise TaskQueueFullError("您提交的任务过多，请等待已有任务完成后再试")
+
+    def _retry_delay(self, attempts: int) -> float:
+        return self.retry_backoff * (2 ** max(0, attempts - 1))
+
+
+class MySQLTaskQueue(BaseTaskQueue):
+    """基于 MySQL 的任务队列"""
+
+    def _to_job(self, row: TaskQueueJob) -> QueuedJob:
+        return QueuedJob(
+            task_id=row.task_id,
+            queue=row.queue,
+            user_id=row.user_id,
+            priority=row.priority,
+            payload=json.loads(row.payload) if row.payload else {},
+            checkpoint=json.loads(row.checkpoint) if row.checkpoint else {},
+            attempts=row.attempts,
+            max_attempts=row.max_attempts,
+        )
+
+    def enqueue(self, task_id: str, queue: str, user_id: str, priority: int, payload: Dict[str, Any], max_attempts: int) -> None:
+        with sync_session() as db:
+            job = db.query(TaskQueueJob).filter(TaskQueueJob.task_id == task_id).first()
+            if job and job.status in (TaskQueueJobStatus.QUEUED, TaskQueueJobStatus.LEASED):
+                logger.info(f"任务 {task_id} 已在队列中，跳过重复入队")
+                return
+            if not job:
+                job = TaskQueueJob(task_id=task_id)
+                db.add(job)
+            job.queue = queue
+            job.user_id = user_id or ""
+            job.priority = int(priority)
+            job.payload = json.dumps(payload, ensure_ascii=False)
+            job.status = TaskQueueJobStatus.QUEUED
+            job.attempts = 0
+            job.max_attempts = max_attempts
+            job.lease_owner = None
+            job.lease_expires_at = None
+            job.available_at = datetime.utcnow()
+            job.last_error = None
+            db.commit()
+
+    def claim(self, queue: str, worker_id: str, lease_seconds: int, per_user_max_running: int) -> Optional[QueuedJob]:
+        now = datetime.utcnow()
+        with sync_session() as db:
+            # 已达到并发上限的用户（多个进程同时领取时可能短暂超出，属于可接受的近似）
+            busy_users = [
+                row.user_id for row in db.query(TaskQueueJob.user_id).filter(
+                    TaskQueueJob.queue == queue,
+                    TaskQueueJob.status == TaskQueueJobStatus.LEASED
+                ).group_by(TaskQueueJob.user_id).having(func.count() >= per_user_max_running).all()
+            ]
+            query = db.query(TaskQueueJob).filter(
+                TaskQueueJob.queue == queue,
+                TaskQueueJob.status == TaskQueueJobStatus.QUEUED,
+                TaskQueueJob.available_at <= now
+            )
+            if busy_users:
+                query = query.filter(TaskQueueJob.user_id.notin_(busy_users))
+            row = query.order_by(
+                TaskQueueJob.priority, TaskQueueJob.created_at
+            ).with_for_update(skip_locked=True).first()
+            if not row:
+                db.rollback()
+                return None
+
+            row.status = TaskQueueJobStatus.LEASED
+            row.lease_owner = worker_id
+            row.lease_expires_at = now + timedelta(seconds=lease_seconds)
+            row.attempts += 1
+            job = self._to_job(row)
+            db.commit()
+            return job
+
+    def extend_lease(self, task_id: str, worker_id: str, lease_seconds: int) -> bool:
+        with sync_session() as db:
+            updated = db.query(TaskQueueJob).filter(
+                TaskQueueJob.task_id == task_id,
+                TaskQueueJob.status == TaskQueueJobStatus.LEASED,
+                TaskQueueJob.lease_owner == worker_id
+            ).update({
+                "lease_expires_at": datetime.utcnow() + timedelta(seconds=lease_seconds)
+            }, synchronize_session=False)
+            db.commit()
+            return updated > 0
+
+    def complete(self, task_id: str, worker_id: str) -> None:
+        with sync_session() as db:
+            db.query(TaskQueueJob).filter(
+                TaskQueueJob.task_id == task_id,
+                TaskQueueJob.lease_owner == worker_id
+            ).update({
+                "status": TaskQueueJobStatus.SUCCEEDED,
+                "lease_owner": None,
+                "lease_expires_at": None,
+            }, synchronize_session=False)
+            db.commit()
+
+    def fail(self, task_id: str, worker_id: str, error: str) -> TaskQueueJobStatus:
+        with sync_session() as db:
+            row = db.query(TaskQueueJob).filter(
+                TaskQueueJob.task_id == task_id,
+                TaskQueueJob.lease_owner == worker_id
+            ).with_for_update().first()
+            if not row:
+                db.rollback()
+                logger.warning(f"任务 {task_id} 的租约已不属于 {worker_id}，忽略失败回报")
+                return TaskQueueJobStatus.LEASED
+            self._release_failed(row, error)
+            status = row.status
+            db.commit()
+            return status
+
+    def _release_failed(self, row: TaskQueueJob, error: str) -> None:
+        row.last_error = error
+        row.lease_owner = None
+        row.lease_expires_at = None
+        if row.attempts >= row.max_attempts:
+            row.status = TaskQueueJobStatus.DEAD
+        else:
+            row.status = TaskQueueJobStatus.QUEUED
+            row.available_at = datetime.utcnow() + timedelta(seconds=self._retry_delay(row.attempts))
+
+    def reap_expired_leases(self) -> List[QueuedJob]:
+        dead_jobs = []
+        with sync_session() as db:
+            rows = db.query(TaskQueueJob).filter(
+                TaskQueueJob.status == TaskQueueJobStatus.LEASED,
+                TaskQueueJob.lease_expires_at < datetime.utcnow()
+            ).with_for_update(skip_locked=True).all()
+            for row in rows:
+                logger.warning(f"任务 {row.task_id} 的租约已过期 [owner={row.lease_owner}]，重新入队")
+                self._release_failed(row, "工作进程租约过期")
+                if row.status == TaskQueueJobStatus.DEAD:
+                    dead_jobs.append(self._to_job(row))
+            db.commit()
+        return dead_jobs
+
+    def save_checkpoint(self, task_id: str, checkpoint: Dict[str, Any]) -> None:
+        with sync_session() as db:
+            db.query(TaskQueueJob).filter(TaskQueueJob.task_id == task_id).update({
+                "checkpoint": json.dumps(checkpoint, ensure_ascii=False)
+            }, synchronize_session=False)
+            db.commit()
+
+    def get_checkpoint(self, task_id: str) -> Dict[str, Any]:
+        with sync_session() as db:
+            row = db.query(TaskQueueJob.checkpoint).filter(TaskQueueJob.task_id == task_id).first()
+            return json.loads(row.checkpoint) if row and row.checkpoint else {}
+
+    def get_queue_position(self, task_id: str) -> Optional[int]:
+        with sync_session() as db:
+            row = db.query(TaskQueueJob).filter(TaskQueueJob.task_id == task_id).first()
+            if not row or row.status != TaskQueueJobStatus.QUEUED:
+                return None
+            ahead = db.query(func.count()).select_from(TaskQueueJob).filter(
+                TaskQueueJob.queue == row.queue,
+                TaskQueueJob.status == TaskQueueJobStatus.QUEUED,
+                (TaskQueueJob.priority < row.priority) | (
+                    (TaskQueueJob.priority == row.priority) & (TaskQueueJob.created_at < row.created_at)
+                )
+            ).scalar()
+            return ahead + 1
+
+    def count_queued(self, queue: str, user_id: Optional[str] = None) -> int:
+        with sync_session() as db:
+            query = db.query(func.count()).select_from(TaskQueueJob).filter(
+                TaskQueueJob.queue == queue,
+                TaskQueueJob.status == TaskQueueJobStatus.QUEUED
+            )
+            if user_id is not None:
+                query = query.filter(TaskQueueJob.user_id == user_id)
+            return query.scalar()
+
+
+# 领取任务：先把到期的延迟任务移入就绪队列，再按优先级找到第一个未超出单用户并发的任务
+_REDIS_CLAIM_SCRIPT = """
+local prefix = ARGV[1]
+local queue = ARGV[2]
+local now = tonumber(ARGV[3])
+local lease_ms = tonumber(ARGV[4])
+local owner = ARGV[5]
+local per_user = tonumber(ARGV[6])
+local scan_limit = tonumber(ARGV[7])
+local ready = prefix .. ':ready:' .. queue
+local delayed = prefix .. ':delayed:' .. queue
+local running = prefix .. ':running_users:' .. queue
+
+for _, id in ipairs(redis.call('ZRANGEBYSCORE', delayed, '-inf', now)) do
+    redis.call('ZREM', delayed, id)
+    redis.call('ZADD', ready, redis.call('HGET', prefix .. ':job:' .. id, 'order'), id)
+end
+
+for _, id in ipairs(redis.call('ZRANGE', ready, 0, scan_limit - 1)) do
+    local job = prefix .. ':job:' .. id
+    local user = redis.call('HGET', job, 'user_id') or ''
+    if tonumber(redis.call('HGET', running, user) or '0') < per_user then
+        redis.call('ZREM', ready, id)
+        redis.call('HSET', job, 'status', 'leased', 'lease_owner', owner)
+        redis.call('HINCRBY', job, 'attempts', 1)
+        redis.call('ZADD', prefix .. ':leases', now + lease_ms, id)
+        redis.call('HINCRBY', running, user, 1)
+        return id
+    end
+end
+return false
+"""
+
+# 续期租约：确认租约仍属于当前工作进程后再更新过期时间，避免续期已被回收并由其他进程领取的任务
+_REDIS_EXTEND_LEASE_SCRIPT = """
+local prefix = ARGV[1]
+local id = ARGV[2]
+local owner = ARGV[3]
+local expires = tonumber(ARGV[4])
+local job = prefix .. ':job:' .. id
+local leases = prefix .. ':leases'
+if redis.call('HGET', job, 'status') ~= 'leased' or redis.call('HGET', job, 'lease_owner') ~= owner then
+    return 0
+end
+if not redis.call('ZSCORE', leases, id) then
+    return 0
+end
+redis.call('ZADD', leases, expires, id)
+return 1
+"""
+
+# 释放租约：成功则标记完成，失败则按剩余次数重新入队或进入死信
+_REDIS_RELEASE_SCRIPT = """
+local prefix = ARGV[1]
+local id = ARGV[2]
+local owner = ARGV[3]
+local outcome = ARGV[4]
+local now = tonumber(ARGV[5])
+local backoff_ms = tonumber(ARGV[6])
+local err = ARGV[7]
+local job = prefix .. ':job:' .. id
+if redis.call('HGET', job, 'status') ~= 'leased' then
+    return false
+end
+if owner ~= '' and redis.call('HGET', job, 'lease_owner') ~= owner then
+    return false
+end
+local queue = redis.call('HGET', job, 'queue')
+local user = redis.call('HGET', job, 'user_id') or ''
+redis.call('ZREM', prefix .. ':leases', id)
+redis.call('HINCRBY', prefix .. ':running_users:' .. queue, user, -1)
+redis.call('HDEL', job, 'lease_owner')
+if outcome == 'succeeded' then
+    redis.call('HSET', job, 'status', 'succeeded')
+    return 'succeeded'
+end
+redis.call('HSET', job, 'last_error', err)
+local attempts = tonumber(redis.call('HGET', job, 'attempts'))
+if attempts >= tonumber(redis.call('HGET', job, 'max_attempts')) then
+    redis.call('HSET', job, 'status', 'dead')
+    redis.call('RPUSH', prefix .. ':dead:' .. queue, id)
+    return 'dead'
+end
+redis.call('HSET', job, 'status', 'queued')
+redis.call('ZADD', prefix .. ':delayed:' .. queue, now + backoff_ms * math.pow(2, attempts - 1), id)
+return 'queued'
+"""
+
+
+class RedisTaskQueue(BaseTaskQueue):
+    """
+    基于 Redis 的任务队列
+
+    适用于单机或 Redis 兼容的本地服务（Lua 脚本中动态拼接键名，不适用于 Redis Cluster）。
+    """
+
+    # 优先级权重，保证不同优先级的任务不会因创建时间交错
+    _PRIORITY_WEIGHT = 10 ** 13
+
+    def __init__(self, redis_url: str, key_prefix: str, max_queue_size: int, per_user_max_queued: int, retry_backoff: float):
+        super().__init__(max_queue_size, per_user_max_queued, retry_backoff)
+        import redis
+        self.redis = redis.Redis.from_url(redis_url, decode_responses=True)
+        self.prefix = key_prefix
+        self._claim = self.redis.register_script(_REDIS_CLAIM_SCRIPT)
+        self._release = self.redis.register_script(_REDIS_RELEASE_SCRIPT)
+        self._extend_lease = self.redis.register_script(_REDIS_EXTEND_LEASE_SCRIPT)
+
+    def _job_key(self, task_id: str) -> str:
+        return f"{self.prefix}:job:{task_id}"
+
+    @staticmethod
+    def _now_ms() -> int:
+        return int(time.time() * 1000)
+
+    def _to_job(self, task_id: str, data: Dict[str, str]) -> QueuedJob:
+        return QueuedJob(
+            task_id=task_id,
+            queue=data.get("queue", ""),
+            user_id=data.get("user_id", ""),
+            priority=int(data.get("priority", 0)),
+            payload=json.loads(data["payload"]) if data.get("payload") else {},
+            checkpoint=json.loads(data["checkpoint"]) if data.get("checkpoint") else {},
+            attempts=int(data.get("attempts", 0)),
+            max_attempts=int(data.get("max_attempts", 1)),
+        )
+
+    def enqueue(self, task_id: str, queue: str, user_id: str, priority: int, payload: Dict[str, Any], max_attempts: int) -> None:
+        key = self._job_key(task_id)
+        if self.redis.hget(key, "status") in ("queued", "leased"):
+            logger.info(f"任务 {task_id} 已在队列中，跳过重复入队")
+            return
+        order = int(priority) * self._PRIORITY_WEIGHT + self._now_ms()
+        pipe = self.redis.pipeline()
+        pipe.hset(key, mapping={
+            "queue": queue,
+            "user_id": user_id or "",
+            "priority": int(priority),
+            "order": order,
+            "status": "queued",
+            "payload": json.dumps(payload, ensure_ascii=False),
+            "attempts": 0,
+            "max_attempts": max_attempts,
+        })
+        pipe.zadd(f"{self.prefix}:ready:{queue}", {task_id: order})
+        pipe.execute()
+
+    def claim(self, queue: str, worker_id: str, lease_seconds: int, per_user_max_running: int) -> Optional[QueuedJob]:
+        task_id = self._claim(args=[
+            self.prefix, queue, self._now_ms(), lease_seconds * 1000,
+            worker_id, per_user_max_running, 100
+        ])
+        if not task_id:
+            return None
+        return self._to_job(task_id, self.redis.hgetall(self._job_key(task_id)))
+
+    def extend_lease(self, task_id: str, worker_id: str, lease_seconds: int) -> bool:
+        return bool(self._extend_lease(args=[
+            self.prefix, task_id, worker_id, self._now_ms() + lease_seconds * 1000
+        ]))
+
+    def _release_job(self, task_id: str, worker_id: str, outcome: str, error: str = "") -> Optional[str]:
+        return self._release(args=[
+            self.prefix, task_id, worker_id, outcome,
+            self._now_ms(), int(self.retry_backoff * 1000), error
+        ])
+
+    def complete(self, task_id: str, worker_id: str) -> None:
+        self._release_job(task_id, worker_id, "succeeded")
+
+    def fail(self, task_id: str, worker_id: str, error: str) -> TaskQueueJobStatus:
+        status = self._release_job(task_id, worker_id, "failed", error)
+        if not status:
+            logger.warning(f"任务 {task_id} 的租约已不属于 {worker_id}，忽略失败回报")
+            return TaskQueueJobStatus.LEASED
+        return TaskQueueJobStatus(status)
+
+    def reap_expired_leases(self) -> List[QueuedJob]:
+        dead_jobs = []
+        for task_id in self.redis.zrangebyscore(f"{self.prefix}:leases", "-inf", self._now_ms()):
+            logger.warning(f"任务 {task_id} 的租约已过期，重新入队")
+            if self._release_job(task_id, "", "failed", "工作进程租约过期") == "dead":
+                dead_jobs.append(self._to_job(task_id, self.redis.hgetall(self._job_key(task_id))))
+        return dead_jobs
+
+    def save_checkpoint(self, task_id: str, checkpoint: Dict[str, Any]) -> None:
+        self.redis.hset(self._job_key(task_id), "checkpoint", json.dumps(checkpoint, ensure_ascii=False))
+
+    def get_checkpoint(self, task_id: str) -> Dict[str, Any]:
+        data = self.redis.hget(self._job_key(task_id), "checkpoint")
+        return json.loads(data) if data else {}
+
+    def get_queue_position(self, task_id: str) -> Optional[int]:
+        queue = self.redis.hget(self._job_key(task_id), "queue")
+        if not queue:
+            return None
+        rank = self.redis.zrank(f"{self.prefix}:ready:{queue}", task_id)
+        if rank is not None:
+            return rank + 1
+        # 等待重试的任务排在就绪任务之后
+        delayed_rank = self.redis.zrank(f"{self.prefix}:delayed:{queue}", task_id)
+        if delayed_rank is not None:
+            return self.redis.zcard(f"{self.prefix}:ready:{queue}") + delayed_rank + 1
+        return None
+
+    def count_queued(self, queue: str, user_id: Optional[str] = None) -> int:
+        task_ids = self.redis.zrange(f"{self.prefix}:ready:{queue}", 0, -1) + \
+            self.redis.zrange(f"{self.prefix}:delayed:{queue}", 0, -1)
+        if user_id is None:
+            return len(task_ids)
+        pipe = self.redis.pipeline()
+        for task_id in task_ids:
+            pipe.hget(self._job_key(task_id), "user_id")
+        return sum(1 for owner in pipe.execute() if owner == user_id)
+
+
+_task_queue: Optional[BaseTaskQueue] = None
+
+
+def get_task_queue() -> Optional[BaseTaskQueue]:
+    """
+    根据配置获取持久化任务队列，backend 为 local 时返回 None（使用进程内调度器）
+    """
+    global _task_queue
+    if _task_queue is not None:
+        return _task_queue
+
+    backend = settings.TASK_QUEUE_BACKEND
+    if backend == "mysql":
+        _task_queue = MySQLTaskQueue(
+            max_queue_size=settings.WRITING_TASK_MAX_QUEUE_SIZE,
+            per_user_max_queued=settings.WRITING_TASK_PER_USER_MAX_QUEUED,
+            retry_backoff=settings.TASK_QUEUE_RETRY_BACKOFF,
+        )
+    elif backend == "redis":
+        _task_queue = RedisTaskQueue(
+            redis_url=settings.TASK_QUEUE_REDIS_URL,
+            key_prefix=settings.TASK_QUEUE_REDIS_PREFIX,
+            max_queue_size=settings.WRITING_TASK_MAX_QUEUE_SIZE,
+            per_user_max_queued=settings.WRITING_TASK_PER_USER_MAX_QUEUED,
+            retry_backoff=settings.TASK_QUEUE_RETRY_BACKOFF,
+        )
+    elif backend != "local":
+        raise ValueError(f"不支持的任务队列类型: {backend}")
+    return _task_queue
+
+
+def save_task_checkpoint(task_id: str, checkpoint: Dict[str, Any]) -> None:
+    """保存任务断点，未启用持久化队列时忽略"""
+    task_queue = get_task_queue()
+    if not task_queue:
+        return
+    try:
+        task_queue.save_checkpoint(task_id, checkpoint)
+    except Exception as e:
+        logger.warning(f"保存任务断点失败 [task_id={task_id}]: {str(e)}")
+
+
+def load_task_checkpoint(task_id: str) -> Dict[str, Any]:
+    """读取任务断点，未启用持久化队列或没有断点时返回空字典"""
+    task_queue = get_task_queue()
+    if not task_queue:
+        return {}
+    try:
+        return task_queue.get_checkpoint(task_id)
+    except Exception as e:
+        logger.warning(f"读取任务断点失败 [task_id={task_id}]: {str(e)}")
+        return {}
@@ -0,0 +1,221 @@
+"""
+写作任务调度器
+
+替代 writing.py 中无界的 ThreadPoolExecutor：
+- 全局并发上限与单用户并发上限
+- 优先级（交互式的大纲生成优先于长耗时的全文生成）
+- 有界队列，队列满时拒绝提交（由调用方返回 429）
+- 查询任务的排队位置
+"""
+import enum
+import itertools
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from app.config import settings
+from app.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+
+class TaskPriority(enum.IntEnum):
+    """任务优先级，数值越小越优先"""
+    INTERACTIVE = 0  # 交互式任务，如大纲生成
+    BATCH = 1        # 长耗时任务，如全文生成
+
+
+class TaskQueueFullError(Exception):
+    """队列已满，拒绝接收新任务"""
+    pass
+
+
+class _Job:
+    __slots__ = ("task_id", "user_id", "priority", "seq", "fn", "kwargs")
+
+    def __init__(self, task_id: str, user_id: str, priority: TaskPriority, seq: int, fn: Callable, kwargs: Dict[str, Any]):
+        self.task_id = task_id
+        self.user_id = user_id
+        self.priority = priority
+        self.seq = seq
+        self.fn = fn
+        self.kwargs = kwargs
+
+    @property
+    def sort_key(self):
+        return (int(self.priority), self.seq)
+
+
+class TaskScheduler:
+    """
+    有界、带优先级的任务调度器
+
+    固定数量的工作线程从等待队列中按 (优先级, 提交顺序) 取任务，
+    跳过已达到单用户并发上限的用户，保证用户间的公平性。
+    """
+
+    def __init__(self, max_workers: int, per_user_max_running: int, max_queue_size: int, per_user_max_queued: int):
+        self.max_workers = max(1, max_workers)
+        self.per_user_max_running = max(1, per_user_max_running)
+        self.max_queue_size = max(0, max_queue_size)
+        self.per_user_max_queued = max(0, per_user_max_queued)
+
+        self._cond = threading.Condition()
+        self._pending: List[_Job] = []
+        self._running: Dict[str, _Job] = {}
+        self._user_running: Dict[str, int] = {}
+        self._user_pending: Dict[str, int] = {}
+        self._seq = itertools.count()
+        self._workers: List[threading.Thread] = []
+        self._shutdown = False
+
+    def _ensure_workers(self):
+        """按需启动工作线程（调用方需持有锁）"""
+        if self._workers:
+            return
+        for i in range(self.max_workers):
+            worker = threading.Thread(target=self._worker_loop, name=f"writing-task-worker-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def check_admission(self, user_id: str) -> None:
+        """
+        检查是否可以接收该用户的新任务，队列已满时抛出 TaskQueueFullError
+        """
+        with self._cond:
+            self._check_admission_locked(user_id)
+
+    def _check_admission_locked(self, user_id: str) -> None:
+        # 只统计超出并发槽位、需要真正排队等待的任务数
+        waiting = len(self._pending) + len(self._running) - self.max_workers
+        if waiting >= self.max_queue_size:
+            raise TaskQueueFullError("系统繁忙，任务队列已满，请稍后再试")
+        user_waiting = self._user_pending.get(user_id, 0) + self._user_running.get(user_id, 0) - self.per_user_max_running
+        if user_waiting >= self.per_user_max_queued:
+            raise TaskQueueFullError("您提交的任务过多，请等待已有任务完成后再试")
+
+    def submit(self, task_id: str, user_id: str, priority: TaskPriority, fn: Callable, kwargs: Optional[Dict[str, Any]] = None, force: bool = False) -> None:
+        """
+        提交任务
+
+        Args:
+            task_id: 任务ID
+            user_id: 用户ID，用于单用户并发控制
+            priority: 任务优先级
+            fn: 任务函数，以 fn(**kwargs) 调用
+            kwargs: 任务函数参数
+            force: 跳过准入检查（用于重启后恢复已接收的任务）
+
+        Raises:
+            TaskQueueFullError: 队列已满
+        """
+        user_id = user_id or ""
+        with self._cond:
+            if self._shutdown:
+                raise RuntimeError("任务调度器已关闭")
+            if task_id in self._running or any(job.task_id == task_id for job in self._pending):
+                logger.info(f"任务 {task_id} 已在调度器中，跳过重复提交")
+                return
+            if not force:
+                self._check_admission_locked(user_id)
+            job = _Job(task_id, user_id, priority, next(self._seq), fn, kwargs or {})
+            self._pending.append(job)
+            self._pending.sort(key=lambda j: j.sort_key)
+            self._user_pending[user_id] = self._user_pending.get(user_id, 0) + 1
+            self._ensure_workers()
+            self._cond.notify()
+
+    def _next_job_locked(self) -> Optional[_Job]:
+        """取出第一个所属用户未达到并发上限的任务"""
+        for index, job in enumerate(self._pending):
+            if self._user_running.get(job.user_id, 0) < self.per_user_max_running:
+                return self._pending.pop(index)
+        return None
+
+    def _worker_loop(self):
+        while True:
+            with self._cond:
+                job = None
+                while not self._shutdown:
+                    job = self._next_job_locked()
+                    if job:
+                        break
+                    self._cond.wait()
+                if job is None:
+                    return
+                self._user_pending[job.user_id] -= 1
+                if not self._user_pending[job.user_id]:
+                    del self._user_pending[job.user_id]
+                self._user_running[job.user_id] = self._user_running.get(job.user_id, 0) + 1
+                self._running[job.task_id] = job
+
+            try:
+                job.fn(**job.kwargs)
+            except Exception as e:
+                logger.exception(f"执行任务 {job.task_id} 时出错: {str(e)}")
+            finally:
+                with self._cond:
+                    self._running.pop(job.task_id, None)
+                    self._user_running[job.user_id] -= 1
+                    if not self._user_running[job.user_id]:
+                        del self._user_running[job.user_id]
+                    # 一个用户的槽位释放后，其他被跳过的任务可能变为可运行
+                    self._cond.notify_all()
+
+    def get_queue_position(self, task_id: str) -> Optional[int]:
+        """
+        获取任务的排队位置（从1开始），任务正在运行或不在调度器中时返回 None
+        """
+        with self._cond:
+            for index, job in enumerate(self._pending):
+                if job.task_id == task_id:
+                    return index + 1
+        return None
+
+    def is_active(self, task_id: str) -> bool:
+        """任务是否正在排队或运行"""
+        with self._cond:
+            return task_id in self._running or any(job.task_id == task_id for job in self._pending)
+
+    def active_task_ids(self) -> List[str]:
+        """正在排队或运行的任务ID列表"""
+        with self._cond:
+            return list(self._running.keys()) + [job.task_id for job in self._pending]
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return {
+                "running": len(self._running),
+                "queued": len(self._pending),
+                "max_workers": self.max_workers,
+                "max_queue_size": self.max_queue_size,
+            }
+
+    def shutdown(self, wait: bool = False):
+        with self._cond:
+            self._shutdown = True
+            self._cond.notify_all()
+        if wait:
+            for worker in self._workers:
+                worker.join()
+
+
+# 写作任务调度器单例
+writing_task_scheduler = TaskScheduler(
+    max_workers=settings.WRITING_TASK_MAX_WORKERS,
+    per_user_max_running=settings.WRITING_TASK_PER_USER_MAX_RUNNING,
+    max_queue_size=settings.WRITING_TASK_MAX_QUEUE_SIZE,
+    per_user_max_queued=settings.WRITING_TASK_PER_USER_MAX_QUEUED,
+)
+
+
+@registry.register_collector
+def collect_writing_scheduler():
+    stats = writing_task_scheduler.stats()
+    return [
+        ("writing_executor_jobs", "gauge", "进程内写作任务执行器的任务数", [
+            ({"state": "running"}, stats["running"]),
+            ({"state": "queued"}, stats["queued"]),
+        ]),
+        ("writing_executor_max_workers", "gauge", "进程内写作任务执行器的并发上限", [({}, stats["max_workers"])]),
+    ]
@@ -0,0 +1,154 @@
+"""
+持久化任务队列的工作进程
+
+每个工作线程循环执行：回收过期租约 -> 领取任务 -> 执行（后台续期租约）-> 回报结果。
+可以嵌入 API 进程运行，也可以通过 `python -m app.worker` 独立部署多个进程横向扩展。
+"""
+import logging
+import socket
+import threading
+import os
+import time
+from typing import Callable, List, Optional
+
+import shortuuid
+
+from app.metrics import registry
+from app.models.task_queue import TaskQueueJobStatus
+from app.services.task_queue import BaseTaskQueue, QueuedJob
+
+logger = logging.getLogger(__name__)
+
+TASK_QUEUE_ACTIVE_JOBS = registry.gauge("task_queue_active_jobs", "工作进程正在执行的队列任务数", ("queue",))
+TASK_QUEUE_JOB_SECONDS = registry.histogram(
+    "task_queue_job_seconds", "队列任务执行耗时（秒）", ("queue", "status"),
+    buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1200, 1800, 3600),
+)
+
+
+class TaskQueueWorker:
+    """
+    从持久化队列领取并执行任务
+
+    Args:
+        task_queue: 任务队列
+        queue: 队列名称
+        handler: 任务处理函数，抛出异常表示失败
+        dead_letter_handler: 任务进入死信后的回调
+        concurrency: 工作线程数
+        lease_seconds: 租约时长，执行期间每 1/3 租约时长续期一次
+        poll_interval: 队列为空时的轮询间隔（秒）
+        per_user_max_running: 单用户同时执行的任务上限
+    """
+
+    def __init__(
+        self,
+        task_queue: BaseTaskQueue,
+        queue: str,
+        handler: Callable[[QueuedJob], None],
+        dead_letter_handler: Optional[Callable[[QueuedJob, str], None]] = None,
+        concurrency: int = 1,
+        lease_seconds: int = 120,
+        poll_interval: float = 2.0,
+        per_user_max_running: int = 1,
+    ):
+        self.task_queue = task_queue
+        self.queue = queue
+        self.handler = handler
+        self.dead_letter_handler = dead_letter_handler
+        self.concurrency = max(1, concurrency)
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.per_user_max_running = per_user_max_running
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}-{shortuuid.uuid()[:8]}"
+        self._stop_event = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self):
+        for i in range(self.concurrency):
+            thread = threading.Thread(target=self._run_loop, name=f"task-queue-worker-{self.queue}-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"任务队列工作进程已启动 [worker_id={self.worker_id}, queue={self.queue}, concurrency={self.concurrency}]")
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stop_event.set()
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+
+    def wait(self):
+        """阻塞直到工作线程退出，用于独立进程"""
+        for thread in self._threads:
+            while thread.is_alive():
+                thread.join(timeout=1)
+
+    def _run_loop(self):
+        while not self._stop_event.is_set():
+            try:
+                self._reap_expired_leases()
+                job = self.task_queue.claim(self.queue, self.worker_id, self.lease_seconds, self.per_user_max_running)
+            except Exception as e:
+                logger.error(f"领取任务失败 [queue={self.queue}]: {str(e)}")
+                job = None
+            if not job:
+                self._stop_event.wait(self.poll_interval)
+                continue
+            self._execute(job)
+
+    def _reap_expired_leases(self):
+        for job in self.task_queue.reap_expired_leases():
+            self._on_dead_letter(job, "工作进程租约过期，重试次数已耗尽")
+
+    def _execute(self, job: QueuedJob):
+        logger.info(f"开始执行队列任务 [task_id={job.task_id}, attempt={job.attempts}/{job.max_attempts}, worker_id={self.worker_id}]")
+        finished = threading.Event()
+
+        def keep_lease():
+            # 执行期间定期续期租约，租约丢失后任务可能被其他进程重新领取
+            while not finished.wait(max(1, self.lease_seconds / 3)):
+                try:
+                    if not self.task_queue.extend_lease(job.task_id, self.worker_id, self.lease_seconds):
+                        logger.warning(f"任务租约已丢失 [task_id={job.task_id}, worker_id={self.worker_id}]")
+                        return
+                except Exception as e:
+                    logger.error(f"续期任务租约失败 [task_id={job.task_id}]: {str(e)}")
+
+        lease_thread = threading.Thread(target=keep_lease, daemon=True)
+        lease_thread.start()
+        TASK_QUEUE_ACTIVE_JOBS.inc(queue=self.queue)
+        start = time.monotonic()
+        outcome = "ok"
+        try:
+            self.handler(job)
+        except Exception as e:
+            finished.set()
+            outcome = "error"
+            logger.exception(f"队列任务执行失败 [task_id={job.task_id}]: {str(e)}")
+            try:
+                status = self.task_queue.fail(job.task_id, self.worker_id, str(e))
+            except Exception as report_error:
+                logger.error(f"回报任务失败状态出错 [task_id={job.task_id}]: {str(report_error)}")
+                return
+            if status == TaskQueueJobStatus.DEAD:
+                self._on_dead_letter(job, str(e))
+            elif status == TaskQueueJobStatus.QUEUED:
+                logger.info(f"队列任务将重试 [task_id={job.task_id}, attempt={job.attempts}/{job.max_attempts}]")
+        else:
+            finished.set()
+            try:
+                self.task_queue.complete(job.task_id, self.worker_id)
+            except Exception as e:
+                logger.error(f"回报任务完成状态出错 [task_id={job.task_id}]: {str(e)}")
+            logger.info(f"队列任务执行完成 [task_id={job.task_id}]")
+        finally:
+            TASK_QUEUE_ACTIVE_JOBS.dec(queue=self.queue)
+            TASK_QUEUE_JOB_SECONDS.observe(time.monotonic() - start, queue=self.queue, status=outcome)
+            lease_thread.join(timeout=1)
+
+    def _on_dead_letter(self, job: QueuedJob, error: str):
+        logger.error(f"任务进入死信 [task_id={job.task_id}]: {error}")
+        if self.dead_letter_handler:
+            try:
+                self.dead_letter_handler(job, error)
+            except Exception as e:
+                logger.error(f"处理死信任务出错 [task_id={job.task_id}]: {str(e)}")
@@ -0,0 +1,98 @@
+"""
+生成段落的近似重复检测
+
+对段落的字符 n-gram 计算 MinHash 签名，签名保存在 NumPy 数组中并随段落生成增量追加。
+两个签名中相同位置取值相等的比例即为 n-gram 集合 Jaccard 相似度的估计，
+查询“最相似的已生成段落”只需一次向量化比较，不再逐句两两比较。
+
+按字符切分 n-gram，对中文文本同样有效。
+"""
+import re
+import zlib
+from typing import Hashable, List, Optional, Tuple
+
+import numpy as np
+
+# 梅森素数 2^31-1，a*h+b 在 uint64 范围内不会溢出（a < 2^31，h < 2^32）
+_MERSENNE_PRIME = np.uint64((1 << 31) - 1)
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+class MinHashIndex:
+    """
+    段落 MinHash 索引
+
+    Args:
+        num_perm: 签名长度（哈希函数个数），越大估计越准
+        ngram: 字符 n-gram 长度
+        min_length: 短于该长度的文本不参与比较
+        seed: 哈希函数随机种子，固定后签名可复现
+    """
+
+    def __init__(self, num_perm: int = 128, ngram: int = 3, min_length: int = 50, seed: int = 1):
+        self.num_perm = num_perm
+        self.ngram = ngram
+        self.min_length = min_length
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, int(_MERSENNE_PRIME), size=num_perm).astype(np.uint64)
+        self._b = rng.randint(0, int(_MERSENNE_PRIME), size=num_perm).astype(np.uint64)
+        self._signatures = np.empty((16, num_perm), dtype=np.uint32)
+        self._keys: List[Hashable] = []
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        """计算文本的 MinHash 签名，文本过短时返回 None"""
+        text = _WHITESPACE_PATTERN.sub("", text or "").lower()
+        if len(text) < self.min_length:
+            return None
+        shingles = {text[i:i + self.ngram] for i in range(len(text) - self.ngram + 1)}
+        hashes = np.fromiter(
+            (zlib.crc32(shingle.encode("utf-8")) for shingle in shingles),
+            dtype=np.uint64,
+            count=len(shingles)
+        )
+        permuted = (hashes[:, None] * self._a + self._b) % _MERSENNE_PRIME
+        return permuted.min(axis=0).astype(np.uint32)
+
+    def add(self, key: Hashable, text: str = "", signature: Optional[np.ndarray] = None) -> bool:
+        """追加段落，文本过短时不加入索引并返回 False"""
+        if signature is None:
+            signature = self.signature(text)
+        if signature is None:
+            return False
+        if len(self._keys) == len(self._signatures):
+            # 容量不足时成倍扩容，摊还追加成本
+            grown = np.empty((len(self._signatures) * 2, self.num_perm), dtype=np.uint32)
+            grown[:len(self._keys)] = self._signatures[:len(self._keys)]
+            self._signatures = grown
+        self._signatures[len(self._keys)] = signature
+        self._keys.append(key)
+        return True
+
+    def most_similar(
+        self,
+        text: str = "",
+        signature: Optional[np.ndarray] = None,
+        exclude: Optional[Hashable] = None
+    ) -> Tuple[Optional[Hashable], float]:
+        """
+        查询最相似的已加入段落
+
+        Returns:
+            Tuple: (段落键, 估计的 Jaccard 相似度)，索引为空或文本过短时返回 (None, 0.0)
+        """
+        if signature is None:
+            signature = self.signature(text)
+        if signature is None or not self._keys:
+            return None, 0.0
+        scores = (self._signatures[:len(self._keys)] == signature).mean(axis=1)
+        if exclude is not None:
+            for i, key in enumerate(self._keys):
+                if key == exclude:
+                    scores[i] = -1.0
+        best = int(np.argmax(scores))
+        if scores[best] < 0:
+            return None, 0.0
+        return self._keys[best], float(scores[best])
@@ -1,5 +1,56 @@
 """大纲相关的工具函数"""
 
+# 物化路径中每一级同级序号的宽度，定宽保证按字符串排序即为文档顺序
+PATH_SEGMENT_WIDTH = 4
+
+
+def paragraph_path(parent_path, sort_index):
+    """根据父段落路径和同级序号（从0开始）生成段落的物化路径"""
+    segment = f"{sort_index:0{PATH_SEGMENT_WIDTH}d}"
+    return f"{parent_path}.{segment}" if parent_path else segment
+
+
+def path_sort_key(paragraph):
+    """按物化路径排序的键，缺少路径的段落排在最后并按 sort_index、ID 排序"""
+    return (paragraph.path is None, paragraph.path or "", paragraph.sort_index if paragraph.sort_index is not None else paragraph.id, paragraph.id)
+
+
+def ensure_document_order(paragraphs):
+    """
+    确保段落按文档顺序排列（原地排序并返回）
+
+    段落一般已通过 ORDER BY path 查询得到，只有存在缺少物化路径的段落时才重新排序。
+    """
+    if any(paragraph.path is None for paragraph in paragraphs):
+        paragraphs.sort(key=path_sort_key)
+    return paragraphs
+
+
+def attach_children(paragraphs):
+    """
+    按文档顺序（物化路径排序）线性构建段落树
+
+    父段落总在子段落之前出现，顺序遍历即可把每个段落挂到父段落下。ORM 段落通过
+    set_committed_value 填充 children 关系，不会触发逐个段落的懒加载，也不会产生更新。
+
+    Args:
+        paragraphs: 按物化路径排序的同一大纲的段落
+
+    Returns:
+        List: 按顺序排列的顶级段落
+    """
+    from sqlalchemy.orm.attributes import set_committed_value
+
+    children_of = {paragraph.id: [] for paragraph in paragraphs}
+    roots = []
+    for paragraph in paragraphs:
+        siblings = children_of.get(paragraph.parent_id)
+        (siblings if siblings is not None else roots).append(paragraph)
+    for paragraph in paragraphs:
+        set_committed_value(paragraph, "children", children_of[paragraph.id])
+    return roots
+
+
 def build_paragraph_key(paragraph, siblings_dict, parent_dict):
     """递归构建段落的层级key
     
@@ -115,4 +166,79 @@ def build_paragraph_response(paragraph, siblings_dict=None, paragraphs_dict=None
         if references_dict and paragraph.id in references_dict:
             data["references"] = references_dict[paragraph.id]
     
-    return data 
\ No newline at end of file
+    return data 
+
+class CompiledOutline:
+    """
+    大纲的预编译表示
+
+    一次线性遍历得到 GET /outlines/{id} 所需的段落树（含层级key）和 Markdown 内容。
+    段落应按物化路径排序传入；存在缺少路径的段落时，同级段落按 sort_index 排序（没有时按ID）。
+
+    Args:
+        outline_id: 大纲ID
+        title: 大纲标题
+        paragraphs: 段落行，需包含 id、parent_id、level、title、description、count_style、
+            reference_status、sort_index、path 属性
+    """
+
+    def __init__(self, outline_id, title, paragraphs):
+        self.id = outline_id
+        self.title = title
+        self.paragraph_count = len(paragraphs)
+
+        # 段落按物化路径有序时同级顺序已经正确，只有缺少路径时才需要排序
+        ordered = all(paragraph.path is not None for paragraph in paragraphs)
+        children_of = {}
+        for paragraph in paragraphs:
+            children_of.setdefault(paragraph.parent_id, []).append(paragraph)
+        if not ordered:
+            for siblings in children_of.values():
+                siblings.sort(key=lambda p: p.sort_index if p.sort_index is not None else p.id)
+
+        self.sub_paragraphs = []
+        markdown = [f"# {title}\n\n"]
+        # 显式栈深度优先遍历，子段落的key由父段落key和同级序号直接得到
+        stack = [(p, str(i + 1), self.sub_paragraphs) for i, p in reversed(list(enumerate(children_of.get(None, []))))]
+        while stack:
+            paragraph, key, container = stack.pop()
+            data = {
+                "id": str(paragraph.id),
+                "title": paragraph.title,
+                "description": paragraph.description,
+                "level": paragraph.level,
+                "key": key,
+                "reference_status": _enum_value(paragraph.reference_status),
+            }
+            if paragraph.level == 1:
+                if paragraph.count_style:
+                    data["count_style"] = _enum_value(paragraph.count_style)
+                data["references"] = []
+            container.append(data)
+
+            # Markdown 标题级别为段落层级加一（大纲标题为一级标题）
+            markdown.append(f"{'#' * (key.count('-') + 2)} {paragraph.title}\n\n")
+            if paragraph.description:
+                markdown.append(f"{paragraph.description}\n\n")
+
+            children = children_of.get(paragraph.id)
+            if children:
+                data["children"] = []
+                stack.extend(
+                    (child, f"{key}-{i + 1}", data["children"])
+                    for i, child in reversed(list(enumerate(children)))
+                )
+        self.markdown_content = "".join(markdown)
+
+    def to_response(self):
+        """构建 GET /outlines/{id} 的响应数据（段落树与缓存共享，调用方不应修改）"""
+        return {
+            "id": self.id,
+            "title": self.title,
+            "markdown_content": self.markdown_content,
+            "sub_paragraphs": self.sub_paragraphs,
+        }
+
+
+def _enum_value(value):
+    return value.value if hasattr(value, "value") else value
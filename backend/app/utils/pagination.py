@@ -0,0 +1,129 @@
+"""
+游标分页
+
+按排序列上最后一条记录的值定位下一页（WHERE (a, b) < (x, y) ORDER BY a DESC, b DESC LIMIT n），
+配合排序列上的索引，翻到多深都只读取 page_size + 1 行，不再随 OFFSET 变慢。
+游标对客户端不透明，内容为排序列取值的 JSON 经 base64url 编码。
+
+游标模式下的总数只用于展示，按查询条件缓存一段时间（近似值），避免每页都执行 COUNT(*)。
+"""
+import base64
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Hashable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, desc, or_
+from sqlalchemy.orm import Query
+
+from app.config import settings
+
+# (排序列, 是否降序)，最后一列须唯一（通常为主键），且各列不能为 NULL
+KeysetOrder = Sequence[Tuple[Any, bool]]
+
+
+class InvalidCursorError(ValueError):
+    """游标无法解析或与排序列不匹配"""
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    payload = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    data = json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, order: KeysetOrder) -> List[Any]:
+    try:
+        data = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(data.decode("utf-8"))
+    except (ValueError, UnicodeDecodeError) as e:
+        raise InvalidCursorError(f"无效的分页游标: {cursor}") from e
+    if not isinstance(values, list) or len(values) != len(order):
+        raise InvalidCursorError(f"无效的分页游标: {cursor}")
+
+    decoded = []
+    for (column, _), value in zip(order, values):
+        try:
+            python_type = column.type.python_type
+        except NotImplementedError:
+            python_type = None
+        try:
+            if python_type is datetime:
+                value = datetime.fromisoformat(value)
+            elif python_type in (int, str) and not isinstance(value, python_type):
+                raise TypeError(type(value).__name__)
+        except (TypeError, ValueError) as e:
+            raise InvalidCursorError(f"无效的分页游标: {cursor}") from e
+        decoded.append(value)
+    return decoded
+
+
+def keyset_filter(order: KeysetOrder, values: Sequence[Any]):
+    """排在游标之后的记录：(a < x) OR (a = x AND b < y) ...，首列额外加 a <= x 以便走索引范围扫描"""
+    clauses = []
+    for i, (column, descending) in enumerate(order):
+        equal = [prev == value for (prev, _), value in zip(order[:i], values[:i])]
+        beyond = column < values[i] if descending else column > values[i]
+        clauses.append(and_(*equal, beyond))
+    first, descending = order[0]
+    bound = first <= values[0] if descending else first >= values[0]
+    return and_(bound, or_(*clauses))
+
+
+def keyset_page(query: Query, order: KeysetOrder, cursor: Optional[str], page_size: int) -> Tuple[list, Optional[str]]:
+    """
+    按游标查询一页
+
+    Args:
+        query: 已包含过滤条件、未排序的查询
+        order: 排序列
+        cursor: 上一页返回的游标，为空时查询第一页
+
+    Returns:
+        (本页记录, 下一页游标)，没有更多数据时游标为 None
+    """
+    if cursor:
+        query = query.filter(keyset_filter(order, decode_cursor(cursor, order)))
+    rows = query.order_by(*[desc(column) if descending else column for column, descending in order])\
+        .limit(page_size + 1)\
+        .all()
+    if len(rows) <= page_size:
+        return rows, None
+    rows = rows[:page_size]
+    return rows, encode_cursor([getattr(rows[-1], column.key) for column, _ in order])
+
+
+class CountCache:
+    """按查询条件缓存总数，过期或超出容量后重新统计"""
+
+    def __init__(self, ttl: float, max_size: int):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, Tuple[float, int]]" = OrderedDict()
+
+    def get_or_count(self, key: Hashable, count: Callable[[], int]) -> int:
+        if self.ttl <= 0 or self.max_size <= 0:
+            return count()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > now:
+                self._entries.move_to_end(key)
+                return entry[1]
+        total = count()
+        with self._lock:
+            self._entries[key] = (now + self.ttl, total)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return total
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+count_cache = CountCache(settings.PAGINATION_COUNT_CACHE_TTL, settings.PAGINATION_COUNT_CACHE_SIZE)
@@ -0,0 +1,116 @@
+"""
+参考资料片段的本地检索索引
+
+全文生成开始时检索到的参考资料（多个RAG问题的回答和网页搜索摘要）被拆分为独立片段，
+用哈希化的词项构建 BM25 权重矩阵（NumPy），生成每个段落时按段落标题/描述检索 top-k 片段，
+代替把整份参考资料塞进每个段落的提示词。
+
+词项：中文按字符二元组，英文和数字按单词；词项通过 crc32 哈希到固定维度的桶中。
+"""
+import re
+import zlib
+from typing import List, Tuple
+
+import numpy as np
+
+from app.utils.prompt_budget import join_passages, split_passages
+
+_TERM_PATTERN = re.compile(r"[一-鿿㐀-䶿]+|[a-z0-9]+")
+_SENTENCE_END_PATTERN = re.compile(r"(?<=[。！？；!?;\n])")
+
+
+def _terms(text: str) -> List[str]:
+    terms = []
+    for token in _TERM_PATTERN.findall(text.lower()):
+        if token.isascii():
+            terms.append(token)
+        elif len(token) == 1:
+            terms.append(token)
+        else:
+            terms.extend(token[i:i + 2] for i in range(len(token) - 1))
+    return terms
+
+
+def _chunk(text: str, chunk_size: int) -> List[str]:
+    """按句子边界将过长的片段切分为不超过 chunk_size 字符的块"""
+    if len(text) <= chunk_size:
+        return [text]
+    chunks = []
+    current = ""
+    for sentence in _SENTENCE_END_PATTERN.split(text):
+        if current and len(current) + len(sentence) > chunk_size:
+            chunks.append(current.strip())
+            current = ""
+        current += sentence
+        # 单句超长时硬切
+        while len(current) > chunk_size:
+            chunks.append(current[:chunk_size].strip())
+            current = current[chunk_size:]
+    if current.strip():
+        chunks.append(current.strip())
+    return [chunk for chunk in chunks if chunk]
+
+
+class PassageIndex:
+    """
+    参考资料片段的 BM25 检索索引
+
+    Args:
+        passages: (分组标题, 片段内容) 列表
+        dim: 词项哈希桶数
+        k1: BM25 词频饱和参数
+        b: BM25 长度归一化参数
+    """
+
+    def __init__(self, passages: List[Tuple[str, str]], dim: int = 4096, k1: float = 1.5, b: float = 0.75):
+        self.passages = passages
+        self.dim = dim
+
+        tf = np.zeros((len(passages), dim), dtype=np.float32)
+        for i, (header, body) in enumerate(passages):
+            np.add.at(tf[i], self._hash_terms(body), 1)
+
+        lengths = tf.sum(axis=1)
+        avg_length = lengths.mean() if len(passages) and lengths.mean() > 0 else 1.0
+        df = (tf > 0).sum(axis=0)
+        idf = np.log(1 + (len(passages) - df + 0.5) / (df + 0.5)).astype(np.float32)
+        norm = k1 * (1 - b + b * lengths / avg_length)
+        # 预先计算每个片段在每个词项桶上的 BM25 权重，查询时只需按列求和
+        self._weights = idf * tf * (k1 + 1) / (tf + norm[:, None])
+
+    @classmethod
+    def from_text(cls, text: str, chunk_size: int = 400, **kwargs) -> "PassageIndex":
+        """从拼接好的参考资料文本构建索引"""
+        passages = []
+        for header, body in split_passages(text):
+            passages.extend((header, chunk) for chunk in _chunk(body, chunk_size))
+        return cls(passages, **kwargs)
+
+    def __len__(self) -> int:
+        return len(self.passages)
+
+    def _hash_terms(self, text: str) -> np.ndarray:
+        return np.array(
+            [zlib.crc32(term.encode("utf-8")) % self.dim for term in _terms(text)],
+            dtype=np.int64
+        )
+
+    def search(self, query: str, top_k: int) -> List[int]:
+        """返回与 query 最相关的 top_k 个片段下标，按相关度降序；没有任何词项命中时返回前 top_k 个片段"""
+        if not self.passages or top_k <= 0:
+            return []
+        buckets, counts = np.unique(self._hash_terms(query), return_counts=True)
+        if len(buckets) == 0:
+            return list(range(min(top_k, len(self.passages))))
+        scores = self._weights[:, buckets] @ counts.astype(np.float32)
+        order = np.argsort(-scores, kind="stable")[:top_k]
+        hits = [int(i) for i in order if scores[i] > 0]
+        return hits or list(range(min(top_k, len(self.passages))))
+
+    def render(self, indices: List[int]) -> str:
+        """按原有顺序拼接选中的片段"""
+        return join_passages([self.passages[i] for i in sorted(indices)])
+
+    def retrieve(self, query: str, top_k: int) -> str:
+        """检索 top_k 个片段并拼接为参考资料文本"""
+        return self.render(self.search(query, top_k))
@@ -0,0 +1,280 @@
+"""
+提示词token预算
+
+段落生成的提示词中，参考资料、章节摘要、父段落内容等上下文会随文档进度不断增长。
+PromptBudgeter 按模型的输入token预算在各上下文之间分配额度：
+- 总长度未超出预算时原样保留
+- 超出预算时按权重分配额度，用不完的额度让给其他部分
+- 参考资料按与当前段落的相关度挑选片段，其余部分按配置保留开头或结尾
+
+token 使用 tiktoken 计数；离线环境无法加载编码表时按字符数估算。
+"""
+import logging
+import math
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+import tiktoken
+
+logger = logging.getLogger(__name__)
+
+# 参考资料中每个问题/搜索结果的分组标题，如 "--- 问题 1: xxx ---"
+_RAG_HEADER_PATTERN = re.compile(r"^---\s.*\s---$")
+_CJK_PATTERN = re.compile(r"[　-〿㐀-鿿＀-￯]")
+
+
+@lru_cache(maxsize=16)
+def _get_encoding(model: str):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        pass
+    except Exception as e:
+        logger.warning(f"加载tiktoken编码失败，使用字符数估算token [model={model}]: {str(e)}")
+        return None
+    try:
+        # 非OpenAI模型（如国产模型）没有对应的编码，使用通用编码近似
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning(f"加载tiktoken编码失败，使用字符数估算token [model={model}]: {str(e)}")
+        return None
+
+
+def _estimate_tokens(text: str) -> int:
+    """按字符数估算token：中文约1字1token，其他字符约4个1token"""
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+def count_tokens(text: str, model: str = "") -> int:
+    """计算文本的token数"""
+    if not text:
+        return 0
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return _estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model: str = "", keep: str = "head") -> str:
+    """
+    将文本截断到指定token数
+
+    Args:
+        text: 文本
+        max_tokens: token上限
+        model: 模型名称
+        keep: head 保留开头，tail 保留结尾
+    """
+    if max_tokens <= 0 or not text:
+        return ""
+    encoding = _get_encoding(model)
+    if encoding is not None:
+        tokens = encoding.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        tokens = tokens[:max_tokens] if keep == "head" else tokens[-max_tokens:]
+        # 截断位置可能落在多字节字符中间，去掉解码产生的替换字符
+        return encoding.decode(tokens).strip("�")
+
+    total = _estimate_tokens(text)
+    if total <= max_tokens:
+        return text
+    length = int(len(text) * max_tokens / total)
+    while length > 0:
+        candidate = text[:length] if keep == "head" else text[-length:]
+        if _estimate_tokens(candidate) <= max_tokens:
+            return candidate
+        length = int(length * 0.9)
+    return ""
+
+
+def _bigrams(text: str) -> Counter:
+    text = re.sub(r"\s+", "", text.lower())
+    return Counter(text[i:i + 2] for i in range(len(text) - 1))
+
+
+def split_passages(text: str) -> List[Tuple[str, str]]:
+    """
+    将参考资料拆分为片段
+
+    Returns:
+        List[Tuple[str, str]]: (分组标题, 片段内容)，保持原有顺序
+    """
+    passages = []
+    header = ""
+    for block in re.split(r"\n\s*\n", text):
+        lines = block.strip().splitlines()
+        if lines and _RAG_HEADER_PATTERN.match(lines[0].strip()):
+            header = lines[0].strip()
+            lines = lines[1:]
+        body = "\n".join(lines).strip()
+        if body:
+            passages.append((header, body))
+    return passages
+
+
+def join_passages(passages: List[Tuple[str, str]]) -> str:
+    """将 (分组标题, 片段内容) 按顺序拼接为参考资料文本，同一分组的片段只输出一次标题"""
+    result = []
+    current_header = None
+    for header, body in passages:
+        if header and header != current_header:
+            result.append(header)
+            current_header = header
+        result.append(body)
+    return "\n\n".join(result)
+
+
+def select_passages(text: str, query: str, max_tokens: int, model: str = "") -> str:
+    """
+    按与 query 的相关度挑选参考资料片段，总token不超过 max_tokens
+
+    相关度为片段与 query 的字符二元组重合度（按片段长度归一化），选中的片段按原有顺序输出。
+    """
+    if count_tokens(text, model) <= max_tokens:
+        return text
+    passages = split_passages(text)
+    if not passages or max_tokens <= 0:
+        return ""
+
+    query_bigrams = set(_bigrams(query))
+    scored = []
+    for index, (header, body) in enumerate(passages):
+        bigrams = _bigrams(body)
+        overlap = sum(count for gram, count in bigrams.items() if gram in query_bigrams)
+        score = overlap / math.sqrt(sum(bigrams.values()) + 1)
+        scored.append((score, index))
+    scored.sort(key=lambda item: (-item[0], item[1]))
+
+    selected: Dict[int, str] = {}
+    remaining = max_tokens
+    for score, index in scored:
+        header, body = passages[index]
+        cost = count_tokens(body, model) + 1
+        if cost <= remaining:
+            selected[index] = body
+            remaining -= cost
+        elif not selected:
+            # 最相关的片段本身超出预算时截断保留
+            selected[index] = truncate_to_tokens(body, remaining, model)
+            remaining = 0
+        if remaining <= 0:
+            break
+
+    # 按原顺序拼接，同一分组的片段只输出一次标题
+    selected_text = join_passages([(passages[index][0], selected[index]) for index in sorted(selected)])
+    # 分组标题也占用token，超出时截断兜底
+    return truncate_to_tokens(selected_text, max_tokens, model)
+
+
+@dataclass
+class BudgetSection:
+    """
+    参与预算分配的提示词片段
+
+    Args:
+        name: 片段名称
+        text: 片段内容
+        weight: 超出预算时的分配权重
+        keep: 截断时保留开头（head）还是结尾（tail）
+        query: 设置后按与 query 的相关度挑选片段，用于参考资料
+    """
+    name: str
+    text: str
+    weight: float = 1.0
+    keep: str = "head"
+    query: Optional[str] = None
+
+
+@dataclass
+class BudgetResult:
+    """预算分配结果"""
+    texts: Dict[str, str]
+    budget: int
+    fixed_tokens: int
+    tokens_before: Dict[str, int] = field(default_factory=dict)
+    tokens_after: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def trimmed(self) -> bool:
+        return self.tokens_before != self.tokens_after
+
+    def summary(self) -> str:
+        parts = [f"{name}={self.tokens_before[name]}->{self.tokens_after[name]}" for name in self.tokens_before]
+        return f"budget={self.budget}, fixed={self.fixed_tokens}, " + ", ".join(parts)
+
+
+class PromptBudgeter:
+    """
+    按模型输入token预算裁剪提示词上下文
+
+    Args:
+        model: 模型名称，用于选择tiktoken编码
+        max_input_tokens: 提示词的输入token上限
+    """
+
+    def __init__(self, model: str, max_input_tokens: int):
+        self.model = model
+        self.max_input_tokens = max_input_tokens
+
+    def count(self, text: str) -> int:
+        return count_tokens(text, self.model)
+
+    def fit(self, fixed_prompt: str, sections: List[BudgetSection]) -> BudgetResult:
+        """
+        在预算内分配各片段的token额度并裁剪
+
+        Args:
+            fixed_prompt: 不参与裁剪的提示词部分（各片段留空时渲染出的提示词）
+            sections: 参与分配的片段
+        """
+        fixed_tokens = self.count(fixed_prompt)
+        available = max(0, self.max_input_tokens - fixed_tokens)
+        demands = {section.name: self.count(section.text) for section in sections}
+        result = BudgetResult(
+            texts={section.name: section.text for section in sections},
+            budget=self.max_input_tokens,
+            fixed_tokens=fixed_tokens,
+            tokens_before=dict(demands),
+            tokens_after=dict(demands),
+        )
+        if sum(demands.values()) <= available:
+            return result
+
+        # 按权重分配额度，需求小于份额的片段只占用实际需求，剩余额度重新分给其他片段
+        allocations: Dict[str, int] = {}
+        pending = [section for section in sections if section.weight > 0]
+        for section in sections:
+            if section.weight <= 0:
+                allocations[section.name] = 0
+        remaining = available
+        while pending:
+            total_weight = sum(section.weight for section in pending)
+            satisfied = [
+                section for section in pending
+                if demands[section.name] <= remaining * section.weight / total_weight
+            ]
+            if not satisfied:
+                for section in pending:
+                    allocations[section.name] = int(remaining * section.weight / total_weight)
+                break
+            for section in satisfied:
+                allocations[section.name] = demands[section.name]
+                remaining -= demands[section.name]
+                pending.remove(section)
+
+        for section in sections:
+            allocation = allocations[section.name]
+            if demands[section.name] <= allocation:
+                continue
+            if section.query is not None:
+                text = select_passages(section.text, section.query, allocation, self.model)
+            else:
+                text = truncate_to_tokens(section.text, allocation, self.model, keep=section.keep)
+            result.texts[section.name] = text
+            result.tokens_after[section.name] = self.count(text)
+        return result
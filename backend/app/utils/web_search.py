@@ -1,23 +1,44 @@
-import requests
+"""
+Web搜索
+
+搜索和网页抓取在后台线程的事件循环上异步执行，所有调用共享同一个 aiohttp 连接池：
+- 搜索请求和每个网页的抓取都有超时，单个网页失败时使用搜索结果的摘要代替
+- 同一次搜索的结果网页并发抓取，响应体超过 WEB_SEARCH_MAX_BODY_BYTES 时截断
+- 搜索结果按查询缓存 WEB_SEARCH_CACHE_TTL 秒
+
+写作任务运行在工作线程中，通过 baidu_search / baidu_search_many 同步调用。
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+import aiohttp
+import html2text
 from bs4 import BeautifulSoup
-from langchain_community.document_loaders import AsyncHtmlLoader
-from langchain_community.document_transformers import Html2TextTransformer
 
-html2text = Html2TextTransformer()
+from app.config import settings
 
-def baidu_search(query: str, top_k: int = 3):
-    # 模拟请求百度搜索
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3"}
-    search_url = f"https://www.baidu.com/s?wd={query}"
+logger = logging.getLogger(__name__)
 
-    response = requests.get(search_url, headers=headers)
-    if response.status_code != 200:
-        raise Exception("百度搜索请求失败")
+_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3"}
+_SEARCH_URL = "https://www.baidu.com/s?wd={query}"
 
-    soup = BeautifulSoup(response.text, "lxml")
 
-    # 提取搜索结果（这里我们假设百度的搜索结果有一定的结构）
+def _html_to_text(html: str) -> str:
+    converter = html2text.HTML2Text()
+    converter.ignore_links = True
+    converter.ignore_images = True
+    return converter.handle(html)
+
+
+def _parse_results(html: str, top_k: int) -> List[Dict[str, str]]:
+    """解析百度搜索结果页"""
+    soup = BeautifulSoup(html, "lxml")
     results = []
     for idx, item in enumerate(soup.select(".result.c-container"), 1):  # 百度搜索结果的标识符
         if idx > top_k:
@@ -30,27 +51,166 @@ def baidu_search(query: str, top_k: int = 3):
             "link": link,
             "description": description
         })
+    return results
+
+
+class WebSearcher:
+    """
+    异步百度搜索
+
+    Args:
+        search_timeout: 搜索请求超时（秒）
+        fetch_timeout: 单个网页抓取超时（秒）
+        max_connections: 连接池大小
+        max_body_bytes: 单个网页读取的最大字节数
+        cache_ttl: 搜索结果缓存时间（秒），为 0 时不缓存
+        cache_size: 最多缓存的查询数
+    """
+
+    def __init__(self, search_timeout: float, fetch_timeout: float, max_connections: int,
+                 max_body_bytes: int, cache_ttl: int, cache_size: int):
+        self.search_timeout = search_timeout
+        self.fetch_timeout = fetch_timeout
+        self.max_connections = max_connections
+        self.max_body_bytes = max_body_bytes
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[Tuple[str, int], Tuple[float, str]]" = OrderedDict()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="web-search", daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # 只在后台事件循环中调用，无需加锁
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                headers=_HEADERS,
+                connector=aiohttp.TCPConnector(limit=self.max_connections, ttl_dns_cache=300)
+            )
+        return self._session
+
+    def _cache_get(self, key: Tuple[str, int]) -> Optional[str]:
+        with self._lock:
+            item = self._cache.get(key)
+            if item is None:
+                return None
+            if item[0] <= time.time():
+                del self._cache[key]
+                return None
+            self._cache.move_to_end(key)
+            return item[1]
+
+    def _cache_put(self, key: Tuple[str, int], value: str) -> None:
+        if self.cache_ttl <= 0 or self.cache_size <= 0:
+            return
+        with self._lock:
+            self._cache[key] = (time.time() + self.cache_ttl, value)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    async def _read_text(self, response: aiohttp.ClientResponse) -> str:
+        """读取响应体，超过大小上限时截断"""
+        body = bytearray()
+        async for chunk in response.content.iter_chunked(65536):
+            body.extend(chunk)
+            if len(body) >= self.max_body_bytes:
+                del body[self.max_body_bytes:]
+                break
+        return body.decode(response.charset or "utf-8", errors="ignore")
+
+    async def _fetch_page(self, url: str) -> str:
+        """抓取网页并转换为纯文本，失败时返回空字符串"""
+        if not url:
+            return ""
+        try:
+            timeout = aiohttp.ClientTimeout(total=self.fetch_timeout)
+            async with self._get_session().get(url, timeout=timeout) as response:
+                if response.status != 200:
+                    logger.warning(f"抓取网页失败 [url={url}, status={response.status}]")
+                    return ""
+                html = await self._read_text(response)
+            # HTML 转文本较耗CPU，放到线程中执行以免阻塞事件循环
+            return await asyncio.to_thread(_html_to_text, html)
+        except Exception as e:
+            logger.warning(f"抓取网页失败 [url={url}]: {type(e).__name__} {str(e)}")
+            return ""
+
+    async def asearch(self, query: str, top_k: int = 3) -> str:
+        """搜索并并发抓取结果网页，返回拼接后的网页文本"""
+        key = (query, top_k)
+        cached = self._cache_get(key)
+        if cached is not None:
+            logger.info(f"Web搜索命中缓存: {query}")
+            return cached
+
+        timeout = aiohttp.ClientTimeout(total=self.search_timeout)
+        async with self._get_session().get(_SEARCH_URL.format(query=quote(query)), timeout=timeout) as response:
+            if response.status != 200:
+                raise Exception("百度搜索请求失败")
+            html = await self._read_text(response)
+        results = _parse_results(html, top_k)
+
+        pages = await asyncio.gather(*(self._fetch_page(res["link"]) for res in results))
+
+        # 组装搜索内容，网页为空时使用搜索结果的摘要
+        search_contents = []
+        for res, page in zip(results, pages):
+            title_content = res["title"]
+            page_content = page or res["description"]
+            search_contents.append(f">>>>>>>>>>>>>>>>>>>>以下是标题为<h1>{title_content}</h1>的网页内容\n{page_content}\n<<<<<<<<<<<<<<<<<以上是标题为<h1>{title_content}</h1>的网页内容\n")
+        content = "\n\n".join(search_contents)
+        self._cache_put(key, content)
+        return content
+
+    async def _asearch_many(self, queries: List[str], top_k: int) -> List[Optional[str]]:
+        async def _one(query: str) -> Optional[str]:
+            try:
+                return await self.asearch(query, top_k)
+            except Exception as e:
+                logger.error(f"Web搜索失败 [query={query}]: {str(e)}")
+                return None
+        return list(await asyncio.gather(*(_one(q) for q in queries)))
+
+    def search(self, query: str, top_k: int = 3) -> str:
+        """同步搜索，失败时抛出异常"""
+        future = asyncio.run_coroutine_threadsafe(self.asearch(query, top_k), self._ensure_loop())
+        return future.result()
+
+    def search_many(self, queries: List[str], top_k: int = 3) -> List[Optional[str]]:
+        """并发搜索多个查询，按顺序返回结果，失败的查询为 None"""
+        if not queries:
+            return []
+        future = asyncio.run_coroutine_threadsafe(self._asearch_many(queries, top_k), self._ensure_loop())
+        return future.result()
+
+
+web_searcher = WebSearcher(
+    settings.WEB_SEARCH_TIMEOUT,
+    settings.WEB_SEARCH_FETCH_TIMEOUT,
+    settings.WEB_SEARCH_MAX_CONNECTIONS,
+    settings.WEB_SEARCH_MAX_BODY_BYTES,
+    settings.WEB_SEARCH_CACHE_TTL,
+    settings.WEB_SEARCH_CACHE_SIZE
+)
 
-    # 提取链接并加载网页内容
-    urls = [res["link"] for res in results]
-    loader = AsyncHtmlLoader(urls)
-    docs = loader.load()
 
-    # 转换网页内容为纯文本
-    for doc in docs:
-        if doc.page_content == '':
-            doc.page_content = doc.metadata.get('description', '')
+def baidu_search(query: str, top_k: int = 3) -> str:
+    return web_searcher.search(query, top_k)
 
-    docs_transformed = html2text.transform_documents(docs)
 
-    # 组装搜索内容
-    search_contents = []
-    for i, doc in enumerate(docs_transformed):
-        title_content = results[i]["title"]
-        search_contents.append(f">>>>>>>>>>>>>>>>>>>>以下是标题为<h1>{title_content}</h1>的网页内容\n{doc.page_content}\n<<<<<<<<<<<<<<<<<以上是标题为<h1>{title_content}</h1>的网页内容\n")
+def baidu_search_many(queries: List[str], top_k: int = 3) -> List[Optional[str]]:
+    return web_searcher.search_many(queries, top_k)
 
-    return "\n\n".join([doc for doc in search_contents])
 
 if __name__ == "__main__":
     result = baidu_search("临安区人口数量，农业人口比例?")
-    print(result)
\ No newline at end of file
+    print(result)
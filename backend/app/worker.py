@@ -0,0 +1,38 @@
+"""
+独立的写作任务工作进程
+
+启用持久化任务队列（task_queue.backend 为 mysql 或 redis）后，可以运行多个工作进程横向扩展：
+
+    python -m app.worker
+
+此时可在 API 进程中设置 task_queue.embedded_worker: false，只负责接收请求。
+"""
+import logging
+import signal
+
+from app.config import settings
+from app.log import setup_logging
+from app.routers.v1.writing import start_writing_task_worker
+
+logger = logging.getLogger("app")
+
+
+def main():
+    setup_logging()
+    worker = start_writing_task_worker()
+    if not worker:
+        logger.error(f"未启用持久化任务队列 [backend={settings.TASK_QUEUE_BACKEND}]，工作进程退出")
+        return
+
+    def handle_signal(signum, frame):
+        logger.info(f"收到信号 {signum}，工作进程停止领取新任务")
+        worker.stop(timeout=0)
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+    worker.wait()
+    logger.info("工作进程已退出")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,432 @@
+"""
+压测用的本地替身服务：OpenAI 兼容的大模型接口和 QAnything 风格的知识库接口
+
+不依赖真实模型和知识库服务即可压测写作、知识库对话和文件上传流程，通常由 benchmarks.service_load 启动，也可以单独运行：
+
+    cd backend && python -m benchmarks.fakes --llm-port 18001 --kb-port 18002 --llm-latency 0.5 --llm-tokens-per-second 50
+
+大模型（/v1/chat/completions）按提示词识别写作流程中需要解析结果的调用（需求提取、大纲结构、子章节扩展、
+补充描述、RAG 检索问题），返回能被解析的固定格式内容，其余调用返回指定长度的填充文本。
+知识库（/api/local_doc_qa/*）上传的文件按 --kb-parse-seconds 依次经过 gray、yellow 变为 green。
+两个服务的 GET /stats 返回按调用类型统计的次数和 token 数。
+"""
+import argparse
+import asyncio
+import json
+import math
+import re
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Tuple
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+# 每个 token 对应的字符数
+TOKEN_CHARS = 2
+CHINESE_NUMERALS = "一二三四五六七八九十"
+FILLER = (
+    "桥梁结构健康监测系统通过布设传感器实时采集应变、位移和振动数据，结合预警阈值设置和交通流量分析，"
+    "为养护决策提供依据。项目统筹推进信息化平台建设，完善数据共享与交换机制，全面加强质量安全保障。"
+)
+QUESTIONS = [
+    "项目建设的主要目标和范围是什么？",
+    "需要遵循哪些技术规范和标准？",
+    "关键设备和传感器如何选型与布设？",
+    "数据采集、传输和存储方案如何设计？",
+    "运营维护和应急预案有哪些要求？",
+]
+
+
+@dataclass
+class LLMProfile:
+    latency: float = 0.5               # 首 token 延迟（秒）
+    tokens_per_second: float = 50.0    # 生成速度，为 0 时不限速
+    completion_tokens: int = 300       # 自由文本回复的 token 数
+
+
+@dataclass
+class KBProfile:
+    upload_latency: float = 0.05       # 上传、建库等接口的延迟（秒）
+    parse_seconds: float = 5.0         # 文件从上传到解析完成（green）的时间，前一半为 gray，后一半为 yellow
+    fail_every: int = 0                # 每 N 个文件解析失败一个（red），为 0 时不失败
+    chat_latency: float = 0.5          # 检索加首 token 延迟（秒）
+    chat_tokens_per_second: float = 50.0
+    chat_tokens: int = 200             # 回答的 token 数
+    doc_chunks: int = 20               # get_doc_completed 返回的文档切片数
+
+
+def _tokens(text: str) -> List[str]:
+    return [text[i:i + TOKEN_CHARS] for i in range(0, len(text), TOKEN_CHARS)]
+
+
+def _filler(tokens: int) -> str:
+    length = tokens * TOKEN_CHARS
+    return (FILLER * (length // len(FILLER) + 1))[:length]
+
+
+async def _paced(tokens: List[str], latency: float, tokens_per_second: float) -> AsyncIterator[str]:
+    """按首 token 延迟和生成速度产出文本片段，速度较快时一次产出多个 token"""
+    await asyncio.sleep(latency)
+    start = time.perf_counter()
+    sent = 0
+    while sent < len(tokens):
+        due = len(tokens) if tokens_per_second <= 0 else min(len(tokens), int((time.perf_counter() - start) * tokens_per_second) + 1)
+        if due > sent:
+            yield "".join(tokens[sent:due])
+            sent = due
+        if sent < len(tokens):
+            await asyncio.sleep(max(1 / tokens_per_second, 0.005))
+
+
+async def _generation_delay(tokens: int, latency: float, tokens_per_second: float) -> None:
+    await asyncio.sleep(latency + (tokens / tokens_per_second if tokens_per_second > 0 else 0))
+
+
+def _sse(data: Any) -> str:
+    return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+# ---------------------------------------------------------------------------
+# 大模型
+# ---------------------------------------------------------------------------
+
+def _outline_text(topic: str, levels: int, leaves: int) -> str:
+    """按层级和最底层章节数生成符合大纲格式示例的大纲结构"""
+    levels = max(1, min(levels, 5))
+    chapters = min(len(CHINESE_NUMERALS), max(2, round(leaves ** (1 / levels))))
+    branch = max(2, math.ceil((leaves / chapters) ** (1 / (levels - 1)))) if levels > 1 else 0
+    lines = [topic[:30] or "压测文档"]
+
+    def add_children(prefix: str, level: int):
+        for i in range(1, branch + 1):
+            number = f"{prefix}.{i}"
+            lines.append(f"{'    ' * (level - 1)}{number} {level}级标题{number}")
+            if level < levels:
+                add_children(number, level + 1)
+
+    for i in range(1, chapters + 1):
+        lines.append(f"{CHINESE_NUMERALS[i - 1]}、第{i}章")
+        if levels > 1:
+            add_children(str(i), 2)
+    return "\n".join(lines)
+
+
+def _between(text: str, start: str, end: str) -> str:
+    begin = text.find(start)
+    if begin < 0:
+        return ""
+    begin += len(start)
+    stop = text.find(end, begin)
+    return text[begin:stop if stop >= 0 else len(text)].strip()
+
+
+def _with_descriptions(outline: str) -> str:
+    lines = []
+    for line in outline.split("\n"):
+        if not line.strip():
+            continue
+        lines.append(line)
+        indent = len(line) - len(line.lstrip())
+        lines.append(f"{' ' * (indent + 4)}描述：{line.strip()}的主要工作内容、技术要求和注意事项")
+    return "\n".join(lines)
+
+
+def _requested_number(prompt: str, pattern: str, default: int) -> int:
+    match = re.search(pattern, prompt)
+    return int(match.group(1)) if match else default
+
+
+def llm_reply(prompt: str, profile: LLMProfile) -> Tuple[str, str]:
+    """返回 (调用类型, 回复内容)"""
+    if "predefined_chapters" in prompt:
+        return "requirements", json.dumps({
+            "required_level": _requested_number(prompt, r"(\d)级大纲", 2),
+            "word_count": _requested_number(prompt, r"约(\d+)字", 2000),
+            "page_count": None,
+            "predefined_chapters": [],
+        }, ensure_ascii=False)
+    if "包含 level（整数）" in prompt:
+        return "requirements", json.dumps({
+            "level": _requested_number(prompt, r"(\d)级大纲", 2),
+            "word_count": _requested_number(prompt, r"约(\d+)字", 2000),
+            "page_count": None,
+        }, ensure_ascii=False)
+    match = re.search(r"完整的(\d)级大纲结构", prompt)
+    if match:
+        topic = _between(prompt, '主题"', '"生成一个完整的')
+        return "outline_structure", _outline_text(topic, int(match.group(1)), _requested_number(prompt, r"控制在(\d+)个", 6))
+    if "扩展同级子章节" in prompt:
+        return "outline_extension", _between(prompt, '扩展同级子章节："', "要求：")
+    if "补充详细的描述内容" in prompt:
+        outline = _between(prompt, "补充详细的描述内容。", "要求：")
+        return "outline_description", _with_descriptions(outline.split("\n", 1)[1] if "\n" in outline else outline)
+    if "整理出5个问题" in prompt:
+        return "rag_questions", "\n".join(QUESTIONS)
+    return "text", _filler(profile.completion_tokens)
+
+
+def _message_text(messages: List[Dict[str, Any]]) -> str:
+    parts = []
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, list):
+            content = "".join(part.get("text", "") for part in content if isinstance(part, dict))
+        parts.append(content or "")
+    return "\n".join(parts)
+
+
+def create_llm_app(profile: LLMProfile) -> FastAPI:
+    app = FastAPI()
+    stats = Counter()
+
+    @app.get("/v1/models")
+    async def list_models():
+        return {"object": "list", "data": [{"id": "fake-llm", "object": "model", "owned_by": "benchmark"}]}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        prompt = _message_text(body.get("messages", []))
+        kind, reply = llm_reply(prompt, profile)
+        tokens = _tokens(reply)
+        if kind == "text" and body.get("max_tokens"):
+            tokens = tokens[:body["max_tokens"]]
+        usage = {"prompt_tokens": len(prompt) // TOKEN_CHARS, "completion_tokens": len(tokens), "total_tokens": len(prompt) // TOKEN_CHARS + len(tokens)}
+        stats[f"{kind}_calls"] += 1
+        stats[f"{kind}_completion_tokens"] += len(tokens)
+        stats["prompt_tokens"] += usage["prompt_tokens"]
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        model = body.get("model", "fake-llm")
+
+        if not body.get("stream"):
+            await _generation_delay(len(tokens), profile.latency, profile.tokens_per_second)
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)}, "finish_reason": "stop"}],
+                "usage": usage,
+            }
+
+        def chunk(delta: Dict[str, Any], finish_reason=None) -> Dict[str, Any]:
+            return {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+
+        async def generate():
+            yield _sse(chunk({"role": "assistant", "content": ""}))
+            async for text in _paced(tokens, profile.latency, profile.tokens_per_second):
+                yield _sse(chunk({"content": text}))
+            yield _sse(chunk({}, "stop"))
+            if (body.get("stream_options") or {}).get("include_usage"):
+                yield _sse({"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model, "choices": [], "usage": usage})
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(generate(), media_type="text/event-stream")
+
+    @app.get("/stats")
+    async def get_stats():
+        return dict(stats)
+
+    return app
+
+
+# ---------------------------------------------------------------------------
+# 知识库
+# ---------------------------------------------------------------------------
+
+def create_kb_app(profile: KBProfile) -> FastAPI:
+    app = FastAPI()
+    stats = Counter()
+    knowledge_bases: Dict[str, str] = {}
+    files: Dict[str, Dict[str, Any]] = {}
+
+    def file_status(item: Dict[str, Any]) -> str:
+        elapsed = time.monotonic() - item["uploaded_at"]
+        if elapsed < profile.parse_seconds / 2:
+            return "gray"
+        if elapsed < profile.parse_seconds:
+            return "yellow"
+        return "red" if item["failed"] else "green"
+
+    @app.post("/api/local_doc_qa/new_knowledge_base")
+    async def new_knowledge_base(request: Request):
+        body = await request.json()
+        stats["new_knowledge_base"] += 1
+        await asyncio.sleep(profile.upload_latency)
+        kb_id = f"KB{uuid.uuid4().hex}"
+        knowledge_bases[kb_id] = body.get("kb_name", "")
+        return {"code": 200, "msg": "success", "data": {"kb_id": kb_id, "kb_name": knowledge_bases[kb_id]}}
+
+    @app.post("/api/local_doc_qa/upload_files")
+    async def upload_files(request: Request):
+        form = await request.form()
+        stats["upload_files"] += 1
+        await asyncio.sleep(profile.upload_latency)
+        data = []
+        for upload in form.getlist("files"):
+            await upload.read()
+            file_id = uuid.uuid4().hex
+            files[file_id] = {
+                "kb_id": form.get("kb_id"),
+                "file_name": upload.filename,
+                "uploaded_at": time.monotonic(),
+                "failed": profile.fail_every > 0 and (len(files) + 1) % profile.fail_every == 0,
+            }
+            data.append({"file_id": file_id, "file_name": upload.filename, "status": "gray"})
+        return {"code": 200, "msg": "success", "data": data}
+
+    @app.post("/api/local_doc_qa/list_files")
+    async def list_files(request: Request):
+        body = await request.json()
+        stats["list_files"] += 1
+        file_id = body.get("file_id")
+        items = [(file_id, files[file_id])] if file_id in files else [] if file_id else [
+            (key, item) for key, item in files.items() if item["kb_id"] == body.get("kb_id")
+        ]
+        details = [{"file_id": key, "file_name": item["file_name"], "status": file_status(item)} for key, item in items]
+        return {"code": 200, "msg": "success", "data": {"total_page": 1, "total": len(details), "details": details}}
+
+    @app.post("/api/local_doc_qa/delete_files")
+    async def delete_files(request: Request):
+        body = await request.json()
+        stats["delete_files"] += 1
+        for file_id in body.get("file_ids") or []:
+            files.pop(file_id, None)
+        return {"code": 200, "msg": "success"}
+
+    @app.post("/api/local_doc_qa/local_doc_chat")
+    async def local_doc_chat(request: Request):
+        body = await request.json()
+        question = body.get("question", "")
+        kb_ids = set(body.get("kb_ids") or [])
+        candidates = [key for key, item in files.items() if item["kb_id"] in kb_ids and file_status(item) == "green"]
+        retrieval_documents = [{"file_id": key, "file_name": files[key]["file_name"], "content": _filler(40), "score": 0.8} for key in candidates[:3]]
+        search_only = bool(body.get("only_need_search_results"))
+        tokens = [] if search_only else _tokens(_filler(profile.chat_tokens))
+        stats["search_calls" if search_only else "chat_calls"] += 1
+        stats["chat_completion_tokens"] += len(tokens)
+
+        if not body.get("streaming"):
+            await _generation_delay(len(tokens), profile.chat_latency, profile.chat_tokens_per_second)
+            answer = "".join(tokens)
+            return {
+                "code": 200,
+                "msg": "success no stream chat",
+                "question": question,
+                "response": answer,
+                "history": (body.get("history") or []) + [[question, answer]],
+                "retrieval_documents": retrieval_documents,
+                "source_documents": retrieval_documents,
+            }
+
+        async def generate():
+            answer = ""
+            async for text in _paced(tokens, profile.chat_latency, profile.chat_tokens_per_second):
+                answer += text
+                yield _sse({"code": 200, "msg": "success", "question": question, "response": text, "history": [], "retrieval_documents": []})
+            yield _sse({
+                "code": 200,
+                "msg": "success stream chat",
+                "question": question,
+                "response": answer,
+                "history": (body.get("history") or []) + [[question, answer]],
+                "retrieval_documents": retrieval_documents,
+                "source_documents": retrieval_documents,
+            })
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(generate(), media_type="text/event-stream")
+
+    @app.post("/api/local_doc_qa/get_doc_completed")
+    async def get_doc_completed(request: Request):
+        body = await request.json()
+        stats["get_doc_completed"] += 1
+        page_id = max(int(body.get("page_id", 1)), 1)
+        page_limit = max(int(body.get("page_limit", 10)), 1)
+        start = (page_id - 1) * page_limit
+        chunks = [{"page_content": f"第{i + 1}段 {_filler(100)}"} for i in range(start, min(start + page_limit, profile.doc_chunks))]
+        return {"code": 200, "msg": "success", "chunks": chunks, "total_count": profile.doc_chunks}
+
+    @app.get("/stats")
+    async def get_stats():
+        return dict(stats)
+
+    return app
+
+
+# ---------------------------------------------------------------------------
+# 命令行
+# ---------------------------------------------------------------------------
+
+def add_profile_arguments(parser: argparse.ArgumentParser) -> None:
+    """替身服务的参数，benchmarks.service_load 复用同样的参数并转发给子进程"""
+    llm, kb = LLMProfile(), KBProfile()
+    parser.add_argument("--llm-latency", type=float, default=llm.latency, help="大模型首 token 延迟（秒）")
+    parser.add_argument("--llm-tokens-per-second", type=float, default=llm.tokens_per_second, help="大模型生成速度，为 0 时不限速")
+    parser.add_argument("--llm-completion-tokens", type=int, default=llm.completion_tokens, help="大模型自由文本回复的 token 数")
+    parser.add_argument("--kb-upload-latency", type=float, default=kb.upload_latency, help="知识库上传、建库接口的延迟（秒）")
+    parser.add_argument("--kb-parse-seconds", type=float, default=kb.parse_seconds, help="知识库文件解析完成所需时间（秒）")
+    parser.add_argument("--kb-fail-every", type=int, default=kb.fail_every, help="每 N 个文件解析失败一个，为 0 时不失败")
+    parser.add_argument("--kb-chat-latency", type=float, default=kb.chat_latency, help="知识库问答检索加首 token 延迟（秒）")
+    parser.add_argument("--kb-chat-tokens-per-second", type=float, default=kb.chat_tokens_per_second, help="知识库问答生成速度")
+    parser.add_argument("--kb-chat-tokens", type=int, default=kb.chat_tokens, help="知识库问答回答的 token 数")
+
+
+def profile_arguments(args: argparse.Namespace) -> List[str]:
+    """把解析后的替身服务参数还原为命令行参数"""
+    names = [
+        "llm_latency", "llm_tokens_per_second", "llm_completion_tokens", "kb_upload_latency", "kb_parse_seconds",
+        "kb_fail_every", "kb_chat_latency", "kb_chat_tokens_per_second", "kb_chat_tokens",
+    ]
+    result = []
+    for name in names:
+        result += [f"--{name.replace('_', '-')}", str(getattr(args, name))]
+    return result
+
+
+def profiles_from_args(args: argparse.Namespace) -> Tuple[LLMProfile, KBProfile]:
+    return (
+        LLMProfile(args.llm_latency, args.llm_tokens_per_second, args.llm_completion_tokens),
+        KBProfile(
+            upload_latency=args.kb_upload_latency,
+            parse_seconds=args.kb_parse_seconds,
+            fail_every=args.kb_fail_every,
+            chat_latency=args.kb_chat_latency,
+            chat_tokens_per_second=args.kb_chat_tokens_per_second,
+            chat_tokens=args.kb_chat_tokens,
+        ),
+    )
+
+
+async def serve(host: str, llm_port: int, kb_port: int, llm_profile: LLMProfile, kb_profile: KBProfile) -> None:
+    servers = [
+        uvicorn.Server(uvicorn.Config(create_llm_app(llm_profile), host=host, port=llm_port, log_level="warning", access_log=False)),
+        uvicorn.Server(uvicorn.Config(create_kb_app(kb_profile), host=host, port=kb_port, log_level="warning", access_log=False)),
+    ]
+    await asyncio.gather(*(server.serve() for server in servers))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--llm-port", type=int, default=18001, help="大模型服务端口，base_url 为 http://host:port/v1")
+    parser.add_argument("--kb-port", type=int, default=18002, help="知识库服务端口，kb_api_base 为 http://host:port/api/")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    llm_profile, kb_profile = profiles_from_args(args)
+    asyncio.run(serve(args.host, args.llm_port, args.kb_port, llm_profile, kb_profile))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+近似重复检测基准：逐句两两比较（原实现） vs MinHash 索引
+
+模拟逐段生成长文档的过程：每生成一个段落，查询与所有已生成段落的最高相似度后加入。
+
+    cd backend && python -m benchmarks.near_duplicate --sections 200
+"""
+import argparse
+import random
+import time
+
+from app.config import settings
+from app.services.langchain_service import OutlineGenerator
+from app.utils.near_duplicate import MinHashIndex
+
+PHRASES = [
+    "桥梁结构健康监测", "传感器布设方案", "数据采集与传输", "治超站点建设", "称重设备部署",
+    "执法流程优化", "信息化平台建设", "应急预案管理", "施工组织设计", "质量安全保障",
+    "运营维护机制", "预警阈值设置", "交通流量分析", "智慧交通系统", "资金投入与保障",
+    "项目进度安排", "技术路线选择", "风险评估与控制", "数据共享与交换", "人员培训计划",
+]
+CONNECTORS = ["是", "需要结合", "应当重点关注", "通过", "有效提升了", "进一步完善", "统筹推进", "全面加强"]
+
+
+def make_sentence(rng: random.Random) -> str:
+    words = [rng.choice(PHRASES) if i % 2 == 0 else rng.choice(CONNECTORS) for i in range(rng.randint(5, 9))]
+    return "".join(words) + "。"
+
+
+def make_sections(count: int, sentences: int, duplicate_ratio: float, seed: int):
+    rng = random.Random(seed)
+    sections = []
+    for _ in range(count):
+        if sections and rng.random() < duplicate_ratio:
+            # 复制已有段落并改写部分句子，模拟大模型生成的重复内容
+            source = rng.choice(sections).split("。")[:-1]
+            for i in rng.sample(range(len(source)), k=max(1, len(source) // 5)):
+                source[i] = make_sentence(rng)[:-1]
+            sections.append("。".join(source) + "。")
+        else:
+            sections.append("".join(make_sentence(rng) for _ in range(sentences)))
+    return sections
+
+
+def run_pairwise(sections):
+    generator = object.__new__(OutlineGenerator)
+    latencies, best_scores = [], []
+    for i, content in enumerate(sections):
+        start = time.perf_counter()
+        best = max((generator._paragraph_similarity(content, previous) for previous in sections[:i]), default=0.0)
+        latencies.append(time.perf_counter() - start)
+        best_scores.append(best)
+    return latencies, best_scores
+
+
+def run_minhash(sections):
+    index = MinHashIndex()
+    latencies, query_latencies, best_scores = [], [], []
+    for i, content in enumerate(sections):
+        start = time.perf_counter()
+        signature = index.signature(content)
+        query_start = time.perf_counter()
+        _, best = index.most_similar(signature=signature)
+        query_latencies.append(time.perf_counter() - query_start)
+        index.add(i, signature=signature)
+        latencies.append(time.perf_counter() - start)
+        best_scores.append(best)
+    return latencies, query_latencies, best_scores
+
+
+def report(name, latencies):
+    ordered = sorted(latencies)
+    p50 = ordered[len(ordered) // 2] * 1000
+    p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000
+    print(f"{name:<10} 总耗时 {sum(latencies):8.3f}s  单段 p50 {p50:8.3f}ms  p99 {p99:8.3f}ms  末段 {latencies[-1] * 1000:8.3f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="近似重复检测基准")
+    parser.add_argument("--sections", type=int, default=200, help="段落数")
+    parser.add_argument("--sentences", type=int, default=20, help="每段句子数")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.1, help="重复段落比例")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--skip-pairwise", action="store_true", help="跳过原实现（段落多时很慢）")
+    args = parser.parse_args()
+
+    sections = make_sections(args.sections, args.sentences, args.duplicate_ratio, args.seed)
+    print(f"段落数 {len(sections)}，平均长度 {sum(map(len, sections)) // len(sections)} 字符")
+
+    minhash_latencies, query_latencies, minhash_scores = run_minhash(sections)
+    report("minhash", minhash_latencies)
+    report("  查询", query_latencies)
+    print(f"minhash 相似度超过 {settings.WRITING_DUPLICATE_THRESHOLD} 的段落数: {sum(score > settings.WRITING_DUPLICATE_THRESHOLD for score in minhash_scores)}")
+    if not args.skip_pairwise:
+        pairwise_latencies, pairwise_scores = run_pairwise(sections)
+        report("pairwise", pairwise_latencies)
+        print(f"加速比 {sum(pairwise_latencies) / max(sum(minhash_latencies), 1e-9):.1f}x")
+
+
+if __name__ == "__main__":
+    main()
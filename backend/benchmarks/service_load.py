@@ -0,0 +1,437 @@
+"""
+写作与知识库接口压测：启动本地大模型和知识库替身服务（benchmarks.fakes）及后端服务，
+在指定并发下驱动大纲生成、全文生成、知识库对话和文件上传，输出 JSON 格式的结果
+
+    cd backend && python -m benchmarks.service_load --config bench.yaml --concurrency 8 --requests 40
+    cd backend && python -m benchmarks.service_load --config bench.yaml --scenarios rag_chat,upload --llm-tokens-per-second 0 --output result.json
+
+--config 指定的配置文件中 mysql 须指向专门的空库（服务启动时建表，压测会写入用户、会话、任务和文件数据，勿用于生产库），
+其余配置沿用该文件，llm_models、知识库地址、摘要模型和上传目录改写为替身服务和临时目录，并开启 /metrics 和 Server-Timing。
+
+场景：
+    outline   POST /writing/outlines/generate，轮询任务直到完成
+    content   POST /writing/content/generate，有 outline 场景生成的大纲时基于大纲生成，否则直接生成，轮询任务直到完成
+    rag_chat  POST /rag/chat 流式对话，读取完整响应
+    upload    POST /rag/files 上传 docx，轮询文件列表直到解析完成（Done 或 Failed）
+
+每个场景输出吞吐量、延迟 p50/p95/p99、首字节延迟（rag_chat）或提交延迟（写作任务）、错误数，以及 SQL 语句数：
+db.statements 为场景期间服务执行的全部语句（/metrics 的 db_statements_total，包括后台任务和轮询请求），
+db.request_statements 为被测请求本身的语句数（Server-Timing），db.auxiliary_statements 为轮询任务和文件状态、
+创建对话会话等辅助请求的语句总数。
+替身服务按调用类型统计的次数和 token 数输出在 llm 和 kb 中。
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+import yaml
+from docx import Document as DocxDocument
+
+from benchmarks.fakes import add_profile_arguments, profile_arguments
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+SCENARIOS = ["outline", "content", "rag_chat", "upload"]
+MODEL_NAME = "benchmark-llm"
+SERVER_TIMING_DB = re.compile(r'db;dur=[\d.]+;desc="(\d+) queries"')
+METRIC_SAMPLE = re.compile(r'^db_statements_total\{[^}]*\} ([\d.eE+-]+)$', re.MULTILINE)
+
+
+class ScenarioError(Exception):
+    """单次操作失败，message 作为错误类别计数"""
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentiles(values: List[float]) -> Optional[Dict[str, float]]:
+    if not values:
+        return None
+    ordered = sorted(values)
+
+    def at(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * q))], 1)
+
+    return {
+        "p50": at(0.5),
+        "p95": at(0.95),
+        "p99": at(0.99),
+        "max": round(ordered[-1], 1),
+        "mean": round(sum(ordered) / len(ordered), 1),
+    }
+
+
+def build_config(base_path: Path, work_dir: Path, llm_port: int, kb_port: int, log_level: str) -> Path:
+    """在基础配置上改写模型、知识库、上传目录和观测相关配置，写入临时目录"""
+    config = yaml.safe_load(base_path.read_text(encoding="utf-8")) or {}
+    llm_base_url = f"http://127.0.0.1:{llm_port}/v1"
+    config["llm_models"] = [{
+        "base_url": llm_base_url,
+        "model": "fake-llm",
+        "api_key": "benchmark",
+        "readable_model_name": MODEL_NAME,
+        "system_prompt": "你是一个专业的写作助手。",
+        "request_timeout": 600.0,
+    }]
+    rag = config.setdefault("rag", {}) or {}
+    rag.update({
+        "kb_api_base": f"http://127.0.0.1:{kb_port}/api/",
+        "summary_base_url": llm_base_url,
+        "summary_model": "fake-llm",
+        "summary_api_key": "benchmark",
+    })
+    config["rag"] = rag
+    config["upload"] = {"dir": str(work_dir / "uploads")}
+    config["logging"] = {**(config.get("logging") or {}), "level": log_level, "file": ""}
+    config["metrics"] = {"enabled": True, "token": ""}
+    config["request_timing"] = {**(config.get("request_timing") or {}), "enabled": True, "server_timing_header": True}
+    path = work_dir / "config.yaml"
+    path.write_text(yaml.safe_dump(config, allow_unicode=True, sort_keys=False), encoding="utf-8")
+    return path
+
+
+def start_process(args: List[str], log_path: Path, env: Optional[Dict[str, str]] = None) -> subprocess.Popen:
+    log = open(log_path, "wb")
+    return subprocess.Popen(args, cwd=BACKEND_DIR, stdout=log, stderr=subprocess.STDOUT, env={**os.environ, **(env or {})})
+
+
+def stop_process(process: Optional[subprocess.Popen]) -> None:
+    if process and process.poll() is None:
+        process.terminate()
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+async def wait_ready(url: str, process: subprocess.Popen, log_path: Path, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(timeout=5) as client:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                break
+            try:
+                if (await client.get(url)).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.5)
+    tail = log_path.read_text(encoding="utf-8", errors="replace")[-3000:]
+    raise RuntimeError(f"服务未就绪: {url}\n{tail}")
+
+
+def make_docx(title: str, paragraphs: int) -> bytes:
+    """内容唯一的 docx，避免上传时按哈希去重"""
+    document = DocxDocument()
+    document.add_heading(title, level=1)
+    for i in range(paragraphs):
+        document.add_paragraph(f"{title} 第{i + 1}段：桥梁结构健康监测系统通过传感器实时采集数据，结合预警阈值设置和交通流量分析，为养护决策提供依据。")
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+class Runner:
+    def __init__(self, client: httpx.AsyncClient, args: argparse.Namespace):
+        self.client = client
+        self.args = args
+        self.tokens: List[str] = []
+        self.outline_ids: List[str] = []
+        self.run_id = uuid.uuid4().hex[:8]
+        # 当前场景被测请求和辅助请求（轮询任务和文件状态、创建对话会话）的 SQL 语句数（来自 Server-Timing）
+        self.request_statements: List[int] = []
+        self.auxiliary_statements = 0
+        self.auxiliary_requests = 0
+
+    def headers(self, worker: int) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.tokens[worker % len(self.tokens)]}"}
+
+    @staticmethod
+    def statements(response: httpx.Response) -> Optional[int]:
+        match = SERVER_TIMING_DB.search(response.headers.get("server-timing", ""))
+        return int(match.group(1)) if match else None
+
+    async def call(self, method: str, url: str, auxiliary: bool = False, **kwargs) -> Dict[str, Any]:
+        """发送请求并返回 data，业务错误（code 不为 200）抛出 ScenarioError"""
+        response = await self.client.request(method, url, **kwargs)
+        count = self.statements(response)
+        if auxiliary:
+            self.auxiliary_requests += 1
+            self.auxiliary_statements += count or 0
+        elif count is not None:
+            self.request_statements.append(count)
+        if response.status_code != 200:
+            raise ScenarioError(f"HTTP {response.status_code}")
+        body = response.json()
+        if body.get("code") != 200:
+            raise ScenarioError(f"code {body.get('code')}: {str(body.get('message'))[:80]}")
+        return body.get("data")
+
+    async def register_users(self, count: int) -> None:
+        for i in range(count):
+            data = await self.call("POST", "/api/v1/register", json={
+                "username": f"bench-{self.run_id}-{i}",
+                "email": f"bench-{self.run_id}-{i}@example.com",
+                "password": f"bench-{self.run_id}",
+            })
+            self.tokens.append(data["access_token"])
+
+    async def metric_statements(self) -> Optional[float]:
+        try:
+            response = await self.client.get("/metrics")
+        except httpx.HTTPError:
+            return None
+        if response.status_code != 200:
+            return None
+        return sum(float(value) for value in METRIC_SAMPLE.findall(response.text))
+
+    async def wait_task(self, worker: int, task_id: str) -> Dict[str, Any]:
+        deadline = time.monotonic() + self.args.task_timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(self.args.poll_interval)
+            task = await self.call("GET", f"/api/v1/writing/tasks/{task_id}", auxiliary=True, headers=self.headers(worker))
+            if task["status"] == "completed":
+                return task
+            if task["status"] == "failed":
+                raise ScenarioError("任务失败")
+        raise ScenarioError("任务超时")
+
+    def prompt(self, index: int) -> str:
+        return f"写一篇关于桥梁结构健康监测系统建设的施工组织设计（编号{self.run_id}-{index}），约{self.args.word_count}字，{self.args.levels}级大纲"
+
+    # 各场景的单次操作，返回附加的耗时指标（毫秒）
+
+    async def outline(self, worker: int, index: int) -> Dict[str, float]:
+        start = time.perf_counter()
+        data = await self.call("POST", "/api/v1/writing/outlines/generate", headers=self.headers(worker), json={
+            "prompt": self.prompt(index), "model_name": MODEL_NAME,
+        })
+        submit_ms = (time.perf_counter() - start) * 1000
+        task = await self.wait_task(worker, data["task_id"])
+        outline_id = (task.get("result") or {}).get("outline_id")
+        if outline_id:
+            self.outline_ids.append(outline_id)
+        return {"submit_ms": submit_ms}
+
+    async def content(self, worker: int, index: int) -> Dict[str, float]:
+        request = {"model_name": MODEL_NAME}
+        if self.outline_ids:
+            request["outline_id"] = self.outline_ids[index % len(self.outline_ids)]
+        else:
+            request["prompt"] = self.prompt(index)
+        start = time.perf_counter()
+        data = await self.call("POST", "/api/v1/writing/content/generate", headers=self.headers(worker), json=request)
+        submit_ms = (time.perf_counter() - start) * 1000
+        await self.wait_task(worker, data["task_id"])
+        return {"submit_ms": submit_ms}
+
+    async def rag_chat(self, worker: int, index: int) -> Dict[str, float]:
+        session = await self.call("POST", "/api/v1/rag/chat/session", auxiliary=True, headers=self.headers(worker), json={})
+        start = time.perf_counter()
+        first_byte_ms = None
+        async with self.client.stream("POST", "/api/v1/rag/chat", headers=self.headers(worker), json={
+            "question": f"桥梁监测系统的传感器如何布设？（{index}）",
+            "model_name": MODEL_NAME,
+            "session_id": session["session_id"],
+            "stream": True,
+        }) as response:
+            count = self.statements(response)
+            if count is not None:
+                self.request_statements.append(count)
+            if response.status_code != 200:
+                raise ScenarioError(f"HTTP {response.status_code}")
+            if not response.headers.get("content-type", "").startswith("text/event-stream"):
+                body = json.loads(await response.aread())
+                raise ScenarioError(f"code {body.get('code')}: {str(body.get('message'))[:80]}")
+            async for line in response.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                if first_byte_ms is None:
+                    first_byte_ms = (time.perf_counter() - start) * 1000
+                if line[6:].strip() != "[DONE]" and "error" in json.loads(line[6:]):
+                    raise ScenarioError("流式响应返回错误")
+        return {"first_byte_ms": first_byte_ms or 0}
+
+    async def upload(self, worker: int, index: int) -> Dict[str, float]:
+        name = f"bench-{self.run_id}-{index}.docx"
+        start = time.perf_counter()
+        data = await self.call(
+            "POST", "/api/v1/rag/files", params={"category": "user"}, headers=self.headers(worker),
+            files=[("files", (name, make_docx(name, self.args.upload_paragraphs), "application/vnd.openxmlformats-officedocument.wordprocessingml.document"))],
+        )
+        submit_ms = (time.perf_counter() - start) * 1000
+        file_id = data[0]["file_id"]
+        deadline = time.monotonic() + self.args.task_timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(self.args.poll_interval)
+            page = await self.call("GET", "/api/v1/rag/files", auxiliary=True, headers=self.headers(worker), params={
+                "category": "user", "page_size": 100,
+            })
+            status = next((item["status"] for item in page["list"] if item["file_id"] == file_id), None)
+            if status == "Done":
+                return {"submit_ms": submit_ms}
+            if status == "Failed":
+                raise ScenarioError("文件解析失败")
+        raise ScenarioError("文件解析超时")
+
+    async def run_scenario(self, name: str, operation: Callable, fakes: Dict[str, str]) -> Dict[str, Any]:
+        self.request_statements, self.auxiliary_statements, self.auxiliary_requests = [], 0, 0
+        statements_before = await self.metric_statements()
+        fake_stats_before = {key: await self.fake_stats(url) for key, url in fakes.items()}
+        latencies: List[float] = []
+        extras: Dict[str, List[float]] = {}
+        errors = Counter()
+        next_index = iter(range(self.args.requests))
+
+        async def worker(worker_id: int):
+            for index in next_index:
+                start = time.perf_counter()
+                try:
+                    extra = await operation(worker_id, index)
+                except ScenarioError as e:
+                    errors[str(e)] += 1
+                    continue
+                except httpx.HTTPError as e:
+                    errors[type(e).__name__] += 1
+                    continue
+                latencies.append((time.perf_counter() - start) * 1000)
+                for key, value in extra.items():
+                    extras.setdefault(key, []).append(value)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(i) for i in range(self.args.concurrency)))
+        duration = time.perf_counter() - start
+        # 等待流式响应结束后写入的语句
+        await asyncio.sleep(0.5)
+        statements_after = await self.metric_statements()
+
+        total_statements = None if statements_before is None or statements_after is None else int(statements_after - statements_before)
+        operations = len(latencies) + sum(errors.values())
+        result = {
+            "scenario": name,
+            "concurrency": self.args.concurrency,
+            "requests": operations,
+            "ok": len(latencies),
+            "errors": dict(errors),
+            "duration_s": round(duration, 3),
+            "throughput_per_s": round(len(latencies) / duration, 3) if duration > 0 else 0,
+            "latency_ms": percentiles(latencies),
+            **{key: percentiles(values) for key, values in extras.items()},
+            "db": {
+                "statements": total_statements,
+                "statements_per_op": round(total_statements / operations, 1) if total_statements is not None and operations else None,
+                "request_statements": percentiles(self.request_statements),
+                "auxiliary_requests": self.auxiliary_requests,
+                "auxiliary_statements": self.auxiliary_statements,
+            },
+        }
+        for key, url in fakes.items():
+            after = await self.fake_stats(url)
+            result[key] = {stat: value - fake_stats_before[key].get(stat, 0) for stat, value in after.items() if value != fake_stats_before[key].get(stat, 0)}
+        return result
+
+    @staticmethod
+    async def fake_stats(url: str) -> Dict[str, int]:
+        async with httpx.AsyncClient(timeout=5) as client:
+            return (await client.get(f"{url}/stats")).json()
+
+
+async def run(args: argparse.Namespace, app_url: str, fakes: Dict[str, str]) -> Dict[str, Any]:
+    limits = httpx.Limits(max_connections=args.concurrency * 2 + 4, max_keepalive_connections=args.concurrency * 2 + 4)
+    async with httpx.AsyncClient(base_url=app_url, timeout=args.task_timeout, limits=limits) as client:
+        runner = Runner(client, args)
+        await runner.register_users(args.users or args.concurrency)
+        results = []
+        for name in args.scenarios:
+            result = await runner.run_scenario(name, getattr(runner, name), fakes)
+            results.append(result)
+            print(f"{name:<10} ok {result['ok']}/{result['requests']}  {result['throughput_per_s']}/s  "
+                  f"p50 {(result['latency_ms'] or {}).get('p50')}ms  p99 {(result['latency_ms'] or {}).get('p99')}ms  "
+                  f"SQL {result['db']['statements']}", file=sys.stderr)
+    return {
+        "run_id": runner.run_id,
+        "config": {
+            key: getattr(args, key) for key in (
+                "concurrency", "requests", "users", "word_count", "levels", "llm_latency", "llm_tokens_per_second",
+                "llm_completion_tokens", "kb_parse_seconds", "kb_chat_latency", "kb_chat_tokens_per_second", "kb_chat_tokens",
+            )
+        },
+        "scenarios": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--config", default=os.getenv("CONFIG_PATH", "config.yaml"), help="基础配置文件，mysql 须指向专门的空库")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"逗号分隔，按顺序执行，可选 {','.join(SCENARIOS)}")
+    parser.add_argument("--concurrency", type=int, default=4, help="每个场景的并发数")
+    parser.add_argument("--requests", type=int, default=20, help="每个场景的操作数")
+    parser.add_argument("--users", type=int, default=0, help="注册的压测用户数，并发请求轮流使用，默认与并发数相同")
+    parser.add_argument("--word-count", type=int, default=2000, help="写作提示中的字数要求")
+    parser.add_argument("--levels", type=int, default=2, help="写作提示中的大纲层级")
+    parser.add_argument("--upload-paragraphs", type=int, default=50, help="上传文件的段落数")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="轮询任务和文件状态的间隔（秒）")
+    parser.add_argument("--task-timeout", type=float, default=1800, help="单个任务或文件的最长等待时间（秒）")
+    parser.add_argument("--startup-timeout", type=float, default=120, help="等待服务启动的时间（秒）")
+    parser.add_argument("--log-level", default="WARNING", help="后端服务日志级别")
+    parser.add_argument("--output", help="结果 JSON 写入的文件，默认输出到标准输出")
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    args.scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"未知场景: {', '.join(unknown)}")
+
+    work_dir = Path(tempfile.mkdtemp(prefix="service_load_"))
+    llm_port, kb_port, app_port = free_port(), free_port(), free_port()
+    config_path = build_config(Path(args.config), work_dir, llm_port, kb_port, args.log_level)
+    fakes = {"llm": f"http://127.0.0.1:{llm_port}", "kb": f"http://127.0.0.1:{kb_port}"}
+    app_url = f"http://127.0.0.1:{app_port}"
+    print(f"工作目录 {work_dir}（配置、上传文件和服务日志）", file=sys.stderr)
+
+    fake_process = app_process = None
+    try:
+        fake_process = start_process(
+            [sys.executable, "-m", "benchmarks.fakes", "--llm-port", str(llm_port), "--kb-port", str(kb_port), *profile_arguments(args)],
+            work_dir / "fakes.log",
+        )
+        for url in fakes.values():
+            asyncio.run(wait_ready(f"{url}/stats", fake_process, work_dir / "fakes.log", args.startup_timeout))
+        app_process = start_process(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(app_port), "--log-level", args.log_level.lower()],
+            work_dir / "app.log",
+            env={"CONFIG_PATH": str(config_path)},
+        )
+        asyncio.run(wait_ready(f"{app_url}/metrics", app_process, work_dir / "app.log", args.startup_timeout))
+        result = asyncio.run(run(args, app_url, fakes))
+    finally:
+        stop_process(app_process)
+        stop_process(fake_process)
+
+    output = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).write_text(output, encoding="utf-8")
+    else:
+        print(output)
+    failed = sum(sum(item["errors"].values()) for item in result["scenarios"])
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+"""
+测试使用的最小配置：未设置 CONFIG_PATH 时写入临时配置文件，须在导入 app 之前生效
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+TEST_CONFIG = """
+llm_models:
+  - base_url: "http://127.0.0.1:18001/v1"
+    model: "test-llm"
+    api_key: "test"
+    readable_model_name: "test-llm"
+    system_prompt: "test"
+rag:
+  kb_api_base: "http://127.0.0.1:18002/api/"
+  summary_base_url: "http://127.0.0.1:18001/v1"
+  summary_model: "test-llm"
+  summary_api_key: "test"
+logging:
+  file: ""
+"""
+
+if "CONFIG_PATH" not in os.environ:
+    config_path = Path(tempfile.mkdtemp(prefix="backend_tests_")) / "config.yaml"
+    config_path.write_text(TEST_CONFIG, encoding="utf-8")
+    os.environ["CONFIG_PATH"] = str(config_path)
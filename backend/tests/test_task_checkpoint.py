@@ -0,0 +1,86 @@
+"""全文生成的段落断点：有任务ID、未选择知识库时，空断点存储同样读写段落断点"""
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import app.models.chat  # noqa: F401 注册关系映射中引用的模型
+from app.models.outline import CountStyle, SubParagraph
+from app.models.task import TaskCheckpoint
+from app.services import task_checkpoint
+from app.services.langchain_service import OutlineGenerator
+from app.services.task_checkpoint import TaskCheckpointStore
+from app.utils.near_duplicate import MinHashIndex
+
+
+@pytest.fixture
+def checkpoint_db(monkeypatch):
+    """断点存储改用内存 SQLite"""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    TaskCheckpoint.__table__.create(engine)
+    monkeypatch.setattr(task_checkpoint, "sync_session", sessionmaker(autocommit=False, autoflush=False, bind=engine))
+    yield
+    engine.dispose()
+
+
+class _FakeGenerator(OutlineGenerator):
+    """不创建大模型客户端，记录段落生成次数"""
+
+    def __init__(self):
+        self.model = "test-llm"
+        self.generate_calls = 0
+
+    def _generate_paragraph_content_with_context(self, **kwargs):
+        self.generate_calls += 1
+        return f"{kwargs['paragraph'].title}的正文内容"
+
+    def _extract_content_summary(self, content):
+        return content[:10]
+
+
+def make_global_context(checkpoints):
+    # 未选择知识库：没有参考资料索引，生成段落前不会保存任何断点
+    return {
+        "previous_content_summary": "",
+        "chapter_summaries": {},
+        "generated_contents": {},
+        "total_content_length": 0,
+        "duplicate_titles": set(),
+        "generated_titles": set(),
+        "doc_id": None,
+        "task_id": None,
+        "total_paragraphs": 1,
+        "generated_paragraph_count": 0,
+        "checkpoints": checkpoints,
+        "duplicate_index": MinHashIndex(),
+        "rag_index": None,
+        "restored_paragraph_count": 0,
+    }
+
+
+def generate(generator, checkpoints):
+    paragraph = SubParagraph(id=1, outline_id=1, parent_id=None, level=1, title="第一章",
+                             description="章节描述", count_style=CountStyle.MEDIUM, sort_index=0)
+    global_context = make_global_context(checkpoints)
+    markdown_content = []
+    generator._generate_paragraph_with_context(
+        paragraph, global_context, markdown_content, "测试文章", "", "", "", is_root=True
+    )
+    return global_context, markdown_content
+
+
+def test_empty_store_saves_and_restores_paragraph(checkpoint_db):
+    generator = _FakeGenerator()
+    checkpoints = TaskCheckpointStore("task-1")
+    assert len(checkpoints) == 0
+
+    generate(generator, checkpoints)
+    assert generator.generate_calls == 1
+    assert len(checkpoints) == 1
+
+    # 任务中断后重新执行：重新加载断点，段落直接从断点恢复
+    resumed = TaskCheckpointStore("task-1")
+    global_context, markdown_content = generate(generator, resumed)
+    assert generator.generate_calls == 1
+    assert global_context["restored_paragraph_count"] == 1
+    assert "第一章的正文内容" in markdown_content[0]
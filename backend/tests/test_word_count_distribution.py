@@ -0,0 +1,61 @@
+"""全文生成前按用户要求的总字数分配段落预期字数"""
+import pytest
+
+import app.models.chat  # noqa: F401 注册关系映射中引用的模型
+from app.metrics import current_llm_call_site
+from app.models.outline import CountStyle, Outline, SubParagraph
+from app.services.langchain_service import OutlineGenerator
+from app.utils.outline import attach_children, paragraph_path
+
+
+def make_outline():
+    """两个一级段落，各有三个子段落，按文档顺序排列"""
+    paragraphs = []
+    next_id = 1
+    for i in range(2):
+        parent = SubParagraph(id=next_id, outline_id=1, parent_id=None, level=1, title=f"第{i + 1}章",
+                              description="", count_style=CountStyle.MEDIUM, sort_index=i, path=paragraph_path(None, i))
+        paragraphs.append(parent)
+        next_id += 1
+        for j in range(3):
+            paragraphs.append(SubParagraph(id=next_id, outline_id=1, parent_id=parent.id, level=2, title=f"{i + 1}.{j + 1} 小节",
+                                           description="小节描述", sort_index=j, path=paragraph_path(parent.path, j)))
+            next_id += 1
+    return Outline(id=1, title="测试大纲"), paragraphs
+
+
+def test_assign_expected_word_counts():
+    outline, all_paragraphs = make_outline()
+    root_paragraphs = attach_children(all_paragraphs)
+    paragraphs_dict = {p.id: p for p in all_paragraphs}
+
+    # 不经过 __init__，避免创建大模型客户端
+    generator = OutlineGenerator.__new__(OutlineGenerator)
+    generator._assign_expected_word_counts(outline, root_paragraphs, paragraphs_dict, 3000)
+
+    leaves = [p for p in all_paragraphs if p.level == 2]
+    assert all(p.expected_word_count and p.expected_word_count > 0 for p in leaves)
+    assert abs(sum(p.expected_word_count for p in leaves) - 3000) <= 3000 * 0.2
+
+
+class _StopGeneration(Exception):
+    pass
+
+
+class _RecordingSession:
+    """记录查询大纲时的大模型调用场景，随后中止生成"""
+
+    def __init__(self):
+        self.call_site = None
+
+    def query(self, *args, **kwargs):
+        self.call_site = current_llm_call_site()
+        raise _StopGeneration()
+
+
+def test_generate_full_content_marks_paragraph_call_site():
+    generator = OutlineGenerator.__new__(OutlineGenerator)
+    session = _RecordingSession()
+    with pytest.raises(_StopGeneration):
+        generator.generate_full_content("1", session)
+    assert session.call_site == "paragraph"